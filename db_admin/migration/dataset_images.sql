@@ -0,0 +1,21 @@
+/*
+    Stores prepared images of dataset scripts, so that datasets can be initialised without running their scripts.
+
+    Images are keyed by the SHA-256 of the script (see `DatasetImage.hash_script` in server/db/admin/datasets.py),
+    and are built again on first use.
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+CREATE TABLE dataset_images (
+    script_hash TEXT NOT NULL,
+    dbms VARCHAR(255) NOT NULL,
+    image BYTEA NOT NULL,
+    created_ts TIMESTAMP NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (script_hash, dbms)
+);
+
+COMMIT;
@@ -0,0 +1,14 @@
+/*
+    Adds the dataset each user's database is known to match: it is set when a dataset is initialised without errors,
+    and cleared by any statement which may modify the database.
+    Cached solution results are only used while it matches the dataset of the exercise (see server/sql/result/solutions.py).
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+ALTER TABLE users
+ADD COLUMN dataset_state TEXT DEFAULT NULL;
+
+COMMIT;
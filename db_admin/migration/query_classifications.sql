@@ -0,0 +1,18 @@
+/*
+    Stores the classification of normalised queries, shared by all server processes
+    when `QUERY_CLASSIFICATION_SHARED` is enabled (see server/sql/classification.py).
+
+    The table starts empty and is filled as queries are classified.
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+CREATE TABLE query_classifications (
+    query_hash TEXT PRIMARY KEY,
+    query_type VARCHAR(255) NOT NULL,
+    query_goal VARCHAR(255) NOT NULL
+);
+
+COMMIT;
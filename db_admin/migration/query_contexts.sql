@@ -0,0 +1,123 @@
+/*
+    Moves the schema context of queries to deduplicated snapshots (`query_contexts`).
+
+    Previously, every column and unique constraint of the user schemas was stored again for each query.
+    Each distinct context is now stored once, and queries link to it through `queries.context_id`.
+
+    Hashes are computed as in `QueryContext.hash_context` (server/db/admin/queries.py),
+    so that contexts logged after the migration reuse the migrated ones.
+    Run `VACUUM FULL` on the context tables afterwards to reclaim the space.
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+CREATE TABLE query_contexts (
+    id SERIAL PRIMARY KEY,
+    context_hash TEXT NOT NULL UNIQUE,
+    created_ts TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE queries
+ADD COLUMN context_id INTEGER DEFAULT NULL REFERENCES query_contexts(id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+-- Hash of the context of each query -------------------------------------------------------------------------
+CREATE TEMPORARY TABLE query_context_hashes ON COMMIT DROP AS
+SELECT
+    q.query_id,
+    MD5(COALESCE(c.content, '') || E'\n\n' || COALESCE(u.content, '')) AS context_hash
+FROM (
+    SELECT query_id FROM query_context_columns
+    UNION
+    SELECT query_id FROM query_context_columns_unique
+) q
+LEFT JOIN (
+    SELECT
+        query_id,
+        STRING_AGG(row_text, E'\n' ORDER BY row_text COLLATE "C") AS content
+    FROM (
+        SELECT
+            query_id,
+            CONCAT_WS(E'\t',
+                schema_name, table_name, column_name, column_type,
+                COALESCE(numeric_precision::TEXT, '\N'), COALESCE(numeric_scale::TEXT, '\N'), is_nullable::TEXT,
+                COALESCE(foreign_key_schema, '\N'), COALESCE(foreign_key_table, '\N'), COALESCE(foreign_key_column, '\N')
+            ) AS row_text
+        FROM query_context_columns
+    ) context_rows
+    GROUP BY query_id
+) c ON c.query_id = q.query_id
+LEFT JOIN (
+    SELECT
+        query_id,
+        STRING_AGG(row_text, E'\n' ORDER BY row_text COLLATE "C") AS content
+    FROM (
+        SELECT
+            query_id,
+            CONCAT_WS(E'\t', schema_name, table_name, constraint_type, columns::TEXT) AS row_text
+        FROM query_context_columns_unique
+    ) context_rows
+    GROUP BY query_id
+) u ON u.query_id = q.query_id;
+
+-- One query per context keeps its rows, which become the rows of the context
+CREATE TEMPORARY TABLE query_context_representatives ON COMMIT DROP AS
+SELECT context_hash, MIN(query_id) AS query_id
+FROM query_context_hashes
+GROUP BY context_hash;
+
+INSERT INTO query_contexts (context_hash)
+SELECT context_hash
+FROM query_context_representatives
+ORDER BY query_id;
+
+UPDATE queries q
+SET context_id = qc.id
+FROM query_context_hashes h
+JOIN query_contexts qc ON qc.context_hash = h.context_hash
+WHERE q.id = h.query_id;
+
+-- Columns ---------------------------------------------------------------------------------------------------
+ALTER TABLE query_context_columns
+ADD COLUMN context_id INTEGER REFERENCES query_contexts(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+UPDATE query_context_columns c
+SET context_id = qc.id
+FROM query_context_representatives r
+JOIN query_contexts qc ON qc.context_hash = r.context_hash
+WHERE c.query_id = r.query_id;
+
+DELETE FROM query_context_columns
+WHERE context_id IS NULL;
+
+-- Also drops the old unique constraint
+ALTER TABLE query_context_columns
+DROP COLUMN query_id;
+
+ALTER TABLE query_context_columns
+ALTER COLUMN context_id SET NOT NULL;
+
+ALTER TABLE query_context_columns
+ADD UNIQUE (context_id, schema_name, table_name, column_name);
+
+-- Unique constraints ----------------------------------------------------------------------------------------
+ALTER TABLE query_context_columns_unique
+ADD COLUMN context_id INTEGER REFERENCES query_contexts(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+UPDATE query_context_columns_unique u
+SET context_id = qc.id
+FROM query_context_representatives r
+JOIN query_contexts qc ON qc.context_hash = r.context_hash
+WHERE u.query_id = r.query_id;
+
+DELETE FROM query_context_columns_unique
+WHERE context_id IS NULL;
+
+ALTER TABLE query_context_columns_unique
+DROP COLUMN query_id;
+
+ALTER TABLE query_context_columns_unique
+ALTER COLUMN context_id SET NOT NULL;
+
+COMMIT;
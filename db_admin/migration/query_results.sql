@@ -0,0 +1,43 @@
+/*
+    Bounds the results stored in `queries.result`.
+
+    Previously, the full CSV of every dataset was stored. Only its first rows are now kept (`RESULT_TEXT_MAX_ROWS`, 20 by default),
+    together with the number of rows (`result_rows`) and a hash of their content (`result_hash`).
+    Full results can optionally be archived, compressed, in `query_results`.
+
+    Existing results are shortened in the same way. Their number of rows is estimated from their lines, and their hash is not available.
+    Run `VACUUM FULL queries` afterwards to reclaim the space.
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+ALTER TABLE queries
+ADD COLUMN result_rows INTEGER DEFAULT NULL,
+ADD COLUMN result_hash TEXT DEFAULT NULL;
+
+CREATE TABLE query_results (
+    query_id INTEGER NOT NULL REFERENCES queries(id) ON UPDATE CASCADE ON DELETE CASCADE PRIMARY KEY,
+    encoding VARCHAR(20) NOT NULL,
+    content BYTEA NOT NULL,
+    size INTEGER NOT NULL,
+    created_ts TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX query_results_created_ts_idx ON query_results(created_ts);
+
+-- Header, 20 rows and the trailing newline
+UPDATE queries q
+SET
+    result_rows = l.line_count - 2,
+    result = ARRAY_TO_STRING(l.lines[1:21], E'\n') || E'\n... (' || (l.line_count - 2) || E' rows)\n'
+FROM (
+    SELECT id, STRING_TO_ARRAY(result, E'\n') AS lines, ARRAY_LENGTH(STRING_TO_ARRAY(result, E'\n'), 1) AS line_count
+    FROM queries
+    WHERE success AND query_type = 'SELECT' AND result IS NOT NULL
+) l
+WHERE q.id = l.id
+AND l.line_count > 22;
+
+COMMIT;
@@ -0,0 +1,19 @@
+/*
+    Adds per-dataset and per-exercise time limits for user statements.
+
+    NULL means that the default is used: the server one for datasets, the dataset one for exercises.
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+ALTER TABLE datasets
+ADD COLUMN statement_timeout_ms INTEGER DEFAULT NULL,
+ADD COLUMN lock_timeout_ms INTEGER DEFAULT NULL;
+
+ALTER TABLE exercises
+ADD COLUMN statement_timeout_ms INTEGER DEFAULT NULL,
+ADD COLUMN lock_timeout_ms INTEGER DEFAULT NULL;
+
+COMMIT;
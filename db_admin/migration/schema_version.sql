@@ -0,0 +1,13 @@
+/*
+    Adds the version of the schemas of each user, incremented by any statement which may change them.
+    Cached schema metadata is only used while its version is current (see server/db/users/metadata.py).
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+ALTER TABLE users
+ADD COLUMN schema_version INTEGER NOT NULL DEFAULT 0;
+
+COMMIT;
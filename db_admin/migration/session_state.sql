@@ -0,0 +1,18 @@
+/*
+    Stores the session state of each user, so that it can be replayed by any server worker.
+
+    `session_settings` is a JSON object mapping each session variable to the last statement changing it,
+    `session_version` is incremented each time it changes, and `session_owner` identifies the connection holding
+    state which cannot be replayed (open transactions or temporary tables), if any.
+*/
+
+BEGIN;
+
+SET search_path TO lensql;
+
+ALTER TABLE users
+ADD COLUMN session_settings TEXT DEFAULT NULL,
+ADD COLUMN session_version INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN session_owner TEXT DEFAULT NULL;
+
+COMMIT;
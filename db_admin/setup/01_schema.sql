@@ -64,7 +64,12 @@ CREATE TABLE users (
     experience INTEGER NOT NULL DEFAULT 0,
     coins INTEGER NOT NULL DEFAULT 50,
     can_use_ai BOOLEAN NOT NULL DEFAULT TRUE,
-    last_search_path TEXT DEFAULT NULL
+    last_search_path TEXT DEFAULT NULL,
+    session_settings TEXT DEFAULT NULL,     -- JSON object of session variable -> last statement changing it
+    session_version INTEGER NOT NULL DEFAULT 0,
+    session_owner TEXT DEFAULT NULL,
+    schema_version INTEGER NOT NULL DEFAULT 0,  -- incremented each time the user's schemas may have changed
+    dataset_state TEXT DEFAULT NULL             -- DBMS and dataset script the user's database is known to match
 );
 
 CREATE TABLE navigation_logs(
@@ -91,6 +96,12 @@ CREATE TABLE user_unique_queries (
     PRIMARY KEY (username, query_hash)
 );
 
+CREATE TABLE query_classifications (
+    query_hash TEXT PRIMARY KEY,    -- MD5 of the normalised query, see server/sql/classification.py
+    query_type VARCHAR(255) NOT NULL,
+    query_goal VARCHAR(255) NOT NULL
+);
+
 CREATE TABLE datasets (
     id TEXT PRIMARY KEY DEFAULT generate_alphanumeric_id(8),
     name VARCHAR(255) NOT NULL,
@@ -98,7 +109,9 @@ CREATE TABLE datasets (
     dataset TEXT DEFAULT NULL,
     domain VARCHAR(255) DEFAULT NULL,
     search_path TEXT NOT NULL DEFAULT 'public',
-    dbms VARCHAR(255) NOT NULL
+    dbms VARCHAR(255) NOT NULL,
+    statement_timeout_ms INTEGER DEFAULT NULL,  -- NULL: use server default
+    lock_timeout_ms INTEGER DEFAULT NULL        -- NULL: use server default
 );
 
 CREATE TABLE dataset_members (
@@ -111,6 +124,15 @@ CREATE TABLE dataset_members (
     PRIMARY KEY (username, dataset_id)
 );
 
+CREATE TABLE dataset_images (
+    script_hash TEXT NOT NULL,      -- SHA-256 of the dataset script
+    dbms VARCHAR(255) NOT NULL,
+    image BYTEA NOT NULL,           -- empty: the script cannot be prepared as an image
+    created_ts TIMESTAMP NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (script_hash, dbms)
+);
+
 
 CREATE TABLE exercises (
     id SERIAL PRIMARY KEY,
@@ -122,7 +144,9 @@ CREATE TABLE exercises (
     created_by VARCHAR(255) REFERENCES users(username) ON UPDATE CASCADE ON DELETE SET NULL, -- allows to keep exercises even if the creator is deleted
     created_ts TIMESTAMP NOT NULL DEFAULT NOW(),
     generation_difficulty INTEGER DEFAULT NULL,
-    generation_error INTEGER DEFAULT NULL
+    generation_error INTEGER DEFAULT NULL,
+    statement_timeout_ms INTEGER DEFAULT NULL,  -- NULL: use dataset value
+    lock_timeout_ms INTEGER DEFAULT NULL        -- NULL: use dataset value
 );
 
 CREATE TABLE learning_objectives (
@@ -143,18 +167,39 @@ CREATE TABLE query_batches (
     exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON UPDATE CASCADE ON DELETE CASCADE
 );
 
+-- distinct schema contexts in which queries were run, stored once (see server/db/admin/queries.py QueryContext)
+CREATE TABLE query_contexts (
+    id SERIAL PRIMARY KEY,
+    context_hash TEXT NOT NULL UNIQUE,
+    created_ts TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE queries (
     id SERIAL PRIMARY KEY,
     batch_id INTEGER NOT NULL REFERENCES query_batches(id) ON UPDATE CASCADE ON DELETE CASCADE,
     query TEXT NOT NULL,
     search_path TEXT DEFAULT NULL,
     success BOOLEAN,        -- supports NULL for queries that are not executed (e.g. when checking solutions in particular cases)
-    result TEXT DEFAULT NULL,
+    result TEXT DEFAULT NULL,  -- summary: first rows of datasets (see server/sql/result/dataset.py result_text)
+    result_rows INTEGER DEFAULT NULL,  -- number of rows returned, for datasets
+    result_hash TEXT DEFAULT NULL,  -- hash of the fetched rows, for datasets
     query_type VARCHAR(50) NOT NULL,
     query_goal VARCHAR(255) DEFAULT NULL,
+    context_id INTEGER DEFAULT NULL REFERENCES query_contexts(id) ON UPDATE CASCADE ON DELETE SET NULL,
     ts TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- full results of datasets, compressed, if archiving is enabled (see server/db/admin/queries.py QueryResultArchive)
+CREATE TABLE query_results (
+    query_id INTEGER NOT NULL REFERENCES queries(id) ON UPDATE CASCADE ON DELETE CASCADE PRIMARY KEY,
+    encoding VARCHAR(20) NOT NULL,
+    content BYTEA NOT NULL,
+    size INTEGER NOT NULL,  -- uncompressed size, in bytes
+    created_ts TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX query_results_created_ts_idx ON query_results(created_ts);
+
 -- solutions attempted by students
 CREATE TABLE exercise_solutions (
     id INTEGER NOT NULL REFERENCES queries(id) ON UPDATE CASCADE ON DELETE CASCADE PRIMARY KEY,
@@ -164,7 +209,7 @@ CREATE TABLE exercise_solutions (
 
 CREATE TABLE query_context_columns (
     id SERIAL PRIMARY KEY,
-    query_id INTEGER NOT NULL REFERENCES queries(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    context_id INTEGER NOT NULL REFERENCES query_contexts(id) ON UPDATE CASCADE ON DELETE CASCADE,
     schema_name TEXT NOT NULL,
     table_name TEXT NOT NULL,
     column_name TEXT NOT NULL,
@@ -176,12 +221,12 @@ CREATE TABLE query_context_columns (
     foreign_key_column TEXT DEFAULT NULL,
     is_nullable BOOLEAN NOT NULL,
 
-    UNIQUE (query_id, schema_name, table_name, column_name)
+    UNIQUE (context_id, schema_name, table_name, column_name)
 );
 
 CREATE TABLE query_context_columns_unique (
     id SERIAL PRIMARY KEY,
-    query_id INTEGER NOT NULL REFERENCES queries(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    context_id INTEGER NOT NULL REFERENCES query_contexts(id) ON UPDATE CASCADE ON DELETE CASCADE,
     schema_name TEXT NOT NULL,
     table_name TEXT NOT NULL,
     constraint_type VARCHAR(32) NOT NULL,
@@ -7,6 +7,7 @@ import dav_tools
 
 from .util import localization
 from server import db
+from server.sql import classification
 
 jwt = JWTManager()
 babel = Babel()
@@ -19,6 +20,8 @@ def create_app() -> Flask:
     if len(jwt_secret_key.encode('utf-8')) < 32:
         dav_tools.messages.critical_error('JWT_SECRET_KEY is less than 32 bytes long. Set a different JWT_SECRET_KEY environment variable for better security.')
 
+    db.users.tenancy.check_configuration()
+
     app.config['JWT_SECRET_KEY'] = jwt_secret_key
     app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 1024*1024*20))   # 20MB
     app.config['BABEL_DEFAULT_LOCALE'] = 'en'
@@ -41,8 +44,12 @@ def create_app() -> Flask:
     # Setup JWT
     jwt.init_app(app)
 
+    # Share query classifications with the other server processes
+    if classification.CLASSIFICATION_SHARED:
+        classification.classifications.store = db.admin.QueryClassification
+
     # Register blueprints
-    from . import auth, datasets, exercises, messages, queries, users, navigation
+    from . import auth, datasets, exercises, messages, queries, users, navigation, system
 
     app.register_blueprint(auth.bp, url_prefix='/auth')
     app.register_blueprint(datasets.bp, url_prefix='/datasets')
@@ -51,4 +58,5 @@ def create_app() -> Flask:
     app.register_blueprint(queries.bp, url_prefix='/queries')
     app.register_blueprint(users.bp, url_prefix='/users')
     app.register_blueprint(navigation.bp, url_prefix='/navigation')
+    app.register_blueprint(system.bp, url_prefix='/system')
     return app
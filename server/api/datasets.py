@@ -10,6 +10,7 @@ from flask_babel import _
 from sqlscope import Dialect
 
 from server import db, gamification
+from server.db.users.governor import parse_limit, MAX_STATEMENT_TIMEOUT_MS, MAX_LOCK_TIMEOUT_MS
 from .util import responses
 
 bp = Blueprint('datasets', __name__)
@@ -213,6 +214,35 @@ def set_owner():
     return responses.response(True)
 
 
+@bp.route('/set-limits', methods=['POST'])
+@jwt_required()
+def set_limits():
+    '''Set the time limits of the queries run in a dataset. Missing values fall back to the server defaults.'''
+    user = db.admin.User(get_jwt_identity())
+
+    data = request.get_json()
+    dataset = db.admin.Dataset(data['dataset_id'])
+
+    if not dataset.has_owner(user):
+        return responses.response(False, message=_('You are not an owner of this dataset.'))
+
+    try:
+        statement_timeout_ms = parse_limit(data.get('statement_timeout_ms'), MAX_STATEMENT_TIMEOUT_MS)
+        lock_timeout_ms = parse_limit(data.get('lock_timeout_ms'), MAX_LOCK_TIMEOUT_MS)
+    except ValueError:
+        return responses.response(False, message=_('Time limits must be whole numbers of milliseconds, between 1 and {statement_max} for statements and between 1 and {lock_max} for locks.').format(
+            statement_max=MAX_STATEMENT_TIMEOUT_MS,
+            lock_max=MAX_LOCK_TIMEOUT_MS,
+        ))
+
+    dataset.set_resource_limits(
+        statement_timeout_ms=statement_timeout_ms,
+        lock_timeout_ms=lock_timeout_ms,
+    )
+
+    return responses.response(True)
+
+
 @bp.route('/add-user', methods=['POST'])
 @jwt_required()
 def add_user_to_dataset():
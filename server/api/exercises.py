@@ -9,6 +9,8 @@ from flask_babel import _
 
 from .util import responses
 from server import db
+from server.db.users.governor import parse_limit, MAX_STATEMENT_TIMEOUT_MS, MAX_LOCK_TIMEOUT_MS
+from server.db.users.script import ScriptProgress
 
 bp = Blueprint('exercise', __name__)
 
@@ -178,6 +180,37 @@ def hide_exercise():
 
     return responses.response(True)
 
+@bp.route('/set-limits', methods=['POST'])
+@jwt_required()
+def set_limits():
+    '''Set the time limits of the queries run in an exercise. Missing values fall back to the dataset limits.'''
+
+    user = db.admin.User(get_jwt_identity())
+
+    data = request.get_json()
+    exercise = db.admin.Exercise(int(data['exercise_id']))
+
+    dataset = db.admin.Dataset(exercise.dataset_id)
+    if not dataset.has_owner(user):
+        return responses.response(False, message=_('You are not authorized to edit this exercise.'))
+
+    try:
+        statement_timeout_ms = parse_limit(data.get('statement_timeout_ms'), MAX_STATEMENT_TIMEOUT_MS)
+        lock_timeout_ms = parse_limit(data.get('lock_timeout_ms'), MAX_LOCK_TIMEOUT_MS)
+    except ValueError:
+        return responses.response(False, message=_('Time limits must be whole numbers of milliseconds, between 1 and {statement_max} for statements and between 1 and {lock_max} for locks.').format(
+            statement_max=MAX_STATEMENT_TIMEOUT_MS,
+            lock_max=MAX_LOCK_TIMEOUT_MS,
+        ))
+
+    exercise.set_resource_limits(
+        statement_timeout_ms=statement_timeout_ms,
+        lock_timeout_ms=lock_timeout_ms,
+    )
+
+    return responses.response(True)
+
+
 @bp.route('/init-dataset', methods=['POST'])
 @jwt_required()
 def init_dataset():
@@ -203,19 +236,41 @@ def init_dataset():
         query_goal='BUILTIN',
     )
 
+    database = db.users.get_database(user.username, dataset.dbms)
+
     def generate_results() -> Iterable[str]:
-        database = db.users.get_database(user.username, dataset.dbms)
-        for query_result in database.execute_sql(dataset_str, strip_comments=False):
+        progress = None
+
+        # Only errors are reported individually, together with periodic progress updates
+        for item in database.init_dataset(dataset_str):
+            if isinstance(item, ScriptProgress):
+                progress = item
+                yield json.dumps({
+                    'progress': progress.to_dict(),
+                }) + '\n'  # Important: one JSON object per line
+                continue
+
+            yield json.dumps({
+                'success': item.success,
+                'builtin': True,
+                'query': item.query.query,
+                'type': item.data_type,
+                **responses.result_data(item),
+                'id': None,
+                'notices': item.notices,
+            }) + '\n'
+
+        if progress is not None:
             yield json.dumps({
-                'success': query_result.success,
+                'success': progress.errors == 0,
                 'builtin': True,
-                'query': query_result.query.query,
-                'type': query_result.data_type,
-                'data': query_result.result_html,
+                'query': 'INIT DATASET',
+                'type': 'message',
+                'data': _('Executed {executed} of {total} statements, {errors} failed.').format(**progress.to_dict()),
                 'id': None,
-            }) + '\n'  # Important: one JSON object per line
+            }) + '\n'
 
-    return responses.streaming_response(generate_results())
+    return responses.streaming_response(generate_results(), on_close=database.release)
 
 @bp.route('/get/<exercise_id>', methods=['GET'])
 @jwt_required()
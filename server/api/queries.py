@@ -4,21 +4,17 @@ from flask import Blueprint, request
 import json
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_babel import _
-from sqlchecker import detectors, get_errors, build_catalog
 
 from server import db, gamification
 from server.sql.code import SQLCode
-from server.sql.result import QueryResultMessage, QueryResult
+from server.sql.result import QueryResultMessage, QueryResult, QueryResultDataset
+from server.sql.detection import DetectionJob, error_detection
+from server.sql.result.dataset import RESULT_PAGE_SIZE
+from server.sql.result.store import results
 from .util import responses
 from server.db.users.solution import NAME as SOLUTION_NAME
-
-
-DETECTORS = [
-    detectors.SyntaxErrorDetector,
-    detectors.SemanticErrorDetector,
-    detectors.LogicalErrorDetector,
-    detectors.ComplicationDetector,
-]
+from server.db.users.connection import MAX_RESULT_ROWS
+from server.db.users.governor import ResourceLimits
 
 bp = Blueprint('query', __name__)
 
@@ -34,6 +30,7 @@ def run_query():
 
     data = request.get_json()
     query_str = data['query_str']
+    max_rows = parse_max_rows(data.get('max_rows'))
     excercise = db.admin.Exercise(data['exercise_id'])
     dataset = db.admin.Dataset(excercise.dataset_id)
 
@@ -80,6 +77,8 @@ def run_query():
     user.add_rewards(rewards=rewards, badges=badges)
     exercise_solutions = excercise.solutions
     exercise_search_path = db.admin.Dataset(excercise.dataset_id).search_path
+    database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
+    database.limits = ResourceLimits.from_values(*excercise.get_resource_limits())
     
     def generate_results():
         yield json.dumps({
@@ -87,11 +86,10 @@ def run_query():
             'badges': [badge.to_dict() for badge in badges],
         }) + '\n'  # Important: one JSON object per line
 
-        database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-        for query_result in database.execute_sql(query_str=query_str):
+        for query_result in database.execute_sql(query_str=query_str, max_rows=max_rows):
             search_path = database.get_search_path()
 
-            query = db.admin.Query.log(
+            query_log = db.admin.QueryLog(
                 query_batch=batch,
                 sql_string=query_result.query.query,
                 search_path=search_path,
@@ -100,53 +98,102 @@ def run_query():
                 query_type=query_result.query.query_type,
                 query_goal=query_result.query.query_goal
             )
-            query_result.query_id = query.query_id
 
-            context_columns = database.get_columns()
-            context_unique_columns = database.get_unique_columns()
+            log_dataset(query_log, query_result)
 
-            # Log context and errors for SELECT queries
+            # Log context and detect errors for SELECT queries
+            detection_job = None
             if query_result.query.query_type == 'SELECT':
-                query.log_context(
-                    columns=context_columns,
-                    unique_columns=context_unique_columns
-                )
+                metadata = database.get_schema_metadata()
 
-                user_catalog = build_catalog(
-                    columns_info=context_columns,
-                    unique_constraints_info=context_unique_columns
+                query_log.context(
+                    columns=metadata.columns,
+                    unique_columns=metadata.unique_columns
                 )
 
-                system_catalog = database.get_system_catalog()
-                system_search_path = database.get_system_search_path()
-
-                catalog = user_catalog.merge(system_catalog)
-
-                errors = get_errors(
+                detection_job = DetectionJob(
                     query_str=query_result.query.query,
                     solutions=exercise_solutions,
-                    catalog=catalog,
-                    search_path=f'{system_search_path}{search_path}',
+                    search_path=search_path,
                     solution_search_path=exercise_search_path,
                     dialect=dataset.dbms,
-                    detectors=DETECTORS,
-                    debug=False,
+                    columns=metadata.columns,
+                    unique_columns=metadata.unique_columns,
                 )
-                print(flush=True)   # Ensure all debug output is flushed
 
-                query.log_errors(errors)
+            # Everything is logged at once
+            query = query_log.flush()
+            query_result.query_id = query.query_id
+
+            # Errors are only logged: they are detected in the background, without delaying the result
+            if detection_job is not None:
+                error_detection.submit(detection_job, query.log_detected_errors)
+
+            # Large results are sent in pages, the following ones are requested by query id
+            paged = (
+                isinstance(query_result, QueryResultDataset)
+                and query_result.row_count() > RESULT_PAGE_SIZE
+                and results.put(query.query_id, user.username, query_result)
+            )
 
             yield json.dumps({
                 'success': query_result.success,
                 'builtin': False,
                 'query': query_result.query.query,
                 'type': query_result.data_type,
-                'data': query_result.result_html,
+                **responses.result_data(query_result, paged=paged),
                 'id': query.query_id,
                 'notices': query_result.notices,
+                'truncated': isinstance(query_result, QueryResultDataset) and query_result.truncated,
+                'total_rows': query_result.total_rows if isinstance(query_result, QueryResultDataset) else None,
+                'elapsed_ms': query_result.elapsed_ms,
             }) + '\n'  # Important: one JSON object per line
 
-    return responses.streaming_response(generate_results())
+    return responses.streaming_response(generate_results(), on_close=database.release)
+
+
+@bp.route('/<int:query_id>/rows', methods=['GET'])
+@jwt_required()
+def get_result_rows(query_id: int):
+    '''
+    Return a page of the result of a query, in columnar form.
+    Only large results run by the same user are available, for a limited time (see `server.sql.result.store`).
+    '''
+    user = db.admin.User(get_jwt_identity())
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', RESULT_PAGE_SIZE, type=int), 1), MAX_RESULT_ROWS)
+
+    result = results.get(query_id, user.username)
+    if result is None:
+        return responses.response(False, message=_('This result is no longer available. Run the query again to see all its rows.'))
+
+    return responses.response(True, **result.result_page(offset, limit))
+
+
+def parse_max_rows(value) -> int:
+    '''Number of rows to return for each query, as requested by the client. Invalid values fall back to the maximum.'''
+
+    try:
+        max_rows = int(value)
+    except (TypeError, ValueError):
+        return MAX_RESULT_ROWS
+
+    return min(max(max_rows, 1), MAX_RESULT_ROWS)
+
+
+def log_dataset(query_log: db.admin.QueryLog, result: QueryResult) -> None:
+    '''
+    Datasets are logged as a summary (`result_text`): log their number of rows and hash too.
+    Their full text is only generated if results are archived.
+    '''
+
+    if isinstance(result, QueryResultDataset):
+        query_log.dataset(
+            rows=result.total_rows,
+            content_hash=result.content_hash,
+            full_result=lambda: result.result_csv,
+        )
 
 
 def log_builtin_query(user: db.admin.User, exercise: db.admin.Exercise, result: QueryResult) -> int:
@@ -182,8 +229,11 @@ def show_search_path():
     dataset = db.admin.Dataset(exercise.dataset_id)
     
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    result = database.builtin_show_search_path()
-    result = next(iter(result))
+    try:
+        result = database.builtin_show_search_path()
+        result = next(iter(result))
+    finally:
+        database.release()
     result.query_id = log_builtin_query(user, exercise, result)
 
     return responses.response_query(result, is_builtin=True)
@@ -197,8 +247,11 @@ def list_schemas():
     dataset = db.admin.Dataset(exercise.dataset_id)
 
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    result = database.builtin_list_schemas()
-    result = next(iter(result))
+    try:
+        result = database.builtin_list_schemas()
+        result = next(iter(result))
+    finally:
+        database.release()
     result.query_id = log_builtin_query(user, exercise, result)
 
     return responses.response_query(result, is_builtin=True)
@@ -213,8 +266,11 @@ def list_tables():
     dataset = db.admin.Dataset(exercise.dataset_id)
 
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    result = database.builtin_list_tables()
-    result = next(iter(result))
+    try:
+        result = database.builtin_list_tables()
+        result = next(iter(result))
+    finally:
+        database.release()
     result.query_id = log_builtin_query(user, exercise, result)
 
     return responses.response_query(result, is_builtin=True)
@@ -229,8 +285,11 @@ def describe_tables():
     dataset = db.admin.Dataset(exercise.dataset_id)
 
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    result = database.builtin_describe_tables()
-    result = next(iter(result))
+    try:
+        result = database.builtin_describe_tables()
+        result = next(iter(result))
+    finally:
+        database.release()
     result.query_id = log_builtin_query(user, exercise, result)
 
     return responses.response_query(result, is_builtin=True)
@@ -245,8 +304,11 @@ def list_constraints():
     dataset = db.admin.Dataset(exercise.dataset_id)
     
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    result = database.builtin_list_constraints()
-    result = next(iter(result))
+    try:
+        result = database.builtin_list_constraints()
+        result = next(iter(result))
+    finally:
+        database.release()
     result.query_id = log_builtin_query(user, exercise, result)
 
     return responses.response_query(result, is_builtin=True)
@@ -261,8 +323,11 @@ def list_users():
     dataset = db.admin.Dataset(exercise.dataset_id)
     
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    result = database.builtin_list_users()
-    result = next(iter(result))
+    try:
+        result = database.builtin_list_users()
+        result = next(iter(result))
+    finally:
+        database.release()
     result.query_id = log_builtin_query(user, exercise, result)
 
     return responses.response_query(result, is_builtin=True)
@@ -289,7 +354,7 @@ def check_solution():
         )
 
     # Only consider the first query in the submitted SQL string
-    all_queries = SQLCode(query_str).split()
+    all_queries = SQLCode(query_str, dialect=dataset.dbms).split()
     query = next(iter(all_queries), None)
 
     if query is None:
@@ -300,15 +365,26 @@ def check_solution():
         )
 
     database = db.users.get_database(dbname=user.username, dbms=dataset.dbms)
-    search_path = database.get_search_path()
-    check = database.check_query_solution(query_user=query, query_solutions=exercise.solutions, solution_search_path=dataset.search_path)
+    try:
+        database.limits = ResourceLimits.from_values(*exercise.get_resource_limits())
+        search_path = database.get_search_path()
+        check = database.check_query_solution(
+            query_user=query,
+            query_solutions=exercise.solutions,
+            solution_search_path=dataset.search_path,
+            exercise_id=exercise.exercise_id,
+            dataset_str=dataset.dataset_str,
+        )
+        metadata = database.get_schema_metadata()
+    finally:
+        database.release()
 
     batch = db.admin.QueryBatch.log(
         user=user,
         exercise=exercise
     )
 
-    query = db.admin.Query.log(
+    query_log = db.admin.QueryLog(
         query_batch=batch,
         sql_string=query_str,
         search_path=search_path,
@@ -318,36 +394,28 @@ def check_solution():
         query_goal='CHECK_SOLUTION'
     )
 
-    context_columns = database.get_columns()
-    unique_columns = database.get_unique_columns()
+    log_dataset(query_log, check.result)
 
-    query.log_context(
-        columns=context_columns,
-        unique_columns=unique_columns
+    query_log.context(
+        columns=metadata.columns,
+        unique_columns=metadata.unique_columns
     )
 
-    catalog = build_catalog(
-        columns_info=context_columns,
-        unique_constraints_info=unique_columns
-    )
+    # Checked before logging this attempt
+    already_solved = exercise.has_been_solved_by_user(user)
+    
+    query_log.solution_attempt(check.correct == True)
+    logged_query = query_log.flush()
 
-    errors = get_errors(
+    error_detection.submit(DetectionJob(
         query_str=query_str,
         solutions=exercise.solutions,
-        catalog=catalog,
         search_path=search_path,
         solution_search_path=dataset.search_path,
         dialect=dataset.dbms,
-        detectors=DETECTORS,
-        debug=False,
-    )
-    print(flush=True)   # Ensure all debug output is flushed
-
-    query.log_errors(errors)
-
-    already_solved = exercise.has_been_solved_by_user(user)
-    
-    query.log_solution_attempt(check.correct == True)
+        columns=metadata.columns,
+        unique_columns=metadata.unique_columns,
+    ), logged_query.log_detected_errors)
 
     rewards = []
     badges = []
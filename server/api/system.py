@@ -0,0 +1,41 @@
+'''This module handles endpoints reporting the state of the server.'''
+
+from flask import Blueprint
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_babel import _
+
+from server import db
+from server.db.admin.writer import analytics
+from server.db.users import Database
+from server.db.users.scheduler import scheduler
+from server.sql.classification import classifications
+from server.sql.detection import error_detection
+from server.sql.result.solutions import solution_results
+from server.sql.result.store import results
+from .util import responses
+
+bp = Blueprint('system', __name__)
+
+
+@bp.route('/containers', methods=['GET'])
+@jwt_required()
+def get_containers_status():
+    '''Admin endpoint reporting the state of the user database containers and connections.'''
+    user = db.admin.User(get_jwt_identity())
+
+    if not user.is_admin:
+        return responses.response(False, message=_('You do not have permission to perform this action.'))
+
+    return responses.response(True,
+        scheduler=scheduler.status(),
+        containers=Database.containers.stats(),
+        readiness=Database.readiness.stats(),
+        pool=Database.pool.stats(),
+        admission=Database.admission.stats(),
+        classifications=classifications.stats(),
+        schemas=Database.schemas.stats(),
+        analytics=analytics.stats(),
+        error_detection=error_detection.stats(),
+        results=results.stats(),
+        solutions=solution_results.stats(),
+    )
@@ -1,8 +1,9 @@
-from typing import Iterable as _Iterable
+from typing import Iterable as _Iterable, Callable as _Callable
 from flask import jsonify as _jsonify, Response as _Response
 
 from server import gamification
-from server.sql import QueryResult as _QueryResult
+from server.sql import QueryResult as _QueryResult, QueryResultDataset as _QueryResultDataset
+from server.sql.result.dataset import RESULT_HTML_MAX_ROWS as _RESULT_HTML_MAX_ROWS
 
 
 def response(success: bool = True, rewards: list[gamification.Reward] = [], badges: list[gamification.Reward] = [], **kwargs) -> _Response:
@@ -13,6 +14,20 @@ def response(success: bool = True, rewards: list[gamification.Reward] = [], badg
         **kwargs
     })
 
+def result_data(result: _QueryResult, *, paged: bool = False) -> dict:
+    '''
+    Data of a query result.
+    Small datasets are rendered as HTML (`data`), larger ones are sent in columnar form (`columns`, `rows`, ...) with `data` set to None:
+    only their first page if `paged` (the others can be requested by query id), all their rows otherwise.
+    '''
+
+    if not isinstance(result, _QueryResultDataset) or result.row_count() <= _RESULT_HTML_MAX_ROWS:
+        return {'data': result.result_html}
+
+    if paged:
+        return {'data': None, **result.result_page()}
+    return {'data': None, **result.result_page(limit=result.row_count())}
+
 def response_query(
         *results: _QueryResult,
         is_builtin: bool = False,
@@ -25,7 +40,7 @@ def response_query(
             'builtin': is_builtin,
             'query': query.query.query,
             'type': query.data_type,
-            'data': query.result_html,
+            **result_data(query),
             'id': query.query_id,
             'rewards': [reward.to_dict() for reward in rewards],
             'badges': [badge.to_dict() for badge in badges],
@@ -34,7 +49,13 @@ def response_query(
         for query in results
     ])
 
-def streaming_response(data: _Iterable[str]) -> _Response:
-    return _Response(data, content_type='application/x-ndjson')
+def streaming_response(data: _Iterable[str], on_close: _Callable[[], None] | None = None) -> _Response:
+    response = _Response(data, content_type='application/x-ndjson')
+
+    # Runs once the whole stream has been sent (or the client disconnected)
+    if on_close is not None:
+        response.call_on_close(on_close)
+
+    return response
 
 NOT_IMPLEMENTED = 'This feature is not implemented yet. Please check back later.'
@@ -1,5 +1,6 @@
-from .datasets import Dataset
+from .datasets import Dataset, DatasetImage
 from .exercises import Exercise
+from .lab_hours import LabHours
 from .messages import Message
-from .queries import Query, QueryBatch
+from .queries import Query, QueryBatch, QueryClassification, QueryContext, QueryLog, QueryResultArchive
 from .users import User
\ No newline at end of file
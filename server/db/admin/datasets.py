@@ -1,3 +1,4 @@
+import hashlib
 import json
 import random
 from dataclasses import asdict, dataclass
@@ -8,6 +9,7 @@ from sqlscope import Dialect
 
 from .users import User
 from .exercises import Exercise
+from ...sql.result.solutions import solution_results
 
 
 @dataclass(frozen=True)
@@ -387,6 +389,8 @@ class Dataset:
     def update(self, title: str, description: str, dataset_str: str, search_path: str | None = None, dbms: Dialect | None = None) -> None:
         '''Update an existing dataset'''
 
+        previous_dataset_str = self.dataset_str
+
         query = database.sql.SQL(
         '''
             UPDATE {schema}.datasets
@@ -395,7 +399,7 @@ class Dataset:
                 description = {description},
                 dataset = {dataset},
                 search_path = {search_path},
-                dbms = {dbms.value}
+                dbms = {dbms}
             WHERE id = {dataset_id}
         ''').format(
             schema=database.sql.Identifier(SCHEMA),
@@ -416,6 +420,36 @@ class Dataset:
             'dbms': dbms.value if dbms else None,
         })
 
+        self._dataset_str = dataset_str.strip()
+        if self._dataset_str != previous_dataset_str:
+            DatasetImage.delete_script(previous_dataset_str)
+
+        # Solution results depend on the dataset, including its search path and DBMS
+        solution_results.invalidate(dataset_str=previous_dataset_str)
+
+    def set_resource_limits(self, statement_timeout_ms: int | None, lock_timeout_ms: int | None) -> None:
+        '''Set the limits for queries run in this dataset. None means the server default is used.'''
+
+        query = database.sql.SQL(
+        '''
+            UPDATE {schema}.datasets
+            SET
+                statement_timeout_ms = {statement_timeout_ms},
+                lock_timeout_ms = {lock_timeout_ms}
+            WHERE id = {dataset_id}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            statement_timeout_ms=database.sql.Placeholder('statement_timeout_ms'),
+            lock_timeout_ms=database.sql.Placeholder('lock_timeout_ms'),
+            dataset_id=database.sql.Placeholder('dataset_id')
+        )
+
+        db.execute(query, {
+            'statement_timeout_ms': statement_timeout_ms,
+            'lock_timeout_ms': lock_timeout_ms,
+            'dataset_id': self.dataset_id
+        })
+
     def delete(self) -> None:
         '''Delete a dataset by its ID'''
 
@@ -809,3 +843,88 @@ class Dataset:
             ) for row in result
         ]
     # endregion
+
+
+class DatasetImage:
+    '''Prepared image of a dataset script, for a given DBMS. Images are keyed by the hash of the script, so that datasets sharing the same script share the same image.'''
+
+    def __init__(self, script_hash: str, dbms: str) -> None:
+        self.script_hash = script_hash
+        self.dbms = dbms
+
+    @staticmethod
+    def hash_script(dataset_str: str) -> str:
+        '''Hash identifying a dataset script.'''
+
+        return hashlib.sha256(dataset_str.strip().encode()).hexdigest()
+
+    def get(self) -> bytes | None:
+        '''
+            Get the image.
+
+            Returns:
+                bytes | None: The image, empty if the script cannot be prepared as an image, or None if the image has not been built yet.
+        '''
+
+        query = database.sql.SQL(
+        '''
+            SELECT image
+            FROM {schema}.dataset_images
+            WHERE
+                script_hash = {script_hash}
+                AND dbms = {dbms}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            script_hash=database.sql.Placeholder('script_hash'),
+            dbms=database.sql.Placeholder('dbms'),
+        )
+
+        result = db.execute_and_fetch(query, {
+            'script_hash': self.script_hash,
+            'dbms': self.dbms,
+        })
+
+        if len(result) == 0:
+            return None
+        return bytes(result[0][0])
+
+    def save(self, image: bytes) -> None:
+        '''Store the image, replacing any previous one. An empty image marks the script as not preparable.'''
+
+        query = database.sql.SQL(
+        '''
+            INSERT INTO {schema}.dataset_images(script_hash, dbms, image)
+            VALUES ({script_hash}, {dbms}, {image})
+            ON CONFLICT (script_hash, dbms) DO UPDATE
+            SET
+                image = EXCLUDED.image,
+                created_ts = NOW()
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            script_hash=database.sql.Placeholder('script_hash'),
+            dbms=database.sql.Placeholder('dbms'),
+            image=database.sql.Placeholder('image'),
+        )
+
+        db.execute(query, {
+            'script_hash': self.script_hash,
+            'dbms': self.dbms,
+            'image': image,
+        })
+
+    @staticmethod
+    def delete_script(dataset_str: str) -> None:
+        '''Delete the images of a dataset script, for all DBMSs.'''
+
+        query = database.sql.SQL(
+        '''
+            DELETE FROM {schema}.dataset_images
+            WHERE script_hash = {script_hash}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            script_hash=database.sql.Placeholder('script_hash'),
+        )
+
+        db.execute(query, {
+            'script_hash': DatasetImage.hash_script(dataset_str),
+        })
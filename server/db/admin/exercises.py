@@ -4,6 +4,7 @@ from sqlerrors import SqlErrors
 
 from .connection import db, SCHEMA
 from .users import User
+from ...sql.result.solutions import solution_results
 
 class Exercise:
     '''Class for managing exercises'''
@@ -255,6 +256,63 @@ class Exercise:
         return '\n\n'.join(row[0] for row in result) if result else None
     # endregion
 
+    # region Resource Limits
+    def get_resource_limits(self) -> tuple[int | None, int | None]:
+        '''
+            Get the limits for queries run in this exercise. Values not set on the exercise are taken from its dataset.
+
+            Returns:
+                tuple[int | None, int | None]: Statement timeout and lock timeout, in milliseconds. None if not set.
+        '''
+
+        query = database.sql.SQL(
+        '''
+            SELECT
+                COALESCE(e.statement_timeout_ms, d.statement_timeout_ms),
+                COALESCE(e.lock_timeout_ms, d.lock_timeout_ms)
+            FROM
+                {schema}.exercises e
+                JOIN {schema}.datasets d ON d.id = e.dataset_id
+            WHERE
+                e.id = {exercise_id}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            exercise_id=database.sql.Placeholder('exercise_id')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'exercise_id': self.exercise_id
+        })
+
+        if len(result) == 0:
+            return None, None
+
+        return result[0][0], result[0][1]
+
+    def set_resource_limits(self, statement_timeout_ms: int | None, lock_timeout_ms: int | None) -> None:
+        '''Set the limits for queries run in this exercise. None means the dataset value is used.'''
+
+        query = database.sql.SQL(
+        '''
+            UPDATE {schema}.exercises
+            SET
+                statement_timeout_ms = {statement_timeout_ms},
+                lock_timeout_ms = {lock_timeout_ms}
+            WHERE id = {exercise_id}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            statement_timeout_ms=database.sql.Placeholder('statement_timeout_ms'),
+            lock_timeout_ms=database.sql.Placeholder('lock_timeout_ms'),
+            exercise_id=database.sql.Placeholder('exercise_id')
+        )
+
+        db.execute(query, {
+            'statement_timeout_ms': statement_timeout_ms,
+            'lock_timeout_ms': lock_timeout_ms,
+            'exercise_id': self.exercise_id
+        })
+    # endregion
+
     # region CRUD Operations
     def _load_properties(self) -> None:
         # NOTE: since we usually access multiple properties at once, we load them all together
@@ -352,6 +410,9 @@ class Exercise:
             'exercise_id': self.exercise_id
         })
 
+        # Results of the previous solutions must not be used to check queries
+        solution_results.invalidate(exercise_id=self.exercise_id)
+
     def delete(self) -> bool:
         '''Delete an exercise'''
 
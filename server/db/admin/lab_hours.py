@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from dav_tools import database
+from .connection import db, SCHEMA
+from sqlscope import Dialect
+
+
+class LabHours:
+    '''Scheduled lab sessions, during which many students use the platform at the same time.'''
+
+    @staticmethod
+    def get_next_session(within: timedelta) -> tuple[datetime, datetime, str | None] | None:
+        '''
+            Get the lab session which is currently running or starts within the given interval.
+
+            Args:
+                within (timedelta): How far in the future to look for sessions.
+
+            Returns:
+                tuple[datetime, datetime, str | None] | None: The start time, end time and name of the session, or None if there is no such session.
+        '''
+
+        query = database.sql.SQL(
+        '''
+            SELECT start_ts, end_ts, lab_name
+            FROM {schema}.lab_hours
+            WHERE
+                end_ts > NOW()
+                AND start_ts <= NOW() + {within}
+            ORDER BY start_ts
+            LIMIT 1
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            within=database.sql.Placeholder('within')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'within': within
+        })
+
+        if len(result) == 0:
+            return None
+
+        return result[0][0], result[0][1], result[0][2]
+
+    @staticmethod
+    def get_prewarm_candidates(limit: int) -> list[tuple[str, Dialect]]:
+        '''
+            Get the students whose database should be ready before a lab session.
+            Students are members of active datasets, most recently active first.
+
+            Args:
+                limit (int): Maximum number of students to return.
+
+            Returns:
+                list[tuple[str, Dialect]]: Username and DBMS of each database to pre-warm.
+        '''
+
+        query = database.sql.SQL(
+        '''
+            SELECT
+                dm.username,
+                d.dbms,
+                MAX(qb.ts) AS last_activity
+            FROM {schema}.dataset_members dm
+                JOIN {schema}.datasets d ON d.id = dm.dataset_id
+                JOIN {schema}.users u ON u.username = dm.username
+                LEFT JOIN {schema}.exercises e ON e.dataset_id = dm.dataset_id
+                LEFT JOIN {schema}.query_batches qb ON qb.exercise_id = e.id AND qb.username = dm.username
+            WHERE
+                dm.is_active
+                AND NOT dm.is_owner
+                AND u.is_active
+            GROUP BY dm.username, d.dbms
+            ORDER BY last_activity DESC NULLS LAST
+            LIMIT {limit}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            limit=database.sql.Placeholder('limit')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'limit': limit
+        })
+
+        return [
+            (row[0], Dialect(row[1]) if row[1] else Dialect.POSTGRES)
+            for row in result
+        ]
@@ -1,3 +1,5 @@
+from datetime import timedelta
+from typing import Callable
 from dav_tools import database
 from sqlchecker import DetectedError, SqlErrors
 from sqlscope.catalog import CatalogColumnInfo, CatalogUniqueConstraintInfo
@@ -5,6 +7,18 @@ from sqlscope.catalog import CatalogColumnInfo, CatalogUniqueConstraintInfo
 from .connection import db, SCHEMA
 from .users import User
 from .exercises import Exercise
+from .writer import analytics
+
+import base64
+import hashlib
+import json
+import zlib
+import os
+
+RESULT_ARCHIVE_ENABLED = os.getenv('RESULT_ARCHIVE_ENABLED', 'False').lower() == 'true'
+'''Whether the full results of datasets are archived, compressed, in `query_results`. Otherwise, only their summary is logged.'''
+RESULT_ARCHIVE_RETENTION_DAYS = int(os.getenv('RESULT_ARCHIVE_RETENTION_DAYS', '30'))
+'''Archived results older than this many days are deleted. If 0, they are kept forever.'''
 
 class QueryBatch:
     '''Class for logging and retrieving query batches.'''
@@ -75,6 +89,31 @@ class QueryBatch:
         batch_id = result[0][0]
         return QueryBatch(batch_id, user=user, exercise=exercise)
 
+    @staticmethod
+    def get_idle_seconds(within: timedelta) -> dict[str, float]:
+        '''
+            Get how long ago each user ran their last query batch, for users active within the given interval.
+            Query batches are logged by all server processes, so this is the activity of the whole deployment.
+        '''
+
+        query = database.sql.SQL('''
+            SELECT
+                username,
+                EXTRACT(EPOCH FROM NOW() - MAX(ts))
+            FROM {schema}.query_batches
+            WHERE ts > NOW() - {within}
+            GROUP BY username
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            within=database.sql.Placeholder('within')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'within': within
+        })
+
+        return { username: float(idle_seconds) for username, idle_seconds in result }
+
 class Query:
     '''Class for logging and retrieving user queries.'''
 
@@ -195,7 +234,7 @@ class Query:
 
     @property
     def result(self) -> str:
-        '''Get the result string associated with this query.'''
+        '''Get the result string associated with this query. Datasets are only summarised, their full result may be in `QueryResultArchive`.'''
 
         if self._result is None:
             query = database.sql.SQL('''
@@ -212,6 +251,26 @@ class Query:
             self._result = result[0][0]
 
         return self._result
+
+    @property
+    def context_id(self) -> int | None:
+        '''Get the id of the context logged for this query, if any.'''
+
+        query = database.sql.SQL('''
+            SELECT context_id
+            FROM {schema}.queries
+            WHERE id = {query_id}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            query_id=database.sql.Placeholder('query_id')
+        )
+        result = db.execute_and_fetch(query, {
+            'query_id': self.query_id
+        })
+
+        if len(result) == 0:
+            return None
+        return result[0][0]
     # endregion
 
     # region Logging
@@ -224,29 +283,18 @@ class Query:
             result: str,
             query_type: str,
             query_goal: str) -> 'Query':
-        '''Log a new query with its result and success status.'''
-
-        res = db.insert(SCHEMA, 'queries', {
-            'batch_id': query_batch.batch_id,
-            'query': sql_string,
-            'search_path': search_path,
-            'success': success,
-            'result': result,
-            'query_type': query_type,
-            'query_goal': query_goal,
-        }, ['id'])
+        '''Log a new query with its result and success status. To also log its context and errors, use `QueryLog`.'''
+
+        return QueryLog(
+            query_batch=query_batch,
+            sql_string=sql_string,
+            search_path=search_path,
+            success=success,
+            result=result,
+            query_type=query_type,
+            query_goal=query_goal,
+        ).flush()
 
-        assert res is not None and len(res) == 1 and len(res[0]) == 1, 'Failed to log query.'
-
-        query_id = int(res[0][0])
-        query = Query(query_id, sql_string=sql_string, search_path=search_path, query_batch=query_batch)
-
-        # Log in unique queries table
-        if query_type != 'BUILTIN':
-            query.log_uniqueness()
-
-        return query
-    
     def log_uniqueness(self) -> None:
         '''Log the query as a unique query for the user.'''
 
@@ -278,6 +326,17 @@ class Query:
                 'details': [str(v) for v in error.data]
             })
 
+    def log_detected_errors(self, errors: list[tuple[int, list[str]]]) -> None:
+        '''Log errors detected after the query was logged, as `(error_id, details)`. They are written in the background, see `writer.analytics`.'''
+
+        if len(errors) == 0:
+            return
+
+        analytics.submit(QueryLog._write_analytics, (self.query_id, None, [], [], [
+            {'error_id': error_id, 'details': details}
+            for error_id, details in errors
+        ]))
+
     @staticmethod
     def is_new(query_str: str, user: User) -> bool:
         '''Check if a query is new for the user.'''
@@ -301,48 +360,440 @@ class Query:
         return result[0][0] == 0
 
     def log_context(self, columns: list[CatalogColumnInfo], unique_columns: list[CatalogUniqueConstraintInfo]) -> None:
-        '''Log context for a query.'''
+        '''Log context for a query. Each distinct context is stored only once, see `QueryContext`.'''
 
-        for column in columns:
-            db.insert(SCHEMA, 'query_context_columns', {
-                'query_id': self.query_id,
-                'schema_name': column.schema_name,
-                'table_name': column.table_name,
-                'column_name': column.column_name,
-                'column_type': column.column_type,
-                'numeric_precision': column.numeric_precision,
-                'numeric_scale': column.numeric_scale,
-                'is_nullable': bool(column.is_nullable),
-                'foreign_key_schema': column.foreign_key_schema,
-                'foreign_key_table': column.foreign_key_table,
-                'foreign_key_column': column.foreign_key_column,
-            })
+        context_hash = QueryContext.hash_context(columns, unique_columns)
 
-        for column in unique_columns:
-            db.insert(SCHEMA, 'query_context_columns_unique', {
-                'query_id': self.query_id,
-                'schema_name': column.schema_name,
-                'table_name': column.table_name,
-                'constraint_type': column.constraint_type,
-                'columns': column.columns,
-            })
+        if self._link_context(context_hash):
+            return
+
+        # First time this context is seen
+        QueryContext.log(context_hash, columns, unique_columns)
+        self._link_context(context_hash)
+
+    def _link_context(self, context_hash: str) -> bool:
+        '''Link the query to a stored context. Returns False if the context has not been stored yet.'''
+
+        statement = database.sql.SQL('''
+            UPDATE {schema}.queries
+            SET context_id = (
+                SELECT id
+                FROM {schema}.query_contexts
+                WHERE context_hash = {context_hash}
+            )
+            WHERE id = {query_id}
+            RETURNING context_id
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            context_hash=database.sql.Placeholder('context_hash'),
+            query_id=database.sql.Placeholder('query_id')
+        )
+
+        result = db.execute_and_fetch(statement, {
+            'context_hash': context_hash,
+            'query_id': self.query_id
+        })
+
+        return len(result) > 0 and result[0][0] is not None
 
     def get_context(self) -> tuple[list[CatalogColumnInfo], list[CatalogUniqueConstraintInfo]]:
         '''Get context for a query.'''
 
+        context_id = self.context_id
+        if context_id is None:
+            return [], []
+
+        return QueryContext(context_id).get()
+
+    def log_solution_attempt(self, is_correct: bool) -> None:
+        '''Log a solution attempt for an exercise'''
+
+        db.insert(SCHEMA, 'exercise_solutions', {
+            'id': self.query_id,
+            'is_correct': is_correct,
+        })
+
+
+class QueryLog:
+    '''
+        Unit of work collecting everything logged for a query: the query itself, its context, its errors and the solution attempt.
+        `flush` writes all of them with a single statement, i.e. in a single round-trip and transaction.
+    '''
+
+    def __init__(self, *,
+                 query_batch: QueryBatch,
+                 sql_string: str,
+                 search_path: str,
+                 success: bool,
+                 result: str,
+                 query_type: str,
+                 query_goal: str) -> None:
+        self.query_batch = query_batch
+        self.sql_string = sql_string
+        self.search_path = search_path
+        self.success = success
+        self.result = result
+        self.query_type = query_type
+        self.query_goal = query_goal
+
+        self._columns: list[CatalogColumnInfo] = []
+        self._unique_columns: list[CatalogUniqueConstraintInfo] = []
+        self._context_hash: str | None = None
+        self._errors: list[DetectedError] = []
+        self._is_correct: bool | None = None
+        self._result_rows: int | None = None
+        self._result_hash: str | None = None
+        self._full_result: Callable[[], str] | None = None
+
+    def dataset(self, rows: int, content_hash: str, full_result: Callable[[], str] | None = None) -> 'QueryLog':
+        '''
+            Log the number of rows and the hash of the dataset returned by the query, whose `result` is only a summary.
+            `full_result` returns the full text of the dataset, which is archived if enabled (see `QueryResultArchive`).
+        '''
+
+        self._result_rows = rows
+        self._result_hash = content_hash
+        self._full_result = full_result
+        return self
+
+    def context(self, columns: list[CatalogColumnInfo], unique_columns: list[CatalogUniqueConstraintInfo]) -> 'QueryLog':
+        '''Log the context of the query. Each distinct context is stored only once, see `QueryContext`.'''
+
+        self._columns = columns
+        self._unique_columns = unique_columns
+        self._context_hash = QueryContext.hash_context(columns, unique_columns)
+        return self
+
+    def errors(self, errors: list[DetectedError]) -> 'QueryLog':
+        '''Log the errors detected in the query.'''
+
+        self._errors = errors
+        return self
+
+    def solution_attempt(self, is_correct: bool) -> 'QueryLog':
+        '''Log the query as a solution attempt for its exercise.'''
+
+        self._is_correct = is_correct
+        return self
+
+    def flush(self) -> Query:
+        '''
+            Write everything collected so far.
+            The query itself is written immediately, since its id is needed by the response.
+            Its context and errors are only used for analytics, and are written in the background (see `writer.analytics`).
+        '''
+
+        deferred = analytics.enabled and (self._context_hash is not None or len(self._errors) > 0)
+        if deferred:
+            context_hash, columns, unique_columns, errors = None, [], [], []
+        else:
+            context_hash, columns, unique_columns, errors = self._context_hash, self._columns, self._unique_columns, self._errors
+
+        statement = database.sql.SQL('WITH ' + _STORE_CONTEXT + '''
+            , query AS (
+                INSERT INTO {schema}.queries (batch_id, query, search_path, success, result, result_rows, result_hash, query_type, query_goal, context_id)
+                VALUES (
+                    {batch_id}, {sql_string}, {search_path}, {success}, {result}, {result_rows}, {result_hash}, {query_type}, {query_goal},
+                    COALESCE(
+                        (SELECT id FROM context),
+                        (SELECT id FROM {schema}.query_contexts WHERE context_hash = {context_hash})
+                    )
+                )
+                RETURNING id
+            ), unique_query AS (
+                INSERT INTO {schema}.user_unique_queries (username, query_hash)
+                SELECT {username}, MD5({sql_string})
+                WHERE {log_uniqueness}
+                ON CONFLICT (username, query_hash) DO NOTHING
+            ), errors AS (
+                INSERT INTO {schema}.has_error (query_id, error_id, details)
+                SELECT query.id, e.error_id, e.details
+                FROM query, jsonb_to_recordset({errors}::jsonb) AS e(error_id INTEGER, details TEXT[])
+            ), solution_attempt AS (
+                INSERT INTO {schema}.exercise_solutions (id, is_correct)
+                SELECT query.id, {is_correct}
+                FROM query
+                WHERE {log_solution_attempt}
+            )
+            SELECT id FROM query
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            context_hash=database.sql.Placeholder('context_hash'),
+            columns=database.sql.Placeholder('columns'),
+            unique_columns=database.sql.Placeholder('unique_columns'),
+            batch_id=database.sql.Placeholder('batch_id'),
+            sql_string=database.sql.Placeholder('sql_string'),
+            search_path=database.sql.Placeholder('search_path'),
+            success=database.sql.Placeholder('success'),
+            result=database.sql.Placeholder('result'),
+            result_rows=database.sql.Placeholder('result_rows'),
+            result_hash=database.sql.Placeholder('result_hash'),
+            query_type=database.sql.Placeholder('query_type'),
+            query_goal=database.sql.Placeholder('query_goal'),
+            username=database.sql.Placeholder('username'),
+            log_uniqueness=database.sql.Placeholder('log_uniqueness'),
+            errors=database.sql.Placeholder('errors'),
+            is_correct=database.sql.Placeholder('is_correct'),
+            log_solution_attempt=database.sql.Placeholder('log_solution_attempt')
+        )
+
+        result = db.execute_and_fetch(statement, {
+            **QueryContext._params(context_hash, columns, unique_columns),
+            'batch_id': self.query_batch.batch_id,
+            'sql_string': self.sql_string,
+            'search_path': self.search_path,
+            'success': self.success,
+            'result': self.result,
+            'result_rows': self._result_rows,
+            'result_hash': self._result_hash,
+            'query_type': self.query_type,
+            'query_goal': self.query_goal,
+            'username': self.query_batch.user.username,
+            'log_uniqueness': self.query_type != 'BUILTIN',
+            'errors': json.dumps(_error_rows(errors)),
+            'is_correct': self._is_correct,
+            'log_solution_attempt': self._is_correct is not None,
+        })
+
+        assert len(result) == 1, 'Failed to log query.'
+        query_id = int(result[0][0])
+
+        if self._full_result is not None and RESULT_ARCHIVE_ENABLED:
+            analytics.submit(QueryResultArchive._write, (query_id, self._full_result))
+
+        if deferred:
+            analytics.submit(QueryLog._write_analytics, (query_id, self._context_hash, self._columns, self._unique_columns, _error_rows(self._errors)))
+
+        return Query(
+            query_id,
+            sql_string=self.sql_string,
+            search_path=self.search_path,
+            query_batch=self.query_batch,
+            result=self.result,
+            errors=self._errors,
+        )
+
+    @staticmethod
+    def _write_analytics(items: list[tuple[int, str | None, list[CatalogColumnInfo], list[CatalogUniqueConstraintInfo], list[dict]]]) -> None:
+        '''
+            Write the contexts and errors of a batch of queries, as `(query_id, context_hash, columns, unique_columns, error_rows)`.
+            Each distinct context is written once, together with the links of all its queries.
+        '''
+
+        contexts: dict[str, tuple[list[int], list[CatalogColumnInfo], list[CatalogUniqueConstraintInfo]]] = {}
+        errors = []
+        for query_id, context_hash, columns, unique_columns, error_rows in items:
+            if context_hash is not None:
+                contexts.setdefault(context_hash, ([], columns, unique_columns))[0].append(query_id)
+            errors.extend({'query_id': query_id, **row} for row in error_rows)
+
+        link_context = database.sql.SQL('WITH ' + _STORE_CONTEXT + '''
+            UPDATE {schema}.queries
+            SET context_id = COALESCE(
+                (SELECT id FROM context),
+                (SELECT id FROM {schema}.query_contexts WHERE context_hash = {context_hash})
+            )
+            WHERE id = ANY({query_ids})
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            context_hash=database.sql.Placeholder('context_hash'),
+            columns=database.sql.Placeholder('columns'),
+            unique_columns=database.sql.Placeholder('unique_columns'),
+            query_ids=database.sql.Placeholder('query_ids')
+        )
+
+        for context_hash, (query_ids, columns, unique_columns) in contexts.items():
+            db.execute(link_context, {
+                **QueryContext._params(context_hash, columns, unique_columns),
+                'query_ids': query_ids,
+            })
+
+        if len(errors) == 0:
+            return
+
+        insert_errors = database.sql.SQL('''
+            INSERT INTO {schema}.has_error (query_id, error_id, details)
+            SELECT e.query_id, e.error_id, e.details
+            FROM jsonb_to_recordset({errors}::jsonb) AS e(query_id INTEGER, error_id INTEGER, details TEXT[])
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            errors=database.sql.Placeholder('errors')
+        )
+
+        db.execute(insert_errors, {
+            'errors': json.dumps(errors),
+        })
+
+
+class QueryClassification:
+    '''Classifications (type and goal) of queries, shared by all server processes. Keyed by the hash of the normalised query.'''
+
+    @staticmethod
+    def get(query_hash: str) -> tuple[str, str] | None:
+        '''Get the type and goal of a query, or None if it has not been classified yet.'''
+
+        statement = database.sql.SQL('''
+            SELECT query_type, query_goal
+            FROM {schema}.query_classifications
+            WHERE query_hash = {query_hash}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            query_hash=database.sql.Placeholder('query_hash')
+        )
+
+        result = db.execute_and_fetch(statement, {
+            'query_hash': query_hash
+        })
+
+        if len(result) == 0:
+            return None
+        return result[0][0], result[0][1]
+
+    @staticmethod
+    def save(query_hash: str, query_type: str, query_goal: str) -> None:
+        '''Store the type and goal of a query, replacing any previous classification.'''
+
+        statement = database.sql.SQL('''
+            INSERT INTO {schema}.query_classifications (query_hash, query_type, query_goal)
+            VALUES ({query_hash}, {query_type}, {query_goal})
+            ON CONFLICT (query_hash) DO UPDATE
+            SET
+                query_type = EXCLUDED.query_type,
+                query_goal = EXCLUDED.query_goal
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            query_hash=database.sql.Placeholder('query_hash'),
+            query_type=database.sql.Placeholder('query_type'),
+            query_goal=database.sql.Placeholder('query_goal')
+        )
+
+        db.execute(statement, {
+            'query_hash': query_hash,
+            'query_type': query_type,
+            'query_goal': query_goal,
+        })
+
+
+# Common table expressions storing a context, unless its hash is NULL or it has already been stored.
+# `context` contains the id of the new context, if it was stored.
+_STORE_CONTEXT = '''
+    context AS (
+        INSERT INTO {schema}.query_contexts (context_hash)
+        SELECT {context_hash}
+        WHERE {context_hash} IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1
+            FROM {schema}.query_contexts
+            WHERE context_hash = {context_hash}
+        )
+        ON CONFLICT (context_hash) DO NOTHING
+        RETURNING id
+    ), context_columns AS (
+        INSERT INTO {schema}.query_context_columns (
+            context_id, schema_name, table_name, column_name, column_type,
+            numeric_precision, numeric_scale, is_nullable,
+            foreign_key_schema, foreign_key_table, foreign_key_column
+        )
+        SELECT
+            context.id, c.schema_name, c.table_name, c.column_name, c.column_type,
+            c.numeric_precision, c.numeric_scale, c.is_nullable,
+            c.foreign_key_schema, c.foreign_key_table, c.foreign_key_column
+        FROM context, jsonb_to_recordset({columns}::jsonb) AS c(
+            schema_name TEXT, table_name TEXT, column_name TEXT, column_type TEXT,
+            numeric_precision INTEGER, numeric_scale INTEGER, is_nullable BOOLEAN,
+            foreign_key_schema TEXT, foreign_key_table TEXT, foreign_key_column TEXT
+        )
+        ON CONFLICT DO NOTHING
+    ), context_unique_columns AS (
+        INSERT INTO {schema}.query_context_columns_unique (context_id, schema_name, table_name, constraint_type, columns)
+        SELECT context.id, u.schema_name, u.table_name, u.constraint_type, u.columns
+        FROM context, jsonb_to_recordset({unique_columns}::jsonb) AS u(
+            schema_name TEXT, table_name TEXT, constraint_type TEXT, columns TEXT[]
+        )
+    )
+'''
+
+
+class QueryContext:
+    '''
+        Schema context (columns and unique constraints) in which queries were run.
+        Users run many queries on the same schemas: each distinct context is stored once, keyed by the hash of its content,
+        and queries link to it (see `Query.log_context`).
+    '''
+
+    def __init__(self, context_id: int) -> None:
+        self.context_id = context_id
+
+    @staticmethod
+    def hash_context(columns: list[CatalogColumnInfo], unique_columns: list[CatalogUniqueConstraintInfo]) -> str:
+        '''
+            Hash of a context, independent of the order of its columns and constraints.
+            Must match the hash computed by `db_admin/migration/query_contexts.sql` for existing contexts.
+        '''
+
+        column_rows = sorted(
+            _context_row(
+                column.schema_name, column.table_name, column.column_name, column.column_type,
+                column.numeric_precision, column.numeric_scale, bool(column.is_nullable),
+                column.foreign_key_schema, column.foreign_key_table, column.foreign_key_column,
+            )
+            for column in columns
+        )
+        unique_rows = sorted(
+            _context_row(constraint.schema_name, constraint.table_name, constraint.constraint_type, _array_text(constraint.columns))
+            for constraint in unique_columns
+        )
+
+        content = '\n'.join(column_rows) + '\n\n' + '\n'.join(unique_rows)
+        return hashlib.md5(content.encode()).hexdigest()
+
+    @staticmethod
+    def log(context_hash: str, columns: list[CatalogColumnInfo], unique_columns: list[CatalogUniqueConstraintInfo]) -> None:
+        '''Store a context, unless it has already been stored. The context and all its rows are inserted by a single statement.'''
+
+        statement = database.sql.SQL('WITH ' + _STORE_CONTEXT + '''
+            SELECT id FROM context
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            context_hash=database.sql.Placeholder('context_hash'),
+            columns=database.sql.Placeholder('columns'),
+            unique_columns=database.sql.Placeholder('unique_columns')
+        )
+
+        db.execute(statement, QueryContext._params(context_hash, columns, unique_columns))
+
+    @staticmethod
+    def _params(context_hash: str | None, columns: list[CatalogColumnInfo], unique_columns: list[CatalogUniqueConstraintInfo]) -> dict[str, str | None]:
+        '''Parameters of `_STORE_CONTEXT`.'''
+
+        return {
+            'context_hash': context_hash,
+            'columns': json.dumps([
+                {**column.to_dict(), 'is_nullable': bool(column.is_nullable)}
+                for column in columns
+            ], default=int),
+            'unique_columns': json.dumps([
+                {**constraint.to_dict(), 'columns': _array_text(constraint.columns)}
+                for constraint in unique_columns
+            ]),
+        }
+
+    def get(self) -> tuple[list[CatalogColumnInfo], list[CatalogUniqueConstraintInfo]]:
+        '''Get the columns and unique constraints of the context.'''
+
         # Get columns
         column_query = database.sql.SQL('''
             SELECT schema_name, table_name, column_name, column_type,
                    numeric_precision, numeric_scale, is_nullable,
                    foreign_key_schema, foreign_key_table, foreign_key_column
             FROM {schema}.query_context_columns
-            WHERE query_id = {query_id}
+            WHERE context_id = {context_id}
         ''').format(
             schema=database.sql.Identifier(SCHEMA),
-            query_id=database.sql.Placeholder('query_id')
+            context_id=database.sql.Placeholder('context_id')
         )
         column_results = db.execute_and_fetch(column_query, {
-            'query_id': self.query_id
+            'context_id': self.context_id
         })
         columns = [
             CatalogColumnInfo(
@@ -363,29 +814,121 @@ class Query:
         unique_query = database.sql.SQL('''
             SELECT schema_name, table_name, constraint_type, columns
             FROM {schema}.query_context_columns_unique
-            WHERE query_id = {query_id}
+            WHERE context_id = {context_id}
         ''').format(
             schema=database.sql.Identifier(SCHEMA),
-            query_id=database.sql.Placeholder('query_id')
+            context_id=database.sql.Placeholder('context_id')
         )
         unique_results = db.execute_and_fetch(unique_query, {
-            'query_id': self.query_id
+            'context_id': self.context_id
         })
         unique_columns = [
             CatalogUniqueConstraintInfo(
                 schema_name=row[0],
                 table_name=row[1],
                 constraint_type=row[2],
-                columns=f'{{{",".join(row[3])}}}',      # NOTE: quick fix, should probably return it as a list. Changes cascade up to sqlscope.catalog.build_from_postgresql, etc.
+                columns=_array_text(row[3]),
             ) for row in unique_results
         ]
 
         return columns, unique_columns
 
-    def log_solution_attempt(self, is_correct: bool) -> None:
-        '''Log a solution attempt for an exercise'''
 
-        db.insert(SCHEMA, 'exercise_solutions', {
-            'id': self.query_id,
-            'is_correct': is_correct,
+class QueryResultArchive:
+    '''
+        Full results of datasets, compressed. `queries.result` only contains a summary of each result:
+        if enabled, full results are also archived here, and kept for a limited time.
+    '''
+
+    ENCODING = 'zlib'
+
+    @staticmethod
+    def get(query_id: int) -> str | None:
+        '''Get the full result of a query, or None if it has not been archived.'''
+
+        query = database.sql.SQL('''
+            SELECT encoding, content
+            FROM {schema}.query_results
+            WHERE query_id = {query_id}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            query_id=database.sql.Placeholder('query_id')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'query_id': query_id
         })
+
+        if len(result) == 0:
+            return None
+
+        encoding, content = result[0]
+        if encoding != QueryResultArchive.ENCODING:
+            raise ValueError(f'Unsupported encoding for archived result of query {query_id}: {encoding}')
+
+        return zlib.decompress(bytes(content)).decode('utf-8')
+
+    @staticmethod
+    def _write(items: list[tuple[int, Callable[[], str]]]) -> None:
+        '''Archive a batch of results, as `(query_id, full_result)`, and delete the expired ones.'''
+
+        results = []
+        for query_id, full_result in items:
+            content = full_result().encode('utf-8')
+            results.append({
+                'query_id': query_id,
+                'content': base64.b64encode(zlib.compress(content)).decode('ascii'),
+                'size': len(content),
+            })
+
+        query = database.sql.SQL('''
+            WITH expired AS (
+                DELETE FROM {schema}.query_results
+                WHERE {retention_days} > 0
+                AND created_ts < NOW() - MAKE_INTERVAL(days => {retention_days})
+            )
+            INSERT INTO {schema}.query_results (query_id, encoding, content, size)
+            SELECT r.query_id, {encoding}, DECODE(r.content, 'base64'), r.size
+            FROM jsonb_to_recordset({results}::jsonb) AS r(query_id INTEGER, content TEXT, size INTEGER)
+            ON CONFLICT (query_id) DO NOTHING
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            retention_days=database.sql.Placeholder('retention_days'),
+            encoding=database.sql.Placeholder('encoding'),
+            results=database.sql.Placeholder('results')
+        )
+
+        db.execute(query, {
+            'retention_days': RESULT_ARCHIVE_RETENTION_DAYS,
+            'encoding': QueryResultArchive.ENCODING,
+            'results': json.dumps(results),
+        })
+
+
+def _context_row(*values) -> str:
+    '''Text form of a row of a context, used to hash it. Same as `concat_ws(E'\\t', ...)` on the values cast to text, with NULLs as `\\N`.'''
+
+    return '\t'.join(
+        '\\N' if value is None else str(value).lower() if isinstance(value, bool) else str(value)
+        for value in values
+    )
+
+
+def _array_text(columns: str | list[str]) -> str:
+    '''
+        Text form (`{col1,col2}`) of the columns of a unique constraint, as expected by `sqlscope`.
+        Depending on the DBMS and the driver, they are returned either as text or as a list.
+    '''
+
+    if isinstance(columns, str):
+        return columns
+    return f'{{{",".join(columns)}}}'
+
+
+def _error_rows(errors: list[DetectedError]) -> list[dict]:
+    '''Rows of `has_error` for the given errors, without the query id.'''
+
+    return [
+        {'error_id': error.error.value, 'details': [str(v) for v in error.data]}
+        for error in errors
+    ]
@@ -1,12 +1,15 @@
 from typing import Any
 from dav_tools import database
 from .connection import db, SCHEMA
+from .writer import analytics
 from ... import gamification
 from ...gamification.rewards import Badges
 from sqlerrors import SqlErrors
 from sqlscope import Dialect
 
 import bcrypt
+import json
+import time
 import re
 
 def _hash_password(password: str) -> str:
@@ -140,12 +143,21 @@ class User:
         return result[0][0] is True
 
     @property
-    def last_search_path(self) -> str | None:
-        '''Return the last search path used by the user, if any.'''
+    def session_state(self) -> tuple[str | None, dict[str, str], int, str | None]:
+        '''
+            Return the state of the user's database session, shared by all server processes.
+
+            Returns:
+                tuple[str | None, dict[str, str], int, str | None]: The search path, the statements changing session variables,
+                    the version of the state and the connection holding non-replayable state (if any).
+        '''
 
         query = database.sql.SQL('''
             SELECT
-                last_search_path
+                last_search_path,
+                session_settings,
+                session_version,
+                session_owner
             FROM
                 {schema}.users
             WHERE
@@ -160,25 +172,138 @@ class User:
         })
 
         if len(result) == 0:
-            return None
+            return None, {}, 0, None
 
-        return result[0][0]
+        settings = json.loads(result[0][1]) if result[0][1] else {}
+
+        return result[0][0], settings, result[0][2], result[0][3]
 
-    def set_last_search_path(self, search_path: str | None) -> None:
-        '''Persist the last search path used by the user.'''
+    def set_session_state(self, search_path: str | None, settings: dict[str, str]) -> int:
+        '''Persist the replayable state of the user's database session. Returns the new version of the state.'''
 
         query = database.sql.SQL('''
             UPDATE {schema}.users
-            SET last_search_path = {last_search_path}
+            SET
+                last_search_path = {last_search_path},
+                session_settings = {session_settings},
+                session_version = session_version + 1
             WHERE username = {username}
+            RETURNING session_version
         ''').format(
             schema=database.sql.Identifier(SCHEMA),
             last_search_path=database.sql.Placeholder('last_search_path'),
+            session_settings=database.sql.Placeholder('session_settings'),
             username=database.sql.Placeholder('username')
         )
 
-        db.execute(query, {
+        result = db.execute_and_fetch(query, {
             'last_search_path': search_path,
+            'session_settings': json.dumps(settings),
+            'username': self.username
+        })
+
+        if len(result) == 0:
+            return 0
+
+        return result[0][0]
+
+    def set_session_owner(self, owner: str | None) -> None:
+        '''Persist which connection holds an open transaction or temporary tables of the user, if any.'''
+
+        query = database.sql.SQL('''
+            UPDATE {schema}.users
+            SET session_owner = {session_owner}
+            WHERE username = {username}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            session_owner=database.sql.Placeholder('session_owner'),
+            username=database.sql.Placeholder('username')
+        )
+
+        db.execute(query, {
+            'session_owner': owner,
+            'username': self.username
+        })
+
+    @property
+    def schema_version(self) -> int:
+        '''Return the version of the user's database schemas, incremented each time they may have changed.'''
+
+        query = database.sql.SQL('''
+            SELECT schema_version
+            FROM {schema}.users
+            WHERE username = {username}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            username=database.sql.Placeholder('username')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'username': self.username
+        })
+
+        if len(result) == 0:
+            return 0
+        return result[0][0]
+
+    def bump_schema_version(self) -> int:
+        '''Record that the user's database schemas may have changed. Returns the new version.'''
+
+        query = database.sql.SQL('''
+            UPDATE {schema}.users
+            SET schema_version = schema_version + 1
+            WHERE username = {username}
+            RETURNING schema_version
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            username=database.sql.Placeholder('username')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'username': self.username
+        })
+
+        if len(result) == 0:
+            return 0
+        return result[0][0]
+
+    @property
+    def dataset_state(self) -> str | None:
+        '''Return the dataset the user's database is known to match, if any (see `sql.result.solutions.dataset_state`).'''
+
+        query = database.sql.SQL('''
+            SELECT dataset_state
+            FROM {schema}.users
+            WHERE username = {username}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            username=database.sql.Placeholder('username')
+        )
+
+        result = db.execute_and_fetch(query, {
+            'username': self.username
+        })
+
+        if len(result) == 0:
+            return None
+        return result[0][0]
+
+    def set_dataset_state(self, state: str | None) -> None:
+        '''Record which dataset the user's database matches, or None if it may have been modified.'''
+
+        query = database.sql.SQL('''
+            UPDATE {schema}.users
+            SET dataset_state = {dataset_state}
+            WHERE username = {username}
+                AND dataset_state IS DISTINCT FROM {dataset_state}
+        ''').format(
+            schema=database.sql.Identifier(SCHEMA),
+            dataset_state=database.sql.Placeholder('dataset_state'),
+            username=database.sql.Placeholder('username')
+        )
+
+        db.execute(query, {
+            'dataset_state': state,
             'username': self.username
         })
     # endregion
@@ -1385,22 +1510,30 @@ class User:
 
     # region Navigation
     def log_navigation(self, url: str, event: str) -> None:
-        '''Log a navigation event for the user'''
+        '''Log a navigation event for the user. The event is written in the background, see `writer.analytics`.'''
+
+        analytics.submit(User._write_navigation, (self.username, url, event, time.monotonic()))
+
+    @staticmethod
+    def _write_navigation(events: list[tuple[str, str, str, float]]) -> None:
+        '''Write a batch of navigation events, as `(username, url, event, monotonic_ts)`.'''
 
         query = database.sql.SQL('''
-            INSERT INTO {schema}.navigation_logs (username, url, event)
-            VALUES ({username}, {url}, {event})
+            INSERT INTO {schema}.navigation_logs (username, url, event, ts)
+            SELECT e.username, e.url, e.event, NOW() - MAKE_INTERVAL(secs => e.age)
+            FROM jsonb_to_recordset({events}::jsonb) AS e(username TEXT, url TEXT, event TEXT, age DOUBLE PRECISION)
         ''').format(
             schema=database.sql.Identifier(SCHEMA),
-            username=database.sql.Placeholder('username'),
-            url=database.sql.Placeholder('url'),
-            event=database.sql.Placeholder('event')
+            events=database.sql.Placeholder('events')
         )
 
+        # Events are timestamped by the database, back-dated by the time they spent in the queue
+        now = time.monotonic()
         db.execute(query, {
-            'username': self.username,
-            'url': url,
-            'event': event
+            'events': json.dumps([
+                {'username': username, 'url': url, 'event': event, 'age': now - ts}
+                for username, url, event, ts in events
+            ])
         })
 
     # endregion
@@ -0,0 +1,222 @@
+'''
+    Write-behind queue for analytics logging.
+
+    Some of what is logged for each request is only used for analytics (query contexts, detected errors, navigation events)
+    and is not needed to build the response. Such writes are queued and performed by a background thread, in batches,
+    so that requests do not wait for them.
+
+    The queue is bounded: when it is full, the request waits for a while and then performs the write itself,
+    slowing down producers instead of dropping data. Pending writes are flushed when the process exits.
+'''
+
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
+import threading
+import atexit
+import time
+import os
+import dav_tools
+
+WRITE_BEHIND_ENABLED = os.getenv('ANALYTICS_WRITE_BEHIND', 'True').lower() == 'true'
+'''Whether analytics are written in the background. If disabled, they are written by the request itself.'''
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('ANALYTICS_WRITE_BEHIND_QUEUE_SIZE', '10000'))
+'''Maximum number of pending writes in each process.'''
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('ANALYTICS_WRITE_BEHIND_BATCH_SIZE', '500'))
+'''Maximum number of writes performed together.'''
+WRITE_BEHIND_ENQUEUE_TIMEOUT_MS = int(os.getenv('ANALYTICS_WRITE_BEHIND_ENQUEUE_TIMEOUT_MS', '100'))
+'''How long a request waits for room in a full queue, before performing the write itself.'''
+WRITE_BEHIND_RETRIES = int(os.getenv('ANALYTICS_WRITE_BEHIND_RETRIES', '3'))
+'''Number of attempts for each batch, before its writes are discarded.'''
+
+# Delay between two attempts of a failed batch
+_RETRY_SECONDS = 1
+
+Handler = Callable[[list[Any]], None]
+'''Function performing a batch of writes of the same kind.'''
+
+
+@dataclass
+class _Write:
+    handler: Handler
+    item: Any
+    enqueued_at: float
+
+
+@dataclass
+class WriteBehindMetrics:
+    '''Counters describing the writes performed by the queue.'''
+
+    enqueued: int = 0
+    '''Writes queued for the background thread.'''
+    written: int = 0
+    '''Writes performed by the background thread.'''
+    sync_writes: int = 0
+    '''Writes performed by the request itself, because the queue was full or disabled.'''
+    failed: int = 0
+    '''Writes discarded after all attempts failed.'''
+    batches: int = 0
+    '''Batches performed by the background thread.'''
+    last_lag_seconds: float = 0
+    '''Time spent in the queue by the oldest write of the last batch.'''
+    max_lag_seconds: float = 0
+    '''Longest time spent in the queue by a write.'''
+
+    def to_dict(self) -> dict[str, int | float]:
+        return asdict(self)
+
+
+class WriteBehindQueue:
+    '''Bounded queue of writes, performed in batches by a background thread.'''
+
+    def __init__(self, *,
+                 enabled: bool = WRITE_BEHIND_ENABLED,
+                 size: int = WRITE_BEHIND_QUEUE_SIZE,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 enqueue_timeout: float = WRITE_BEHIND_ENQUEUE_TIMEOUT_MS / 1000,
+                 retries: int = WRITE_BEHIND_RETRIES):
+        self.enabled = enabled
+        self.size = size
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self.metrics = WriteBehindMetrics()
+
+        self._condition = threading.Condition()
+        self._pending: deque[_Write] = deque()
+        self._in_flight: list[_Write] = []
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+    def submit(self, handler: Handler, item: Any) -> None:
+        '''Queue a write, which will be performed by calling `handler` on a batch of items.'''
+
+        if self.enabled:
+            deadline = time.monotonic() + self.enqueue_timeout
+
+            with self._condition:
+                if not self._stopping:
+                    self._ensure_thread()
+
+                    while len(self._pending) >= self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._pending.append(_Write(handler, item, time.monotonic()))
+                        self.metrics.enqueued += 1
+                        self._condition.notify_all()
+                        return
+
+        # Disabled, full or shutting down: the caller writes by itself
+        with self._condition:
+            self.metrics.sync_writes += 1
+        handler([item])
+
+    def flush(self, timeout: float | None = None) -> bool:
+        '''Wait until all queued writes have been performed. Returns False if the timeout expired first.'''
+
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    def stop(self, timeout: float | None = None) -> None:
+        '''Perform the pending writes and stop the background thread. Writes submitted afterwards are performed synchronously.'''
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+
+    @property
+    def lag_seconds(self) -> float:
+        '''How long the oldest write not yet performed has been waiting, i.e. how far analytics trail live traffic.'''
+
+        with self._condition:
+            return self._lag()
+
+    def stats(self) -> dict[str, int | float | bool]:
+        '''Returns the state of the queue, together with its metrics.'''
+
+        with self._condition:
+            return {
+                'enabled': self.enabled,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'pending': len(self._pending) + len(self._in_flight),
+                'max_size': self.size,
+                'lag_seconds': round(self._lag(), 3),
+                **self.metrics.to_dict(),
+            }
+
+    # region Background thread
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _lag(self) -> float:
+        oldest = self._in_flight[0] if self._in_flight else self._pending[0] if self._pending else None
+        if oldest is None:
+            return 0
+        return time.monotonic() - oldest.enqueued_at
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    # Stopping, and nothing left to write
+                    self._thread = None
+                    self._condition.notify_all()
+                    return
+
+                count = min(self.batch_size, len(self._pending))
+                self._in_flight = [self._pending.popleft() for _ in range(count)]
+                # Room was made for blocked producers
+                self._condition.notify_all()
+
+                batch = self._in_flight
+
+            lag = time.monotonic() - batch[0].enqueued_at
+            failed = self._write_batch(batch)
+
+            with self._condition:
+                self._in_flight = []
+                self.metrics.batches += 1
+                self.metrics.written += len(batch) - failed
+                self.metrics.failed += failed
+                self.metrics.last_lag_seconds = round(lag, 3)
+                self.metrics.max_lag_seconds = max(self.metrics.max_lag_seconds, round(lag, 3))
+                self._condition.notify_all()
+
+    def _write_batch(self, batch: list[_Write]) -> int:
+        '''Perform a batch, one handler call per kind of write. Returns the number of discarded writes.'''
+
+        groups: dict[Handler, list[Any]] = {}
+        for write in batch:
+            groups.setdefault(write.handler, []).append(write.item)
+
+        failed = 0
+        for handler, items in groups.items():
+            for attempt in range(1, self.retries + 1):
+                try:
+                    handler(items)
+                    break
+                except Exception as e:
+                    dav_tools.messages.warning(f'Analytics write failed (attempt {attempt}/{self.retries}): {e}')
+                    if attempt < self.retries:
+                        time.sleep(_RETRY_SECONDS)
+            else:
+                dav_tools.messages.error(f'Discarding {len(items)} analytics writes.')
+                failed += len(items)
+
+        return failed
+    # endregion
+
+
+analytics = WriteBehindQueue()
+'''Queue of the analytics writes of this process.'''
@@ -1,16 +1,29 @@
 from .database import Database
-from .postgresql import PostgresqlDatabase
-from .mysql import MySQLDatabase
+from .postgresql import PostgresqlDatabase, PostgresqlSharedDatabase
+from .mysql import MySQLDatabase, MySQLSharedDatabase
+from .tenancy import TENANCY, TENANCY_CONTAINER, TENANCY_SHARED
 from sqlscope import Dialect
 
 
 def get_database(dbname: str, dbms: Dialect) -> Database:
-    '''Factory function to get the appropriate database backend.'''
+    '''Factory function to get the appropriate database backend, according to the DBMS and the tenancy model of the deployment.'''
+
+    if TENANCY not in (TENANCY_CONTAINER, TENANCY_SHARED):
+        raise ValueError(f'Unsupported tenancy model: {TENANCY}')
+
+    shared = TENANCY == TENANCY_SHARED
 
     if dbms == Dialect.POSTGRES:
-        return PostgresqlDatabase(dbname)
+        return PostgresqlSharedDatabase(dbname) if shared else PostgresqlDatabase(dbname)
 
     if dbms == Dialect.MYSQL:
-        return MySQLDatabase(dbname)
+        return MySQLSharedDatabase(dbname) if shared else MySQLDatabase(dbname)
 
     raise ValueError(f'Unsupported DBMS: {dbms} ({dbname})')
+
+
+def preload_system_catalogs() -> None:
+    '''Loads the system catalogs of all supported DBMSs, so that the first queries do not have to.'''
+
+    for dbms in (Dialect.POSTGRES, Dialect.MYSQL):
+        get_database('system', dbms).get_system_catalog()
@@ -0,0 +1,107 @@
+'''
+    Limits the number of user statements running at the same time.
+
+    Each running statement occupies a server thread: capping them keeps some threads free for
+    the other requests (logins, statistics, ...), which are then never queued behind slow queries.
+'''
+
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Iterator
+import threading
+import time
+import os
+
+MAX_CONCURRENT_QUERIES = int(os.getenv('DB_USERS_MAX_CONCURRENT_QUERIES', '24'))
+'''Maximum number of user statements running at the same time in this process. Should be lower than the number of server threads.'''
+ADMISSION_TIMEOUT_SECONDS = float(os.getenv('DB_USERS_ADMISSION_TIMEOUT_SECONDS', '15'))
+'''Maximum time a statement waits for a free slot before being rejected.'''
+
+
+class AdmissionTimeoutError(Exception):
+    '''Raised when a statement cannot be admitted before the admission timeout.'''
+
+
+@dataclass
+class AdmissionMetrics:
+    '''Counters describing admitted statements.'''
+
+    admitted: int = 0
+    '''Statements which were admitted.'''
+    waits: int = 0
+    '''Statements which had to wait for a free slot.'''
+    rejected: int = 0
+    '''Statements which were rejected after waiting for too long.'''
+    total_wait_seconds: float = 0
+    '''Sum of the time spent waiting for a free slot.'''
+
+    def to_dict(self) -> dict[str, float]:
+        return asdict(self)
+
+
+class AdmissionControl:
+    '''Bounds the number of statements running at the same time, queueing the others up to a timeout.'''
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_QUERIES, timeout: float = ADMISSION_TIMEOUT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+
+        self.metrics = AdmissionMetrics()
+
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        '''
+            Holds a slot while the block runs.
+
+            Raises:
+                AdmissionTimeoutError: If no slot becomes available within the timeout.
+        '''
+
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self) -> None:
+        with self._cond:
+            if self._running < self.max_concurrent:
+                self._running += 1
+                self.metrics.admitted += 1
+                return
+
+            self.metrics.waits += 1
+            self._waiting += 1
+            start = time.monotonic()
+            try:
+                admitted = self._cond.wait_for(lambda: self._running < self.max_concurrent, timeout=self.timeout)
+            finally:
+                self._waiting -= 1
+                self.metrics.total_wait_seconds += time.monotonic() - start
+
+            if not admitted:
+                self.metrics.rejected += 1
+                raise AdmissionTimeoutError(f'No free slot to run the statement after {self.timeout} seconds.')
+
+            self._running += 1
+            self.metrics.admitted += 1
+
+    def _release(self) -> None:
+        with self._cond:
+            self._running -= 1
+            self._cond.notify()
+
+    def stats(self) -> dict[str, float]:
+        '''Returns the number of running and waiting statements, together with the admission metrics.'''
+
+        with self._cond:
+            return {
+                'running': self._running,
+                'waiting': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                **self.metrics.to_dict(),
+            }
@@ -0,0 +1,124 @@
+'''
+    System catalogs of the user databases.
+
+    System catalogs never change and can be large (the PostgreSQL one describes the whole `pg_catalog`):
+    each one is loaded once per process and shared by all queries.
+    The catalog used to analyse a query overlays the user schemas on top of it: system schemas are shared,
+    and only copied if the analysis modifies them, so building and copying it costs time proportional to the user schemas.
+'''
+
+from dataclasses import dataclass, field
+from copy import deepcopy
+from typing import Callable
+import threading
+
+from sqlscope import Catalog
+from sqlscope.catalog.util import split_search_path
+
+
+@dataclass
+class OverlayCatalog(Catalog):
+    '''Catalog sharing some of its schemas with other catalogs. Shared schemas are copied before being modified.'''
+
+    _shared: frozenset[str] = field(default_factory=frozenset)
+    '''Names of the schemas still shared with other catalogs.'''
+
+    def _own(self, schema_name: str) -> None:
+        '''Replaces a shared schema with a private copy.'''
+
+        if schema_name in self._shared:
+            self._schemas[schema_name] = deepcopy(self._schemas[schema_name])
+            self._shared = self._shared - {schema_name}
+
+    def _own_table_schema(self, search_path: str, table_name: str) -> None:
+        '''Owns the schema a table would be read from or added to.'''
+
+        for schema_name in split_search_path(search_path):
+            schema = self._schemas.get(schema_name)
+            if schema is not None and schema.has_table(table_name):
+                self._own(schema_name)
+                return
+
+        self._own(split_search_path(search_path)[0])
+
+    # Accessors returning objects which callers may modify
+    def get_schema(self, search_path: str):
+        schema = self.lookup_schema(search_path)
+        if schema is not None:
+            self._own(schema.name)
+
+        return super().get_schema(search_path)
+
+    def get_table(self, search_path: str, table_name: str):
+        self._own_table_schema(search_path, table_name)
+        return super().get_table(search_path, table_name)
+
+    def add_column(self, search_path: str, table_name: str, *args, **kwargs) -> None:
+        self._own_table_schema(search_path, table_name)
+        super().add_column(search_path, table_name, *args, **kwargs)
+
+    def copy_table(self, search_path: str, table_name: str, table):
+        self._own(split_search_path(search_path)[0])
+        return super().copy_table(search_path, table_name, table)
+
+    def __setitem__(self, search_path: str, schema):
+        self._shared = self._shared - {split_search_path(search_path)[0]}
+        return super().__setitem__(search_path, schema)
+
+    def copy(self) -> 'OverlayCatalog':
+        # Also used by `merge`
+        return OverlayCatalog(
+            _schemas={
+                name: schema if name in self._shared else deepcopy(schema)
+                for name, schema in self._schemas.items()
+            },
+            _shared=self._shared,
+        )
+
+
+@dataclass(frozen=True)
+class SystemCatalog:
+    '''System catalog of a DBMS, shared by all queries. Must not be modified.'''
+
+    catalog: Catalog
+    search_path: str
+    '''Search path to prefix to the user search path, so that system objects are found.'''
+
+    def overlay(self, user_catalog: Catalog) -> Catalog:
+        '''
+            Returns the user catalog merged with the system catalog, as `user_catalog.merge(catalog)` would.
+            User schemas take precedence over system schemas with the same name.
+            If the user catalog is itself an overlay, the schemas it shares remain shared.
+        '''
+
+        shared = {
+            name: schema
+            for name, schema in self.catalog._schemas.items()
+            if name not in user_catalog._schemas
+        }
+        user_shared = user_catalog._shared if isinstance(user_catalog, OverlayCatalog) else frozenset()
+
+        return OverlayCatalog(
+            _schemas={**user_catalog._schemas, **shared},
+            _shared=frozenset(shared) | user_shared,
+        )
+
+
+class SystemCatalogCache:
+    '''System catalogs of each DBMS, loaded once per process.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogs: dict[str, SystemCatalog] = {}
+
+    def get(self, dbms_name: str, load: Callable[[], SystemCatalog]) -> SystemCatalog:
+        '''Returns the system catalog of the DBMS, calling `load` only the first time.'''
+
+        catalog = self._catalogs.get(dbms_name)
+        if catalog is not None:
+            return catalog
+
+        with self._lock:
+            if dbms_name not in self._catalogs:
+                self._catalogs[dbms_name] = load()
+            return self._catalogs[dbms_name]
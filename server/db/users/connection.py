@@ -1,8 +1,19 @@
 from abc import ABC, abstractmethod
 from server.sql import SQLCode, QueryResult
+from server.sql.result.fingerprint import ResultFingerprint
 from typing import Any
+import time
+import os
 
-from typing import Iterable
+from typing import Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .governor import ResourceLimits
+
+MAX_RESULT_ROWS = int(os.getenv('DB_USERS_MAX_RESULT_ROWS', '1000'))
+'''Maximum number of rows returned to the user for each statement. Further rows are counted but not fetched.'''
+FETCH_BATCH_SIZE = int(os.getenv('DB_USERS_FETCH_BATCH_SIZE', '500'))
+'''Number of rows fetched from the server at a time.'''
 
 
 class DatabaseConnection(ABC):
@@ -11,12 +22,64 @@ class DatabaseConnection(ABC):
         self.port = port
         self.autocommit = autocommit
 
+        self.search_path: str | None = None
+        '''Search path last set on this connection, if known.'''
+
+        self.last_alive = time.monotonic()
+        '''Last time the connection was known to be working.'''
+
+        self.limits: 'ResourceLimits | None' = None
+        '''Resource limits currently set on the session, if known.'''
+
+        self.session_version: int | None = None
+        '''Version of the shared session state replayed on this connection, if any.'''
+
+    def mark_alive(self) -> None:
+        '''Records that the connection has just been used successfully.'''
+        self.last_alive = time.monotonic()
+
+    @abstractmethod
+    def execute_sql(self, statement: SQLCode, *, max_rows: int | None = None) -> Iterable[QueryResult]:
+        '''
+            Executes the given SQLCode statement and yields QueryResult objects.
+
+            Args:
+                statement (SQLCode): The statement to execute.
+                max_rows (int | None): Maximum number of rows to fetch. Results with more rows are marked as truncated. If None, all rows are fetched.
+        '''
+
+        pass
+
     @abstractmethod
-    def execute_sql(self, statement: SQLCode) -> Iterable[QueryResult]:
-        '''Executes the given SQLCode statement and yields QueryResult objects.'''
+    def fingerprint_sql(self, statement: SQLCode) -> ResultFingerprint | None:
+        '''
+            Executes the given SELECT statement and returns the fingerprint of its result, without keeping its rows.
+            Rows are read in batches of `FETCH_BATCH_SIZE`.
+
+            Returns:
+                ResultFingerprint | None: The fingerprint, or None if the statement does not return a result set.
+        '''
 
         pass
 
+    atomic_batches: bool = False
+    '''Whether `execute_batch` sends all statements in a single round-trip, applying either all of them or none.'''
+
+    def execute_batch(self, statements: list[SQLCode]) -> None:
+        '''
+            Executes the given statements, discarding their results.
+
+            By default, statements are executed one at a time: if one fails, the previous ones remain applied.
+            Connections which set `atomic_batches` execute them all at once instead.
+
+            Raises:
+                SQLException: If a statement fails.
+        '''
+
+        for statement in statements:
+            for _ in self.execute_sql(statement, max_rows=0):
+                pass
+
     @abstractmethod
     def execute_sql_raw(self, statement: str) -> list[tuple[Any, ...]]:
         '''Executes the given SQL statement and returns the raw results as a list of tuples.'''
@@ -24,7 +87,42 @@ class DatabaseConnection(ABC):
 
     @abstractmethod
     def is_open(self) -> bool:
-        '''Returns True if the connection is open, False otherwise.'''
+        '''Returns True if the connection is open, False otherwise. Does not contact the server.'''
+        pass
+
+    @abstractmethod
+    def ping(self) -> bool:
+        '''Returns True if the server answers on this connection. Forces a round-trip.'''
+        pass
+
+    @abstractmethod
+    def is_disconnect(self, exception: Exception) -> bool:
+        '''Returns True if the given driver exception means the connection has been lost.'''
+        pass
+
+    @abstractmethod
+    def apply_limits(self, limits: 'ResourceLimits') -> None:
+        '''Sets the resource limits on the session, if they differ from the current ones.'''
+        pass
+
+    @abstractmethod
+    def cancel(self) -> None:
+        '''Cancels the statement currently running on this connection. Safe to call from another thread.'''
+        pass
+
+    @abstractmethod
+    def is_timeout(self, exception: Exception) -> bool:
+        '''Returns True if the given driver exception means the statement exceeded a time limit or was cancelled.'''
+        pass
+
+    @abstractmethod
+    def in_transaction(self) -> bool:
+        '''Returns True if a transaction is open.'''
+        pass
+
+    @abstractmethod
+    def has_bound_state(self) -> bool:
+        '''Returns True if the session holds state which cannot be replayed on another connection, such as open transactions or temporary tables.'''
         pass
 
     @abstractmethod
@@ -0,0 +1,193 @@
+'''Cache of the state of the user database containers, to avoid querying Docker on every new connection.'''
+
+from dataclasses import dataclass, asdict
+import threading
+import time
+import os
+import dav_tools
+import docker
+
+CONTAINER_CACHE_TTL_SECONDS = int(os.getenv('DB_USERS_CONTAINER_CACHE_TTL_SECONDS', '60'))
+'''Containers seen running within this many seconds are not checked again with Docker. Only used when the events watcher is not active.'''
+CONTAINER_EVENTS_WATCHER = os.getenv('DB_USERS_CONTAINER_EVENTS_WATCHER', 'True').lower() == 'true'
+'''Whether to keep the cache up to date by listening to Docker events.'''
+
+# Time to wait before reconnecting to the Docker events stream after an error
+_WATCHER_RETRY_SECONDS = 5
+
+_RUNNING_ACTIONS = { 'start', 'unpause', 'restart' }
+'''Docker events after which a container is running.'''
+_STOPPED_ACTIONS = { 'kill', 'die', 'stop', 'pause', 'oom', 'destroy' }
+'''Docker events after which a container can no longer be assumed to be running.'''
+
+
+@dataclass
+class ContainerCacheMetrics:
+    '''Counters describing how the container cache has been used.'''
+
+    hits: int = 0
+    '''Lookups answered by the cache.'''
+    misses: int = 0
+    '''Lookups that required a call to Docker.'''
+    invalidations: int = 0
+    '''Entries removed because of a connection error or a Docker event.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class ContainerCache:
+    '''
+        Keeps track of which user database containers are known to be running.
+
+        Entries are added when a container is started and expire after `ttl` seconds.
+        While the Docker events watcher is connected, entries do not expire: they are
+        removed as soon as Docker reports that the container stopped.
+        On (re)connection, the watcher fills the cache with a single listing of all running containers,
+        so that a server restart does not cause one Docker call per user.
+    '''
+
+    def __init__(self, label: str, *, ttl: float = CONTAINER_CACHE_TTL_SECONDS, watch_events: bool = CONTAINER_EVENTS_WATCHER):
+        self.label = label
+        self.ttl = ttl
+        self.watch_events = watch_events
+
+        self.metrics = ContainerCacheMetrics()
+
+        self._lock = threading.Lock()
+        self._running: dict[str, float] = {}
+        self._last_used: dict[str, float] = {}
+        self._name_locks: dict[str, threading.Lock] = {}
+        self._client: docker.DockerClient | None = None
+        self._watcher: threading.Thread | None = None
+        self._watcher_live = False
+
+    @property
+    def client(self) -> docker.DockerClient:
+        '''Docker client shared by all users of the cache.'''
+
+        with self._lock:
+            if self._client is None:
+                self._client = docker.from_env()
+            return self._client
+
+    def is_running(self, name: str) -> bool:
+        '''Returns True if the container is known to be running, without contacting Docker.'''
+
+        self._ensure_watcher()
+
+        with self._lock:
+            ts = self._running.get(name)
+            if ts is not None and (self._watcher_live or time.monotonic() - ts < self.ttl):
+                self.metrics.hits += 1
+                return True
+
+            self.metrics.misses += 1
+            return False
+
+    def mark_running(self, name: str) -> None:
+        '''Records that the container is running.'''
+
+        with self._lock:
+            self._running[name] = time.monotonic()
+
+    def mark_used(self, name: str) -> None:
+        '''Records that the container has just been used. Timestamps are wall-clock, to be compared with Docker ones.'''
+
+        with self._lock:
+            self._last_used[name] = time.time()
+
+    def last_used(self, name: str) -> float | None:
+        '''Returns when the container was last used by this process, if ever.'''
+
+        with self._lock:
+            return self._last_used.get(name)
+
+    def invalidate(self, name: str) -> None:
+        '''Forgets the state of the container, so that it will be checked with Docker on next use.'''
+
+        with self._lock:
+            if self._running.pop(name, None) is not None:
+                self.metrics.invalidations += 1
+
+    def clear(self) -> None:
+        '''Forgets the state of all containers.'''
+
+        with self._lock:
+            self._running.clear()
+
+    def lock(self, name: str) -> threading.Lock:
+        '''
+            Returns a lock specific to the container.
+            Used to make sure only one thread at a time contacts Docker for the same container.
+        '''
+
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    def stats(self) -> dict[str, int | bool]:
+        '''Returns the current size of the cache, together with its metrics.'''
+
+        with self._lock:
+            return {
+                'running': len(self._running),
+                'watcher_live': self._watcher_live,
+                **self.metrics.to_dict(),
+            }
+
+    # region Events watcher
+    def _ensure_watcher(self) -> None:
+        '''Starts the Docker events watcher, if enabled and not already running.'''
+
+        if not self.watch_events or self._watcher is not None:
+            return
+
+        with self._lock:
+            if self._watcher is not None:
+                return
+
+            self._watcher = threading.Thread(target=self._watch, name='container-events-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self) -> None:
+        '''Listens to Docker events for user containers, reconnecting on errors.'''
+
+        while True:
+            try:
+                client = self.client
+                events = client.events(decode=True, filters={ 'type': 'container', 'label': self.label })
+
+                # Events may have been missed while disconnected: start from the current state
+                running = client.containers.list(filters={ 'label': self.label, 'status': 'running' })
+                now = time.monotonic()
+                with self._lock:
+                    self._running = { container.name: now for container in running }
+                    self._watcher_live = True
+
+                for event in events:
+                    self._handle_event(event)
+            except Exception as e:
+                dav_tools.messages.warning(f'Docker events watcher disconnected: {e}. Retrying in {_WATCHER_RETRY_SECONDS} seconds.')
+
+            with self._lock:
+                self._watcher_live = False
+                self._running.clear()
+
+            time.sleep(_WATCHER_RETRY_SECONDS)
+
+    def _handle_event(self, event: dict) -> None:
+        '''Updates the cache according to a single Docker event.'''
+
+        action = event.get('Action') or event.get('status') or ''
+        name = event.get('Actor', {}).get('Attributes', {}).get('name')
+        if name is None:
+            return
+
+        # Health status events are reported as e.g. `health_status: healthy`
+        action = action.split(':')[0]
+
+        if action in _RUNNING_ACTIONS:
+            self.mark_running(name)
+        elif action in _STOPPED_ACTIONS:
+            self.invalidate(name)
+    # endregion
@@ -1,13 +1,26 @@
 
 from server.sql.result.message import QueryResultMessage
 
-from .connection import DatabaseConnection
+from .connection import DatabaseConnection, MAX_RESULT_ROWS
+from .pool import ConnectionPool
+from .liveness import LivenessPolicy
+from .containers import ContainerCache
+from .readiness import ReadinessProbe, backoff
+from .governor import ResourceLimits, DEFAULT_LIMITS, WATCHDOG_GRACE_MS, watchdog
+from .admission import AdmissionControl, AdmissionTimeoutError
+from .session import SessionState, session_owner
+from .catalog import SystemCatalog, SystemCatalogCache
+from .metadata import SchemaMetadata, SchemaMetadataCache, changes_schema, is_read_only
+from .images import DATASET_IMAGES
+from .script import ScriptProgress, batches, SCRIPT_BATCH_STATEMENTS, SCRIPT_BATCH_BYTES, SCRIPT_PROGRESS_EVERY
 from .queries import BuiltinQueries, MetadataQueries
 from .solution import CheckExecutionStatus, result_message, CheckResult, CheckResultMessage, CheckResultDataset
 from ...sql import SQLCode, QueryResult, SQLException, QueryResultError, QueryResultDataset
+from ...sql.result.fingerprint import ResultFingerprint
+from ...sql.result.solutions import dataset_state, solution_key, solution_results
 from .. import admin
 
-import threading
+from dataclasses import replace
 import time
 import os
 import dav_tools
@@ -15,18 +28,38 @@ import docker
 import docker.errors
 from docker.models.containers import Container
 from abc import ABC, abstractmethod
-from typing import Iterable
+from typing import Callable, Iterable, TypeVar
 from flask_babel import _
+from sqlscope import Dialect
 from sqlscope.catalog import CatalogColumnInfo, CatalogUniqueConstraintInfo, Catalog
 
+T = TypeVar('T')
+
+_DIALECTS = {
+    'postgresql': Dialect.POSTGRES,
+    'mysql': Dialect.MYSQL,
+}
+
 PROJECT_NAME = os.getenv('PROJECT_NAME', 'lensql')
+CONTAINER_LABEL = f'{PROJECT_NAME}_db_user'
+'''Label shared by all user database containers.'''
 
 class Database(ABC):
-    connections: dict[str, DatabaseConnection] = {}
-    '''Pool of active connections. Keyed by `username_dbms`.'''
-    conn_lock: threading.Lock = threading.Lock()
-    '''Lock for accessing the connections pool.'''
-    
+    pool: ConnectionPool = ConnectionPool()
+    '''Pool of connections, shared by all instances. Keyed by `username_dbms`.'''
+    liveness: LivenessPolicy = LivenessPolicy()
+    '''Decides when pooled connections need an active liveness check.'''
+    containers: ContainerCache = ContainerCache(CONTAINER_LABEL)
+    '''State of the user containers, shared by all instances.'''
+    readiness: ReadinessProbe = ReadinessProbe()
+    '''Containers currently booting, shared by all instances.'''
+    admission: AdmissionControl = AdmissionControl()
+    '''Bounds the number of user statements running at the same time, shared by all instances.'''
+    system_catalogs: SystemCatalogCache = SystemCatalogCache()
+    '''System catalog of each DBMS, shared by all instances.'''
+    schemas: SchemaMetadataCache = SchemaMetadataCache()
+    '''Metadata of the user schemas, shared by all instances. Keyed by `username_dbms`.'''
+
     def __init__(
             self,
             dbname: str,
@@ -46,12 +79,38 @@ class Database(ABC):
         self.metadata_queries = metadata_queries
         self.data_types = data_types
 
+        self._conn: DatabaseConnection | None = None
+        '''Connection checked out from the pool, held until `release` is called.'''
+
+        self.limits: ResourceLimits = DEFAULT_LIMITS
+        '''Resource limits applied to the statements run by this instance.'''
+
+        self.session: SessionState | None = None
+        '''Shared session state, loaded when the connection is checked out.'''
+        self._session_warning: str | None = None
+        '''Warning shown with the next result, if the session lost state which could not be replayed.'''
+
+        self._dataset_forgotten = False
+        '''Whether the dataset state is known to be cleared, so that it is not cleared again by each statement.'''
+
+    def __del__(self):
+        # Safety net for instances that are not explicitly released (e.g. abandoned generators)
+        try:
+            self.release()
+        except Exception:
+            pass
+
+    @property
+    def dialect(self) -> Dialect | None:
+        '''Returns the SQL dialect of the DBMS.'''
+        return _DIALECTS.get(self.dbms_name)
+
     def get_datatype_name(self, data_type_code: int) -> str:
         '''Returns the name of the data type for the given type code, or the code itself if not found.'''
         return self.data_types.get(data_type_code, f'id={data_type_code}')
 
     # region SQL Execution
-    def execute_sql(self, query_str: str, *, strip_comments: bool = True, builtin_name: str | None = None) -> Iterable[QueryResult]:
+    def execute_sql(self, query_str: str, *, strip_comments: bool = True, builtin_name: str | None = None, max_rows: int | None = MAX_RESULT_ROWS) -> Iterable[QueryResult]:
         '''
         Executes the given SQL queries and returns the results.
         The queries will be separated into individual statements.
@@ -59,45 +118,342 @@ class Database(ABC):
         Parameters:
             query_str (str): The SQL query string to execute. The query string can contain multiple SQL statements separated by semicolons.
             strip_comments (bool): Whether to strip comments from the SQL code before execution. Default is True.
+            max_rows (int | None): Maximum number of rows to fetch for each statement. Larger results are truncated. If None, all rows are fetched.
         Returns:
             Iterable[QueryResult]: An iterable of QueryResult objects.
         '''
 
-        for statement in SQLCode(query_str).split():
-            # NOTE: do not `strip_comments` from the SQL code for very large queries
-            #   as it takes the server too much time to parse the SQL code,
-            #   causing a timeout error in the client.
+        for statement in SQLCode(query_str, dialect=self.dialect).split():
             if strip_comments:
                 statement = statement.strip_comments()
 
             conn = None
-            try:
-                conn = self.connect()
-
-                # run each query
-                for result in conn.execute_sql(statement):
-                    # if a builtin query name is provided, replace its SQL with its shorter name
-                    if builtin_name is not None:
-                        result.query = SQLCode(builtin_name, builtin=True)
+            watch = None
+            retried = False
+            while True:
+                start = time.monotonic()
+                sent = False
+                try:
+                    with self.admission.slot():
+                        conn = self.connect()
+                        conn.apply_limits(self.limits)
+
+                        # run each query, making sure it does not exceed its time limit
+                        watch = watchdog.watch(conn, self.limits.statement_timeout_ms + WATCHDOG_GRACE_MS if self.limits.statement_timeout_ms > 0 else 0)
+                        start = time.monotonic()
+                        try:
+                            sent = True
+                            results = list(conn.execute_sql(statement, max_rows=max_rows))
+                        finally:
+                            watchdog.done(watch)
+                    elapsed_ms = (time.monotonic() - start) * 1000
+
+                    # Before yielding, so that the caller reads the new schema metadata
+                    if changes_schema(statement):
+                        self.invalidate_schema_metadata()
+                    if not is_read_only(statement):
+                        self.forget_dataset()
+
+                    if self._session_warning is not None and results:
+                        results[0].notices = [*results[0].notices, self._session_warning]
+                        self._session_warning = None
+
+                    for result in results:
+                        result.elapsed_ms = elapsed_ms
+
+                        # if a builtin query name is provided, replace its SQL with its shorter name
+                        if builtin_name is not None:
+                            result.query = SQLCode(builtin_name, builtin=True)
+                        
+                        yield result
+
+                    self._persist_session(conn, statement)
+                    break
+                except AdmissionTimeoutError:
+                    yield QueryResultMessage(
+                        query=statement if builtin_name is None else SQLCode(builtin_name, builtin=True),
+                        message=_('The server is busy running other queries. Please try again in a few seconds.')
+                    )
+                    return
+                except SQLException as e:
+                    elapsed_ms = (time.monotonic() - start) * 1000
+
+                    # The connection was lost (e.g. container restarted): try once more on a fresh one, unless the statement
+                    #   may have already run and changed something
+                    if self._discard_if_disconnected(conn, e) and self.liveness.retry_on_disconnect and not retried and (not sent or is_read_only(statement)):
+                        dav_tools.messages.info(f'Connection for {self.dbname} was lost, retrying statement on a new connection.')
+                        retried = True
+                        continue
+
+                    if conn is not None and conn.is_open():
+                        # can only rollback if connection is open
+                        try:
+                            conn.rollback()
+                        except Exception as e2:     # catch all to avoid handling each DB exception separately
+                            dav_tools.messages.error(f'Error rolling back connection for db "{self.dbname}": {e2}')
+
+                    # A failed statement may still have changed the schemas (e.g. a procedure), or aborted a transaction which did
+                    if changes_schema(statement):
+                        self.invalidate_schema_metadata()
+                    if not is_read_only(statement):
+                        self.forget_dataset()
                     
-                    yield result
+                    timed_out = conn is not None and (conn.is_timeout(e.exception) or (watch is not None and watch.cancelled))
 
-                self._persist_current_search_path(conn)
-            except SQLException as e:
-                if conn is not None and conn.is_open():
-                    # can only rollback if connection is open
-                    try:
-                        conn.rollback()
-                    except Exception as e2:     # catch all to avoid handling each DB exception separately
-                        dav_tools.messages.error(f'Error rolling back connection for db "{self.dbname}": {e2}')
-                
-                yield QueryResultError(
-                    exception=e,
-                    query=statement if builtin_name is None else SQLCode(builtin_name, builtin=True),
-                    notices=conn.notices if conn is not None and conn.is_open() else []
+                    yield QueryResultError(
+                        exception=e,
+                        query=statement if builtin_name is None else SQLCode(builtin_name, builtin=True),
+                        notices=conn.notices if conn is not None and conn.is_open() else [],
+                        elapsed_ms=elapsed_ms,
+                        timeout_ms=self.limits.statement_timeout_ms if timed_out else None,
+                    )
+
+                    return
+
+    def execute_script(self, script: str) -> Iterable[QueryResult | ScriptProgress]:
+        '''
+        Executes a long SQL script, such as a dataset initialisation script.
+        Statements are sent to the server in batches and their results are discarded.
+
+        Parameters:
+            script (str): The SQL script to execute.
+        Returns:
+            Iterable[QueryResult | ScriptProgress]: The errors of failed statements, interleaved with progress updates every `SCRIPT_PROGRESS_EVERY` statements.
+                The final progress is always the last item.
+        '''
+
+        statements = list(SQLCode(script, dialect=self.dialect).split())
+        progress = ScriptProgress(executed=0, total=len(statements))
+        reported = 0
+
+        self.forget_dataset()
+
+        for batch in batches(statements, SCRIPT_BATCH_STATEMENTS, SCRIPT_BATCH_BYTES):
+            try:
+                errors, lost = self._execute_batch(batch)
+            except AdmissionTimeoutError:
+                yield QueryResultMessage(
+                    query=batch[0],
+                    message=_('The server is busy running other queries. Please try again in a few seconds.')
                 )
+                break
+            except SQLException as e:
+                # Could not connect to the database
+                yield QueryResultError(exception=e, query=batch[0])
+                break
 
-                return
+            yield from errors
+
+            if any(changes_schema(statement) for statement in batch):
+                self.invalidate_schema_metadata()
+
+            progress.errors += len(errors)
+            if lost:
+                # The remaining statements cannot run
+                progress.executed += len(errors)
+                break
+            progress.executed += len(batch)
+
+            if progress.executed - reported >= SCRIPT_PROGRESS_EVERY and progress.executed < progress.total:
+                reported = progress.executed
+                yield replace(progress)
+
+        yield progress
+
+    def _execute_batch(self, batch: list[SQLCode]) -> tuple[list[QueryResultError], bool]:
+        '''
+        Executes a batch of statements of a script.
+        If the connection supports it, the whole batch is executed at once: should any statement fail, nothing is applied and
+        the statements are executed again one at a time, to find the failing ones.
+        Inside a transaction opened by the script, rolling back would also undo its previous statements, so statements
+        are always executed one at a time.
+
+        Returns:
+            tuple[list[QueryResultError], bool]: The errors of the failed statements, and whether the connection was lost.
+                If it was, the statements after the last error have not been executed.
+        '''
+
+        with self.admission.slot():
+            conn = self.connect()
+            conn.apply_limits(self.limits)
+
+            if conn.atomic_batches and len(batch) > 1 and not conn.in_transaction():
+                if self._run_batch(conn, batch) is None:
+                    self._persist_session(conn, *batch)
+                    return [], False
+
+            errors = []
+            for statement in batch:
+                error = self._run_batch(conn, [statement])
+                if error is None:
+                    continue
+
+                errors.append(error)
+                if not conn.is_open():
+                    return errors, True
+
+            self._persist_session(conn, *batch)
+            return errors, False
+
+    def _run_batch(self, conn: DatabaseConnection, statements: list[SQLCode]) -> QueryResultError | None:
+        '''Executes the statements under the watchdog. Returns the error if they failed, after rolling back.'''
+
+        timeout_ms = self.limits.statement_timeout_ms
+        watch = watchdog.watch(conn, timeout_ms + WATCHDOG_GRACE_MS if timeout_ms > 0 else 0)
+        start = time.monotonic()
+        try:
+            conn.execute_batch(statements)
+            return None
+        except SQLException as e:
+            elapsed_ms = (time.monotonic() - start) * 1000
+
+            if not self._discard_if_disconnected(conn, e):
+                try:
+                    conn.rollback()
+                except Exception as e2:     # catch all to avoid handling each DB exception separately
+                    dav_tools.messages.error(f'Error rolling back connection for db "{self.dbname}": {e2}')
+
+            timed_out = conn.is_timeout(e.exception) or watch.cancelled
+
+            return QueryResultError(
+                exception=e,
+                query=statements[0],
+                notices=conn.notices if conn.is_open() else [],
+                elapsed_ms=elapsed_ms,
+                timeout_ms=timeout_ms if timed_out else None,
+            )
+        finally:
+            watchdog.done(watch)
+    # endregion
+
+    # region Dataset Images
+    supports_images: bool = False
+    '''Whether this backend can initialise datasets from prepared images, see `build_image` and `restore_image`.'''
+
+    def init_dataset(self, script: str) -> Iterable[QueryResult | ScriptProgress]:
+        '''
+        Initialises a dataset.
+        If the backend supports images, the script is run only once: later initialisations restore the prepared image.
+        Otherwise, or if the image cannot be used (e.g. the script contains errors), the script is executed with `execute_script`.
+        If all the statements succeed, the database is recorded as matching the dataset (see `matches_dataset`).
+
+        Parameters:
+            script (str): The dataset script.
+        Returns:
+            Iterable[QueryResult | ScriptProgress]: Same as `execute_script`.
+        '''
+
+        self.forget_dataset()
+
+        if DATASET_IMAGES and self.supports_images:
+            statements = list(SQLCode(script, dialect=self.dialect).split())
+            try:
+                if self._init_from_image(script, statements):
+                    self._record_dataset(script)
+                    yield ScriptProgress(executed=len(statements), total=len(statements))
+                    return
+            except Exception as e:
+                dav_tools.messages.warning(f'Failed to initialise dataset from image for {self.dbname}, running the script instead: {e}')
+
+        progress = None
+        for item in self.execute_script(script):
+            if isinstance(item, ScriptProgress):
+                progress = item
+            yield item
+
+        if progress is not None and progress.errors == 0 and progress.executed == progress.total:
+            self._record_dataset(script)
+
+    def _init_from_image(self, script: str, statements: list[SQLCode]) -> bool:
+        '''
+        Restores the image of the script, building it first if needed.
+
+        Returns:
+            bool: False if the script cannot be prepared as an image.
+        '''
+
+        # Make sure the DBMS is running
+        self.connect()
+
+        image_store = admin.DatasetImage(admin.DatasetImage.hash_script(script), self.dbms_name)
+        image = image_store.get()
+        if image is None:
+            start = time.monotonic()
+            image = self.build_image(script) or b''
+            image_store.save(image)
+            dav_tools.messages.info(f'Built dataset image in {time.monotonic() - start:.1f}s ({len(image)} bytes).')
+
+        if not image:
+            return False
+
+        self.restore_image(image)
+        self.invalidate_schema_metadata()
+
+        # Session settings are not part of the image
+        settings = [statement for statement in statements if statement.first_token in ('SET', 'RESET')]
+        if settings:
+            conn = self.connect()
+            conn.execute_batch(settings)
+            self._persist_session(conn, *settings)
+
+        return True
+
+    def build_image(self, script: str) -> bytes | None:
+        '''
+        Runs the script in an empty database and dumps the result.
+
+        Returns:
+            bytes | None: The image, or None if the script failed.
+
+        Raises:
+            ImageError: If the image could not be built for other reasons.
+        '''
+
+        raise NotImplementedError
+
+    def restore_image(self, image: bytes) -> None:
+        '''
+        Restores an image built by `build_image` into the user database, replacing the objects it contains.
+
+        Raises:
+            ImageError: If the image could not be restored.
+        '''
+
+        raise NotImplementedError
+
+    def matches_dataset(self, script: str) -> bool:
+        '''Whether the database is known to match the dataset script, i.e. it was initialised with it and not modified since.'''
+
+        try:
+            state = admin.User(self.dbname).dataset_state
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to load dataset state for {self.dbname}: {e}')
+            return False
+
+        self._dataset_forgotten = state is None
+        return state == dataset_state(self.dbms_name, script)
+
+    def _record_dataset(self, script: str) -> None:
+        try:
+            admin.User(self.dbname).set_dataset_state(dataset_state(self.dbms_name, script))
+            self._dataset_forgotten = False
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to update dataset state for {self.dbname}: {e}')
+
+    def forget_dataset(self) -> None:
+        '''
+            Records that the database may no longer match the dataset it was initialised with.
+            The admin database is only updated the first time, until the dataset is initialised again.
+        '''
+
+        if self._dataset_forgotten:
+            return
+
+        try:
+            admin.User(self.dbname).set_dataset_state(None)
+            self._dataset_forgotten = True
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to update dataset state for {self.dbname}: {e}')
     # endregion
 
     # region Connections
@@ -110,7 +466,7 @@ class Database(ABC):
     def container_labels(self) -> list[str]:
         '''Returns the labels to identify the database container.'''
         return [
-            f'{PROJECT_NAME}_db_user'
+            CONTAINER_LABEL
         ]
     
     @abstractmethod
@@ -121,12 +477,18 @@ class Database(ABC):
     def start_container(self) -> Container:
         '''Gets the Docker container for the given username, or creates it if it doesn't exist.'''
         
-        client = docker.from_env()
+        client = self.containers.client
         
         try:
             container = client.containers.get(self.hostname)
         except docker.errors.NotFound:
-            return self.create_container()
+            try:
+                return self.create_container()
+            except docker.errors.APIError as e:
+                # Another server process created the same container in the meantime
+                if e.status_code != 409:
+                    raise
+                container = client.containers.get(self.hostname)
         
         # If the container exists but is not running, start it.
         # If it fails to start due to a network error, remove it and create it again
@@ -149,19 +511,75 @@ class Database(ABC):
             
             raise
 
+    def is_ready(self, container: Container) -> bool:
+        '''
+            Returns True if the DBMS in the container accepts connections.
+            By default only checks that the container is running, backends should probe the DBMS itself.
+        '''
+
+        container.reload()
+        return container.status == 'running'
+
+    def _probe_ready(self, container: Container) -> bool:
+        '''Checks whether the container is ready, failing fast if it stopped while booting.'''
+
+        if self.is_ready(container):
+            return True
+
+        container.reload()
+        if container.status in ('exited', 'dead'):
+            raise Exception(f'Container {self.hostname} stopped while starting (status: {container.status}).')
+
+        return False
+
+    def ensure_container(self) -> bool:
+        '''
+            Makes sure the container is running and ready, contacting Docker only if its state is not cached.
+            Concurrent calls for the same container result in a single call to Docker, and wait for the same boot.
+
+            Returns:
+                bool: True if the container state was taken from the cache, False if Docker was contacted.
+        '''
+
+        if self.readiness.wait_pending(self.hostname) or self.containers.is_running(self.hostname):
+            return True
+
+        with self.containers.lock(self.hostname):
+            # Another thread may have started the container while we were waiting
+            if self.readiness.wait_pending(self.hostname) or self.containers.is_running(self.hostname):
+                return True
+
+            # Registered before starting the container, so that requests arriving meanwhile wait for the boot to complete
+            self.readiness.begin(self.hostname)
+            try:
+                container = self.start_container()
+            except Exception as e:
+                self.readiness.fail(self.hostname, e)
+                raise
+
+        boot_seconds = self.readiness.wait_ready(self.hostname, lambda: self._probe_ready(container))
+        self.containers.mark_running(self.hostname)
+
+        if boot_seconds > 1:
+            dav_tools.messages.info(f'Container {self.hostname} ready after {boot_seconds:.1f} seconds.')
+
+        return False
+
     def get_connection(self, autocommit: bool = True, timeout_s: int = 30) -> DatabaseConnection:
         '''Gets a connection to the database, creating a new one if necessary.'''
-        self.start_container() # ensure container is running before connecting
+        from_cache = self.ensure_container() # ensure container is running before connecting
 
-        deadline = time.time() + timeout_s
-
-        while time.time() < deadline:
+        for elapsed in backoff(timeout_s):
             try:
-                conn = self._get_connection(autocommit=autocommit)
-                return conn
+                return self._get_connection(autocommit=autocommit)
             except Exception as e:
-                dav_tools.messages.warning(f'Failed to get connection for {self.hostname}: {e}. Retrying in 1 second... (will timeout after {int(deadline - time.time())} seconds)')
-                time.sleep(1)
+                if from_cache:
+                    # The cached state may be stale (e.g. container stopped while the events watcher was not active)
+                    self.containers.invalidate(self.hostname)
+                    from_cache = self.ensure_container()
+                    continue
+
+                dav_tools.messages.warning(f'Failed to get connection for {self.hostname}: {e}. Retrying... (will timeout after {int(timeout_s - elapsed)} seconds)')
 
         raise Exception(f'Timeout getting connection for {self.hostname} after {timeout_s} seconds.')
 
@@ -170,26 +588,75 @@ class Database(ABC):
         '''Gets a connection to the database.'''
         pass
 
+    @property
+    def pool_key(self) -> str:
+        '''Returns the key identifying this user database in the connection pool.'''
+        return f'{self.dbname}_{self.dbms_name}'
+
     def connect(self, autocommit: bool = True) -> DatabaseConnection:
-        '''Connects to the database as the specified user.'''
-        
-        if f'{self.dbname}_{self.dbms_name}' in self.connections:
-            conn = self.connections[f'{self.dbname}_{self.dbms_name}']
+        '''
+            Connects to the database as the specified user.
+            The connection is checked out from the pool on first use and held by this instance until `release` is called,
+            so that all statements of a request share the same session.
+        '''
 
-            if conn.is_open():
-                conn.clear_notices()
-                return conn
-            
-            # Stale connection in the pool, remove it and create a new one
-            with self.conn_lock:
-                del self.connections[f'{self.dbname}_{self.dbms_name}']
+        if self._conn is not None:
+            if self._conn.is_open():
+                self.containers.mark_used(self.hostname)
+                self._conn.clear_notices()
+                return self._conn
+
+            # Held connection was closed (e.g. container restarted), drop it and get a new one
             dav_tools.messages.info(f'Connection for {self.dbname} was closed, removed from pool. Creating a new connection.')
+            self.pool.discard(self.pool_key, self._conn)
+            self._conn = None
+
+        self.containers.mark_used(self.hostname)
+
+        conn = self.pool.checkout(
+            self.pool_key,
+            factory=lambda: self._open_connection(autocommit=autocommit),
+            validate=self.liveness.is_alive,
+        )
+        self._conn = conn
+
+        # Another connection of the same user, possibly in another server process, may have changed the session in the meantime
+        self._sync_session(conn)
+
+        conn.clear_notices()
+        return conn
+
+    def _open_connection(self, autocommit: bool = True) -> DatabaseConnection:
+        '''Opens a new connection. Its session state is restored by `connect`.'''
+
+        return self.get_connection(autocommit=autocommit)
+
+    def _discard_if_disconnected(self, conn: DatabaseConnection | None, exception: SQLException) -> bool:
+        '''Drops the held connection if the exception means it has been lost. Returns True if it was dropped.'''
+
+        if conn is None or conn is not self._conn or not conn.is_disconnect(exception.exception):
+            return False
+
+        self.pool.discard(self.pool_key, conn)
+        self._conn = None
+        self.containers.invalidate(self.hostname)
+        return True
+
+    def release(self) -> None:
+        '''Returns the connection held by this instance to the pool.'''
+
+        if self._conn is None:
+            return
+
+        conn, self._conn = self._conn, None
+        self._update_session_owner(conn)
+        self.pool.checkin(self.pool_key, conn)
+
+    def __enter__(self):
+        return self
 
-        with self.conn_lock:
-            conn = self.get_connection(autocommit=autocommit)
-            self._restore_last_search_path(conn)
-            self.connections[f'{self.dbname}_{self.dbms_name}'] = conn
-            return conn
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
 
     def connect_as_admin(self, autocommit: bool = True) -> DatabaseConnection:
         '''
@@ -282,28 +749,6 @@ class Database(ABC):
 
         return result[0][0]
 
-    def _persist_current_search_path(self, conn: DatabaseConnection) -> None:
-        '''Persist the current search path for future connections.'''
-
-        try:
-            result = conn.execute_sql_raw(self.metadata_queries.get_search_path())
-            search_path = result[0][0] if result else None
-            admin.User(self.dbname).set_last_search_path(search_path)
-        except Exception as e:
-            dav_tools.messages.warning(f'Failed to persist search_path for {self.dbname}: {e}')
-
-    def _restore_last_search_path(self, conn: DatabaseConnection) -> None:
-        '''Restore the last saved search path on a newly opened connection.'''
-
-        try:
-            search_path = admin.User(self.dbname).last_search_path
-            if not search_path:
-                return
-
-            conn.execute_sql_raw(self.metadata_queries.set_search_path(search_path))
-        except Exception as e:
-            dav_tools.messages.warning(f'Failed to restore search_path for {self.dbname}: {e}')
-
     def get_columns(self) -> list[CatalogColumnInfo]:
         '''Lists all tables'''
 
@@ -339,19 +784,167 @@ class Database(ABC):
             )
             for row in result
         ]
+
+    def get_schema_metadata(self) -> SchemaMetadata:
+        '''
+            Returns the columns and unique constraints of the user schemas.
+            The metadata is cached until a statement changes the schemas (see `invalidate_schema_metadata`).
+        '''
+
+        try:
+            version = admin.User(self.dbname).schema_version
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to load schema version for {self.dbname}: {e}')
+            version = None
+
+        if version is not None:
+            metadata = self.schemas.get(self.pool_key, version)
+            if metadata is not None:
+                return metadata
+
+        metadata = SchemaMetadata(
+            columns=self.get_columns(),
+            unique_columns=self.get_unique_columns(),
+            version=version,
+        )
+        self.schemas.put(self.pool_key, metadata)
+
+        return metadata
+
+    def invalidate_schema_metadata(self) -> None:
+        '''Records that the user schemas may have changed, for all server processes.'''
+
+        self.schemas.invalidate(self.pool_key)
+
+        try:
+            admin.User(self.dbname).bump_schema_version()
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to update schema version for {self.dbname}: {e}')
+    # endregion
+
+    # region Session State
+    def _sync_session(self, conn: DatabaseConnection) -> None:
+        '''Replays the shared session state on the connection, if it is behind.'''
+
+        try:
+            search_path, settings, version, owner = admin.User(self.dbname).session_state
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to load session state for {self.dbname}: {e}')
+            return
+
+        self.session = SessionState(search_path=search_path, settings=settings, version=version, owner=owner)
+
+        if conn.session_version != version:
+            self._restore_session(conn, self.session)
+
+        if owner is not None and owner != session_owner(conn):
+            self._session_warning = _('Your open transaction or temporary tables are in another session and are not visible to this query.')
+
+            # Warn only once: the owner is set again if its connection is released still holding the state
+            try:
+                admin.User(self.dbname).set_session_owner(None)
+                self.session.owner = None
+            except Exception as e:
+                dav_tools.messages.warning(f'Failed to update session owner for {self.dbname}: {e}')
+
+    def _restore_session(self, conn: DatabaseConnection, state: SessionState) -> None:
+        '''Replays session variables and search path on a connection.'''
+
+        for statement in state.settings.values():
+            try:
+                conn.execute_sql_raw(statement)
+            except Exception as e:
+                dav_tools.messages.warning(f'Failed to restore session setting for {self.dbname} ({statement}): {e}')
+
+        # Replayed statements may have reset the resource limits and the search path
+        conn.limits = None
+        if state.search_path:
+            self._restore_search_path(conn, state.search_path)
+
+        conn.session_version = state.version
+
+    def _persist_session(self, conn: DatabaseConnection, *statements: SQLCode) -> None:
+        '''Persist any change to the session state made by the statements, for future connections.'''
+
+        try:
+            result = conn.execute_sql_raw(self.metadata_queries.get_search_path())
+            search_path = result[0][0] if result else None
+            conn.search_path = search_path
+
+            state = self.session if self.session is not None else SessionState()
+            changed = state.search_path != search_path
+            state.search_path = search_path
+
+            recorded = False
+            for statement in statements:
+                recorded = state.record(statement.query) or recorded
+
+            if recorded:
+                # The statements may have changed the resource limits as well
+                conn.limits = None
+                changed = True
+
+            if changed:
+                state.version = admin.User(self.dbname).set_session_state(search_path, state.settings)
+                conn.session_version = state.version
+
+            self.session = state
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to persist session state for {self.dbname}: {e}')
+
+    def _update_session_owner(self, conn: DatabaseConnection) -> None:
+        '''Records whether the connection holds state which cannot be replayed, before it is returned to the pool.'''
+
+        if self.session is None or not conn.is_open():
+            return
+
+        try:
+            owner = session_owner(conn) if conn.has_bound_state() else None
+            if owner == self.session.owner or (owner is None and self.session.owner != session_owner(conn)):
+                return
+
+            admin.User(self.dbname).set_session_owner(owner)
+            self.session.owner = owner
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to update session owner for {self.dbname}: {e}')
+
+    def _restore_search_path(self, conn: DatabaseConnection, search_path: str) -> None:
+        '''Set the given search path on a connection.'''
+
+        try:
+            conn.execute_sql_raw(self.metadata_queries.set_search_path(search_path))
+            conn.search_path = search_path
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to restore search_path for {self.dbname}: {e}')
     # endregion
 
     # region Solution Checking
-    def _execute_solution_check(self, query: SQLCode, *, search_path: str | None = None) -> tuple[QueryResultDataset | None, bool | None]:
+    def _watched(self, conn: DatabaseConnection, execute: Callable[[], T]) -> T:
+        '''Executes a statement under the admission control and the watchdog.'''
+
+        timeout_ms = self.limits.statement_timeout_ms
+        with self.admission.slot():
+            watch = watchdog.watch(conn, timeout_ms + WATCHDOG_GRACE_MS if timeout_ms > 0 else 0)
+            try:
+                return execute()
+            finally:
+                watchdog.done(watch)
+
+    def _first_result(self, conn: DatabaseConnection, query: SQLCode) -> QueryResult | None:
+        '''Executes the query under the watchdog and returns its first result.'''
+        return self._watched(conn, lambda: next(iter(conn.execute_sql(query)), None))
+
+    def _run_solution_check(self, query: SQLCode, execute: Callable[[DatabaseConnection], T | None], *, search_path: str | None = None) -> tuple[T | None, bool | None]:
         '''
-            Execute the first statement of the query and return the result.
+            Execute the first statement of the query through `execute`, and return its outcome.
 
             Args:
                 query (SQLCode): The SQL query to execute.
+                execute (Callable[[DatabaseConnection], T | None]): Executes the query on the given connection. Returns None if the query does not return a dataset.
                 search_path (str | None): Optional search path to set for the connection before executing the query. If None, the current search path is used.
 
             Returns:
-                QueryResultDataset: The result of the query execution.
+                T | None: The value returned by `execute`.
                 bool: True if the query was executed successfully, False otherwise. None if the query was not executed (e.g. not a SELECT query).
         '''
 
@@ -362,25 +955,27 @@ class Database(ABC):
         conn = None
         try:
             conn = self.connect()
+            conn.apply_limits(self.limits)
 
             if search_path is not None:
                 # Set the search path for the connection, and reset it back to the original after executing the query
                 current_search_path = self.get_search_path()
                 self.set_search_path(search_path)
 
-                results = conn.execute_sql(query)
-                dataset = next(iter(results), None) # iterator needs to be exhausted here, before resetting search path
+                result = execute(conn)  # rows need to be read here, before resetting search path
 
                 self.set_search_path(current_search_path)
             else:
-                results = conn.execute_sql(query)
-                dataset = next(iter(results), None)
+                result = execute(conn)
 
             # If the query does not return a dataset, we don't need it
-            if not isinstance(dataset, QueryResultDataset):
+            if result is None:
                 return None, False
 
-            return dataset, True
+            return result, True
+        except AdmissionTimeoutError:
+            dav_tools.messages.warning(f'Solution check for db "{self.dbname}" rejected: too many statements running.')
+            return None, False
         except SQLException:
             # Connection was not opened, nothing to rollback
             if conn is None:
@@ -396,19 +991,47 @@ class Database(ABC):
             
             return None, False
 
-    def check_query_solution(self, query_user: SQLCode, query_solutions: list[str], solution_search_path: str) -> CheckExecutionStatus:
+    def _execute_solution_check(self, query: SQLCode, *, search_path: str | None = None) -> tuple[QueryResultDataset | None, bool | None]:
+        '''Execute the first statement of the query and return its result (see `_run_solution_check`).'''
+
+        def execute(conn: DatabaseConnection) -> QueryResultDataset | None:
+            result = self._first_result(conn, query)
+            return result if isinstance(result, QueryResultDataset) else None
+
+        return self._run_solution_check(query, execute, search_path=search_path)
+
+    def _fingerprint_solution_check(self, query: SQLCode, *, search_path: str | None = None) -> tuple[ResultFingerprint | None, bool | None]:
+        '''Execute the first statement of the query and return the fingerprint of its result, without building it (see `_run_solution_check`).'''
+
+        def execute(conn: DatabaseConnection) -> ResultFingerprint | None:
+            return self._watched(conn, lambda: conn.fingerprint_sql(query))
+
+        return self._run_solution_check(query, execute, search_path=search_path)
+
+    def check_query_solution(self, query_user: SQLCode, query_solutions: list[str], solution_search_path: str, *,
+                             exercise_id: int | None = None, dataset_str: str = '') -> CheckExecutionStatus:
         '''
         Checks the user's solution against the exercise solution.
         If multiple queries are present, only the first one is checked.
         If the exercise has no solution, a message is returned.
+
+        The check is done in two phases. First, the fingerprints of the results of the user query and of the solutions are
+        compared: they are computed while reading the rows, so correct queries are confirmed without building any result.
+        Only if no solution matches, the results of the user query and of the closest solution are built and compared.
+
         Args:
             query_user (SQLCode): The SQL query submitted by the user.
             query_solutions (list[str]): The list of SQL solutions for the exercise.
+            solution_search_path (str): The search path to use when executing the solutions.
+            exercise_id (int | None): The exercise the solutions belong to. If given, and the database matches the dataset
+                (see `matches_dataset`), the fingerprints of the solution results are cached (see `sql.result.solutions`),
+                so that the solutions are not run again.
+            dataset_str (str): The script of the dataset of the exercise, which the solution results depend on.
 
         Returns:
             tuple: A tuple containing a boolean indicating if the solution is correct and a QueryResult object.
             If the solution is correct, the QueryResult object contains a success message.
-            If the solution is incorrect, the QueryResult object contains the comparison of results.
+            If the solution is incorrect, the QueryResult object contains the comparison of results with the closest solution.
             If the exercise has no solution, a message indicating that is returned.
         '''
 
@@ -416,63 +1039,124 @@ class Database(ABC):
             message = _('No solution found for this exercise.')
             return result_message(None, None, message)
 
-        result_user, execution_success = self._execute_solution_check(query_user)
-        if result_user is None:
-            message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
-            message += _('Your query is not supported. Please ensure it is a valid SQL SELECT query.')
-            return result_message(False, execution_success, message)
+        fingerprint_user, execution_success = self._fingerprint_solution_check(query_user)
+        if fingerprint_user is None:
+            return self._unsupported_query(execution_success).to_result()
 
-        results: list[CheckResult] = []
-        for query_solution in query_solutions:
-            solution = SQLCode(query_solution)
-            result_solution, execution_success_solution = self._execute_solution_check(solution, search_path=solution_search_path)
+        # Solution results can only be shared with other students if the database has not been modified
+        cacheable = exercise_id is not None and self.matches_dataset(dataset_str)
 
-            if result_solution is None:
-                message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
-                message += _('Error executing teacher-provided solution. Have you initialized the dataset?')
+        # Cached solutions are compared first, since they do not need to be run
+        cached: dict[str, ResultFingerprint] = {}
+        if cacheable:
+            for query_solution in query_solutions:
+                fingerprint_solution = solution_results.get(solution_key(exercise_id, query_solution, dataset_str))
+                if fingerprint_solution is not None:
+                    cached[query_solution] = fingerprint_solution
 
-                results.append(CheckResultMessage(correct=None, execution_success=execution_success_solution, message=message))
-                continue
+        candidates: list[tuple[SQLCode, ResultFingerprint]] = []
+        failed: CheckResult | None = None
 
-            # ensure both results have the same columns
-            if not result_user.compare_column_names(result_solution):
-                message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
-                message += _('Your query has different columns from the solution. Cannot compare results.') + '<br/>'
-                message += _('Expected:') + f' <code>{"</code>, <code>".join([col.name for col in result_solution.columns])}</code><br/>'
-                message += _('Your query:') + f' <code>{"</code>, <code>".join([col.name for col in result_user.columns])}</code><br/>'
+        for query_solution in sorted(query_solutions, key=lambda query_solution: query_solution not in cached):
+            solution = SQLCode(query_solution, dialect=self.dialect)
+            fingerprint_solution = cached.get(query_solution)
 
-                results.append(CheckResultMessage(correct=False, execution_success=execution_success, message=message))
-                continue
+            if fingerprint_solution is None:
+                fingerprint_solution, execution_success_solution = self._fingerprint_solution_check(solution, search_path=solution_search_path)
 
-            # check for wrong data types
-            wrong_types = result_user.compare_column_types(result_solution)
+                if fingerprint_solution is None:
+                    if failed is None:
+                        failed = self._solution_error(execution_success_solution)
+                    continue
 
-            if wrong_types:
-                message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
-                message += _('Your query has different data types from the solution. Cannot compare results.') + '<br/>'
-                message += _('Expected:') + f' <code>{"</code>, <code>".join([f"{col.name}<i>({self.get_datatype_name(col.data_type)}</i>)" for col in result_solution.columns])}</code><br/>'
-                message += _('Your query:') + f' <code>{"</code>, <code>".join([f"{col.name}<i>({self.get_datatype_name(col.data_type)}</i>)" for col in result_user.columns])}</code><br/>'
+                if cacheable:
+                    solution_results.put(solution_key(exercise_id, query_solution, dataset_str), fingerprint_solution)
 
-                results.append(CheckResultMessage(correct=False, execution_success=execution_success, message=message))
-                continue
+            if fingerprint_solution.matches(fingerprint_user):
+                return self._correct_solution(execution_success).to_result()
 
-            has_same_result, comparison = result_user.compare_results(result_solution)
+            candidates.append((solution, fingerprint_solution))
 
-            if has_same_result:
-                message = '<i class="fa fa-check text-success me-1"></i>'
-                message += _('Your query returns the same values as the solution.') + '<br/>'
-                result = CheckResultMessage(correct=True, execution_success=execution_success, message=message)
-                return result.to_result()
-            else:
-                results.append(CheckResultDataset(correct=False, execution_success=execution_success, result=comparison, columns=result_user.columns))
+        # None of the solutions could be run
+        if len(candidates) == 0:
+            assert failed is not None
+            return failed.to_result()
+
+        solution, fingerprint_solution = max(candidates, key=lambda candidate: fingerprint_user.similarity(candidate[1]))
+        return self._compare_solution(query_user, fingerprint_user, solution, fingerprint_solution, solution_search_path).to_result()
+
+    def _compare_solution(self,
+                          query_user: SQLCode, fingerprint_user: ResultFingerprint,
+                          solution: SQLCode, fingerprint_solution: ResultFingerprint,
+                          solution_search_path: str) -> CheckResult:
+        '''Shows the differences between the result of the user query and the one of a solution, whose fingerprints differ.'''
+
+        columns_user, columns_solution = fingerprint_user.columns, fingerprint_solution.columns
+
+        # ensure both results have the same columns
+        if len(columns_user) != len(columns_solution):
+            message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
+            message += _('Your query has different columns from the solution. Cannot compare results.') + '<br/>'
+            message += _('Expected:') + f' <code>{"</code>, <code>".join([col.name for col in columns_solution])}</code><br/>'
+            message += _('Your query:') + f' <code>{"</code>, <code>".join([col.name for col in columns_user])}</code><br/>'
+
+            return CheckResultMessage(correct=False, execution_success=True, message=message)
 
-        # If none of the solutions were correct, return the first incorrect result
-        return results[0].to_result()
+        # check for wrong data types
+        if fingerprint_user.column_types != fingerprint_solution.column_types:
+            message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
+            message += _('Your query has different data types from the solution. Cannot compare results.') + '<br/>'
+            message += _('Expected:') + f' <code>{"</code>, <code>".join([f"{col.name}<i>({self.get_datatype_name(col.data_type)}</i>)" for col in columns_solution])}</code><br/>'
+            message += _('Your query:') + f' <code>{"</code>, <code>".join([f"{col.name}<i>({self.get_datatype_name(col.data_type)}</i>)" for col in columns_user])}</code><br/>'
+
+            return CheckResultMessage(correct=False, execution_success=True, message=message)
+
+        # Both queries are run again, this time building their results
+        result_user, execution_success = self._execute_solution_check(query_user)
+        if result_user is None:
+            return self._unsupported_query(execution_success)
+
+        result_solution, execution_success_solution = self._execute_solution_check(solution, search_path=solution_search_path)
+        if result_solution is None:
+            return self._solution_error(execution_success_solution)
+
+        # Fingerprints can differ for equal results (e.g. NaN values)
+        has_same_result, comparison = result_user.compare_results(result_solution)
+        if has_same_result:
+            return self._correct_solution(execution_success)
+
+        return CheckResultDataset(correct=False, execution_success=execution_success, result=comparison, columns=result_user.columns)
+
+    @staticmethod
+    def _correct_solution(execution_success: bool | None) -> CheckResult:
+        message = '<i class="fa fa-check text-success me-1"></i>'
+        message += _('Your query returns the same values as the solution.') + '<br/>'
+        return CheckResultMessage(correct=True, execution_success=execution_success, message=message)
+
+    @staticmethod
+    def _unsupported_query(execution_success: bool | None) -> CheckResult:
+        message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
+        message += _('Your query is not supported. Please ensure it is a valid SQL SELECT query.')
+        return CheckResultMessage(correct=False, execution_success=execution_success, message=message)
+
+    @staticmethod
+    def _solution_error(execution_success: bool | None) -> CheckResult:
+        message = '<i class="fa fa-exclamation-triangle text-danger me-1"></i>'
+        message += _('Error executing teacher-provided solution. Have you initialized the dataset?')
+        return CheckResultMessage(correct=None, execution_success=execution_success, message=message)
     # endregion
 
     # region Error checking
-    def get_system_catalog(self) -> Catalog:
-        '''Returns the system catalog for the database.'''
+    def get_system_catalog(self) -> SystemCatalog:
+        '''Returns the system catalog of the DBMS, loaded once per process and shared by all instances. Must not be modified.'''
+
+        return self.system_catalogs.get(self.dbms_name, lambda: SystemCatalog(
+            catalog=self.load_system_catalog(),
+            search_path=self.get_system_search_path(),
+        ))
+
+    def load_system_catalog(self) -> Catalog:
+        '''Loads the system catalog for the database.'''
 
         return Catalog()
 
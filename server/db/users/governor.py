@@ -0,0 +1,151 @@
+'''Limits on the resources used by each statement run on the user databases.'''
+
+from .connection import DatabaseConnection
+
+from dataclasses import dataclass
+from typing import Any
+import heapq
+import itertools
+import threading
+import time
+import os
+import dav_tools
+
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_USERS_STATEMENT_TIMEOUT_MS', '30000'))
+'''Default maximum execution time of a single statement, in milliseconds. Can be overridden per dataset or exercise.'''
+LOCK_TIMEOUT_MS = int(os.getenv('DB_USERS_LOCK_TIMEOUT_MS', '5000'))
+'''Default maximum time a statement waits for a lock, in milliseconds. Can be overridden per dataset or exercise.'''
+MAX_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_USERS_MAX_STATEMENT_TIMEOUT_MS', '300000'))
+'''Highest statement timeout which can be set for a dataset or exercise, in milliseconds.'''
+MAX_LOCK_TIMEOUT_MS = int(os.getenv('DB_USERS_MAX_LOCK_TIMEOUT_MS', '60000'))
+'''Highest lock timeout which can be set for a dataset or exercise, in milliseconds.'''
+WATCHDOG_GRACE_MS = int(os.getenv('DB_USERS_WATCHDOG_GRACE_MS', '2000'))
+'''Time given to the DBMS to enforce the statement timeout by itself, before the statement is cancelled from the server.'''
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    '''Limits applied to each statement.'''
+
+    statement_timeout_ms: int = STATEMENT_TIMEOUT_MS
+    '''Maximum execution time of a statement. 0 disables the limit.'''
+    lock_timeout_ms: int = LOCK_TIMEOUT_MS
+    '''Maximum time a statement waits for a lock. 0 disables the limit.'''
+
+    @staticmethod
+    def from_values(statement_timeout_ms: int | None, lock_timeout_ms: int | None) -> 'ResourceLimits':
+        '''Builds limits from optional values, using the defaults for the missing ones and for those out of range (see `parse_limit`).'''
+
+        return ResourceLimits(
+            statement_timeout_ms=_limit_or_default(statement_timeout_ms, MAX_STATEMENT_TIMEOUT_MS, STATEMENT_TIMEOUT_MS),
+            lock_timeout_ms=_limit_or_default(lock_timeout_ms, MAX_LOCK_TIMEOUT_MS, LOCK_TIMEOUT_MS),
+        )
+
+
+def parse_limit(value: Any, maximum: int) -> int | None:
+    '''
+        Validates a limit set for a dataset or exercise.
+        Limits cannot be disabled: they must be between 1 and `maximum` milliseconds, or None to use the default.
+
+        Raises:
+            ValueError: If the value is not a valid limit.
+    '''
+
+    if value is None:
+        return None
+
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= maximum:
+        raise ValueError(f'Invalid limit: {value!r}')
+
+    return value
+
+
+def _limit_or_default(value: int | None, maximum: int, default: int) -> int:
+    try:
+        limit = parse_limit(value, maximum)
+    except ValueError:
+        return default
+    return default if limit is None else limit
+
+
+DEFAULT_LIMITS = ResourceLimits()
+
+
+class _Watch:
+    '''A statement being watched.'''
+
+    def __init__(self, conn: DatabaseConnection):
+        self.conn = conn
+        self.done = False
+        '''Whether the statement has completed.'''
+        self.cancelled = False
+        '''Whether the statement has been cancelled by the watchdog.'''
+
+
+class Watchdog:
+    '''
+        Cancels statements still running after their deadline.
+
+        Timeouts are normally enforced by the DBMS itself, but users can change their own session settings
+        and MySQL only limits SELECT statements: the watchdog makes sure no statement holds a worker for too long.
+        A single thread watches all statements.
+    '''
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, _Watch]] = []
+        self._counter = itertools.count()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, conn: DatabaseConnection, timeout_ms: int) -> _Watch:
+        '''Starts watching a statement, which will be cancelled if not completed within the given time.'''
+
+        watch = _Watch(conn)
+        if timeout_ms <= 0:
+            return watch
+
+        deadline = time.monotonic() + timeout_ms / 1000
+
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='statement-watchdog', daemon=True)
+                self._thread.start()
+
+            heapq.heappush(self._heap, (deadline, next(self._counter), watch))
+            self._cond.notify()
+
+        return watch
+
+    def done(self, watch: _Watch) -> None:
+        '''Stops watching a statement. The entry is removed lazily, when its deadline expires.'''
+
+        with self._cond:
+            watch.done = True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+
+                deadline, _, watch = self._heap[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+
+                heapq.heappop(self._heap)
+                if watch.done:
+                    continue
+                watch.cancelled = True
+
+            # Cancel outside the lock: it requires a round-trip to the server
+            try:
+                dav_tools.messages.warning(f'Cancelling statement on {watch.conn.host}: deadline exceeded.')
+                watch.conn.cancel()
+            except Exception as e:
+                dav_tools.messages.error(f'Error cancelling statement on {watch.conn.host}: {e}')
+
+
+watchdog = Watchdog()
+'''Watchdog shared by all connections.'''
@@ -0,0 +1,58 @@
+'''
+    Prepared images of dataset scripts.
+
+    Large dataset scripts take a long time to run, and every user runs the same ones.
+    Backends supporting images run each script only once, dump the resulting objects into an image
+    and restore that image for every later initialisation of the same script.
+
+    Images are stored in the admin database, keyed by the hash of the script (see `admin.DatasetImage`),
+    so that they are shared by all server processes and dropped when the dataset script changes.
+'''
+
+from docker.models.containers import Container
+import io
+import os
+import tarfile
+import time
+
+DATASET_IMAGES = os.getenv('DB_USERS_DATASET_IMAGES', 'True').lower() == 'true'
+'''Whether datasets are initialised from prepared images, when the backend supports it.'''
+
+
+class ImageError(Exception):
+    '''Raised when an image cannot be built or restored.'''
+
+
+def put_file(container: Container, path: str, data: bytes) -> None:
+    '''Writes a file inside a container.'''
+
+    directory, _, name = path.rpartition('/')
+
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+
+    if not container.put_archive(directory or '/', archive.getvalue()):
+        raise ImageError(f'Could not copy {path} into container {container.name}.')
+
+
+def run(container: Container, command: list[str], *, environment: dict[str, str] | None = None) -> bytes:
+    '''
+        Runs a command inside a container.
+
+        Returns:
+            bytes: The standard output of the command.
+
+        Raises:
+            ImageError: If the command fails.
+    '''
+
+    exit_code, (stdout, stderr) = container.exec_run(command, environment=environment, demux=True)
+    if exit_code != 0:
+        message = (stderr or b'').decode(errors='replace').strip()
+        raise ImageError(f'`{command[0]}` failed with exit code {exit_code}: {message}')
+
+    return stdout or b''
@@ -0,0 +1,43 @@
+'''Policy deciding when a pooled connection needs an active liveness check.'''
+
+from .connection import DatabaseConnection
+
+from dataclasses import dataclass
+import os
+import time
+
+LIVENESS_TRUST_SECONDS = float(os.getenv('DB_USERS_LIVENESS_TRUST_SECONDS', '30'))
+'''Connections used successfully within this many seconds are not pinged. Set to 0 to always ping.'''
+LIVENESS_RETRY_ON_DISCONNECT = os.getenv('DB_USERS_LIVENESS_RETRY_ON_DISCONNECT', 'True').lower() == 'true'
+'''Whether a statement failing because the connection dropped is retried once on a fresh connection, if it had not been sent or is read-only.'''
+
+
+@dataclass(frozen=True)
+class LivenessPolicy:
+    '''
+        Decides whether a connection can be used without an active round-trip.
+
+        Broken connections that slip through the trust window are detected reactively,
+        when a statement fails with a disconnection error.
+    '''
+
+    trust_seconds: float = LIVENESS_TRUST_SECONDS
+    '''Connections used successfully within this interval are trusted without a round-trip.'''
+    retry_on_disconnect: bool = LIVENESS_RETRY_ON_DISCONNECT
+    '''Whether to retry a statement once on a fresh connection after a disconnection, if it had not been sent or is read-only.'''
+
+    def is_trusted(self, conn: DatabaseConnection) -> bool:
+        '''Returns True if the connection was seen alive recently enough to skip the active check.'''
+
+        return time.monotonic() - conn.last_alive < self.trust_seconds
+
+    def is_alive(self, conn: DatabaseConnection) -> bool:
+        '''Returns True if the connection can be used, pinging the server only if it is not trusted.'''
+
+        if not conn.is_open():
+            return False
+
+        if self.is_trusted(conn):
+            return True
+
+        return conn.ping()
@@ -0,0 +1,159 @@
+'''
+    Cache of the metadata of the user schemas (columns and unique constraints).
+
+    Listing the columns of a user database requires heavy joins on `information_schema`, yet it is needed for every `SELECT`,
+    both to log the query context and to build the catalog used by the error detectors.
+    User schemas rarely change between two queries, so the metadata is cached in each process, tagged with the version of the
+    user's schemas stored in the admin database (see `admin.User.schema_version`). The version is bumped by any statement which
+    may change the schemas, so that all server processes notice the change.
+'''
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from functools import cached_property
+import threading
+import os
+
+from sqlchecker import build_catalog
+from sqlscope import Catalog
+from sqlscope.catalog import CatalogColumnInfo, CatalogUniqueConstraintInfo
+
+from server.sql import SQLCode
+from .catalog import OverlayCatalog
+
+SCHEMA_CACHE_SIZE = int(os.getenv('DB_USERS_SCHEMA_CACHE_SIZE', '1000'))
+'''Maximum number of user databases whose schema metadata is kept in memory by each process.'''
+
+_SCHEMA_CHANGING_TYPES = {
+    'DO', 'CALL',                   # may run any statement
+    'COMMIT', 'ROLLBACK', 'ABORT',  # make visible or undo the changes of a transaction
+    'UNKNOWN',                      # e.g. `COMMENT`, `RENAME TABLE`, `END`
+}
+
+_READ_ONLY_TYPES = {'SHOW', 'EXPLAIN', 'SET', 'RESET'}
+_CTE_MODIFYING_TYPES = ('INSERT', 'UPDATE', 'DELETE', 'MERGE')
+
+
+def changes_schema(statement: SQLCode) -> bool:
+    '''Returns True if the statement may change the user schemas.'''
+
+    query_type = statement.query_type
+    if query_type.startswith(('CREATE', 'ALTER', 'DROP')) or query_type in _SCHEMA_CHANGING_TYPES:
+        return True
+
+    # `SELECT ... INTO` creates a table
+    return query_type == 'SELECT' and statement.has_clause('INTO')
+
+
+def is_read_only(statement: SQLCode) -> bool:
+    '''Returns True if the statement cannot change the user data or schemas. Functions called by queries are not considered.'''
+
+    query_type = statement.query_type
+    if query_type == 'SELECT':
+        # CTEs can modify data (`WITH d AS (DELETE ...) SELECT ...`)
+        if statement.first_token == 'WITH' and any(statement.has_clause(clause) for clause in _CTE_MODIFYING_TYPES):
+            return False
+        return not statement.has_clause('INTO')
+
+    return query_type in _READ_ONLY_TYPES
+
+
+@dataclass
+class SchemaMetadata:
+    '''Columns and unique constraints of the user schemas, as of a given schema version.'''
+
+    columns: list[CatalogColumnInfo]
+    unique_columns: list[CatalogUniqueConstraintInfo]
+    version: int | None = None
+    '''Schema version the metadata refers to. None if it is not known, in which case the metadata is not cached.'''
+
+    @cached_property
+    def _catalog(self) -> Catalog:
+        return build_catalog(
+            columns_info=self.columns,
+            unique_constraints_info=self.unique_columns,
+        )
+
+    @property
+    def catalog(self) -> Catalog:
+        '''Catalog of the user schemas. The catalog is built only once, each call returns a copy sharing its unmodified schemas.'''
+
+        catalog = self._catalog
+        return OverlayCatalog(_schemas=dict(catalog._schemas), _shared=frozenset(catalog._schemas))
+
+
+@dataclass
+class SchemaMetadataMetrics:
+    '''Counters describing how the schema metadata cache has been used.'''
+
+    hits: int = 0
+    '''Lookups answered by the cache.'''
+    misses: int = 0
+    '''Lookups which required querying the user database.'''
+    invalidations: int = 0
+    '''Entries dropped because the schemas changed.'''
+    evictions: int = 0
+    '''Entries removed to make room for new ones.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class SchemaMetadataCache:
+    '''LRU cache of the schema metadata of each user database, keyed by pool key.'''
+
+    def __init__(self, size: int = SCHEMA_CACHE_SIZE):
+        self.size = size
+        self.metrics = SchemaMetadataMetrics()
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, SchemaMetadata] = OrderedDict()
+
+    def get(self, key: str, version: int) -> SchemaMetadata | None:
+        '''Returns the cached metadata, if it refers to the given schema version.'''
+
+        with self._lock:
+            metadata = self._entries.get(key)
+            if metadata is None or metadata.version != version:
+                self.metrics.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.metrics.hits += 1
+            return metadata
+
+    def put(self, key: str, metadata: SchemaMetadata) -> None:
+        '''Caches the metadata of a user database, unless its version is unknown.'''
+
+        if self.size <= 0 or metadata.version is None:
+            return
+
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.version is not None and current.version > metadata.version:
+                # A newer version was loaded in the meantime
+                return
+
+            self._entries[key] = metadata
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.metrics.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        '''Drops the metadata of a user database.'''
+
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.metrics.invalidations += 1
+
+    def stats(self) -> dict[str, int]:
+        '''Returns the number of cached entries, together with the cache metrics.'''
+
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.size,
+                **self.metrics.to_dict(),
+            }
@@ -1 +1,2 @@
-from .database import MySQLDatabase, MySQLConnection
\ No newline at end of file
+from .database import MySQLDatabase, MySQLConnection
+from .shared import MySQLSharedDatabase
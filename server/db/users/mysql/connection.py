@@ -1,32 +1,63 @@
-from ..connection import DatabaseConnection
+from ..connection import DatabaseConnection, FETCH_BATCH_SIZE
 import dav_tools
 from server.sql import SQLCode, QueryResult, QueryResultDataset, QueryResultMessage, Column
+from server.sql.result.fingerprint import ResultFingerprint
 import pandas as pd
-from typing import Iterable, Any
+from typing import Iterable, Any, TYPE_CHECKING
+import math
 
 import mysql.connector
-from mysql.connector import Error as MySQLError
+from mysql.connector import Error as MySQLError, errorcode
 
 from .exception import MySQLException
 
+if TYPE_CHECKING:
+    from ..governor import ResourceLimits
+
+# Client errors meaning the server connection has been lost
+DISCONNECT_ERRNOS = {
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_SERVER_LOST_EXTENDED,
+    errorcode.CR_CONN_HOST_ERROR,
+}
+
+
+# Server errors meaning the statement exceeded a time limit or was cancelled
+TIMEOUT_ERRNOS = {
+    errorcode.ER_QUERY_TIMEOUT,         # max_execution_time
+    errorcode.ER_QUERY_INTERRUPTED,     # KILL QUERY
+    errorcode.ER_LOCK_WAIT_TIMEOUT,     # innodb_lock_wait_timeout
+}
+
+# Largest value accepted by `innodb_lock_wait_timeout`, used when the lock timeout is disabled
+_MAX_LOCK_WAIT_TIMEOUT_S = 1073741824
+
 
 class MySQLConnection(DatabaseConnection):
-    def __init__(self, host: str, port: int, autocommit: bool = True):
+    def __init__(self, host: str, port: int, autocommit: bool = True, *,
+                 database: str = 'default',
+                 user: str = 'root',
+                 password: str = ''):  # Match your container defaults: root / password (set in container env)
         super().__init__(host, port)
 
-        # Match your container defaults: root / password (set in container env)
         self.connection = mysql.connector.connect(
             host=host,
             port=port,
-            database='default',
-            user='root',
-            password='',
+            database=database,
+            user=user,
+            password=password,
             autocommit=autocommit,
         )
+        self._closed = False
+
+        # Needed to open a second connection to cancel statements
+        self._credentials = { 'database': database, 'user': user, 'password': password }
 
     def close(self) -> None:
         super().close()
 
+        self._closed = True
         try:
             if self.connection:
                 self.connection.close()
@@ -34,14 +65,13 @@ class MySQLConnection(DatabaseConnection):
             dav_tools.messages.error(f'Error closing MySQL connection for user database {self.host}: {e}')
 
     def is_open(self) -> bool:
-        # Quick local check first
-        try:
-            if not self.connection or not self.connection.is_connected():
-                return False
-        except Exception:
+        # Local check only: `is_connected()` would ping the server
+        return bool(self.connection) and not self._closed
+
+    def ping(self) -> bool:
+        if not self.is_open():
             return False
 
-        # Active check: forces a round-trip to the server
         try:
             cur = self.connection.cursor()
             try:
@@ -49,15 +79,56 @@ class MySQLConnection(DatabaseConnection):
                 cur.fetchone()
             finally:
                 cur.close()
+            self.mark_alive()
             return True
         except MySQLError:
             # The connection is broken/stale (e.g., container restarted)
-            try:
-                self.connection.close()
-            except Exception:
-                pass
+            self.close()
             return False
 
+    def is_disconnect(self, exception: Exception) -> bool:
+        if isinstance(exception, MySQLError) and exception.errno in DISCONNECT_ERRNOS:
+            self._closed = True
+            return True
+        return False
+
+    def apply_limits(self, limits: 'ResourceLimits') -> None:
+        if limits == self.limits:
+            return
+
+        lock_wait_timeout_s = math.ceil(limits.lock_timeout_ms / 1000) if limits.lock_timeout_ms > 0 else _MAX_LOCK_WAIT_TIMEOUT_S
+
+        cur = self.connection.cursor()
+        try:
+            # `max_execution_time` only applies to SELECT statements: other statements are bounded by the watchdog
+            cur.execute(f'SET SESSION max_execution_time = {int(limits.statement_timeout_ms)}, SESSION innodb_lock_wait_timeout = {max(lock_wait_timeout_s, 1)}')
+            self.limits = limits
+        except MySQLError as e:
+            dav_tools.messages.warning(f'Failed to set resource limits for user database {self.host}: {e}')
+            self.limits = None
+        finally:
+            cur.close()
+
+    def cancel(self) -> None:
+        # MySQL has no out-of-band cancel request: kill the statement from a second connection
+        killer = mysql.connector.connect(host=self.host, port=self.port, **self._credentials)
+        try:
+            cur = killer.cursor()
+            cur.execute(f'KILL QUERY {int(self.connection.connection_id)}')
+            cur.close()
+        finally:
+            killer.close()
+
+    def is_timeout(self, exception: Exception) -> bool:
+        return isinstance(exception, MySQLError) and exception.errno in TIMEOUT_ERRNOS
+
+    def in_transaction(self) -> bool:
+        return self.connection.in_transaction
+
+    def has_bound_state(self) -> bool:
+        # MySQL does not list the temporary tables of a session, only open transactions are detected
+        return self.in_transaction()
+
     def cursor(self):
         # buffered=True allows fetchall() safely even if unread results exist
         return self.connection.cursor(buffered=True)
@@ -79,43 +150,88 @@ class MySQLConnection(DatabaseConnection):
         super().clear_notices()
         # Nothing to clear for MySQL
 
-    def execute_sql(self, statement: SQLCode) -> Iterable[QueryResult]:
-        super().execute_sql(statement)
+    def execute_sql(self, statement: SQLCode, *, max_rows: int | None = None) -> Iterable[QueryResult]:
+        super().execute_sql(statement, max_rows=max_rows)
 
-        with self.cursor() as cur:
-            try:
-                cur.execute(statement.query)
-
-                if cur.description:  # query returned a result set
-                    rows = cur.fetchall()
-                    columns = [desc[0] for desc in cur.description]
-
-                    yield QueryResultDataset(
-                        result=pd.DataFrame(rows, columns=columns),
-                        columns=[
-                            Column(name=desc[0], data_type=desc[1])
-                            for desc in cur.description
-                        ] if cur.description else [],
-                        query=statement,
-                        notices=self.notices,
-                    )
-                    return
-
-                # No result set -> return a message
-                # MySQL doesn't have cur.statusmessage; provide something stable.
-                yield QueryResultMessage(
-                    message=f'OK ({cur.rowcount} rows affected)',
+        # Unbuffered cursor: rows are read from the server in batches, instead of all at once
+        cur = self.connection.cursor(buffered=False)
+        try:
+            cur.execute(statement.query)
+            self.mark_alive()
+
+            if cur.description:  # query returned a result set
+                rows: list[tuple] = []
+                while max_rows is None or len(rows) < max_rows:
+                    size = FETCH_BATCH_SIZE if max_rows is None else min(FETCH_BATCH_SIZE, max_rows - len(rows))
+                    batch = cur.fetchmany(size)
+                    rows.extend(batch)
+
+                    if len(batch) < size:
+                        break
+
+                # All rows must be read before the connection can be used again: count the remaining ones without keeping them
+                total_rows = len(rows)
+                while batch := cur.fetchmany(FETCH_BATCH_SIZE):
+                    total_rows += len(batch)
+
+                columns = [desc[0] for desc in cur.description]
+
+                yield QueryResultDataset(
+                    result=pd.DataFrame(rows, columns=columns),
+                    columns=[
+                        Column(name=desc[0], data_type=desc[1])
+                        for desc in cur.description
+                    ] if cur.description else [],
                     query=statement,
                     notices=self.notices,
+                    total_rows=total_rows,
                 )
-            except MySQLError as e:
-                raise MySQLException(e) from e
+                return
+
+            # No result set -> return a message
+            # MySQL doesn't have cur.statusmessage; provide something stable.
+            yield QueryResultMessage(
+                message=f'OK ({cur.rowcount} rows affected)',
+                query=statement,
+                notices=self.notices,
+            )
+        except MySQLError as e:
+            raise MySQLException(e) from e
+        finally:
+            try:
+                cur.close()
+            except MySQLError:
+                pass
+
+    def fingerprint_sql(self, statement: SQLCode) -> ResultFingerprint | None:
+        super().fingerprint_sql(statement)
+
+        cur = self.connection.cursor(buffered=False)
+        try:
+            cur.execute(statement.query)
+            self.mark_alive()
+
+            if not cur.description:
+                return None
+
+            return ResultFingerprint.of_rows(
+                [Column(name=desc[0], data_type=desc[1]) for desc in cur.description],
+                iter(lambda: cur.fetchmany(FETCH_BATCH_SIZE), []),
+            )
+        except MySQLError as e:
+            raise MySQLException(e) from e
+        finally:
+            try:
+                cur.close()
+            except MySQLError:
+                pass
 
     def execute_sql_raw(self, statement: str) -> list[tuple[Any, ...]]:
         super().execute_sql_raw(statement)
 
         with self.cursor() as cur:
             cur.execute(statement)
+            self.mark_alive()
 
             if cur.description:
                 return cur.fetchall()
@@ -7,7 +7,7 @@ from ..database import Database
 
 import dav_tools
 import os
-import docker
+import socket
 from docker.models.containers import Container
 from sqlscope import Catalog, load_catalog
 from pathlib import Path
@@ -28,7 +28,7 @@ class MySQLDatabase(Database):
         )
 
     def create_container(self) -> Container:
-        client = docker.from_env()
+        client = self.containers.client
 
         container = client.containers.run(
             image='mysql:latest',
@@ -51,14 +51,22 @@ class MySQLDatabase(Database):
             nano_cpus=1_000_000_000,  # Limit to 1 CPU
         )
 
-        # Wait for the container to be ready
-        container.reload()
-        while container.status != 'running':
-            dav_tools.messages.info(f'Waiting for container {self.hostname} to be running...')
-            container.reload()
-
+        # Readiness is checked by the caller, see `is_ready`
         return container
 
+    def is_ready(self, container: Container) -> bool:
+        # The temporary server started by the image entrypoint during initialization does not listen on TCP,
+        #   so the handshake only succeeds once the actual server is up
+        try:
+            with socket.create_connection((self.hostname, self.port), timeout=1) as sock:
+                header = sock.recv(5, socket.MSG_WAITALL)
+        except OSError:
+            return False
+
+        # Initial handshake packet: 3-byte length, 1-byte sequence id, then protocol version 10.
+        #   Error packets (e.g. too many connections) start with 0xff instead.
+        return len(header) == 5 and header[4] == 0x0a
+
     def _get_connection(self, autocommit: bool = True) -> MySQLConnection:
         return MySQLConnection(host=self.hostname, port=self.port, autocommit=autocommit)
     
\ No newline at end of file
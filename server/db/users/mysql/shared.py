@@ -0,0 +1,78 @@
+from .connection import MySQLConnection
+from .database import MySQLDatabase
+from .. import tenancy
+from ..database import PROJECT_NAME
+
+import os
+from mysql.connector import Error as MySQLError
+
+SHARED_HOSTS = tenancy.parse_hosts(os.getenv('DB_USERS_SHARED_MYSQL_HOSTS', f'{PROJECT_NAME}_db_users_shared_mysql'), 3306)
+'''Shared MySQL servers, as a comma-separated list of `host[:port]`.'''
+SHARED_ADMIN_USER = os.getenv('DB_USERS_SHARED_MYSQL_ADMIN_USER', 'root')
+'''User used to create the user databases and accounts.'''
+SHARED_ADMIN_PASSWORD = os.getenv('DB_USERS_SHARED_MYSQL_ADMIN_PASSWORD', '')
+
+
+class MySQLSharedDatabase(MySQLDatabase):
+    '''
+        Places each user in a dedicated database, accessible only by a dedicated account, on one of the shared MySQL servers.
+        Sessions are limited by `max_execution_time` and the number of concurrent connections of the account.
+        Since in MySQL schemas are databases, users cannot create additional schemas.
+    '''
+
+    tenants: tenancy.TenantRegistry = tenancy.TenantRegistry()
+    '''Users already provisioned by this process, shared by all instances.'''
+
+    def __init__(self, dbname: str):
+        super().__init__(dbname)
+
+        self.server_host, self.port = tenancy.pick_host(SHARED_HOSTS, dbname)
+        self.tenant = tenancy.tenant_name(dbname)
+
+    @property
+    def hostname(self) -> str:
+        return self.server_host
+
+    @property
+    def tenant_key(self) -> str:
+        return f'{self.server_host}:{self.port}/{self.tenant}'
+
+    def create_container(self):
+        raise NotImplementedError('Shared servers are managed by the deployment.')
+
+    def ensure_container(self) -> bool:
+        return self.tenants.ensure(self.tenant_key, self._provision)
+
+    def _provision(self) -> None:
+        '''Creates the account and database of the user, if needed, and (re)applies their limits.'''
+
+        # Tenant names and passwords are hex strings, so they can be safely embedded in the statements
+        account = f"'{self.tenant}'@'%'"
+        password = tenancy.tenant_password(self.dbname)
+
+        conn = MySQLConnection(host=self.server_host, port=self.port, database='mysql', user=SHARED_ADMIN_USER, password=SHARED_ADMIN_PASSWORD)
+        try:
+            conn.execute_sql_raw(f'CREATE DATABASE IF NOT EXISTS `{self.tenant}`')
+            conn.execute_sql_raw(f"CREATE USER IF NOT EXISTS {account} IDENTIFIED BY '{password}'")
+            conn.execute_sql_raw(f"ALTER USER {account} IDENTIFIED BY '{password}' WITH MAX_USER_CONNECTIONS {tenancy.SHARED_CONNECTION_LIMIT}")
+            conn.execute_sql_raw(f'GRANT ALL PRIVILEGES ON `{self.tenant}`.* TO {account}')
+        finally:
+            conn.close()
+
+    def _get_connection(self, autocommit: bool = True) -> MySQLConnection:
+        try:
+            conn = MySQLConnection(
+                host=self.server_host,
+                port=self.port,
+                autocommit=autocommit,
+                database=self.tenant,
+                user=self.tenant,
+                password=tenancy.tenant_password(self.dbname),
+            )
+        except MySQLError:
+            # The database or account may have been dropped, provision them again on retry
+            self.tenants.forget(self.tenant_key)
+            raise
+
+        conn.execute_sql_raw(f'SET SESSION max_execution_time = {tenancy.SHARED_STATEMENT_TIMEOUT_MS}')
+        return conn
@@ -0,0 +1,280 @@
+'''Thread-safe, bounded pool of connections to the user databases.'''
+
+from .connection import DatabaseConnection
+
+from dataclasses import dataclass, field, asdict
+from typing import Callable
+import threading
+import time
+import os
+import dav_tools
+
+POOL_SIZE = int(os.getenv('DB_USERS_POOL_SIZE', '2'))
+'''Maximum number of connections to each user database.'''
+POOL_MAX_TOTAL = int(os.getenv('DB_USERS_POOL_MAX_TOTAL', '200'))
+'''Maximum number of connections across all user databases.'''
+POOL_IDLE_SECONDS = int(os.getenv('DB_USERS_POOL_IDLE_SECONDS', '900'))
+'''Idle connections older than this are closed by the pool.'''
+POOL_TIMEOUT_SECONDS = int(os.getenv('DB_USERS_POOL_TIMEOUT_SECONDS', '30'))
+'''Maximum time to wait for a free connection before giving up.'''
+
+# Minimum interval between two sweeps for expired idle connections
+_SWEEP_INTERVAL_SECONDS = 10
+
+
+class PoolTimeoutError(Exception):
+    '''Raised when no connection becomes available before the checkout timeout.'''
+
+
+@dataclass
+class PoolMetrics:
+    '''Counters describing how the pool has been used.'''
+
+    hits: int = 0
+    '''Checkouts served by an idle connection.'''
+    misses: int = 0
+    '''Checkouts that had to open a new connection.'''
+    waits: int = 0
+    '''Checkouts that had to wait for a connection to be returned.'''
+    timeouts: int = 0
+    '''Checkouts that gave up waiting.'''
+    evictions: int = 0
+    '''Idle connections closed by the pool (expired or to make room for other users).'''
+    discards: int = 0
+    '''Connections dropped because they were found to be broken.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class _KeyState:
+    '''Connections belonging to a single user database.'''
+
+    idle: list[tuple[DatabaseConnection, float]] = field(default_factory=list)
+    '''Idle connections, with the time they were returned. Most recently used last.'''
+    in_use: int = 0
+    '''Connections currently checked out, including the ones being opened.'''
+
+
+class ConnectionPool:
+    '''
+        Pool of connections, keyed by user database.
+
+        Each key holds at most `max_per_key` connections, and the pool holds at most `max_total`
+        connections overall. When the global cap is reached, the least recently used idle
+        connection of any key is closed to make room.
+        Connections are opened outside the pool lock, so a slow container does not block other users.
+    '''
+
+    def __init__(self, *,
+                 max_per_key: int = POOL_SIZE,
+                 max_total: int = POOL_MAX_TOTAL,
+                 idle_timeout: float = POOL_IDLE_SECONDS,
+                 checkout_timeout: float = POOL_TIMEOUT_SECONDS):
+        self.max_per_key = max_per_key
+        self.max_total = max_total
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+
+        self.metrics = PoolMetrics()
+
+        self._cond = threading.Condition()
+        self._keys: dict[str, _KeyState] = {}
+        self._total = 0
+        self._last_sweep = time.monotonic()
+
+    def checkout(self,
+                 key: str,
+                 factory: Callable[[], DatabaseConnection],
+                 validate: Callable[[DatabaseConnection], bool] | None = None) -> DatabaseConnection:
+        '''
+            Checks out a connection for the given key.
+
+            Args:
+                key (str): The user database the connection belongs to.
+                factory (Callable): Opens a new connection, if no idle one is available.
+                validate (Callable | None): Called on idle connections before handing them out. Connections failing validation are discarded.
+
+            Returns:
+                DatabaseConnection: A connection reserved for the caller until it is checked in or discarded.
+
+            Raises:
+                PoolTimeoutError: If no connection becomes available within the checkout timeout.
+        '''
+
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+
+        while True:
+            to_close: list[DatabaseConnection] = []
+            conn = None
+
+            with self._cond:
+                to_close.extend(self._sweep())
+
+                while True:
+                    state = self._keys.setdefault(key, _KeyState())
+
+                    if state.idle:
+                        conn, _ = state.idle.pop()
+                        state.in_use += 1
+                        break
+
+                    if state.in_use < self.max_per_key:
+                        if self._total >= self.max_total:
+                            evicted = self._evict_lru()
+                            if evicted is not None:
+                                to_close.append(evicted)
+
+                        if self._total < self.max_total:
+                            state.in_use += 1
+                            self._total += 1
+                            self.metrics.misses += 1
+                            break
+
+                    if not waited:
+                        waited = True
+                        self.metrics.waits += 1
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics.timeouts += 1
+                        self._close_all(to_close)
+                        raise PoolTimeoutError(f'Timeout waiting for a connection to {key} after {self.checkout_timeout} seconds.')
+
+                    self._cond.wait(remaining)
+
+            self._close_all(to_close)
+
+            if conn is None:
+                # A slot was reserved: open a new connection outside the lock
+                try:
+                    return factory()
+                except BaseException:
+                    self._release_slot(key)
+                    raise
+
+            if validate is None or validate(conn):
+                with self._cond:
+                    self.metrics.hits += 1
+                return conn
+
+            # Idle connection was broken, drop it and try again
+            self.discard(key, conn)
+
+    def checkin(self, key: str, conn: DatabaseConnection) -> None:
+        '''Returns a checked out connection to the pool.'''
+
+        with self._cond:
+            state = self._keys.setdefault(key, _KeyState())
+            state.in_use -= 1
+            state.idle.append((conn, time.monotonic()))
+            self._cond.notify_all()
+
+    def discard(self, key: str, conn: DatabaseConnection) -> None:
+        '''Drops a checked out connection that can no longer be used, and closes it.'''
+
+        with self._cond:
+            self.metrics.discards += 1
+        self._release_slot(key)
+        self._close_all([conn])
+
+    def clear(self, key: str | None = None) -> None:
+        '''Closes all idle connections, or only the ones of the given key.'''
+
+        to_close: list[DatabaseConnection] = []
+        with self._cond:
+            keys = list(self._keys) if key is None else [key] if key in self._keys else []
+
+            for key in keys:
+                state = self._keys[key]
+                to_close.extend(conn for conn, _ in state.idle)
+                self._total -= len(state.idle)
+                state.idle.clear()
+                if state.in_use == 0:
+                    del self._keys[key]
+            self._cond.notify_all()
+
+        self._close_all(to_close)
+
+    def in_use(self, key: str) -> int:
+        '''Returns the number of connections of the given key currently checked out.'''
+
+        with self._cond:
+            state = self._keys.get(key)
+            return state.in_use if state is not None else 0
+
+    def stats(self) -> dict[str, int]:
+        '''Returns the current size of the pool, together with its metrics.'''
+
+        with self._cond:
+            idle = sum(len(state.idle) for state in self._keys.values())
+            return {
+                'keys': len(self._keys),
+                'total': self._total,
+                'idle': idle,
+                'in_use': self._total - idle,
+                **self.metrics.to_dict(),
+            }
+
+    # region Internals
+    def _release_slot(self, key: str) -> None:
+        '''Frees the slot of a connection that will not be returned to the pool.'''
+
+        with self._cond:
+            state = self._keys.get(key)
+            if state is not None:
+                state.in_use -= 1
+                if state.in_use == 0 and not state.idle:
+                    del self._keys[key]
+            self._total -= 1
+            self._cond.notify_all()
+
+    def _evict_lru(self) -> DatabaseConnection | None:
+        '''Removes the least recently used idle connection of any key. Must be called with the lock held.'''
+
+        oldest_key = None
+        oldest_ts = None
+        for key, state in self._keys.items():
+            if state.idle and (oldest_ts is None or state.idle[0][1] < oldest_ts):
+                oldest_key = key
+                oldest_ts = state.idle[0][1]
+
+        if oldest_key is None:
+            return None
+
+        conn, _ = self._keys[oldest_key].idle.pop(0)
+        self._total -= 1
+        self.metrics.evictions += 1
+        return conn
+
+    def _sweep(self) -> list[DatabaseConnection]:
+        '''Removes idle connections past the idle timeout. Must be called with the lock held.'''
+
+        now = time.monotonic()
+        if now - self._last_sweep < _SWEEP_INTERVAL_SECONDS:
+            return []
+        self._last_sweep = now
+
+        expired: list[DatabaseConnection] = []
+        for key, state in list(self._keys.items()):
+            while state.idle and now - state.idle[0][1] > self.idle_timeout:
+                conn, _ = state.idle.pop(0)
+                expired.append(conn)
+
+            if state.in_use == 0 and not state.idle:
+                del self._keys[key]
+
+        self._total -= len(expired)
+        self.metrics.evictions += len(expired)
+        return expired
+
+    @staticmethod
+    def _close_all(connections: list[DatabaseConnection]) -> None:
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                dav_tools.messages.warning(f'Error closing pooled connection to {conn.host}: {e}')
+    # endregion
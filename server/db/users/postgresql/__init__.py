@@ -1 +1,2 @@
-from .database import PostgresqlDatabase, PostgresqlConnection
\ No newline at end of file
+from .database import PostgresqlDatabase, PostgresqlConnection
+from .shared import PostgresqlSharedDatabase
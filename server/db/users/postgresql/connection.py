@@ -1,21 +1,46 @@
-from ..connection import DatabaseConnection
+from ..connection import DatabaseConnection, FETCH_BATCH_SIZE
 import psycopg2
 import dav_tools
 from server.sql import SQLCode, QueryResult, QueryResultDataset, QueryResultMessage, Column
+from server.sql.result.fingerprint import FingerprintBuilder, ResultFingerprint
 import pandas as pd
-from typing import Iterable
+from typing import Callable, Iterable, TypeVar, TYPE_CHECKING
 from .exception import PostgresqlException
 from typing import Any
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+if TYPE_CHECKING:
+    from ..governor import ResourceLimits
+
+# Name of the server-side cursor used to stream query results
+_CURSOR_NAME = 'lensql_result'
+_DECLARE_CURSOR = f'DECLARE {_CURSOR_NAME} NO SCROLL CURSOR FOR '
+
+T = TypeVar('T')
+
+# Errors raised when declaring a cursor for a query which cannot be run through one
+_UNDECLARABLE_PGCODES = {
+    '42601',    # syntax_error
+    '0A000',    # feature_not_supported
+}
+
+_TIMEOUT_PGCODES = {
+    '57014',    # query_canceled (statement_timeout or cancel request)
+    '55P03',    # lock_not_available (lock_timeout)
+}
 
 class PostgresqlConnection(DatabaseConnection):
-    def __init__(self, host: str, port: int, autocommit: bool = True):
+    def __init__(self, host: str, port: int, autocommit: bool = True, *,
+                 dbname: str = 'postgres',
+                 user: str = 'postgres',
+                 password: str = ''):  # Password is set to trust in the container configuration
         super().__init__(host, port)
         self.connection = psycopg2.connect(
             host=host,
             port=port,
-            dbname='postgres',
-            user='postgres',
-            password='' # Password is set to trust in the container configuration
+            dbname=dbname,
+            user=user,
+            password=password,
         )
 
         self.connection.autocommit = autocommit
@@ -29,15 +54,17 @@ class PostgresqlConnection(DatabaseConnection):
             dav_tools.messages.error(f"Error closing PostgreSQL connection for user database {self.host}: {e}")
 
     def is_open(self) -> bool:
-        # Quick local check first
-        if not self.connection or self.connection.closed:
+        return bool(self.connection) and self.connection.closed == 0
+
+    def ping(self) -> bool:
+        if not self.is_open():
             return False
 
-        # Active check: forces a round-trip to the server
         try:
             with self.connection.cursor() as cur:
                 cur.execute('SELECT 1;')
                 cur.fetchone()
+            self.mark_alive()
             return True
         except psycopg2.Error:
             # The connection is broken/stale (e.g., container restarted)
@@ -47,6 +74,45 @@ class PostgresqlConnection(DatabaseConnection):
                 pass
             return False
 
+    def is_disconnect(self, exception: Exception) -> bool:
+        # psycopg2 flags the connection as closed when the server goes away,
+        #   which distinguishes it from other OperationalErrors (e.g. query cancelled)
+        return isinstance(exception, (psycopg2.OperationalError, psycopg2.InterfaceError)) and self.connection.closed != 0
+
+    def apply_limits(self, limits: 'ResourceLimits') -> None:
+        if limits == self.limits:
+            return
+
+        try:
+            with self.cursor() as cur:
+                cur.execute(f'SET statement_timeout = {int(limits.statement_timeout_ms)}; SET lock_timeout = {int(limits.lock_timeout_ms)};')
+        except psycopg2.Error as e:
+            # e.g. the user's transaction is aborted: the statement will fail anyway
+            dav_tools.messages.warning(f'Failed to set resource limits for user database {self.host}: {e}')
+            self.limits = None
+            return
+
+        # Settings changed inside a transaction are reverted if it is rolled back, so they are not cached
+        self.limits = limits if self.connection.info.transaction_status == TRANSACTION_STATUS_IDLE else None
+
+    def cancel(self) -> None:
+        # Sends a cancel request on a separate channel, as `pg_cancel_backend` would
+        self.connection.cancel()
+
+    def is_timeout(self, exception: Exception) -> bool:
+        return isinstance(exception, psycopg2.Error) and exception.pgcode in _TIMEOUT_PGCODES
+
+    def in_transaction(self) -> bool:
+        return self.connection.info.transaction_status != TRANSACTION_STATUS_IDLE
+
+    def has_bound_state(self) -> bool:
+        if self.in_transaction():
+            return True
+
+        with self.cursor() as cur:
+            cur.execute('SELECT EXISTS (SELECT 1 FROM pg_class WHERE relnamespace = pg_my_temp_schema())')
+            return cur.fetchone()[0]
+
     def cursor(self):
         return self.connection.cursor()
     
@@ -69,22 +135,29 @@ class PostgresqlConnection(DatabaseConnection):
 
         self.connection.notices.clear()
 
-    def execute_sql(self, statement: SQLCode) -> Iterable[QueryResult]:
-        super().execute_sql(statement)
+    def execute_sql(self, statement: SQLCode, *, max_rows: int | None = None) -> Iterable[QueryResult]:
+        super().execute_sql(statement, max_rows=max_rows)
+
+        if max_rows is not None and self._can_stream(statement):
+            result = self._execute_streaming(statement, max_rows)
+            if result is not None:
+                yield result
+                return
 
         with self.cursor() as cur:
             try:
                 cur.execute(statement.query)
+                self.mark_alive()
 
                 if cur.description:     # Check if the query has a result set
-                    rows = cur.fetchall()
-                    columns = [desc[0] for desc in cur.description]
-
-                    yield QueryResultDataset(
-                        result=pd.DataFrame(rows, columns=columns),
-                        columns=[Column(name=col.name, data_type=col.type_code) for col in cur.description] if cur.description else [],
-                        query=statement,
-                        notices=self.notices)
+                    if max_rows is None:
+                        rows = cur.fetchall()
+                        total_rows = len(rows)
+                    else:
+                        rows = cur.fetchmany(max_rows)
+                        total_rows = cur.rowcount
+
+                    yield self._dataset(statement, cur.description, rows, total_rows)
                     return
 
                 # No result set, return message status 
@@ -94,13 +167,183 @@ class PostgresqlConnection(DatabaseConnection):
                     notices=self.notices)
             except psycopg2.Error as e:
                 raise PostgresqlException(e) from e
-            
+
+    def _dataset(self, statement: SQLCode, description, rows: list[tuple], total_rows: int) -> QueryResultDataset:
+        return QueryResultDataset(
+            result=pd.DataFrame(rows, columns=[desc[0] for desc in description]),
+            columns=self._columns(description),
+            query=statement,
+            notices=self.notices,
+            total_rows=total_rows)
+
+    @staticmethod
+    def _columns(description) -> list[Column]:
+        return [Column(name=col.name, data_type=col.type_code) for col in description]
+
+    def _can_stream(self, statement: SQLCode) -> bool:
+        '''Returns True if the statement can be run through a server-side cursor.'''
+
+        # Transactions are managed explicitly, so psycopg2 must not open its own.
+        # Only plain queries can be declared as cursors (`SELECT ... INTO` creates a table instead),
+        #   and nothing can run in a transaction which already failed
+        return (
+            self.connection.autocommit
+            and statement.query_type == 'SELECT'
+            and not statement.has_clause('INTO')
+            and self.connection.info.transaction_status in (TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS)
+        )
+
+    def _execute_streaming(self, statement: SQLCode, max_rows: int) -> QueryResultDataset | None:
+        '''
+            Runs a query through a server-side cursor, fetching at most `max_rows` rows in batches.
+            The remaining rows are skipped on the server, only to count them.
+
+            Returns:
+                QueryResultDataset | None: The result, or None if the query cannot be run through a cursor.
+                    In this case the query is to be run again without a cursor.
+        '''
+
+        def read(cur) -> QueryResultDataset:
+            rows: list[tuple] = []
+            while True:
+                size = min(FETCH_BATCH_SIZE, max_rows - len(rows))
+                cur.execute(f'FETCH FORWARD {size} FROM {_CURSOR_NAME}')
+                batch = cur.fetchall()
+                rows.extend(batch)
+
+                if len(batch) < size or len(rows) >= max_rows:
+                    break
+
+            description = cur.description
+            total_rows = len(rows)
+
+            if len(rows) >= max_rows:
+                cur.execute(f'MOVE FORWARD ALL IN {_CURSOR_NAME}')
+                total_rows += cur.rowcount
+
+            return self._dataset(statement, description, rows, total_rows)
+
+        return self._with_declared_cursor(statement, read)
+
+    def _with_declared_cursor(self, statement: SQLCode, read: Callable[[Any], T]) -> T | None:
+        '''
+            Declares a server-side cursor for a query, and reads its rows with `read`.
+
+            psycopg2 named cursors cannot be used on autocommit connections, even inside a transaction opened by the user,
+            so the cursor is declared explicitly: in its own transaction if the user has none open, or inside a savepoint otherwise.
+
+            Returns:
+                T | None: The value returned by `read`, or None if the query cannot be declared as a cursor.
+                    Nothing has been run in this case, so the query can be run again without a cursor.
+
+            Raises:
+                PostgresqlException: If the query fails. Errors refer to the query as written by the user.
+        '''
+
+        own_transaction = self.connection.info.transaction_status == TRANSACTION_STATUS_IDLE
+        declared = False
+
+        with self.cursor() as cur:
+            try:
+                cur.execute('BEGIN' if own_transaction else f'SAVEPOINT {_CURSOR_NAME}')
+                cur.execute(f'{_DECLARE_CURSOR}{statement.query}')
+                declared = True
+                self.mark_alive()
+
+                result = read(cur)
+
+                cur.execute(f'CLOSE {_CURSOR_NAME}')
+                cur.execute('COMMIT' if own_transaction else f'RELEASE SAVEPOINT {_CURSOR_NAME}')
+            except psycopg2.Error as e:
+                try:
+                    cur.execute('ROLLBACK' if own_transaction else f'ROLLBACK TO SAVEPOINT {_CURSOR_NAME}')
+                except psycopg2.Error:
+                    pass
+
+                if not declared and e.pgcode in _UNDECLARABLE_PGCODES:
+                    return None
+
+                exception = PostgresqlException(e)
+                exception.traceback = _without_cursor(exception.traceback)
+                raise exception from e
+
+        return result
+
+    def fingerprint_sql(self, statement: SQLCode) -> ResultFingerprint | None:
+        super().fingerprint_sql(statement)
+
+        def read(cur) -> ResultFingerprint:
+            builder = None
+            while True:
+                cur.execute(f'FETCH FORWARD {FETCH_BATCH_SIZE} FROM {_CURSOR_NAME}')
+                batch = cur.fetchall()
+
+                if builder is None:
+                    builder = FingerprintBuilder(self._columns(cur.description))
+                builder.add(batch)
+
+                if len(batch) < FETCH_BATCH_SIZE:
+                    return builder.build()
+
+        if self._can_stream(statement):
+            fingerprint = self._with_declared_cursor(statement, read)
+            if fingerprint is not None:
+                return fingerprint
+
+        with self.cursor() as cur:
+            try:
+                cur.execute(statement.query)
+                self.mark_alive()
+
+                if not cur.description:
+                    return None
+
+                return ResultFingerprint.of_rows(self._columns(cur.description), iter(lambda: cur.fetchmany(FETCH_BATCH_SIZE), []))
+            except psycopg2.Error as e:
+                raise PostgresqlException(e) from e
+
+    # Multiple statements sent in a single query run in an implicit transaction
+    atomic_batches = True
+
+    def execute_batch(self, statements: list[SQLCode]) -> None:
+        script = '\n'.join(
+            code if code.endswith(';') else f'{code};'
+            for code in (statement.strip_comments().query for statement in statements)
+        )
+
+        with self.cursor() as cur:
+            try:
+                cur.execute(script)
+                self.mark_alive()
+            except psycopg2.Error as e:
+                raise PostgresqlException(e) from e
+
     def execute_sql_raw(self, statement: str) -> list[tuple[Any, ...]]:
         super().execute_sql_raw(statement)
 
         with self.cursor() as cur:
             cur.execute(statement)
+            self.mark_alive()
 
             if cur.description:     # Check if the query has a result set
                 return cur.fetchall()
             return []
+
+
+def _without_cursor(traceback: list[str]) -> list[str]:
+    '''Removes the cursor declaration from the context of an error, i.e. the query line and the position marker below it.'''
+
+    traceback = list(traceback)
+
+    for i, line in enumerate(traceback):
+        start = line.find(_DECLARE_CURSOR)
+        if not line.startswith('LINE ') or start == -1:
+            continue
+
+        end = start + len(_DECLARE_CURSOR)
+        traceback[i] = line[:start] + line[end:]
+
+        if i + 1 < len(traceback) and traceback[i + 1].strip() == '^' and traceback[i + 1].index('^') >= end:
+            traceback[i + 1] = traceback[i + 1][:start] + traceback[i + 1][end:]
+
+    return traceback
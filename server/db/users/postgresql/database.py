@@ -7,10 +7,12 @@ from .data_types import DATA_TYPES
 from .connection import PostgresqlConnection
 from .queries import PostgresqlBuiltinQueries, PostgresqlMetadataQueries
 from ..database import Database
+from .. import images
 
 import dav_tools
 import os
-import docker
+import secrets
+import docker.errors
 from docker.models.containers import Container
 from sqlscope import Catalog, load_catalog
 from pathlib import Path
@@ -30,7 +32,7 @@ class PostgresqlDatabase(Database):
         )
 
     def create_container(self) -> Container:
-        client = docker.from_env()
+        client = self.containers.client
 
         container = client.containers.run(
             image='postgres:latest',
@@ -53,16 +55,64 @@ class PostgresqlDatabase(Database):
             nano_cpus=1_000_000_000,  # Limit to 1 CPU,
         )
 
-        # Wait for the container to be ready
-        container.reload()
-        while container.status != 'running':
-            dav_tools.messages.info(f'Waiting for container {self.hostname} to be running...')
-            container.reload()
-
+        # Readiness is checked by the caller, see `is_ready`
         return container
 
+    def is_ready(self, container: Container) -> bool:
+        # The temporary server started by the image entrypoint during initialization does not listen on TCP,
+        #   so `pg_isready` on the loopback address only succeeds once the actual server is up
+        try:
+            exit_code, _ = container.exec_run(['pg_isready', '-q', '-h', '127.0.0.1', '-p', str(self.port), '-U', self.admin_username])
+        except docker.errors.APIError:
+            # container not running yet
+            return False
+
+        return exit_code == 0
+
     def _get_connection(self, autocommit: bool = True) -> PostgresqlConnection:
         return PostgresqlConnection(host=self.hostname, port=self.port, autocommit=autocommit)
+
+    # Images are built and restored with the client tools shipped in the container
+    supports_images = True
+
+    def build_image(self, script: str) -> bytes | None:
+        container = self.containers.client.containers.get(self.hostname)
+
+        # Concurrent builds in the same container must not clash
+        build_db = f'lensql_image_{secrets.token_hex(6)}'
+        script_path = f'/tmp/{build_db}.sql'
+
+        images.put_file(container, script_path, script.encode())
+        try:
+            images.run(container, ['createdb', '-U', self.admin_username, build_db])
+            try:
+                try:
+                    images.run(container, ['psql', '-U', self.admin_username, '-d', build_db, '-X', '-q', '-v', 'ON_ERROR_STOP=1', '-f', script_path])
+                except images.ImageError as e:
+                    dav_tools.messages.info(f'Dataset script cannot be prepared as an image: {e}')
+                    return None
+
+                return images.run(container, ['pg_dump', '-U', self.admin_username, '--format=custom', '--no-owner', build_db])
+            finally:
+                images.run(container, ['dropdb', '-U', self.admin_username, '--if-exists', build_db])
+        finally:
+            images.run(container, ['rm', '-f', script_path])
+
+    def restore_image(self, image: bytes) -> None:
+        container = self.containers.client.containers.get(self.hostname)
+        image_path = f'/tmp/lensql_image_{secrets.token_hex(6)}.dump'
+
+        images.put_file(container, image_path, image)
+        try:
+            # Objects in the image replace existing ones, atomically.
+            # Locks held by the user's own sessions would block the restore, so it is bounded by the lock timeout
+            images.run(
+                container,
+                ['pg_restore', '-U', self.admin_username, '-d', 'postgres', '--clean', '--if-exists', '--no-owner', '--single-transaction', image_path],
+                environment={'PGOPTIONS': f'-c lock_timeout={int(self.limits.lock_timeout_ms)}'},
+            )
+        finally:
+            images.run(container, ['rm', '-f', image_path])
     
     def get_search_path(self) -> str:
         result = super().get_search_path()
@@ -82,7 +132,7 @@ class PostgresqlDatabase(Database):
 
         return result
 
-    def get_system_catalog(self) -> Catalog:
+    def load_system_catalog(self) -> Catalog:
         this_dir = Path(__file__).parent
 
         return load_catalog(f'{this_dir}/system_catalog.json')
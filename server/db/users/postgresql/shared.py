@@ -0,0 +1,88 @@
+from .connection import PostgresqlConnection
+from .database import PostgresqlDatabase
+from .. import tenancy
+from ..database import PROJECT_NAME
+
+import os
+import psycopg2
+
+SHARED_HOSTS = tenancy.parse_hosts(os.getenv('DB_USERS_SHARED_POSTGRES_HOSTS', f'{PROJECT_NAME}_db_users_shared_postgresql'), 5432)
+'''Shared PostgreSQL servers, as a comma-separated list of `host[:port]`.'''
+SHARED_ADMIN_USER = os.getenv('DB_USERS_SHARED_POSTGRES_ADMIN_USER', 'postgres')
+'''Superuser used to create the user databases and roles.'''
+SHARED_ADMIN_PASSWORD = os.getenv('DB_USERS_SHARED_POSTGRES_ADMIN_PASSWORD', 'password')
+
+
+class PostgresqlSharedDatabase(PostgresqlDatabase):
+    '''
+        Places each user in a dedicated database, owned by a dedicated role, on one of the shared PostgreSQL servers.
+        Roles cannot connect to other databases, and their sessions are limited by `statement_timeout`, `work_mem` and `temp_file_limit`.
+    '''
+
+    tenants: tenancy.TenantRegistry = tenancy.TenantRegistry()
+    '''Users already provisioned by this process, shared by all instances.'''
+
+    # Shared servers are managed by the deployment: their client tools cannot be run from here
+    supports_images = False
+
+    def __init__(self, dbname: str):
+        super().__init__(dbname)
+
+        self.server_host, self.port = tenancy.pick_host(SHARED_HOSTS, dbname)
+        self.tenant = tenancy.tenant_name(dbname)
+
+    @property
+    def hostname(self) -> str:
+        return self.server_host
+
+    @property
+    def tenant_key(self) -> str:
+        return f'{self.server_host}:{self.port}/{self.tenant}'
+
+    def create_container(self):
+        raise NotImplementedError('Shared servers are managed by the deployment.')
+
+    def ensure_container(self) -> bool:
+        return self.tenants.ensure(self.tenant_key, self._provision)
+
+    def _provision(self) -> None:
+        '''Creates the role and database of the user, if needed, and (re)applies their limits.'''
+
+        # Tenant names and passwords are hex strings, so they can be safely embedded in the statements
+        role = self.tenant
+        password = tenancy.tenant_password(self.dbname)
+
+        conn = PostgresqlConnection(host=self.server_host, port=self.port, user=SHARED_ADMIN_USER, password=SHARED_ADMIN_PASSWORD)
+        try:
+            if not conn.execute_sql_raw(f"SELECT 1 FROM pg_roles WHERE rolname = '{role}'"):
+                conn.execute_sql_raw(f'CREATE ROLE {role}')
+
+            conn.execute_sql_raw(f"ALTER ROLE {role} WITH LOGIN NOSUPERUSER NOCREATEDB NOCREATEROLE NOREPLICATION CONNECTION LIMIT {tenancy.SHARED_CONNECTION_LIMIT} PASSWORD '{password}'")
+            conn.execute_sql_raw(f'ALTER ROLE {role} SET statement_timeout = {tenancy.SHARED_STATEMENT_TIMEOUT_MS}')
+            conn.execute_sql_raw(f"ALTER ROLE {role} SET work_mem = '{tenancy.SHARED_WORK_MEM}'")
+            conn.execute_sql_raw(f"ALTER ROLE {role} SET temp_file_limit = '{tenancy.SHARED_TEMP_FILE_LIMIT}'")
+
+            if not conn.execute_sql_raw(f"SELECT 1 FROM pg_database WHERE datname = '{role}'"):
+                conn.execute_sql_raw(f'CREATE DATABASE {role} OWNER {role}')
+
+            # Only the owner can connect to each user database, and users cannot connect to the databases of the server itself
+            conn.execute_sql_raw(f'REVOKE ALL ON DATABASE {role} FROM PUBLIC')
+            conn.execute_sql_raw('REVOKE CONNECT ON DATABASE postgres FROM PUBLIC')
+            conn.execute_sql_raw('REVOKE CONNECT ON DATABASE template1 FROM PUBLIC')
+        finally:
+            conn.close()
+
+    def _get_connection(self, autocommit: bool = True) -> PostgresqlConnection:
+        try:
+            return PostgresqlConnection(
+                host=self.server_host,
+                port=self.port,
+                autocommit=autocommit,
+                dbname=self.tenant,
+                user=self.tenant,
+                password=tenancy.tenant_password(self.dbname),
+            )
+        except psycopg2.OperationalError:
+            # The database or role may have been dropped, provision them again on retry
+            self.tenants.forget(self.tenant_key)
+            raise
@@ -0,0 +1,172 @@
+'''Waits for user database containers to accept connections, sharing a single wait among concurrent requests.'''
+
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
+from typing import Callable, Iterator
+import threading
+import time
+import os
+
+READINESS_TIMEOUT_SECONDS = int(os.getenv('DB_USERS_READINESS_TIMEOUT_SECONDS', '60'))
+'''Maximum time to wait for a container to accept connections.'''
+READINESS_INITIAL_DELAY_SECONDS = float(os.getenv('DB_USERS_READINESS_INITIAL_DELAY_SECONDS', '0.05'))
+'''Delay before the second readiness probe. Each following delay is doubled.'''
+READINESS_MAX_DELAY_SECONDS = float(os.getenv('DB_USERS_READINESS_MAX_DELAY_SECONDS', '2'))
+'''Maximum delay between two readiness probes.'''
+
+
+class ReadinessTimeoutError(Exception):
+    '''Raised when a container does not become ready before the readiness timeout.'''
+
+
+def backoff(timeout: float,
+            initial_delay: float = READINESS_INITIAL_DELAY_SECONDS,
+            max_delay: float = READINESS_MAX_DELAY_SECONDS) -> Iterator[float]:
+    '''
+        Yields the elapsed time before each attempt, sleeping with exponential backoff in between.
+        Stops once `timeout` seconds have passed.
+    '''
+
+    start = time.monotonic()
+    delay = initial_delay
+
+    while True:
+        elapsed = time.monotonic() - start
+        yield elapsed
+
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+@dataclass
+class ReadinessMetrics:
+    '''Counters describing container boots.'''
+
+    boots: int = 0
+    '''Containers which became ready.'''
+    failures: int = 0
+    '''Containers which did not become ready.'''
+    shared_waits: int = 0
+    '''Requests which waited on a boot started by another request.'''
+    total_boot_seconds: float = 0
+    '''Sum of the time taken by each container to become ready.'''
+    max_boot_seconds: float = 0
+    '''Longest time taken by a container to become ready.'''
+
+    def to_dict(self) -> dict[str, float]:
+        return asdict(self)
+
+
+class ReadinessProbe:
+    '''
+        Tracks containers which are booting.
+
+        The first request for a booting container polls it with exponential backoff,
+        all the other requests wait on the same future.
+    '''
+
+    def __init__(self, *,
+                 timeout: float = READINESS_TIMEOUT_SECONDS,
+                 initial_delay: float = READINESS_INITIAL_DELAY_SECONDS,
+                 max_delay: float = READINESS_MAX_DELAY_SECONDS):
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+
+        self.metrics = ReadinessMetrics()
+        self.boot_seconds: dict[str, float] = {}
+        '''Time taken by the last boot of each container.'''
+
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+
+    def begin(self, name: str) -> Future:
+        '''Records that the container is booting. Must be followed by `wait_ready` or `fail`.'''
+
+        with self._lock:
+            future = self._pending.get(name)
+            if future is None:
+                future = Future()
+                self._pending[name] = future
+            return future
+
+    def wait_pending(self, name: str) -> bool:
+        '''
+            Waits for the container to become ready, if it is booting.
+
+            Returns:
+                bool: True if the container was booting and is now ready, False if it was not booting.
+
+            Raises:
+                ReadinessTimeoutError: If the container did not become ready.
+        '''
+
+        with self._lock:
+            future = self._pending.get(name)
+            if future is None:
+                return False
+            self.metrics.shared_waits += 1
+
+        future.result(timeout=self.timeout)
+        return True
+
+    def wait_ready(self, name: str, is_ready: Callable[[], bool]) -> float:
+        '''
+            Polls the container until it is ready, then wakes up any request waiting for it.
+
+            Args:
+                name (str): The container name.
+                is_ready (Callable): Returns True once the container accepts connections. May raise if the container cannot become ready.
+
+            Returns:
+                float: Seconds taken by the container to become ready.
+
+            Raises:
+                ReadinessTimeoutError: If the container did not become ready within the timeout.
+        '''
+
+        future = self.begin(name)
+
+        try:
+            for elapsed in backoff(self.timeout, self.initial_delay, self.max_delay):
+                if is_ready():
+                    break
+            else:
+                raise ReadinessTimeoutError(f'Container {name} not ready after {self.timeout} seconds.')
+        except BaseException as e:
+            self.fail(name, e)
+            raise
+
+        with self._lock:
+            self._pending.pop(name, None)
+            self.boot_seconds[name] = elapsed
+            self.metrics.boots += 1
+            self.metrics.total_boot_seconds += elapsed
+            self.metrics.max_boot_seconds = max(self.metrics.max_boot_seconds, elapsed)
+
+        future.set_result(elapsed)
+        return elapsed
+
+    def fail(self, name: str, exception: BaseException) -> None:
+        '''Records that the container could not be started, waking up any request waiting for it.'''
+
+        with self._lock:
+            future = self._pending.pop(name, None)
+            self.metrics.failures += 1
+
+        if future is not None and not future.done():
+            future.set_exception(exception)
+
+    def stats(self) -> dict[str, float]:
+        '''Returns the number of booting containers, together with the boot metrics.'''
+
+        with self._lock:
+            return {
+                'booting': len(self._pending),
+                'avg_boot_seconds': self.metrics.total_boot_seconds / self.metrics.boots if self.metrics.boots else 0,
+                **self.metrics.to_dict(),
+            }
@@ -0,0 +1,311 @@
+'''
+    Background scheduler managing the lifecycle of the user database containers.
+
+    Before a lab session, the containers of the students most likely to attend are started,
+    so that their first query does not have to wait for the DBMS to boot.
+    Containers not used for a while are stopped (their data volume is kept), and the number
+    of running containers is kept within a configurable bound.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import threading
+import fcntl
+import time
+import os
+import dav_tools
+
+from .database import Database, CONTAINER_LABEL, PROJECT_NAME
+from .. import admin
+from . import get_database
+
+MAX_CONNECTION_HOURS = float(os.getenv('MAX_CONNECTION_HOURS', '4'))
+'''Containers not used for this many hours are stopped.'''
+CLEANUP_INTERVAL_SECONDS = int(os.getenv('CLEANUP_INTERVAL_SECONDS', '3600'))
+'''Interval between two checks for idle containers.'''
+MAX_RUNNING_CONTAINERS = int(os.getenv('DB_USERS_MAX_RUNNING_CONTAINERS', '100'))
+'''Maximum number of containers kept running. Containers started on demand are never refused, but the least recently used ones are stopped afterwards.'''
+PREWARM_LEAD_MINUTES = int(os.getenv('DB_USERS_PREWARM_LEAD_MINUTES', '15'))
+'''How long before a lab session the containers are started.'''
+PREWARM_WORKERS = int(os.getenv('DB_USERS_PREWARM_WORKERS', '4'))
+'''Number of containers started in parallel when pre-warming.'''
+HIBERNATE_GRACE_SECONDS = int(os.getenv('DB_USERS_HIBERNATE_GRACE_SECONDS', '600'))
+'''Containers used by any server process within this many seconds are never stopped, as their queries may still be running.'''
+SCHEDULER_ENABLED = os.getenv('DB_USERS_SCHEDULER_ENABLED', 'True').lower() == 'true'
+'''Whether the scheduler is started with the server.'''
+SCHEDULER_LOCK_FILE = os.getenv('DB_USERS_SCHEDULER_LOCK_FILE', f'/tmp/{PROJECT_NAME}_scheduler.lock')
+'''File locked by the server process running the scheduler, so that only one process runs it when the server has multiple workers.'''
+
+# Interval between two checks for upcoming lab sessions
+_TICK_SECONDS = 60
+
+_HOSTNAME_PREFIX = f'{CONTAINER_LABEL}_'
+
+
+def _parse_docker_ts(ts: str) -> float | None:
+    '''Converts a Docker timestamp (e.g. `2024-01-01T10:00:00.123456789Z`) to a UNIX timestamp.'''
+
+    try:
+        # Docker uses nanoseconds, which `fromisoformat` does not support
+        return datetime.fromisoformat(ts[:19]).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ContainerScheduler:
+    '''Pre-warms user containers before lab sessions and stops idle ones.'''
+
+    def __init__(self, *,
+                 max_idle: timedelta = timedelta(hours=MAX_CONNECTION_HOURS),
+                 cleanup_interval: float = CLEANUP_INTERVAL_SECONDS,
+                 max_running: int = MAX_RUNNING_CONTAINERS,
+                 prewarm_lead: timedelta = timedelta(minutes=PREWARM_LEAD_MINUTES)):
+        self.max_idle = max_idle
+        self.cleanup_interval = cleanup_interval
+        self.max_running = max_running
+        self.prewarm_lead = prewarm_lead
+
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._lock_file = None
+        self._stop = threading.Event()
+
+        self._last_cleanup: datetime | None = None
+        self._last_prewarm: datetime | None = None
+        self._prewarmed_sessions: set[datetime] = set()
+        self._next_session: tuple[datetime, datetime, str | None] | None = None
+        self._running = 0
+        self._hibernated = 0
+        self._prewarmed = 0
+        self._last_error: str | None = None
+
+    def start(self) -> None:
+        '''Starts the scheduler in a background thread.'''
+
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            if not self._acquire_leadership():
+                dav_tools.messages.info('Container scheduler is running in another server process.')
+                return
+
+            self._thread = threading.Thread(target=self._run, name='container-scheduler', daemon=True)
+            self._thread.start()
+
+        dav_tools.messages.info(f'Container scheduler started (idle limit: {self.max_idle}, max running: {self.max_running}).')
+
+    def _acquire_leadership(self) -> bool:
+        '''Locks the scheduler lock file. The lock is released by the OS when the process exits.'''
+
+        try:
+            lock_file = open(SCHEDULER_LOCK_FILE, 'w')
+        except OSError as e:
+            # Cannot coordinate with other processes: run anyway, as with a single worker
+            dav_tools.messages.warning(f'Cannot open scheduler lock file {SCHEDULER_LOCK_FILE}: {e}')
+            return True
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        return True
+
+    def stop(self) -> None:
+        '''Stops the scheduler at the end of the current iteration.'''
+
+        self._stop.set()
+
+    def status(self) -> dict:
+        '''Returns the current state of the scheduler.'''
+
+        with self._lock:
+            next_session = None
+            if self._next_session is not None:
+                start_ts, end_ts, name = self._next_session
+                next_session = {
+                    'start_ts': start_ts.isoformat(),
+                    'end_ts': end_ts.isoformat(),
+                    'name': name,
+                }
+
+            return {
+                'enabled': self._thread is not None and not self._stop.is_set(),
+                'running_containers': self._running,
+                'max_running_containers': self.max_running,
+                'max_idle_hours': self.max_idle.total_seconds() / 3600,
+                'last_cleanup': self._last_cleanup.isoformat() if self._last_cleanup else None,
+                'last_prewarm': self._last_prewarm.isoformat() if self._last_prewarm else None,
+                'next_session': next_session,
+                'hibernated_total': self._hibernated,
+                'prewarmed_total': self._prewarmed,
+                'last_error': self._last_error,
+            }
+
+    def _run(self) -> None:
+        next_cleanup = time.monotonic()
+
+        while not self._stop.is_set():
+            try:
+                self.prewarm()
+
+                if time.monotonic() >= next_cleanup:
+                    self.cleanup()
+                    next_cleanup = time.monotonic() + self.cleanup_interval
+            except Exception as e:
+                dav_tools.messages.error(f'Container scheduler error: {e}')
+                with self._lock:
+                    self._last_error = str(e)
+
+            self._stop.wait(_TICK_SECONDS)
+
+    # region Pre-warming
+    def prewarm(self) -> None:
+        '''Starts the containers of the most recently active students, if a lab session is about to start.'''
+
+        session = admin.LabHours.get_next_session(self.prewarm_lead)
+
+        with self._lock:
+            self._next_session = session
+
+            if session is None or session[0] in self._prewarmed_sessions:
+                return
+            self._prewarmed_sessions.add(session[0])
+
+        start_ts, _, name = session
+        available = self.max_running - len(self._list_running())
+        if available <= 0:
+            dav_tools.messages.warning(f'Not pre-warming containers for lab session "{name}": {self.max_running} containers already running.')
+            return
+
+        candidates = [get_database(username, dbms) for username, dbms in admin.LabHours.get_prewarm_candidates(available)]
+        dav_tools.messages.info(f'Pre-warming {len(candidates)} containers for lab session "{name}" starting at {start_ts}.')
+
+        with ThreadPoolExecutor(max_workers=PREWARM_WORKERS) as executor:
+            started = sum(executor.map(self._prewarm_one, candidates))
+
+        with self._lock:
+            self._prewarmed += started
+            self._last_prewarm = datetime.now()
+
+    @staticmethod
+    def _prewarm_one(database: Database) -> bool:
+        try:
+            database.ensure_container()
+            return True
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to pre-warm container {database.hostname}: {e}')
+            return False
+    # endregion
+
+    # region Hibernation
+    def cleanup(self) -> None:
+        '''Stops containers idle for too long, then the least recently used ones if too many are running.'''
+
+        now = time.time()
+        running = self._list_running()
+
+        # Least recently used first
+        running.sort(key=lambda item: item[1])
+
+        to_stop = []
+        for container, last_used in running:
+            if now - last_used > self.max_idle.total_seconds():
+                to_stop.append(container)
+
+        excess = len(running) - len(to_stop) - self.max_running
+        for container, _ in running:
+            if excess <= 0:
+                break
+            if container not in to_stop:
+                to_stop.append(container)
+                excess -= 1
+
+        last_used = dict(running)
+
+        stopped = 0
+        for container in to_stop:
+            if self._hibernate(container, last_used[container]):
+                stopped += 1
+
+        with self._lock:
+            self._running = len(running) - stopped
+            self._hibernated += stopped
+            self._last_cleanup = datetime.now()
+
+        if stopped:
+            dav_tools.messages.info(f'Stopped {stopped} idle containers, {len(running) - stopped} still running.')
+
+    def _hibernate(self, container, last_used: float) -> bool:
+        '''Stops a container, unless it is being used. Its data volume is kept.'''
+
+        pool_key = container.name.removeprefix(_HOSTNAME_PREFIX)
+
+        if Database.pool.in_use(pool_key) > 0:
+            return False
+
+        # Connections of other server processes are not in this pool: their usage is only known from the admin database
+        idle = time.time() - last_used
+        if idle < HIBERNATE_GRACE_SECONDS:
+            return False
+
+        # Open transactions and temporary tables would be lost, unless abandoned for longer than the idle limit
+        if idle < self.max_idle.total_seconds() and self._has_bound_session(pool_key.rsplit('_', 1)[0]):
+            return False
+
+        try:
+            Database.pool.clear(pool_key)
+            Database.containers.invalidate(container.name)
+            container.stop()
+            return True
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to stop container {container.name}: {e}')
+            return False
+
+    @staticmethod
+    def _has_bound_session(username: str) -> bool:
+        '''Returns True if a connection of any server process holds state of the user which cannot be replayed.'''
+
+        try:
+            return admin.User(username).session_state[3] is not None
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to load the session state of {username}: {e}')
+            return True
+
+    def _list_running(self) -> list[tuple]:
+        '''Lists running user containers, together with the time they were last used.'''
+
+        containers = Database.containers.client.containers.list(filters={ 'label': CONTAINER_LABEL, 'status': 'running' })
+        now = time.time()
+
+        # Other server processes do not share their in-memory usage: their activity is taken from the query logs
+        try:
+            idle_seconds = admin.QueryBatch.get_idle_seconds(self.max_idle)
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to load user activity: {e}')
+            idle_seconds = {}
+
+        result = []
+        for container in containers:
+            # Containers not used since this process started count as used when they were started
+            started_at = _parse_docker_ts(container.attrs.get('State', {}).get('StartedAt')) or now
+            last_used = max(started_at, Database.containers.last_used(container.name) or 0)
+
+            username = container.name.removeprefix(_HOSTNAME_PREFIX).rsplit('_', 1)[0]
+            if username in idle_seconds:
+                last_used = max(last_used, now - idle_seconds[username])
+
+            result.append((container, last_used))
+
+        with self._lock:
+            self._running = len(result)
+
+        return result
+    # endregion
+
+
+scheduler = ContainerScheduler()
+'''Scheduler shared by the whole server.'''
@@ -0,0 +1,80 @@
+'''
+    Bulk execution of long SQL scripts, such as dataset initialisation scripts.
+
+    Statements are sent to the server in batches instead of one at a time, and their results are discarded:
+    only errors are reported individually, together with periodic progress updates.
+
+    Transaction control statements (e.g. `COMMIT`) are always sent on their own, so that a batch is either applied as a whole
+    or not at all, and the statements of a failed batch can be executed again.
+'''
+
+from dataclasses import dataclass, asdict
+from typing import Iterator, Sequence
+import os
+
+from ...sql import SQLCode
+
+SCRIPT_BATCH_STATEMENTS = int(os.getenv('DB_USERS_SCRIPT_BATCH_STATEMENTS', '500'))
+'''Maximum number of statements sent to the server in a single batch.'''
+SCRIPT_BATCH_BYTES = int(os.getenv('DB_USERS_SCRIPT_BATCH_BYTES', str(1024 * 1024)))
+'''Maximum size of a single batch, in characters. A single statement larger than this is sent on its own.'''
+SCRIPT_PROGRESS_EVERY = int(os.getenv('DB_USERS_SCRIPT_PROGRESS_EVERY', '1000'))
+'''Number of executed statements between two progress updates.'''
+
+_TRANSACTION_CONTROL = {'BEGIN', 'START', 'COMMIT', 'END', 'ROLLBACK', 'ABORT', 'SAVEPOINT', 'RELEASE', 'PREPARE'}
+
+
+@dataclass
+class ScriptProgress:
+    '''Progress of a script being executed.'''
+
+    executed: int
+    '''Statements executed so far, including the failed ones.'''
+    total: int
+    '''Statements in the script.'''
+    errors: int = 0
+    '''Statements which failed so far.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+def batches(statements: Sequence[SQLCode], max_statements: int = SCRIPT_BATCH_STATEMENTS, max_bytes: int = SCRIPT_BATCH_BYTES) -> Iterator[list[SQLCode]]:
+    '''
+        Groups consecutive statements into batches. Transaction control statements are put in batches of their own.
+
+        Args:
+            statements (Sequence[SQLCode]): The statements, in execution order.
+            max_statements (int): Maximum number of statements in each batch.
+            max_bytes (int): Maximum total length of the statements in each batch.
+
+        Returns:
+            Iterator[list[SQLCode]]: Non-empty batches, in execution order.
+    '''
+
+    batch: list[SQLCode] = []
+    size = 0
+
+    for statement in statements:
+        length = len(statement.query)
+        alone = is_transaction_control(statement)
+
+        if batch and (alone or len(batch) >= max_statements or size + length > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+
+        if alone:
+            yield [statement]
+            continue
+
+        batch.append(statement)
+        size += length
+
+    if batch:
+        yield batch
+
+
+def is_transaction_control(statement: SQLCode) -> bool:
+    '''Returns True if the statement starts, ends or partially undoes a transaction.'''
+    return statement.first_token in _TRANSACTION_CONTROL
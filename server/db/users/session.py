@@ -0,0 +1,99 @@
+'''
+    Session state of the user databases, shared by all server processes.
+
+    Each user may be served by any connection of any server process, so the state of their session is stored
+    in the admin database and replayed on connections which are behind:
+    - the search path;
+    - the session variables changed with `SET` / `RESET`.
+
+    Open transactions and temporary tables only exist in the connection that created them and cannot be replayed.
+    The connection holding them is recorded as the owner of the session, so that queries running elsewhere can warn the user.
+'''
+
+from dataclasses import dataclass, field
+import re
+import socket
+import os
+
+_SET_RE = re.compile(r'^\s*SET\s+(?:(SESSION|LOCAL|GLOBAL|PERSIST|PERSIST_ONLY)\s+)?(?:@@(?:SESSION\.)?)?(@?[\w$.]+)', re.IGNORECASE)
+_RESET_RE = re.compile(r'^\s*RESET\s+(ALL\b|[\w.]+)', re.IGNORECASE)
+
+# Variables handled separately (search path) or not affecting the session (transaction characteristics)
+_NOT_REPLAYED = {'search_path', 'transaction'}
+_ALIASES = {'time': 'timezone'}     # `SET TIME ZONE` is the same as `SET timezone`
+_ALL = '*'
+
+
+def setting_name(statement: str) -> str | None:
+    '''
+        Returns the name of the session variable changed by a statement.
+
+        Returns:
+            str | None: The variable name, `*` for `RESET ALL`, or None if the statement does not change a session variable
+                        which can be replayed (e.g. `SET LOCAL`, `SET GLOBAL`, `SET search_path`, or any other statement).
+    '''
+
+    match = _SET_RE.match(statement)
+    if match is not None:
+        scope, name = match.group(1), match.group(2).lower()
+        if scope is not None and scope.upper() != 'SESSION':
+            return None
+        if name.startswith(('global.', 'persist.', 'persist_only.')):
+            return None
+    else:
+        match = _RESET_RE.match(statement)
+        if match is None:
+            return None
+        name = match.group(1).lower()
+        if name == 'all':
+            return _ALL
+
+    name = _ALIASES.get(name, name)
+    if name in _NOT_REPLAYED:
+        return None
+    return name
+
+
+def session_owner(conn: object) -> str:
+    '''Identifies a connection across all server processes.'''
+
+    return f'{socket.gethostname()}:{os.getpid()}:{id(conn)}'
+
+
+@dataclass
+class SessionState:
+    '''State of a user session which can be restored on any connection.'''
+
+    search_path: str | None = None
+    settings: dict[str, str] = field(default_factory=dict)
+    '''Last statement changing each session variable, in execution order.'''
+    version: int = 0
+    '''Incremented each time the state changes, so that connections can tell whether they are behind.'''
+    owner: str | None = None
+    '''Connection holding an open transaction or temporary tables, if any.'''
+
+    def record(self, statement: str) -> bool:
+        '''
+            Updates the settings if the statement changes a session variable.
+
+            Returns:
+                bool: True if the settings changed.
+        '''
+
+        name = setting_name(statement)
+        if name is None:
+            return False
+
+        statement = statement.strip()
+
+        if name == _ALL:
+            self.settings = { _ALL: statement }
+            return True
+
+        if self.settings.get(name) == statement:
+            return False
+
+        # Keep execution order: the statement must be replayed after any previous `RESET ALL`
+        self.settings.pop(name, None)
+        self.settings[name] = statement
+        return True
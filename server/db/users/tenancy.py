@@ -0,0 +1,118 @@
+'''
+    Tenancy model of the user databases.
+
+    - `container`: each user gets a dedicated DBMS container (default).
+    - `shared`: each user gets a database and a role inside one of a few shared DBMS servers.
+'''
+
+from typing import Callable
+import hashlib
+import hmac
+import threading
+import os
+import dav_tools
+
+TENANCY = os.getenv('DB_USERS_TENANCY', 'container').lower()
+'''Tenancy model used by this deployment: `container` or `shared`.'''
+TENANCY_CONTAINER = 'container'
+TENANCY_SHARED = 'shared'
+
+SHARED_SECRET = os.getenv('DB_USERS_SHARED_SECRET', '')
+'''Secret used to derive the password of each user role on the shared servers. Required with the `shared` tenancy model.'''
+SHARED_CONNECTION_LIMIT = int(os.getenv('DB_USERS_SHARED_CONNECTION_LIMIT', '5'))
+'''Maximum number of concurrent connections of each user role.'''
+SHARED_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_USERS_SHARED_STATEMENT_TIMEOUT_MS', '30000'))
+'''Maximum execution time of a single statement, in milliseconds.'''
+SHARED_WORK_MEM = os.getenv('DB_USERS_SHARED_WORK_MEM', '4MB')
+'''Memory available to each sort/hash operation of a user query (PostgreSQL only).'''
+SHARED_TEMP_FILE_LIMIT = os.getenv('DB_USERS_SHARED_TEMP_FILE_LIMIT', '256MB')
+'''Maximum temporary disk space used by a single user session (PostgreSQL only).'''
+
+
+def check_configuration() -> None:
+    '''Terminates the server if the tenancy model cannot be used as configured.'''
+
+    if TENANCY == TENANCY_SHARED and not SHARED_SECRET:
+        dav_tools.messages.critical_error('DB_USERS_SHARED_SECRET is not set. It is required to derive the passwords of the user roles when DB_USERS_TENANCY is shared.')
+
+
+def parse_hosts(value: str, default_port: int) -> list[tuple[str, int]]:
+    '''Parses a comma-separated list of `host[:port]` entries.'''
+
+    hosts = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        host, _, port = entry.partition(':')
+        hosts.append((host, int(port) if port else default_port))
+
+    return hosts
+
+
+def pick_host(hosts: list[tuple[str, int]], dbname: str) -> tuple[str, int]:
+    '''Assigns a user to one of the shared servers. The assignment is stable as long as the list of servers does not change.'''
+
+    if not hosts:
+        raise ValueError('No shared servers configured for the user databases.')
+
+    digest = hashlib.sha256(dbname.encode()).digest()
+    return hosts[int.from_bytes(digest[:8], 'big') % len(hosts)]
+
+
+def tenant_name(dbname: str) -> str:
+    '''
+        Name of the database and role of a user on the shared servers.
+        Usernames are hashed, so that names only contain safe characters and fit the identifier length limits of both DBMSs.
+    '''
+
+    return f'u_{hashlib.sha256(dbname.encode()).hexdigest()[:24]}'
+
+
+def tenant_password(dbname: str) -> str:
+    '''Password of a user role on the shared servers, derived from the shared secret so that it never needs to be stored.'''
+
+    if not SHARED_SECRET:
+        raise ValueError('No secret configured for the user roles on the shared servers.')
+
+    return hmac.new(SHARED_SECRET.encode(), dbname.encode(), hashlib.sha256).hexdigest()
+
+
+class TenantRegistry:
+    '''Keeps track of the tenants already provisioned by this process, provisioning each one only once.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._provisioned: set[str] = set()
+        self._locks: dict[str, threading.Lock] = {}
+
+    def ensure(self, key: str, provision: Callable[[], None]) -> bool:
+        '''
+            Provisions the tenant if needed.
+
+            Returns:
+                bool: True if the tenant was already provisioned, False if `provision` was called.
+        '''
+
+        if key in self._provisioned:
+            return True
+
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key in self._provisioned:
+                return True
+
+            provision()
+
+            with self._lock:
+                self._provisioned.add(key)
+            return False
+
+    def forget(self, key: str) -> None:
+        '''Forces the tenant to be provisioned again on next use (e.g. if its database was dropped).'''
+
+        with self._lock:
+            self._provisioned.discard(key)
@@ -0,0 +1,20 @@
+'''
+    Gunicorn configuration.
+
+    Requests are served by threads, so that a slow user query only occupies one thread
+    instead of the whole worker. The number of user statements running at the same time is capped
+    separately (`DB_USERS_MAX_CONCURRENT_QUERIES`), so that some threads are always free for other requests.
+
+    Multiple workers can be used: the state of user sessions is shared through the admin database
+    and the container scheduler only runs in one of them, taking the activity of the others from the admin database.
+    Large results are only sent in pages with a single worker, since each worker keeps its own results
+    (see `server.sql.result.store`).
+'''
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
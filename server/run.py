@@ -1,5 +1,8 @@
 from server import create_app
+from server.db.users import scheduler, preload_system_catalogs
 
 app = create_app()
+preload_system_catalogs()
 
-
+if scheduler.SCHEDULER_ENABLED:
+    scheduler.scheduler.start()
@@ -1,68 +1,63 @@
-import argparse
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from dataclasses import dataclass
-import multiprocessing
+from concurrent.futures import Future, as_completed
+from functools import lru_cache
+from typing import Iterator
+import json
 import os
 import sys
 
 from dav_tools import database, messages, argument_parser
-from sqlchecker import build_catalog, get_errors, detectors, DetectedError
-from sqlscope import Catalog, Dialect
+from sqlchecker import detectors
+from sqlscope import Dialect
 
-from server.db.admin import Query, Dataset
+from server.db.admin import QueryContext
 from server.db.admin.connection import db, SCHEMA
-from server.db.users import get_database
+from server.db.users.metadata import SchemaMetadata
+from server.sql.detection import DetectionJob, Detector, ErrorDetection, SerializedError
 
 from tqdm import tqdm
 NCOLS = 80
 
 
-SerializedError = tuple[int, list[str]]
-
-@dataclass
-class DBInfo:
-    catalog: Catalog
-    search_path: str
-
-DB_INFO_CACHE: dict[Dialect, DBInfo] = {}
-
-DETECTORS: list[type[detectors.BaseDetector]] = [
+DETECTORS: tuple[Detector, ...] = (
     detectors.SyntaxErrorDetector,
     # detectors.SemanticErrorDetector,
     # detectors.LogicalErrorDetector,
     # detectors.ComplicationDetector,
-]
-
-def detect_errors(query: Query) -> list[DetectedError]:
-    context_columns, context_unique_constraints = query.get_context()
-
-    dataset = Dataset(query.query_batch.exercise.dataset_id)
-
-    user_catalog = build_catalog(
-        columns_info=context_columns,
-        unique_constraints_info=context_unique_constraints
+)
+
+QueryRow = tuple[int, str, str, int | None, str, str, str, int]
+'''Query id, query, search path, context id, exercise solutions, dataset search path, DBMS and number of logged errors.'''
+
+@lru_cache(maxsize=1024)
+def load_context(context_id: int | None) -> SchemaMetadata:
+    '''Contexts are shared by many queries: each one is loaded once.'''
+
+    if context_id is None:
+        return SchemaMetadata(columns=[], unique_columns=[])
+
+    columns, unique_columns = QueryContext(context_id).get()
+    return SchemaMetadata(columns=columns, unique_columns=unique_columns)
+
+@lru_cache(maxsize=1024)
+def load_solutions(solutions: str) -> list[str]:
+    return json.loads(solutions)
+
+def build_job(row: QueryRow) -> DetectionJob:
+    _, query_str, search_path, context_id, solutions, solution_search_path, dbms, _ = row
+    context = load_context(context_id)
+
+    return DetectionJob(
+        query_str=query_str,
+        solutions=load_solutions(solutions),
+        search_path=search_path or '',
+        solution_search_path=solution_search_path,
+        dialect=Dialect(dbms) if dbms else Dialect.POSTGRES,
+        columns=context.columns,
+        unique_columns=context.unique_columns,
+        detectors=DETECTORS,
     )
-    # use SYSTEM_CATALOGS to cache system catalogs for each dbms type
-    if dataset.dbms not in DB_INFO_CACHE:
-        DB_INFO_CACHE[dataset.dbms] = DBInfo(
-            catalog=get_database('lens', dataset.dbms).get_system_catalog(),
-            search_path=get_database('lens', dataset.dbms).get_system_search_path()
-        )
-    system_catalog = DB_INFO_CACHE[dataset.dbms].catalog
-    system_search_path = DB_INFO_CACHE[dataset.dbms].search_path
-    catalog = user_catalog.merge(system_catalog)
-
-    return get_errors(
-                    query_str=query.sql_string,
-                    solutions=query.query_batch.exercise.solutions,
-                    catalog=catalog,
-                    search_path=f'{system_search_path}{query.search_path}',
-                    solution_search_path=dataset.search_path,
-                    detectors=DETECTORS,
-                    dialect=dataset.dbms
-                )
-
-def delete_existing_errors(query: Query) -> None:
+
+def delete_existing_errors(query_id: int) -> None:
     delete_query = database.sql.SQL(
         '''
             DELETE FROM {schema}.has_error
@@ -74,7 +69,7 @@ def delete_existing_errors(query: Query) -> None:
     )
 
     db.execute(delete_query, {
-        'query_id': query.query_id
+        'query_id': query_id
     })
 
 def log_errors(query_id: int, errors: list[SerializedError]) -> None:
@@ -85,38 +80,48 @@ def log_errors(query_id: int, errors: list[SerializedError]) -> None:
             'details': details
         })
 
-def list_queries() -> list[Query]:
+def list_queries() -> list[QueryRow]:
+    '''Everything needed to analyse the queries is loaded at once.'''
+
     query = database.sql.SQL(
         '''
-            SELECT id
-            FROM {schema}.queries
-            WHERE query_type = 'SELECT'
+            SELECT
+                q.id, q.query, q.search_path, q.context_id, e.solutions, d.search_path, d.dbms,
+                (SELECT COUNT(*) FROM {schema}.has_error he WHERE he.query_id = q.id)
+            FROM {schema}.queries q
+                JOIN {schema}.query_batches qb ON qb.id = q.batch_id
+                JOIN {schema}.exercises e ON e.id = qb.exercise_id
+                JOIN {schema}.datasets d ON d.id = e.dataset_id
+            WHERE q.query_type = 'SELECT'
+            ORDER BY q.id
         '''
     ).format(
         schema=database.sql.Identifier(SCHEMA)
     )
 
-    result = db.execute_and_fetch(query)
+    return [tuple(row) for row in db.execute_and_fetch(query)]
 
-    return [Query(row[0]) for row in result]
+def detect_errors(rows: list[QueryRow], jobs: int) -> Iterator[tuple[QueryRow, Future]]:
+    '''Detect the errors of the queries, with the engine used by the server. Results are returned as they are available.'''
 
-def process_query(query_id: int) -> tuple[int, int, list[SerializedError], str | None]:
-    query = Query(query_id)
+    engine = ErrorDetection(workers=jobs if jobs > 1 else 0, max_pending=len(rows) + 1)
 
     try:
-        old_count = len(query.errors)
-        errors = detect_errors(query)
-    except Exception as e:
-        return query_id, 0, [], str(e)
-
-    return query_id, old_count, [
-        (error.error.value, [str(v) for v in error.data])
-        for error in errors
-    ], None
-
-def recategorize_errors(query_ids: list[int], jobs: int, start: int | None, end: int | None) -> tuple[int, int]:
+        if engine.workers == 0:
+            for row in rows:
+                yield row, engine.submit(build_job(row))
+            return
+
+        futures = {engine.submit(build_job(row)): row for row in rows}
+        for future in as_completed(futures):
+            yield futures[future], future
+    finally:
+        engine.shutdown(wait=False)
+
+def recategorize_errors(rows: list[QueryRow], jobs: int, start: int | None, end: int | None) -> tuple[int, int]:
     old_count = 0
     new_count = 0
+    query_ids = [row[0] for row in rows]
 
     if start:
         if start > max(query_ids):
@@ -136,51 +141,25 @@ def recategorize_errors(query_ids: list[int], jobs: int, start: int | None, end:
             end = max((q for q in query_ids if q <= end), default=None)
             messages.warning(f'End query ID {old_end} is not in the list of query IDs. Ending at ID {end}.')
 
-    query_ids = [q for q in query_ids if (start is None or q >= start) and (end is None or q <= end)]
+    rows = [row for row in rows if (start is None or row[0] >= start) and (end is None or row[0] <= end)]
 
-    if jobs <= 1:
-        results = (process_query(query_id) for query_id in query_ids)
-        iterator = tqdm(results, total=len(query_ids), dynamic_ncols=True)
+    with tqdm(detect_errors(rows, jobs), total=len(rows), dynamic_ncols=True) as progress:
+        for row, future in progress:
+            query_id, query_old_count = row[0], row[-1]
 
-        for query_id, query_old_count, errors, error in iterator:
+            error = future.exception()
             if error is not None:
                 print(file=sys.stderr)
-                messages.error(f'Error processing query {query_id}: {error}')
+                messages.error(f'Error processing query {query_id}: {error!r}')
                 continue
 
+            errors = future.result()
             old_count += query_old_count
             new_count += len(errors)
 
-            query = Query(query_id)
-            delete_existing_errors(query)
+            delete_existing_errors(query_id)
             log_errors(query_id, errors)
-            iterator.set_postfix_str(f'errors: {(new_count - old_count):+d}')
-
-        return old_count, new_count
-
-    context = multiprocessing.get_context('spawn')
-    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
-        futures = [
-            executor.submit(process_query, query_id)
-            for query_id in query_ids
-        ]
-
-
-        with tqdm(as_completed(futures), total=len(futures), dynamic_ncols=True) as progress:
-            for future in progress:
-                query_id, query_old_count, errors, error = future.result()
-                if error is not None:
-                    print(file=sys.stderr)
-                    messages.error(f'Error processing query {query_id}: {error}')
-                    continue
-
-                old_count += query_old_count
-                new_count += len(errors)
-
-                query = Query(query_id)
-                delete_existing_errors(query)
-                log_errors(query_id, errors)
-                progress.set_postfix_str(f'errors: {(new_count - old_count):+d}')
+            progress.set_postfix_str(f'errors: {(new_count - old_count):+d}')
 
     return old_count, new_count
 
@@ -205,9 +184,8 @@ if __name__ == '__main__':
 
     argument_parser.parse_args()
 
-    query_ids = [query.query_id for query in list_queries()]
     old_count, new_count = recategorize_errors(
-        query_ids=query_ids,
+        rows=list_queries(),
         jobs=argument_parser.args.jobs,
         start=argument_parser.args.start,
         end=argument_parser.args.end
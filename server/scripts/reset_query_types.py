@@ -1,11 +1,16 @@
 from dav_tools import database, messages
 
-from server.db.admin import Query
+from server.db.admin import Query, QueryClassification
 from server.db.admin.connection import db, SCHEMA
 from server.sql.code import SQLCode
+from server.sql.classification import ClassificationCache, CLASSIFICATION_SHARED
 
 from tqdm import tqdm
 
+# Classifications are recomputed, not read from the shared store: repeated queries are still classified only once,
+#   and the shared store is refreshed with the new results
+classifications = ClassificationCache(store=QueryClassification if CLASSIFICATION_SHARED else None, trust_store=False)
+
 
 def list_queries() -> list[tuple[int, str, str]]:
     query = database.sql.SQL(
@@ -25,9 +30,9 @@ def reset_query_type(query: Query, current_query_type: str, query_goal: str) ->
     if current_query_type == 'BUILTIN' and query_goal == 'BUILTIN':
         return 'BUILTIN'
     else:
-        q = SQLCode(query.sql_string)
-        new_query_type = q.query_type
-        new_query_goal = q.query_goal
+        classification = classifications.classify(SQLCode(query.sql_string))
+        new_query_type = classification.query_type
+        new_query_goal = classification.query_goal
 
     update_query = database.sql.SQL(
         '''
@@ -62,3 +67,4 @@ if __name__ == '__main__':
             changed_count += 1
 
     messages.info(f'Reset query_type for {changed_count} queries.')
+    messages.info(f'Classified {classifications.metrics.misses} distinct queries.')
@@ -0,0 +1,173 @@
+'''
+    Cache of query classifications (query type and goal).
+
+    Students run the same queries over and over, and finding the goal of a `SELECT` requires a full parse.
+    Classifications are kept in an in-process LRU cache, keyed by the hash of the normalised query, and optionally
+    in a store shared by all server processes (see `admin.QueryClassification`).
+'''
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Protocol, TYPE_CHECKING
+import dav_tools
+import hashlib
+import threading
+import os
+
+if TYPE_CHECKING:
+    from .code import SQLCode
+
+CLASSIFICATION_CACHE_SIZE = int(os.getenv('QUERY_CLASSIFICATION_CACHE_SIZE', '10000'))
+'''Maximum number of classifications kept in memory by each process.'''
+CLASSIFICATION_SHARED = os.getenv('QUERY_CLASSIFICATION_SHARED', 'False').lower() == 'true'
+'''Whether classifications are also stored in the admin database, to be shared by all server processes.'''
+
+
+@dataclass(frozen=True)
+class Classification:
+    '''Classification of a query.'''
+
+    query_type: str
+    query_goal: str
+
+
+class ClassificationStore(Protocol):
+    '''Shared storage for classifications.'''
+
+    def get(self, query_hash: str) -> tuple[str, str] | None:
+        '''Returns the query type and goal, or None if the query has not been classified yet.'''
+        ...
+
+    def save(self, query_hash: str, query_type: str, query_goal: str) -> None:
+        ...
+
+
+@dataclass
+class ClassificationMetrics:
+    '''Counters describing how the classification cache has been used.'''
+
+    hits: int = 0
+    '''Lookups answered from memory.'''
+    store_hits: int = 0
+    '''Lookups answered by the shared store.'''
+    misses: int = 0
+    '''Lookups which required classifying the query.'''
+    evictions: int = 0
+    '''Entries removed from memory to make room for new ones.'''
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.store_hits + self.misses
+        return (self.hits + self.store_hits) / lookups if lookups > 0 else 0
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            **asdict(self),
+            'hit_rate': self.hit_rate,
+        }
+
+
+def query_hash(code: 'SQLCode') -> str:
+    '''Hash of a query, ignoring comments and differences in whitespace.'''
+
+    normalised = ' '.join(code.strip_comments().query.split())
+    dialect = code.dialect.value if code.dialect is not None else ''
+
+    return hashlib.md5(f'{dialect}:{normalised}'.encode()).hexdigest()
+
+
+class ClassificationCache:
+    '''LRU cache of query classifications, optionally backed by a shared store.'''
+
+    def __init__(self, size: int = CLASSIFICATION_CACHE_SIZE, *, store: ClassificationStore | None = None, trust_store: bool = True):
+        self.size = size
+        self.store = store
+        '''Shared store, read on misses and written with every new classification.'''
+        self.trust_store = trust_store
+        '''Whether classifications found in the store are used. If False, the store is only written (e.g. to recompute it).'''
+
+        self.metrics = ClassificationMetrics()
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Classification] = OrderedDict()
+
+    def classify(self, code: 'SQLCode') -> Classification:
+        '''Returns the classification of the query, computing it only if it is not cached.'''
+
+        key = query_hash(code)
+
+        with self._lock:
+            classification = self._entries.get(key)
+            if classification is not None:
+                self._entries.move_to_end(key)
+                self.metrics.hits += 1
+                return classification
+
+        classification = self._load(key)
+        from_store = classification is not None
+        if classification is None:
+            classification = Classification(query_type=code.query_type, query_goal=code._compute_query_goal())
+            self._save(key, classification)
+
+        with self._lock:
+            if from_store:
+                self.metrics.store_hits += 1
+            else:
+                self.metrics.misses += 1
+
+        self._put(key, classification)
+        return classification
+
+    def _put(self, key: str, classification: Classification) -> None:
+        if self.size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = classification
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.metrics.evictions += 1
+
+    def _load(self, key: str) -> Classification | None:
+        if self.store is None or not self.trust_store:
+            return None
+
+        try:
+            result = self.store.get(key)
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to load query classification: {e}')
+            return None
+
+        return Classification(*result) if result is not None else None
+
+    def _save(self, key: str, classification: Classification) -> None:
+        if self.store is None:
+            return
+
+        try:
+            self.store.save(key, classification.query_type, classification.query_goal)
+        except Exception as e:
+            dav_tools.messages.warning(f'Failed to save query classification: {e}')
+
+    def clear(self) -> None:
+        '''Removes all classifications from memory.'''
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, float]:
+        '''Returns the number of cached classifications, together with the cache metrics.'''
+
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.size,
+                'shared': self.store is not None,
+                **self.metrics.to_dict(),
+            }
+
+
+classifications = ClassificationCache()
+'''Classifications of the queries run by this process.'''
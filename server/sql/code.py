@@ -1,69 +1,89 @@
-import sqlparse
 import sqlscope
-from typing import Iterable, Self
+from sqlscope import Dialect
+from typing import Iterable
 from .query_goal import QueryGoal
-
-# Maximum length of SQL code to strip comments from
-STRIP_COMMENTS_MAX_LENGTH = 1000
+from .classification import Classification, classifications
+from .lexer import lex, LexResult, LexedStatement
+
+# Documentation for SQL query types: https://www.postgresql.org/docs/current/sql-commands.html
+_EXPANDABLE_TYPES = {'CREATE', 'ALTER', 'DROP'}
+_EXPANDABLE_TYPES_KEYWORDS = {
+    'TABLE', 'VIEW', 'INDEX', 'SEQUENCE', 'FUNCTION', 'PROCEDURE',
+    'TRIGGER', 'USER', 'ROLE', 'DATABASE', 'SCHEMA',
+}
+# Number of keywords after CREATE/ALTER/DROP in which the object type is looked for (e.g. `CREATE OR REPLACE TEMP VIEW`)
+_EXPANDABLE_TYPES_LOOKAHEAD = 5
+
+_TYPES = {
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'REPLACE',
+    'START', 'TRUNCATE',
+    'SET', 'SHOW', 'RESET',
+    'EXPLAIN',
+    'ANALYZE',
+    'DO', 'CALL', 'PERFORM',
+    'COPY',
+    'CLUSTER',
+    'GRANT', 'REVOKE',
+    'BEGIN', 'COMMIT', 'ROLLBACK', 'ABORT',
+}
+_CTE_TYPES = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE'}
 
 
 class SQLCode:
     '''Represents a SQL code snippet with utility methods.'''
-    def __init__(self, query: str, builtin: bool = False):
+    def __init__(self, query: str, builtin: bool = False, *, dialect: Dialect | None = None):
         self.query = query
         '''The SQL query string.'''
 
-        self._parse_cache = None
+        self.dialect = dialect
+        '''The SQL dialect of the query, if known. Affects how strings, comments and delimiters are recognized.'''
+
+        self._lex_cache: LexResult | None = None
         self._query_type_cache = None
         self.builtin = builtin
 
-    def strip_comments(self, *, force: bool = False) -> 'SQLCode':
+    def _lex(self) -> LexResult:
+        '''Lex the SQL query. The result is cached.'''
+        if self._lex_cache is None:
+            self._lex_cache = lex(self.query, self.dialect)
+
+        return self._lex_cache
+
+    def _derive(self, query: str, statements: tuple[LexedStatement, ...], code: str) -> 'SQLCode':
+        '''Create a SQLCode object for part of this query, reusing the lexer result.'''
+        sql_code = SQLCode(query, dialect=self.dialect)
+        sql_code._lex_cache = LexResult(statements=statements, code=code)
+        return sql_code
+
+    def strip_comments(self) -> 'SQLCode':
         '''
             Remove comments from the SQL query
-            If the query is too long, it will not be stripped unless force is set to True.
-            This is to avoid performance issues with very large queries.
 
-            Parameters:
-                force (bool): If True, strip comments even if the query is too long.
             Returns:
                 SQLCode: A new SQLCode object with comments stripped.
         '''
 
-        if len(self.query) > STRIP_COMMENTS_MAX_LENGTH and not force:
-            return self
-        
-        code = sqlparse.format(self.query, strip_comments=True)
-        return SQLCode(code)
+        lexed = self._lex()
+        statements = tuple(LexedStatement(text=statement.code, code=statement.code, keywords=statement.keywords) for statement in lexed.statements)
+        return self._derive(lexed.code, statements, lexed.code)
 
     def has_clause(self, clause: str) -> bool:
         '''Check if the SQL query has a specific clause'''
         return clause.upper() in self.query.upper()
 
     def split(self) -> Iterable['SQLCode']:
-        '''Split the SQL query into individual statements'''
-        for query in sqlparse.split(self.query, strip_semicolon=False):
-            sql_code = SQLCode(query)
-
-            if sql_code.strip_comments().query.strip():  # Only yield non-empty statements after stripping comments
-                yield sql_code
+        '''Split the SQL query into individual statements. Statements containing only comments are skipped.'''
+        for statement in self._lex().statements:
+            yield self._derive(statement.text, (statement,), statement.code)
 
-    def _parse(self) -> tuple[sqlparse.sql.Statement]:
-        '''Parse the SQL query and return the first statement'''
-        if self._parse_cache is None:
-            self._parse_cache = sqlparse.parse(self.query)
-
-        return self._parse_cache 
-    
     @property
     def first_token(self) -> str | None:
-        statement = self._parse()[0]
-        first_token = statement.token_first(skip_cm=True)
-        
-        if first_token:
-            return first_token.value.upper()
-        
-        return None
+        '''The first keyword of the query, uppercase.'''
+        statements = self._lex().statements
+        if len(statements) == 0 or len(statements[0].keywords) == 0:
+            return None
 
+        return statements[0].keywords[0]
 
     def __str__(self) -> str:
         return self.query
@@ -75,71 +95,41 @@ class SQLCode:
         if self.builtin:
             return 'BUILTIN'
 
-        # Use cache to avoid re-parsing the query
-        if self._query_type_cache is not None:
-            return self._query_type_cache
+        # Use cache to avoid re-computing the type
+        if self._query_type_cache is None:
+            self._query_type_cache = self._compute_query_type()
 
-        # Documentation for SQL query types: https://www.postgresql.org/docs/current/sql-commands.html
+        return self._query_type_cache
 
-        expandable_types = {'CREATE', 'ALTER', 'DROP'}
-        expandable_types_keywords = {
-            'TABLE', 'VIEW', 'INDEX', 'SEQUENCE', 'FUNCTION', 'PROCEDURE',
-            'TRIGGER', 'USER', 'ROLE', 'DATABASE', 'SCHEMA',
-        }
+    def _compute_query_type(self) -> str:
+        statements = self._lex().statements
+        if len(statements) == 0:
+            return 'EMPTY' if not self.query.strip() else 'UNKNOWN'
 
-        allowed_types = {
-            'SET', 'SHOW', 'RESET',
-            'EXPLAIN',
-            'ANALYZE',
-            'DO', 'CALL', 'PERFORM',
-            'COPY',
-            'CLUSTER',
-            'GRANT', 'REVOKE',
-            'BEGIN', 'COMMIT', 'ROLLBACK', 'ABORT',
-        }
+        keywords = statements[0].keywords
+        if len(keywords) == 0:
+            return 'UNKNOWN'
 
+        query_type = keywords[0]
+
+        # The type of a CTE is the type of the statement following it
+        if query_type == 'WITH':
+            return next((keyword for keyword in keywords[1:] if keyword in _CTE_TYPES), 'UNKNOWN')
+
+        # For expandable types, we need to determine the specific type of statement (e.g. CREATE TABLE)
+        if query_type in _EXPANDABLE_TYPES:
+            for keyword in keywords[1:1 + _EXPANDABLE_TYPES_LOOKAHEAD]:
+                if keyword in _EXPANDABLE_TYPES_KEYWORDS:
+                    return f'{query_type} {keyword}'
+            return query_type
+
+        if query_type not in _TYPES:
+            return 'UNKNOWN'
+
+        # If it's an EXPLAIN statement, check if it has ANALYZE
+        if query_type == 'EXPLAIN' and len(keywords) > 1 and keywords[1] == 'ANALYZE':
+            return 'EXPLAIN ANALYZE'
 
-        statements = self._parse()
-        if len(statements) == 0:
-            self._query_type_cache = 'EMPTY'
-            return self._query_type_cache
-
-        statement = statements[0]
-        query_type = statement.get_type()
-
-        # CREATE OR REPLACE is treated as CREATE
-        if query_type == 'CREATE OR REPLACE':
-            query_type = 'CREATE'
-
-        # For expandable types, we need to determine the specific type of statement
-        if query_type in expandable_types:
-            # get type of create/alter/drop statement
-            tokens = [t for t in statement.flatten() if t.ttype not in (sqlparse.tokens.Whitespace, sqlparse.tokens.Comment)]
-
-            for i, token in enumerate(tokens):
-                if token.ttype is sqlparse.tokens.DDL and token.normalized in expandable_types:
-                    # Look ahead for the next Keyword (e.g. TABLE, VIEW, FUNCTION, USER...)
-                    for next_token in tokens[i+1:]:
-                        if next_token.ttype in (sqlparse.tokens.Keyword, sqlparse.tokens.DDL) and next_token.normalized in expandable_types_keywords:
-                            next_token_str = next_token.normalized
-                            self._query_type_cache = f'{query_type} {next_token_str}'
-                            return query_type
-                    break
-
-        # Extract more types
-        if query_type == 'UNKNOWN':
-            first_token = statement.token_first(skip_cm=True, skip_ws=True)
-            if first_token and first_token.ttype in (sqlparse.tokens.Keyword, sqlparse.tokens.Token.Keyword.DCL):
-                if first_token.normalized in allowed_types:
-                    query_type = first_token.normalized.upper()
-
-                    # If it's an EXPLAIN statement, check if it has ANALYZE
-                    if query_type == 'EXPLAIN':
-                        next_token = statement.token_next(statement.token_index(first_token), skip_cm=True, skip_ws=True)[1]
-                        if next_token and next_token.normalized == 'ANALYZE':
-                            query_type = 'EXPLAIN ANALYZE'
-
-        self._query_type_cache = query_type
         return query_type
     
     @property
@@ -148,7 +138,19 @@ class SQLCode:
 
         if self.builtin:
             return QueryGoal.BUILTIN.value
-        
+
+        return self.classification.query_goal
+
+    @property
+    def classification(self) -> Classification:
+        '''Get the type and goal of the SQL query, from the classification cache if possible'''
+
+        if self.builtin:
+            return Classification(query_type='BUILTIN', query_goal=QueryGoal.BUILTIN.value)
+
+        return classifications.classify(self)
+
+    def _compute_query_goal(self) -> str:
         # Only consider SELECT queries
         if self.query_type != 'SELECT':
             return QueryGoal.UNKNOWN.value
@@ -0,0 +1,276 @@
+'''
+    Detection of the errors in user queries.
+
+    Errors are detected by `sqlchecker`, whose semantic and logical analysis can take a long time.
+    Its output is only logged, so detection runs in a pool of worker processes and requests do not wait for it:
+    each job is given a timeout, after which it is interrupted so that a pathological query cannot stall a worker.
+
+    The same engine is used by the server and by `server/scripts/recategorize_errors.py`.
+'''
+
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, asdict, field
+from typing import Callable
+import multiprocessing
+import threading
+import signal
+import atexit
+import os
+import dav_tools
+
+from sqlchecker import DetectedError, detectors, get_errors
+from sqlscope import Dialect
+from sqlscope.catalog import CatalogColumnInfo, CatalogUniqueConstraintInfo
+
+from server.db.admin import QueryContext
+from server.db.users import get_database
+from server.db.users.metadata import SchemaMetadata
+
+DETECTION_WORKERS = int(os.getenv('ERROR_DETECTION_WORKERS', '2'))
+'''Number of worker processes detecting errors for each server process. If 0, errors are detected by the caller itself.'''
+DETECTION_TIMEOUT_SECONDS = float(os.getenv('ERROR_DETECTION_TIMEOUT_SECONDS', '10'))
+'''Maximum time spent detecting the errors of a query.'''
+DETECTION_MAX_PENDING = int(os.getenv('ERROR_DETECTION_MAX_PENDING', '1000'))
+'''Maximum number of queries waiting for detection. Further queries are not analysed (see `recategorize_errors.py`).'''
+
+Detector = type[detectors.BaseDetector]
+
+DETECTORS: list[Detector] = [
+    detectors.SyntaxErrorDetector,
+    detectors.SemanticErrorDetector,
+    detectors.LogicalErrorDetector,
+    detectors.ComplicationDetector,
+]
+
+# Number of user schema contexts whose catalog is kept by each worker process
+_CONTEXT_CACHE_SIZE = 256
+
+SerializedError = tuple[int, list[str]]
+'''Error id and details of a detected error, as stored in `has_error`.'''
+
+
+class DetectionTimeout(Exception):
+    '''Raised when detecting the errors of a query takes too long.'''
+
+
+@dataclass(frozen=True)
+class DetectionJob:
+    '''Everything needed to detect the errors of a query. Sent to the worker processes.'''
+
+    query_str: str
+    solutions: list[str]
+    search_path: str
+    '''Search path of the user, without the system schemas.'''
+    solution_search_path: str
+    dialect: Dialect
+    columns: list[CatalogColumnInfo] = field(default_factory=list)
+    unique_columns: list[CatalogUniqueConstraintInfo] = field(default_factory=list)
+    detectors: tuple[Detector, ...] = tuple(DETECTORS)
+
+
+def serialize_errors(errors: list[DetectedError]) -> list[SerializedError]:
+    return [(error.error.value, [str(v) for v in error.data]) for error in errors]
+
+
+# region Worker
+_contexts: OrderedDict[str, SchemaMetadata] = OrderedDict()
+
+
+def _init_worker() -> None:
+    def timeout(signum, frame):
+        raise DetectionTimeout()
+
+    signal.signal(signal.SIGALRM, timeout)
+
+
+def _context(job: DetectionJob) -> SchemaMetadata:
+    '''Many queries are run on the same schemas: the catalog of each context is built once per worker.'''
+
+    key = QueryContext.hash_context(job.columns, job.unique_columns)
+
+    metadata = _contexts.get(key)
+    if metadata is None:
+        metadata = SchemaMetadata(columns=job.columns, unique_columns=job.unique_columns)
+        _contexts[key] = metadata
+        if len(_contexts) > _CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    else:
+        _contexts.move_to_end(key)
+
+    return metadata
+
+
+def detect(job: DetectionJob) -> list[SerializedError]:
+    '''Detect the errors of a query.'''
+
+    # system catalogs are loaded once per process
+    system_catalog = get_database('system', job.dialect).get_system_catalog()
+    catalog = system_catalog.overlay(_context(job).catalog)
+
+    errors = get_errors(
+        query_str=job.query_str,
+        solutions=job.solutions,
+        catalog=catalog,
+        search_path=f'{system_catalog.search_path}{job.search_path}',
+        solution_search_path=job.solution_search_path,
+        dialect=job.dialect,
+        detectors=list(job.detectors),
+        debug=False,
+    )
+
+    return serialize_errors(errors)
+
+
+def _detect_with_timeout(job: DetectionJob, timeout: float) -> list[SerializedError]:
+    '''Runs in the worker processes, where jobs are run by the main thread and can be interrupted by `SIGALRM`.'''
+
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return detect(job)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+# endregion
+
+
+@dataclass
+class ErrorDetectionMetrics:
+    '''Counters describing the jobs run by the engine.'''
+
+    submitted: int = 0
+    '''Jobs accepted by the engine.'''
+    completed: int = 0
+    '''Jobs whose errors were detected.'''
+    timeouts: int = 0
+    '''Jobs interrupted because they took too long.'''
+    failed: int = 0
+    '''Jobs which raised an error.'''
+    rejected: int = 0
+    '''Jobs not run because too many were pending.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class ErrorDetection:
+    '''Pool of worker processes detecting the errors of queries.'''
+
+    def __init__(self, *,
+                 workers: int = DETECTION_WORKERS,
+                 timeout: float = DETECTION_TIMEOUT_SECONDS,
+                 max_pending: int = DETECTION_MAX_PENDING):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.metrics = ErrorDetectionMetrics()
+
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._registered = False
+
+    def submit(self, job: DetectionJob, callback: Callable[[list[SerializedError]], None] | None = None) -> 'Future[list[SerializedError]] | None':
+        '''
+            Detect the errors of a query. `callback` is called with the errors, once detected.
+            Returns None if the job was rejected because too many jobs are pending.
+        '''
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.metrics.rejected += 1
+                dav_tools.messages.warning('Error detection queue is full: not analysing query.')
+                return None
+
+            self._pending += 1
+            self.metrics.submitted += 1
+
+            executor = self._get_executor() if self.workers > 0 else None
+            if executor is not None:
+                future = executor.submit(_detect_with_timeout, job, self.timeout)
+
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(detect(job))
+            except Exception as e:
+                future.set_exception(e)
+
+        future.add_done_callback(lambda f: self._done(f, callback, executor))
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        '''Stop the worker processes.'''
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self) -> dict[str, int | float]:
+        '''Returns the state of the engine, together with its metrics.'''
+
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'timeout_seconds': self.timeout,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                **self.metrics.to_dict(),
+            }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        '''Worker processes are started on first use. Must be called with the lock held.'''
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # Server processes run many threads, which must not be forked
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+
+            if not self._registered:
+                # Pending jobs are completed at exit, so that their errors are logged
+                atexit.register(self.shutdown)
+                self._registered = True
+        return self._executor
+
+    def _done(self, future: 'Future[list[SerializedError]]', callback: Callable[[list[SerializedError]], None] | None,
+              executor: ProcessPoolExecutor | None) -> None:
+        '''Handles a completed job. `executor` is the pool which ran it, if any.'''
+
+        error = future.exception()
+
+        with self._lock:
+            self._pending -= 1
+
+            if error is None:
+                self.metrics.completed += 1
+            elif isinstance(error, DetectionTimeout):
+                self.metrics.timeouts += 1
+            else:
+                self.metrics.failed += 1
+
+            # A worker died: replace the pool, unless another job already replaced it
+            broken = isinstance(error, BrokenProcessPool) and executor is not None and self._executor is executor
+            if broken:
+                self._executor = None
+
+        if broken:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if isinstance(error, DetectionTimeout):
+            dav_tools.messages.warning(f'Error detection timed out after {self.timeout} seconds.')
+        elif error is not None:
+            dav_tools.messages.warning(f'Error detection failed: {error}')
+        elif callback is not None:
+            try:
+                callback(future.result())
+            except Exception as e:
+                dav_tools.messages.error(f'Failed to handle detected errors: {e}')
+
+
+error_detection = ErrorDetection()
+'''Error detection engine of this process.'''
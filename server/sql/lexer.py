@@ -0,0 +1,287 @@
+'''
+    Single-pass SQL lexer.
+
+    Splits SQL code into statements and, in the same pass, computes the comment-free text and the leading keywords of each one.
+    Strings, quoted identifiers and comments are skipped with `str.find`/regex searches, so the cost is linear in the length of the code
+    even for multi-megabyte dataset scripts.
+
+    Dialect differences:
+    - PostgreSQL: dollar-quoted strings, nested block comments, `E'...'` strings with backslash escapes.
+    - MySQL: backslash escapes in all strings, backtick identifiers, `#` comments, `-- ` comments only if followed by whitespace,
+      executable comments (`/*! ... */`) kept as code, `DELIMITER` client command.
+    - Unknown dialect: PostgreSQL rules, plus backtick identifiers and `DELIMITER`.
+
+    Without `DELIMITER`, semicolons inside the `BEGIN ... END` body of routines and triggers do not end the statement.
+    In PostgreSQL, only `BEGIN ATOMIC` bodies are considered, since other bodies are strings.
+'''
+
+from dataclasses import dataclass
+from functools import lru_cache
+from sqlscope import Dialect
+import re
+
+MAX_KEYWORDS = 8
+'''Number of leading keywords collected for each statement.'''
+
+# After this many words, keywords are no longer looked for (unless still needed, see `_Statement.collecting`)
+_MAX_SCANNED_WORDS = 32
+
+_DML = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE'}
+
+# Strings and quoted identifiers, matched from the character after the opening quote
+_SINGLE_QUOTED = re.compile(r"[^']*(?:''[^']*)*(?:'|$)")
+_SINGLE_QUOTED_ESCAPES = re.compile(r"[^'\\]*(?:(?:\\.|'')[^'\\]*)*(?:'|$)", re.DOTALL)
+_DOUBLE_QUOTED = re.compile(r'[^"]*(?:""[^"]*)*(?:"|$)')
+_DOUBLE_QUOTED_ESCAPES = re.compile(r'[^"\\]*(?:(?:\\.|"")[^"\\]*)*(?:"|$)', re.DOTALL)
+_BACKTICK_QUOTED = re.compile(r'[^`]*(?:``[^`]*)*(?:`|$)')
+
+_NESTED_COMMENT = re.compile(r'/\*|\*/')
+_DELIMITER_COMMAND = re.compile(r'\s*DELIMITER[ \t]+(\S+)[^\n]*(?:\n|$)', re.IGNORECASE)
+_TRAILING_COMMENT = re.compile(r'[ \t]*--[^\n]*')
+_TRAILING_COMMENT_MYSQL = re.compile(r'[ \t]*(?:--\s|#)[^\n]*')
+_END_BLOCK = re.compile(r'\s+(IF|LOOP|WHILE|REPEAT|FOR|CASE)\b', re.IGNORECASE)
+_ATOMIC = re.compile(r'\s+ATOMIC\b', re.IGNORECASE)
+
+# Objects whose definition can contain a `BEGIN ... END` body
+_ROUTINES = {'PROCEDURE', 'FUNCTION', 'TRIGGER', 'EVENT'}
+
+
+@dataclass(frozen=True)
+class LexedStatement:
+    '''A single statement.'''
+
+    text: str
+    '''Original text of the statement, including comments and the terminating semicolon.'''
+    code: str
+    '''Text of the statement without comments.'''
+    keywords: tuple[str, ...]
+    '''Leading keywords, uppercase: the first word, followed by words outside parentheses.'''
+
+
+@dataclass(frozen=True)
+class LexResult:
+    '''Result of lexing some SQL code.'''
+
+    statements: tuple[LexedStatement, ...]
+    '''Statements containing code, in order. Statements containing only comments are skipped.'''
+    code: str
+    '''The whole code without comments.'''
+
+
+@lru_cache(maxsize=None)
+def _token_pattern(dialect: Dialect | None, delimiter: str, words: bool) -> re.Pattern:
+    '''Matches the next token which changes the lexer state.'''
+
+    mysql = dialect == Dialect.MYSQL
+
+    alternatives = [
+        re.escape(delimiter),
+        r'--(?=\s|$)' if mysql else r'--',
+        r'/\*',
+        r"'",
+        r'"',
+    ]
+    if mysql:
+        alternatives += [r'#', r'`']
+    else:
+        alternatives += [r'(?<![\w$])\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$']
+        if dialect is None:
+            alternatives += [r'`']
+    if words:
+        alternatives += [r'[()]', r'[A-Za-z_][\w$]*']
+
+    return re.compile('|'.join(alternatives))
+
+
+class _Statement:
+    '''State of the statement being lexed.'''
+
+    def __init__(self, start: int):
+        self.start = start
+        self.pieces: list[str] = []
+        '''Code of the statement, up to the last comment.'''
+        self.code_start = start
+        '''Start of the code not yet added to `pieces`.'''
+
+        self.keywords: list[str] = []
+        self.words = 0
+        self.depth = 0
+        '''Parentheses depth.'''
+        self.blocks = 0
+        '''`BEGIN ... END` depth of the body of routines and triggers.'''
+
+    @property
+    def is_create(self) -> bool:
+        return len(self.keywords) > 0 and self.keywords[0] == 'CREATE'
+
+    @property
+    def is_routine(self) -> bool:
+        '''Whether the statement creates a routine or trigger, whose body can contain semicolons.'''
+        return self.is_create and any(keyword in _ROUTINES for keyword in self.keywords[1:])
+
+    @property
+    def collecting(self) -> bool:
+        '''Whether keywords are still being collected.'''
+
+        if len(self.keywords) == 0:
+            return True
+
+        # The type of a CTE is given by the first DML keyword after it
+        if self.keywords[0] == 'WITH':
+            return not any(keyword in _DML for keyword in self.keywords[1:])
+
+        return len(self.keywords) < MAX_KEYWORDS and self.words < _MAX_SCANNED_WORDS
+
+    def cut(self, query: str, start: int, end: int, replacement: str = '') -> None:
+        '''Removes `query[start:end]` from the code.'''
+
+        self.pieces.append(query[self.code_start:start])
+        if replacement:
+            self.pieces.append(replacement)
+        self.code_start = end
+
+    def code(self, query: str, end: int) -> str:
+        return (''.join(self.pieces) + query[self.code_start:end]).strip()
+
+
+def lex(query: str, dialect: Dialect | None = None) -> LexResult:
+    '''
+        Splits SQL code into statements, in a single pass.
+
+        Args:
+            query (str): The SQL code.
+            dialect (Dialect | None): The SQL dialect. If None, rules common to PostgreSQL and MySQL are used.
+
+        Returns:
+            LexResult: The statements and the comment-free code.
+    '''
+
+    mysql = dialect == Dialect.MYSQL
+    single_quoted = _SINGLE_QUOTED_ESCAPES if mysql else _SINGLE_QUOTED
+    double_quoted = _DOUBLE_QUOTED_ESCAPES if mysql else _DOUBLE_QUOTED
+
+    n = len(query)
+    delimiter = ';'
+    statements: list[LexedStatement] = []
+    code: list[str] = []
+
+    pos = 0
+    stmt = _Statement(0)
+
+    def end_statement(end: int, text_end: int) -> None:
+        '''Ends the current statement: its code runs until `end`, its text until `text_end`.'''
+
+        stmt_code = stmt.code(query, end)
+        code.append(stmt_code)
+
+        if stmt_code:
+            statements.append(LexedStatement(
+                text=query[stmt.start:text_end].strip(),
+                code=stmt_code,
+                keywords=tuple(stmt.keywords),
+            ))
+
+    while True:
+        # `DELIMITER` is a client command: it is only recognized at the beginning of a statement
+        if dialect != Dialect.POSTGRES and pos == stmt.start:
+            match = _DELIMITER_COMMAND.match(query, pos)
+            if match is not None:
+                delimiter = match.group(1)
+                pos = match.end()
+                stmt = _Statement(pos)
+                continue
+
+        pattern = _token_pattern(dialect, delimiter, stmt.collecting or (stmt.is_create and delimiter == ';'))
+        match = pattern.search(query, pos)
+        if match is None:
+            end_statement(n, n)
+            break
+
+        token = match.group()
+        start, pos = match.span()
+
+        if token == delimiter and stmt.blocks == 0:
+            if delimiter == ';':
+                # A comment on the same line belongs to the statement that just ended
+                comment = (_TRAILING_COMMENT_MYSQL if mysql else _TRAILING_COMMENT).match(query, pos)
+                text_end = comment.end() if comment is not None else pos
+                end_statement(pos, text_end)
+                pos = text_end
+            else:
+                # Custom delimiters are not understood by the server
+                end_statement(start, start)
+
+            stmt = _Statement(pos)
+        elif token == delimiter:
+            # Semicolon inside a `BEGIN ... END` block
+            pass
+        elif token.startswith('--') or token == '#':
+            end = query.find('\n', pos)
+            end = n if end == -1 else end
+            stmt.cut(query, start, end)
+            pos = end
+        elif token == '/*':
+            if mysql and query.startswith(('!', '+'), pos):
+                # Executable comments and optimizer hints are code
+                end = query.find('*/', pos)
+                pos = n if end == -1 else end + 2
+                continue
+
+            if mysql:
+                end = query.find('*/', pos)
+                end = n if end == -1 else end + 2
+            else:
+                depth = 1
+                end = pos
+                while depth > 0:
+                    nested = _NESTED_COMMENT.search(query, end)
+                    if nested is None:
+                        end = n
+                        break
+                    depth += 1 if nested.group() == '/*' else -1
+                    end = nested.end()
+
+            stmt.cut(query, start, end, ' ')
+            pos = end
+        elif token == "'":
+            escapes = start > 0 and query[start - 1] in 'eE' and (start < 2 or not (query[start - 2].isalnum() or query[start - 2] == '_'))
+            pos = (_SINGLE_QUOTED_ESCAPES if escapes else single_quoted).match(query, pos).end()
+        elif token == '"':
+            pos = double_quoted.match(query, pos).end()
+        elif token == '`':
+            pos = _BACKTICK_QUOTED.match(query, pos).end()
+        elif token.startswith('$'):
+            end = query.find(token, pos)
+            pos = n if end == -1 else end + len(token)
+        elif token == '(':
+            stmt.depth += 1
+        elif token == ')':
+            stmt.depth = max(stmt.depth - 1, 0)
+        else:
+            word = token.upper()
+            stmt.words += 1
+
+            if word == 'E' and query.startswith("'", pos):
+                # Prefix of an escaped string
+                continue
+
+            if stmt.collecting and (len(stmt.keywords) == 0 or stmt.depth == 0):
+                stmt.keywords.append(word)
+
+            # Blocks are only counted outside parentheses, so that e.g. columns named `begin` are not mistaken for them
+            if stmt.is_routine and delimiter == ';' and stmt.depth == 0:
+                if stmt.blocks == 0:
+                    if word == 'BEGIN' and (dialect != Dialect.POSTGRES or _ATOMIC.match(query, pos) is not None):
+                        stmt.blocks += 1
+                elif word in ('BEGIN', 'CASE'):
+                    stmt.blocks += 1
+                elif word == 'END':
+                    # `END IF`, `END LOOP`, ... close statements which are not counted, except for `END CASE`.
+                    # The keyword following `END` is skipped, so that it does not open a new block
+                    compound = _END_BLOCK.match(query, pos)
+                    if compound is None or compound.group(1).upper() == 'CASE':
+                        stmt.blocks -= 1
+                    if compound is not None:
+                        pos = compound.end()
+
+    return LexResult(statements=tuple(statements), code='\n'.join(part for part in code if part))
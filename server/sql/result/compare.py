@@ -0,0 +1,208 @@
+'''
+    Comparison of query results as multisets of rows.
+
+    Each row is hashed into a 64-bit key, so that two results are compared by counting their keys, without
+    merging their values. Only the rows which differ are then materialised, up to a display limit.
+
+    Values of object columns are hashed through their text form, so numbers in such columns (e.g. NUMERIC values,
+    read as `Decimal`) are normalised first: `Decimal('3.0')`, `Decimal('3')` and `3.0` have the same hash.
+'''
+
+from dataclasses import dataclass
+from decimal import Context, Decimal
+from typing import Any
+import numpy as np
+import pandas as pd
+import math
+import os
+
+RESULT_COMPARE_MAX_ROWS = int(os.getenv('RESULT_COMPARE_MAX_ROWS', '100'))
+'''Maximum number of unexpected rows, and of missing rows, shown when comparing a result with the solution.'''
+
+# Number of rows looked up at once when searching for differing rows
+_SCAN_CHUNK_SIZE = 65536
+
+# Inferred types of object columns containing numbers, which may be compared with `Decimal` values
+_NUMBER_TYPES = {'decimal', 'floating', 'integer', 'mixed', 'mixed-integer', 'mixed-integer-float'}
+
+
+@dataclass
+class Comparison:
+    '''Differences between the rows of a result and the expected ones.'''
+
+    unexpected: np.ndarray
+    '''Positions of the unexpected rows in the result, once for each extra occurrence, at most `max_rows`.'''
+    unexpected_count: int
+    '''Total number of unexpected rows.'''
+    missing: np.ndarray
+    '''Positions of the missing rows in the expected result, once for each missing occurrence, at most `max_rows`.'''
+    missing_count: int
+    '''Total number of missing rows.'''
+    correct_count: int
+    '''Number of rows of the result which are also in the expected one.'''
+
+    @property
+    def equal(self) -> bool:
+        '''Whether both results contain the same rows, the same number of times.'''
+        return self.unexpected_count == 0 and self.missing_count == 0
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    '''64-bit hash of each row of a DataFrame, computed on the values only.'''
+
+    if len(df.columns) == 0:
+        return np.zeros(len(df), dtype=np.uint64)
+
+    # Columns are hashed by position, so duplicate names do not matter
+    df = df.set_axis(range(len(df.columns)), axis=1)
+
+    for i in df.columns:
+        if df[i].dtype == object and pd.api.types.infer_dtype(df[i], skipna=True) in _NUMBER_TYPES:
+            df[i] = df[i].map(normalise_number)
+
+    try:
+        hashes = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        # Unhashable values (e.g. JSON objects and arrays) are hashed through their text form
+        hashes = pd.util.hash_pandas_object(df.map(_hashable), index=False)
+
+    return hashes.to_numpy()
+
+
+def compare(actual: pd.DataFrame, expected: pd.DataFrame, max_rows: int = RESULT_COMPARE_MAX_ROWS) -> Comparison:
+    '''
+        Compares two results with the same number of columns, regardless of row order.
+        Rows are equal if all their values are equal. NULLs are equal to each other.
+    '''
+
+    actual, expected = _align_types(actual, expected)
+    actual_hashes, expected_hashes = row_hashes(actual), row_hashes(expected)
+
+    actual_keys, actual_counts = np.unique(actual_hashes, return_counts=True)
+    expected_keys, expected_counts = np.unique(expected_hashes, return_counts=True)
+
+    # Occurrences of each key in the other result
+    actual_in_expected = _lookup(actual_keys, expected_keys, expected_counts)
+    expected_in_actual = _lookup(expected_keys, actual_keys, actual_counts)
+
+    unexpected = np.maximum(actual_counts - actual_in_expected, 0)
+    missing = np.maximum(expected_counts - expected_in_actual, 0)
+
+    return Comparison(
+        unexpected=_positions(actual_hashes, actual_keys, unexpected, max_rows),
+        unexpected_count=int(unexpected.sum()),
+        missing=_positions(expected_hashes, expected_keys, missing, max_rows),
+        missing_count=int(missing.sum()),
+        correct_count=int(np.minimum(actual_counts, actual_in_expected).sum()),
+    )
+
+
+def _align_types(a: pd.DataFrame, b: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+        Columns of the same SQL type can have different pandas types, e.g. integers become floats when a result contains NULLs.
+        Such columns are converted to a common type, so that equal values have equal hashes.
+    '''
+
+    a = a.set_axis(range(len(a.columns)), axis=1)
+    b = b.set_axis(range(len(b.columns)), axis=1)
+
+    for i in range(len(a.columns)):
+        type_a, type_b = a[i].dtype, b[i].dtype
+        if type_a == type_b:
+            continue
+
+        if _is_number(type_a) and _is_number(type_b):
+            common = 'float64'
+        else:
+            common = 'object'
+
+        a[i] = a[i].astype(common)
+        b[i] = b[i].astype(common)
+
+    return a, b
+
+
+def _is_number(dtype: Any) -> bool:
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def _lookup(keys: np.ndarray, other_keys: np.ndarray, other_counts: np.ndarray) -> np.ndarray:
+    '''Returns the count of each key among the sorted `other_keys`, or 0 if it is not there.'''
+
+    if len(other_keys) == 0:
+        return np.zeros(len(keys), dtype=other_counts.dtype)
+
+    idx = np.searchsorted(other_keys, keys).clip(max=len(other_keys) - 1)
+    return np.where(other_keys[idx] == keys, other_counts[idx], 0)
+
+
+def _positions(hashes: np.ndarray, keys: np.ndarray, counts: np.ndarray, max_rows: int) -> np.ndarray:
+    '''
+        Positions of the first `max_rows` differing rows, in the order they appear.
+        Each row is repeated for its differing occurrences.
+    '''
+
+    mask = counts > 0
+    keys, counts = keys[mask], counts[mask]
+
+    positions: list[np.ndarray] = []
+    seen: set[int] = set()
+    found = 0
+
+    # Rows are scanned in chunks, stopping as soon as enough differing rows are found
+    for start in range(0, len(hashes), _SCAN_CHUNK_SIZE):
+        if found >= max_rows or len(keys) == 0:
+            break
+
+        chunk = hashes[start:start + _SCAN_CHUNK_SIZE]
+        idx = np.searchsorted(keys, chunk).clip(max=len(keys) - 1)
+
+        for i in np.flatnonzero(keys[idx] == chunk):
+            key = int(chunk[i])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            count = min(int(counts[idx[i]]), max_rows - found)
+            positions.append(np.full(count, start + i, dtype=np.intp))
+            found += count
+            if found >= max_rows:
+                break
+
+    return np.concatenate(positions) if positions else np.zeros(0, dtype=np.intp)
+
+
+def normalise_number(value: Any) -> Any:
+    '''Converts numbers to an equal `int` if they are integral, or otherwise to the `Decimal` with the shortest text form.'''
+
+    if isinstance(value, int):
+        return value
+
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        if not math.isfinite(value):
+            return value
+
+        # Converted through their shortest text form, e.g. `0.1` and not `0.1000000000000000055511151231257827`
+        number = Decimal(repr(value))
+    elif isinstance(value, Decimal):
+        if not value.is_finite():
+            return value
+        if value == value.to_integral_value():
+            return int(value)
+
+        number = value
+    else:
+        return value
+
+    # Trailing zeros are removed without rounding
+    return number.normalize(Context(prec=len(number.as_tuple().digits)))
+
+
+def _hashable(value: Any) -> Any:
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
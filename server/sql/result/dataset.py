@@ -1,11 +1,23 @@
 from .result import QueryResult
+from . import compare
 from .util import Column
 
 from ..code import SQLCode
 
-from typing import Self
+from typing import Any, Self
+import numpy as np
 import pandas as pd
 from flask_babel import _
+import hashlib
+import math
+import os
+
+RESULT_PAGE_SIZE = int(os.getenv('RESULT_PAGE_SIZE', '100'))
+'''Number of rows in each page of a result sent in columnar form.'''
+RESULT_HTML_MAX_ROWS = int(os.getenv('RESULT_HTML_MAX_ROWS', '50'))
+'''Results with at most this many rows are rendered as HTML tables, larger ones are sent in columnar form.'''
+RESULT_TEXT_MAX_ROWS = int(os.getenv('RESULT_TEXT_MAX_ROWS', '20'))
+'''Number of rows included in the text form of a result, which is logged and used in LLM prompts.'''
 
 
 class QueryResultDataset(QueryResult):
@@ -13,7 +25,8 @@ class QueryResultDataset(QueryResult):
     def __init__(self, result: pd.DataFrame, *,
                   query: SQLCode,
                   columns: list[Column],
-                  notices: list = []):
+                  notices: list = [],
+                  total_rows: int | None = None):
         super().__init__(
             query=query,
             success=True,
@@ -22,6 +35,14 @@ class QueryResultDataset(QueryResult):
         self._result = result
         self.columns = columns
 
+        self.total_rows = len(result) if total_rows is None else max(total_rows, len(result))
+        '''Number of rows returned by the query, including the ones which were not fetched.'''
+
+    @property
+    def truncated(self) -> bool:
+        '''Whether only part of the rows returned by the query are available.'''
+        return self.total_rows > len(self._result)
+
     @property
     def result_html(self) -> str:
         result = self._result.replace({None: 'NULL'})
@@ -57,12 +78,67 @@ class QueryResultDataset(QueryResult):
         col_str = _("column") if cols == 1 else _("columns")
         dimensions = f'<p><i>{rows} {row_str} × {cols} {col_str}</i></p>'
 
+        if self.truncated:
+            total_row_str = _("row") if self.total_rows == 1 else _("rows")
+            dimensions = f'<p><i>{self.total_rows} {total_row_str} × {cols} {col_str}, ' + _('showing the first {rows}').format(rows=rows) + '</i></p>'
+
         return f'{dimensions}\n{result}'
     
     @property
     def result_text(self) -> str:
+        '''Summary of the result: its first rows as CSV, followed by the number of rows if some were left out.'''
+
+        text = self._result.head(RESULT_TEXT_MAX_ROWS).replace({None: 'NULL'}).to_csv()
+        if self.total_rows > RESULT_TEXT_MAX_ROWS:
+            text += f'... ({self.total_rows} rows)\n'
+        return text
+
+    @property
+    def result_csv(self) -> str:
+        '''All the fetched rows of the result, as CSV.'''
         return self._result.replace({None: 'NULL'}).to_csv()
 
+    def row_hashes(self) -> np.ndarray:
+        '''64-bit hash of each row of the result, computed on the values only.'''
+        return compare.row_hashes(self._result)
+
+    @property
+    def content_hash(self) -> str:
+        '''Hash of the fetched rows of the result, in order.'''
+        return hashlib.md5(self.row_hashes().tobytes()).hexdigest()
+
+    @property
+    def result_columns(self) -> list[dict[str, str | None]]:
+        '''Names and types of the columns of the result.'''
+
+        # Comparisons with the solution add a column, which has no type
+        types = [column.data_type for column in self.columns] if len(self.columns) == len(self._result.columns) else []
+        types += [None] * (len(self._result.columns) - len(types))
+
+        return [
+            {'name': str(name), 'type': None if data_type is None else str(data_type)}
+            for name, data_type in zip(self._result.columns, types)
+        ]
+
+    def result_page(self, offset: int = 0, limit: int = RESULT_PAGE_SIZE) -> dict[str, Any]:
+        '''
+            Returns some rows of the result, in columnar form: the column metadata, a page of rows (each one as a list of values),
+            and the position of the page in the result.
+        '''
+
+        page = self._result.iloc[offset:offset + limit]
+
+        return {
+            'columns': self.result_columns,
+            'rows': [
+                [_json_value(value) for value in row]
+                for row in page.itertuples(index=False, name=None)
+            ],
+            'offset': offset,
+            'fetched_rows': len(self._result),
+            'total_rows': self.total_rows,
+        }
+
     def row_count(self) -> int:
         '''Returns the number of rows in the result.'''
         return len(self._result)
@@ -91,10 +167,12 @@ class QueryResultDataset(QueryResult):
         return wrong_types
     
     def compare_results(self, other: Self) -> tuple[bool, pd.DataFrame]:
-        self_cp = self._result.copy()
-        other_cp = other._result.copy()
+        '''
+            Compares the rows of this result with the ones of the solution, regardless of their order.
+            Returns whether they are the same, and the differing rows with a `check_result` column describing each of them.
+        '''
 
-        # NOTE: duplicate columns names are not supported, as they would cause issues with pd.merge
+        # Duplicate column names are renamed, so that each column can be addressed
         column_names_no_duplicates: list[str] = []
         for col in self.columns:
             count = column_names_no_duplicates.count(col.name)
@@ -103,52 +181,45 @@ class QueryResultDataset(QueryResult):
             else:
                 column_names_no_duplicates.append(f"{col.name}_{count}")
 
-        self_cp.columns = column_names_no_duplicates
-        other_cp.columns = column_names_no_duplicates
+        comparison = compare.compare(self._result, other._result)
 
-        # Count row occurrences
-        vc_self = self_cp.value_counts().reset_index(name='__count_self__')
-        vc_other = other_cp.value_counts().reset_index(name='__count_other__')
+        def summary_row(check_result: str) -> pd.DataFrame:
+            '''Single row with no values, and a message in the check_result column.'''
+            return pd.DataFrame([[''] * len(column_names_no_duplicates) + [check_result]], columns=column_names_no_duplicates + ['check_result'])
 
-        # Outer join on all columns to align rows
-        merged = pd.merge(
-            vc_self, vc_other,
-            on=column_names_no_duplicates,
-            how='outer'
-        ).fillna(0)
+        def differing_rows(df: pd.DataFrame, positions: np.ndarray, count: int, marker: str, message: str) -> list[pd.DataFrame]:
+            rows = df.iloc[positions].set_axis(column_names_no_duplicates, axis=1)
+            rows['check_result'] = f'{marker} {message}'
 
-        merged['__diff__'] = merged['__count_self__'] - merged['__count_other__']
+            # Rows beyond the display limit are only counted
+            if count > len(positions):
+                return [rows, summary_row(f'{marker} {_("{count} more rows are not shown").format(count=count - len(positions))}')]
+            return [rows]
 
-        # Helper to expand rows with origin label
-        def expand_rows(df: pd.DataFrame, label: str) -> pd.DataFrame:
-            repeat_counts = df['__diff__'].abs().where(
-                df['__diff__'].ne(0),
-                df['__count_self__'],
-            ).astype(int)
+        parts = [
+            *differing_rows(self._result, comparison.unexpected, comparison.unexpected_count, '__UNEXPECTED__', _("your query should not return this row")),
+            *differing_rows(other._result, comparison.missing, comparison.missing_count, '__MISSING__', _("your query should return this row but it does not")),
+        ]
 
-            rows = df.loc[df.index.repeat(repeat_counts)]
-            rows = rows[column_names_no_duplicates]
-            rows['check_result'] = label
-            return rows
+        # for correct rows, print a single row with no values and the amount of correct rows in the check_result column
+        if comparison.correct_count > 0:
+            parts.append(summary_row(f'__CORRECT__ {_("{count} rows in your query are correct").format(count=comparison.correct_count)}'))
 
-        unexpected_rows = expand_rows(merged[merged['__diff__'] > 0], f'__UNEXPECTED__ {_("your query should not return this row")}')
-        missing_rows = expand_rows(merged[merged['__diff__'] < 0], f'__MISSING__ {_("your query should return this row but it does not")}')
-        correct_rows = expand_rows(merged[merged['__diff__'] == 0], '__CORRECT__')
+        result = pd.concat(parts, ignore_index=True)
 
-        # for correct rows, print a single row with no values and the amount of correct rows in the check_result column
-        if len(correct_rows) == 0:
-            # Don't print the correct rows if there are none
-            correct_rows = correct_rows[0:0]
-        else:
-            count = len(correct_rows)
+        return comparison.equal, result
 
-            correct_rows = correct_rows.iloc[0:1]
-            correct_rows[column_names_no_duplicates] = ''
-            correct_rows['check_result'] = f'__CORRECT__ {_("{count} rows in your query are correct").format(count=count)}'
 
-        diff_rows = pd.concat([unexpected_rows, missing_rows], ignore_index=True)
-        are_equal = diff_rows.empty
+def _json_value(value: Any) -> Any:
+    '''Converts a value of a result to a JSON-serialisable one. NULLs are returned as None.'''
 
-        result = pd.concat([diff_rows, correct_rows], ignore_index=True)
+    if isinstance(value, np.generic):
+        value = value.item()
 
-        return are_equal, result
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return None if math.isnan(value) else value if math.isfinite(value) else str(value)
+    if value is pd.NaT:
+        return None
+    return str(value)
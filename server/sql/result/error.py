@@ -3,25 +3,48 @@ from ..exception import SQLException
 
 from .result import QueryResult
 
+from flask_babel import _
+
 class QueryResultError(QueryResult):
     '''Represents the result of a SQL query that failed to execute.'''
     def __init__(self, exception: SQLException, *,
                  query: SQLCode,
-                 notices: list = []):
+                 notices: list = [],
+                 elapsed_ms: float | None = None,
+                 timeout_ms: int | None = None):
         super().__init__(
             query=query,
             success=False,
             notices=notices,
             data_type='message')
         self._result = exception
+        self.elapsed_ms = elapsed_ms
+
+        self.timeout_ms = timeout_ms
+        '''Time limit exceeded by the query, if it was stopped for taking too long.'''
+
+    @property
+    def timed_out(self) -> bool:
+        '''Whether the query was stopped for exceeding a time limit.'''
+        return self.timeout_ms is not None
+
+    def _timeout_message(self) -> str:
+        return _('Query stopped after {elapsed:.1f} seconds: the time limit is {limit:.1f} seconds.').format(
+            elapsed=(self.elapsed_ms or 0) / 1000,
+            limit=(self.timeout_ms or 0) / 1000,
+        )
 
     @property
     def result_html(self) -> str:
+        if self.timed_out:
+            return f'{self._timeout_message()}<br/>{self._result}'
         return str(self._result)
 
     @property
     def result_text(self) -> str:
+        message = f'Message: {self._result}'
         if self._result.error_code:
-            return f'Message: {self._result}\nError Code: {self._result.error_code}'
-        else:
-            return f'Message: {self._result}'
\ No newline at end of file
+            message += f'\nError Code: {self._result.error_code}'
+        if self.timed_out:
+            message += f'\nElapsed: {self.elapsed_ms or 0:.0f} ms (limit: {self.timeout_ms} ms)'
+        return message
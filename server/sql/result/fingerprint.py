@@ -0,0 +1,130 @@
+'''
+    Order-insensitive fingerprints of query results, computed while rows are read from the cursor.
+
+    A fingerprint holds the columns of a result and the multiset of its rows, as sorted 64-bit row hashes with their
+    number of occurrences. Rows are hashed in batches and then discarded, so that no DataFrame is built.
+
+    Each row is hashed with a 64-bit BLAKE2b digest of its values, numbers being normalised first (see
+    `compare.normalise_number`), so that e.g. `1`, `1.0` and `Decimal('1')` have the same hash.
+    Equal results can still have different fingerprints (e.g. JSON objects whose keys are written differently),
+    so a fingerprint can confirm that two results are equal, but a different fingerprint must be confirmed by
+    comparing the results.
+'''
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Iterable
+import numpy as np
+import hashlib
+import json
+
+from .compare import normalise_number
+from .util import Column
+
+
+@dataclass(frozen=True, eq=False)
+class Fingerprint:
+    '''Multiset of the rows of a result. Results with the same fingerprint contain the same rows, regardless of their order.'''
+
+    keys: np.ndarray
+    '''Sorted, distinct row hashes.'''
+    counts: np.ndarray
+    '''Number of occurrences of each key.'''
+
+    @staticmethod
+    def of(hashes: np.ndarray) -> 'Fingerprint':
+        keys, counts = np.unique(hashes, return_counts=True)
+        return Fingerprint(keys, counts)
+
+    @property
+    def rows(self) -> int:
+        return int(self.counts.sum())
+
+    def matches(self, other: 'Fingerprint') -> bool:
+        return np.array_equal(self.keys, other.keys) and np.array_equal(self.counts, other.counts)
+
+    def common_rows(self, other: 'Fingerprint') -> int:
+        '''Number of rows contained in both results.'''
+
+        _, i, j = np.intersect1d(self.keys, other.keys, assume_unique=True, return_indices=True)
+        return int(np.minimum(self.counts[i], other.counts[j]).sum())
+
+
+@dataclass(frozen=True, eq=False)
+class ResultFingerprint:
+    '''Columns and rows of a result.'''
+
+    columns: list[Column]
+    rows: Fingerprint
+
+    @staticmethod
+    def of_rows(columns: list[Column], batches: Iterable[list[tuple]]) -> 'ResultFingerprint':
+        '''Fingerprint of a result whose rows are read in batches.'''
+
+        builder = FingerprintBuilder(columns)
+        for batch in batches:
+            builder.add(batch)
+        return builder.build()
+
+    @property
+    def column_types(self) -> list[Any]:
+        return [column.data_type for column in self.columns]
+
+    @property
+    def size(self) -> int:
+        '''Number of distinct rows.'''
+        return len(self.rows.keys)
+
+    def matches(self, other: 'ResultFingerprint') -> bool:
+        '''Whether both results certainly have the same column types and rows.'''
+        return self.column_types == other.column_types and self.rows.matches(other.rows)
+
+    def similarity(self, other: 'ResultFingerprint') -> tuple[bool, bool, int, int]:
+        '''Sort key of the results closest to this one: same columns first, then the most rows in common, then the closest number of rows.'''
+
+        return (
+            len(self.columns) == len(other.columns),
+            self.column_types == other.column_types,
+            self.rows.common_rows(other.rows),
+            -abs(self.rows.rows - other.rows.rows),
+        )
+
+
+@dataclass
+class FingerprintBuilder:
+    '''Fingerprint of a result being read from a cursor.'''
+
+    columns: list[Column]
+    _hashes: list[np.ndarray] = field(default_factory=list)
+
+    def add(self, rows: list[tuple]) -> None:
+        '''Hashes a batch of rows.'''
+        self._hashes.append(np.fromiter((_hash_row(row) for row in rows), dtype=np.int64, count=len(rows)))
+
+    def build(self) -> ResultFingerprint:
+        hashes = np.concatenate(self._hashes) if self._hashes else np.zeros(0, dtype=np.int64)
+        return ResultFingerprint(self.columns, Fingerprint.of(hashes))
+
+
+def _hash_row(row: tuple) -> int:
+    # Values are prefixed with their length, so that they cannot be confused with their separators
+    data = ''.join(f'{len(text)}:{text}' for text in map(_encode, row))
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+def _encode(value: Any) -> str:
+    '''Text form of a value, tagged with its kind. Equal values have the same text form.'''
+
+    if value is None:
+        return 'N'
+    if isinstance(value, bool):
+        return f'b{value:d}'
+    if isinstance(value, (int, float, Decimal)):
+        return f'n{normalise_number(value)}'
+    if isinstance(value, str):
+        return f's{value}'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'x{bytes(value).hex()}'
+    if isinstance(value, (dict, list)):
+        return f'j{json.dumps(value, sort_keys=True, default=str)}'
+    return f'{type(value).__name__}:{value}'
@@ -25,6 +25,9 @@ class QueryResult(ABC):
 
         self.query_id: int | None = None
 
+        self.elapsed_ms: float | None = None
+        '''Time taken to execute the query, in milliseconds, if measured.'''
+
     @property
     @abstractmethod
     def result_html(self) -> str:
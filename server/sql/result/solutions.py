@@ -0,0 +1,166 @@
+'''
+    Fingerprints of the results of exercise solutions.
+
+    Checking a query against the solutions of an exercise requires running each solution, which every student pays for.
+    The fingerprint of each solution result (see `fingerprint.py`) is kept in memory, keyed by exercise, solution and
+    dataset script, so that a correct query can be confirmed without running the solutions again.
+
+    Solutions are run on the database of each student, which the student can modify. A cached fingerprint is therefore only
+    used, and stored, while the student's database is known to match the dataset (see `dataset_state`): otherwise the
+    solutions are run.
+
+    Entries are dropped when exercises and datasets are updated (`admin.Exercise.update`, `admin.Dataset.update`).
+    Since the key also includes the hash of the solution and of the dataset script, other processes never use the result
+    of an outdated solution, and their entries expire after a while.
+'''
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+import threading
+import hashlib
+import time
+import os
+
+from .fingerprint import ResultFingerprint
+
+SOLUTION_CACHE_MAX_ROWS = int(os.getenv('SOLUTION_CACHE_MAX_ROWS', '1000000'))
+'''Maximum number of distinct rows whose hashes are kept in memory by each process, across all solutions.'''
+SOLUTION_CACHE_TTL_SECONDS = int(os.getenv('SOLUTION_CACHE_TTL_SECONDS', '3600'))
+'''How long each solution fingerprint is kept.'''
+
+SolutionKey = tuple[int, str, str]
+'''Exercise id, hash of the solution and hash of the dataset script.'''
+
+
+def hash_text(text: str) -> str:
+    '''Hash identifying a solution or a dataset script.'''
+    return hashlib.sha256(text.strip().encode()).hexdigest()
+
+
+def solution_key(exercise_id: int, solution: str, dataset_str: str) -> SolutionKey:
+    return exercise_id, hash_text(solution), hash_text(dataset_str)
+
+
+def dataset_state(dbms: str, dataset_str: str) -> str:
+    '''
+        Identifies a database initialised with a dataset script and not modified since (see `admin.User.dataset_state`).
+        It is set when the dataset is initialised without errors, and cleared by any statement which may modify the database.
+    '''
+    return f'{dbms}:{hash_text(dataset_str)}'
+
+
+@dataclass
+class _CachedFingerprint:
+    fingerprint: ResultFingerprint
+    expires_at: float
+
+
+@dataclass
+class SolutionCacheMetrics:
+    '''Counters describing how the solution cache has been used.'''
+
+    hits: int = 0
+    '''Solutions whose fingerprint was cached.'''
+    misses: int = 0
+    '''Solutions whose fingerprint was not (or no longer) cached.'''
+    evictions: int = 0
+    '''Fingerprints dropped to make room for new ones.'''
+    expirations: int = 0
+    '''Fingerprints dropped because they were too old.'''
+    invalidations: int = 0
+    '''Fingerprints dropped because their exercise or dataset was updated.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class SolutionCache:
+    '''LRU cache of solution fingerprints, bounded by the total number of distinct rows.'''
+
+    def __init__(self, max_rows: int = SOLUTION_CACHE_MAX_ROWS, ttl: float = SOLUTION_CACHE_TTL_SECONDS):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.metrics = SolutionCacheMetrics()
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[SolutionKey, _CachedFingerprint] = OrderedDict()
+        self._rows = 0
+
+    def get(self, key: SolutionKey) -> ResultFingerprint | None:
+        '''Returns the fingerprint of the result of a solution, if cached.'''
+
+        with self._lock:
+            self._expire()
+
+            cached = self._entries.get(key)
+            if cached is None:
+                self.metrics.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.metrics.hits += 1
+            return cached.fingerprint
+
+    def put(self, key: SolutionKey, fingerprint: ResultFingerprint) -> bool:
+        '''Caches the fingerprint of the result of a solution. Returns False if it does not fit in the cache.'''
+
+        if fingerprint.size > self.max_rows:
+            return False
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _CachedFingerprint(fingerprint, time.monotonic() + self.ttl)
+            self._rows += fingerprint.size
+
+            self._expire()
+            while self._rows > self.max_rows:
+                _, oldest = self._entries.popitem(last=False)
+                self._rows -= oldest.fingerprint.size
+                self.metrics.evictions += 1
+
+        return True
+
+    def invalidate(self, *, exercise_id: int | None = None, dataset_str: str | None = None) -> None:
+        '''Drops the fingerprints of the solutions of an exercise, or of all the exercises on a dataset script.'''
+
+        dataset_hash = None if dataset_str is None else hash_text(dataset_str)
+
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if key[0] == exercise_id or key[2] == dataset_hash
+            ]
+
+            for key in keys:
+                self._remove(key)
+                self.metrics.invalidations += 1
+
+    def stats(self) -> dict[str, int]:
+        '''Returns the number of cached fingerprints and rows, together with the cache metrics.'''
+
+        with self._lock:
+            return {
+                'solutions': len(self._entries),
+                'rows': self._rows,
+                'max_rows': self.max_rows,
+                **self.metrics.to_dict(),
+            }
+
+    def _remove(self, key: SolutionKey) -> None:
+        cached = self._entries.pop(key, None)
+        if cached is not None:
+            self._rows -= cached.fingerprint.size
+
+    def _expire(self) -> None:
+        '''Drops the fingerprints which are too old. Must be called with the lock held.'''
+
+        now = time.monotonic()
+        expired = [key for key, cached in self._entries.items() if cached.expires_at <= now]
+
+        for key in expired:
+            self._remove(key)
+            self.metrics.expirations += 1
+
+
+solution_results = SolutionCache()
+'''Fingerprints of the solution results of this process.'''
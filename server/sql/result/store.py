@@ -0,0 +1,128 @@
+'''
+    Results kept in memory, so that their rows can be sent in pages.
+
+    Large results are not sent at once: the response only contains their first page, and the client requests
+    the following ones by query id. Results are kept by the process which ran the query, within a budget of rows,
+    and dropped after a while. Once a result is no longer available, the query must be run again.
+
+    Pages can only be requested from the same process, so paging requires a single server worker (`GUNICORN_WORKERS`).
+    With more workers no result is stored, and large results are sent at once, up to `MAX_RESULT_ROWS`.
+'''
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+import threading
+import time
+import os
+
+from .dataset import QueryResultDataset
+
+RESULT_STORE_MAX_ROWS = int(os.getenv('RESULT_STORE_MAX_ROWS', '200000'))
+'''Maximum number of rows kept in memory by each process, across all results.'''
+RESULT_STORE_TTL_SECONDS = int(os.getenv('RESULT_STORE_TTL_SECONDS', '3600'))
+'''How long each result is kept.'''
+
+SINGLE_WORKER = int(os.getenv('GUNICORN_WORKERS', '1')) <= 1
+'''Whether requests are served by a single process, which is required to request pages.'''
+
+
+@dataclass
+class _StoredResult:
+    username: str
+    result: QueryResultDataset
+    expires_at: float
+
+
+@dataclass
+class ResultStoreMetrics:
+    '''Counters describing how the result store has been used.'''
+
+    hits: int = 0
+    '''Pages served from a stored result.'''
+    misses: int = 0
+    '''Pages requested for results which are not (or no longer) stored.'''
+    evictions: int = 0
+    '''Results dropped to make room for new ones.'''
+    expirations: int = 0
+    '''Results dropped because they were too old.'''
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class ResultStore:
+    '''LRU store of query results, keyed by query id and bounded by the total number of rows.'''
+
+    def __init__(self, max_rows: int = RESULT_STORE_MAX_ROWS, ttl: float = RESULT_STORE_TTL_SECONDS):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.metrics = ResultStoreMetrics()
+
+        self._lock = threading.Lock()
+        self._results: OrderedDict[int, _StoredResult] = OrderedDict()
+        self._rows = 0
+
+    def put(self, query_id: int, username: str, result: QueryResultDataset) -> bool:
+        '''Stores the result of a query run by a user. Returns False if the result does not fit in the store.'''
+
+        rows = result.row_count()
+        if rows > self.max_rows:
+            return False
+
+        with self._lock:
+            self._remove(query_id)
+            self._results[query_id] = _StoredResult(username, result, time.monotonic() + self.ttl)
+            self._rows += rows
+
+            self._expire()
+            while self._rows > self.max_rows:
+                _, oldest = self._results.popitem(last=False)
+                self._rows -= oldest.result.row_count()
+                self.metrics.evictions += 1
+
+        return True
+
+    def get(self, query_id: int, username: str) -> QueryResultDataset | None:
+        '''Returns the result of a query, if it is still stored and was run by the given user.'''
+
+        with self._lock:
+            self._expire()
+
+            stored = self._results.get(query_id)
+            if stored is None or stored.username != username:
+                self.metrics.misses += 1
+                return None
+
+            self._results.move_to_end(query_id)
+            self.metrics.hits += 1
+            return stored.result
+
+    def stats(self) -> dict[str, int]:
+        '''Returns the number of stored results and rows, together with the store metrics.'''
+
+        with self._lock:
+            return {
+                'results': len(self._results),
+                'rows': self._rows,
+                'max_rows': self.max_rows,
+                **self.metrics.to_dict(),
+            }
+
+    def _remove(self, query_id: int) -> None:
+        stored = self._results.pop(query_id, None)
+        if stored is not None:
+            self._rows -= stored.result.row_count()
+
+    def _expire(self) -> None:
+        '''Drops the results which are too old. Must be called with the lock held.'''
+
+        now = time.monotonic()
+        expired = [query_id for query_id, stored in self._results.items() if stored.expires_at <= now]
+
+        for query_id in expired:
+            self._remove(query_id)
+            self.metrics.expirations += 1
+
+
+results = ResultStore(max_rows=RESULT_STORE_MAX_ROWS if SINGLE_WORKER else 0)
+'''Results of this process whose rows are sent in pages.'''
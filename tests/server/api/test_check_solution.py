@@ -48,7 +48,7 @@ def test_check_solution_returns_not_enough_coins_message(authenticated_client, m
     get_database.assert_not_called()
 
 
-def test_check_solution_returns_rewards_and_logs_context(authenticated_client, mocker):
+def test_check_solution_returns_rewards_and_detects_errors_in_background(authenticated_client, mocker):
     fake_user = SimpleNamespace(
         username='alice',
         get_coins=lambda: 10,
@@ -57,14 +57,17 @@ def test_check_solution_returns_rewards_and_logs_context(authenticated_client, m
         add_rewards=mocker.stub(name='add_rewards'),
     )
     fake_exercise = SimpleNamespace(
+        exercise_id=7,
         dataset_id='dataset-1',
         count_attempts=lambda user: 0,
         solutions=['SELECT 1'],
         has_been_solved_by_user=lambda user: False,
+        get_resource_limits=lambda: (None, None),
     )
     fake_dataset = SimpleNamespace(
         dbms='postgresql',
         search_path='public',
+        dataset_str='CREATE TABLE students(id INT);',
     )
     fake_result = QueryResultMessage('Correct', query=SQLCode('CHECK_SOLUTION', builtin=True))
     fake_check = SimpleNamespace(
@@ -75,25 +78,28 @@ def test_check_solution_returns_rewards_and_logs_context(authenticated_client, m
     fake_database = SimpleNamespace(
         get_search_path=lambda: 'public',
         check_query_solution=lambda **kwargs: fake_check,
-        get_columns=lambda: ['columns'],
-        get_unique_columns=lambda: ['unique_columns'],
+        get_schema_metadata=lambda: SimpleNamespace(
+            columns=['columns'],
+            unique_columns=['unique_columns'],
+            catalog='catalog',
+        ),
+        release=mocker.stub(name='release'),
     )
     fake_batch = SimpleNamespace()
-    fake_query = SimpleNamespace(
-        query_id=321,
-        log_context=mocker.stub(name='log_context'),
-        log_errors=mocker.stub(name='log_errors'),
-        log_solution_attempt=mocker.stub(name='log_solution_attempt'),
+    fake_query = SimpleNamespace(log_detected_errors=mocker.stub(name='log_detected_errors'))
+    fake_query_log = SimpleNamespace(
+        context=mocker.stub(name='context'),
+        solution_attempt=mocker.stub(name='solution_attempt'),
+        flush=mocker.Mock(return_value=fake_query),
     )
+    error_detection = mocker.patch('server.api.queries.error_detection')
 
     mocker.patch('server.api.queries.db.admin.User', return_value=fake_user)
     mocker.patch('server.api.queries.db.admin.Exercise', return_value=fake_exercise)
     mocker.patch('server.api.queries.db.admin.Dataset', return_value=fake_dataset)
     mocker.patch('server.api.queries.db.users.get_database', return_value=fake_database)
     mocker.patch('server.api.queries.db.admin.QueryBatch.log', return_value=fake_batch)
-    mocker.patch('server.api.queries.db.admin.Query.log', return_value=fake_query)
-    mocker.patch('server.api.queries.build_catalog', return_value='catalog')
-    mocker.patch('server.api.queries.get_errors', return_value=['error'])
+    mocker.patch('server.api.queries.db.admin.QueryLog', return_value=fake_query_log)
 
     response = authenticated_client.post('/queries/check-solution', json={
         'query': 'SELECT 1',
@@ -116,9 +122,16 @@ def test_check_solution_returns_rewards_and_logs_context(authenticated_client, m
         {'reason': 'exercise_solutions.1', 'experience': 0, 'coins': 10},
     ]
 
-    fake_query.log_context.assert_called_once_with(
+    fake_query_log.context.assert_called_once_with(
         columns=['columns'],
         unique_columns=['unique_columns'],
     )
-    fake_query.log_solution_attempt.assert_called_once_with(True)
+    fake_query_log.solution_attempt.assert_called_once_with(True)
+    fake_query_log.flush.assert_called_once()
+
+    job, callback = error_detection.submit.call_args.args
+    assert job.query_str == 'SELECT 1'
+    assert job.columns == ['columns'] and job.unique_columns == ['unique_columns']
+    assert callback is fake_query.log_detected_errors
     fake_user.add_rewards.assert_called_once()
+    fake_database.release.assert_called_once()
@@ -1,6 +1,8 @@
 import json
 from types import SimpleNamespace
 
+import pytest
+
 
 def test_export_dataset_returns_dump_for_owner(authenticated_client, mocker):
     fake_user = SimpleNamespace(username='alice')
@@ -210,3 +212,40 @@ def test_add_user_to_dataset_user_not_found(authenticated_client, mocker):
     assert response.status_code == 200
     assert response.get_json()['success'] is False
     assert 'user does not exist' in response.get_json()['message'].lower()
+
+
+@pytest.mark.parametrize('limits', [
+    {'statement_timeout_ms': 0},
+    {'statement_timeout_ms': -1000},
+    {'statement_timeout_ms': '1000'},
+    {'lock_timeout_ms': 10 ** 12},
+])
+def test_set_limits_rejects_invalid_values(authenticated_client, mocker, limits):
+    fake_dataset = SimpleNamespace(
+        has_owner=lambda user: True,
+        set_resource_limits=mocker.stub(name='set_resource_limits'),
+    )
+
+    mocker.patch('server.api.datasets.db.admin.User', return_value=SimpleNamespace(username='alice'))
+    mocker.patch('server.api.datasets.db.admin.Dataset', return_value=fake_dataset)
+
+    response = authenticated_client.post('/datasets/set-limits', json={'dataset_id': 'DS1', **limits})
+
+    assert response.status_code == 200
+    assert response.get_json()['success'] is False
+    fake_dataset.set_resource_limits.assert_not_called()
+
+
+def test_set_limits_stores_valid_values(authenticated_client, mocker):
+    fake_dataset = SimpleNamespace(
+        has_owner=lambda user: True,
+        set_resource_limits=mocker.stub(name='set_resource_limits'),
+    )
+
+    mocker.patch('server.api.datasets.db.admin.User', return_value=SimpleNamespace(username='alice'))
+    mocker.patch('server.api.datasets.db.admin.Dataset', return_value=fake_dataset)
+
+    response = authenticated_client.post('/datasets/set-limits', json={'dataset_id': 'DS1', 'statement_timeout_ms': 1000})
+
+    assert response.get_json()['success'] is True
+    fake_dataset.set_resource_limits.assert_called_once_with(statement_timeout_ms=1000, lock_timeout_ms=None)
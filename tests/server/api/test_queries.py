@@ -2,6 +2,9 @@ from types import SimpleNamespace
 
 import pytest
 
+from server.api.queries import parse_max_rows
+from server.db.users.connection import MAX_RESULT_ROWS
+
 
 def _fake_query_result(query_text):
     return SimpleNamespace(
@@ -30,6 +33,7 @@ def test_builtin_query_endpoints_use_database_and_log_results(authenticated_clie
     fake_result = _fake_query_result('BUILTIN_SQL')
     fake_database = SimpleNamespace(**{
         database_method: lambda: iter([fake_result]),
+        'release': mocker.stub(name='release'),
     })
 
     mock_user = mocker.patch('server.api.queries.db.admin.User', return_value=fake_user)
@@ -57,6 +61,7 @@ def test_builtin_query_endpoints_use_database_and_log_results(authenticated_clie
     mock_dataset_ctor.assert_called_once_with('dataset-1')
     mock_get_database.assert_called_once_with(dbname='alice', dbms='postgresql')
     mock_log_builtin_query.assert_called_once_with(fake_user, fake_exercise, fake_result)
+    fake_database.release.assert_called_once()
 
 
 def test_builtin_list_users_endpoint_returns_first_result_from_iterator(authenticated_client, mocker):
@@ -67,6 +72,7 @@ def test_builtin_list_users_endpoint_returns_first_result_from_iterator(authenti
     second_result = _fake_query_result('SECOND')
     fake_database = SimpleNamespace(
         builtin_list_users=lambda: iter([first_result, second_result]),
+        release=mocker.stub(name='release'),
     )
 
     mocker.patch('server.api.queries.db.admin.User', return_value=fake_user)
@@ -80,3 +86,41 @@ def test_builtin_list_users_endpoint_returns_first_result_from_iterator(authenti
     assert response.status_code == 200
     assert response.get_json()[0]['query'] == 'FIRST'
     assert response.get_json()[0]['id'] == 999
+
+
+def test_result_rows_endpoint_returns_pages_of_stored_results(authenticated_client, mocker):
+    fake_result = SimpleNamespace(result_page=mocker.Mock(return_value={'rows': [[100]], 'offset': 100}))
+    results = mocker.patch('server.api.queries.results')
+    results.get.return_value = fake_result
+
+    response = authenticated_client.get('/queries/12/rows?offset=100&limit=1')
+
+    assert response.get_json()['success'] is True
+    assert response.get_json()['rows'] == [[100]]
+    results.get.assert_called_once_with(12, 'alice')
+    fake_result.result_page.assert_called_once_with(100, 1)
+
+
+def test_result_rows_endpoint_reports_unavailable_results(authenticated_client, mocker):
+    results = mocker.patch('server.api.queries.results')
+    results.get.return_value = None
+
+    response = authenticated_client.get('/queries/12/rows')
+
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize(
+    ('value', 'expected'),
+    [
+        (None, 'max'),
+        ('abc', 'max'),
+        ([10], 'max'),
+        ('10', 10),
+        (0, 1),
+        (-5, 1),
+        (10**12, 'max'),
+    ],
+)
+def test_max_rows_is_clamped_to_valid_range(value, expected):
+    assert parse_max_rows(value) == (MAX_RESULT_ROWS if expected == 'max' else expected)
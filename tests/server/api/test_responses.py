@@ -1,6 +1,10 @@
 from flask import Flask
+from flask_babel import Babel
+import pandas as pd
 
 from server.api.util import responses
+from server.sql import Column, QueryResultDataset, SQLCode
+from server.sql.result.dataset import RESULT_HTML_MAX_ROWS, RESULT_PAGE_SIZE
 
 
 class FakeReward:
@@ -61,3 +65,37 @@ def test_streaming_response_uses_ndjson_content_type():
     response = responses.streaming_response(['{"success": true}\n'])
 
     assert response.content_type == 'application/x-ndjson'
+
+
+def _dataset(rows: int) -> QueryResultDataset:
+    return QueryResultDataset(
+        pd.DataFrame({'id': range(rows), 'name': [None] * rows}),
+        query=SQLCode('SELECT id, name FROM students'),
+        columns=[Column('id', 23), Column('name', 25)],
+    )
+
+
+def test_small_datasets_are_rendered_as_html():
+    app = Flask(__name__)
+    Babel(app)
+
+    with app.app_context():
+        data = responses.result_data(_dataset(RESULT_HTML_MAX_ROWS))
+
+    assert data.keys() == {'data'}
+    assert '<table' in data['data']
+
+
+def test_large_datasets_are_sent_in_columnar_pages():
+    result = _dataset(RESULT_HTML_MAX_ROWS + 1)
+
+    paged = responses.result_data(result, paged=True)
+    full = responses.result_data(result)
+
+    assert paged['data'] is None
+    assert paged['columns'] == [{'name': 'id', 'type': '23'}, {'name': 'name', 'type': '25'}]
+    assert paged['rows'][:2] == [[0, None], [1, None]]
+    assert len(paged['rows']) == min(RESULT_PAGE_SIZE, RESULT_HTML_MAX_ROWS + 1)
+    assert paged['offset'] == 0
+    assert paged['fetched_rows'] == paged['total_rows'] == RESULT_HTML_MAX_ROWS + 1
+    assert len(full['rows']) == RESULT_HTML_MAX_ROWS + 1
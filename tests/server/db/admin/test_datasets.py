@@ -141,3 +141,16 @@ def test_shuffle_renames_exercises_in_randomized_order(mocker):
         {'title': 'Task 2', 'request': 'Request 2', 'solutions': ['SELECT 2']},
         {'title': 'Task 3', 'request': 'Request 1', 'solutions': ['SELECT 1']},
     ]
+
+
+def test_update_drops_images_of_previous_script(mocker):
+    execute = mocker.patch('server.db.admin.datasets.db.execute')
+    delete = mocker.patch('server.db.admin.datasets.DatasetImage.delete_script')
+
+    dataset = Dataset('ds1', dataset_str='CREATE TABLE t (a INT);')
+    dataset.update('Title', 'Description', 'CREATE TABLE t (a INT);', dbms=Dialect.POSTGRES)
+    delete.assert_not_called()
+
+    dataset.update('Title', 'Description', 'CREATE TABLE u (a INT);', dbms=Dialect.POSTGRES)
+    delete.assert_called_once_with('CREATE TABLE t (a INT);')
+    assert execute.call_count == 2
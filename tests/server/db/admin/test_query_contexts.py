@@ -0,0 +1,128 @@
+import json
+from types import SimpleNamespace
+
+from sqlchecker import DetectedError, SqlErrors
+from sqlscope.catalog import CatalogColumnInfo, CatalogUniqueConstraintInfo
+
+from server.db.admin.queries import Query, QueryContext, QueryLog
+from server.db.admin.writer import WriteBehindQueue
+
+
+def _column(name: str, table: str = 'students') -> CatalogColumnInfo:
+    return CatalogColumnInfo(
+        schema_name='public',
+        table_name=table,
+        column_name=name,
+        column_type='integer',
+        numeric_precision=32,
+        numeric_scale=0,
+        is_nullable=True,
+        foreign_key_schema=None,
+        foreign_key_table=None,
+        foreign_key_column=None,
+    )
+
+
+def _unique(columns) -> CatalogUniqueConstraintInfo:
+    return CatalogUniqueConstraintInfo(
+        schema_name='public',
+        table_name='students',
+        constraint_type='PRIMARY KEY',
+        columns=columns,
+    )
+
+
+def test_context_hash_ignores_order_and_array_representation():
+    first = QueryContext.hash_context([_column('id'), _column('age')], [_unique('{id,age}')])
+    second = QueryContext.hash_context([_column('age'), _column('id')], [_unique(['id', 'age'])])
+
+    assert first == second
+    assert first != QueryContext.hash_context([_column('id')], [_unique('{id,age}')])
+
+
+def test_known_context_is_only_linked(mocker):
+    fetch = mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[[5]])
+    execute = mocker.patch('server.db.admin.queries.db.execute')
+
+    Query(1).log_context([_column('id')], [])
+
+    assert fetch.call_count == 1
+    execute.assert_not_called()
+
+
+def test_new_context_is_stored_once_then_linked(mocker):
+    fetch = mocker.patch('server.db.admin.queries.db.execute_and_fetch', side_effect=[[[None]], [[6]]])
+    execute = mocker.patch('server.db.admin.queries.db.execute')
+
+    Query(1).log_context([_column('id'), _column('age')], [_unique('{id}')])
+
+    assert fetch.call_count == 2
+    execute.assert_called_once()
+    params = execute.call_args.args[1]
+    assert [column['column_name'] for column in json.loads(params['columns'])] == ['id', 'age']
+    assert json.loads(params['unique_columns'])[0]['columns'] == '{id}'
+
+
+def test_query_without_context_has_empty_context(mocker):
+    mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[[None]])
+
+    assert Query(1).get_context() == ([], [])
+
+
+def _query_log() -> QueryLog:
+    batch = SimpleNamespace(batch_id=3, user=SimpleNamespace(username='alice'))
+
+    return (
+        QueryLog(
+            query_batch=batch,
+            sql_string='SELECT id FROM students',
+            search_path='public',
+            success=True,
+            result='1 row',
+            query_type='SELECT',
+            query_goal='SELECT',
+        )
+        .context([_column('id')], [_unique('{id}')])
+        .errors([DetectedError(SqlErrors(1), ('a', 1))])
+        .solution_attempt(False)
+    )
+
+
+def test_query_log_writes_everything_with_one_statement(mocker):
+    mocker.patch('server.db.admin.queries.analytics', WriteBehindQueue(enabled=False))
+    fetch = mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[[42]])
+    execute = mocker.patch('server.db.admin.queries.db.execute')
+
+    query = _query_log().flush()
+
+    assert query.query_id == 42
+    fetch.assert_called_once()
+    execute.assert_not_called()
+
+    params = fetch.call_args.args[1]
+    assert params['context_hash'] == QueryContext.hash_context([_column('id')], [_unique('{id}')])
+    assert json.loads(params['errors']) == [{'error_id': 1, 'details': ['a', '1']}]
+    assert params['log_uniqueness'] is True
+    assert params['is_correct'] is False and params['log_solution_attempt'] is True
+
+
+def test_query_log_defers_context_and_errors(mocker):
+    analytics = WriteBehindQueue()
+    mocker.patch('server.db.admin.queries.analytics', analytics)
+    fetch = mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[[42]])
+    execute = mocker.patch('server.db.admin.queries.db.execute')
+
+    query = _query_log().flush()
+
+    params = fetch.call_args.args[1]
+    assert params['context_hash'] is None
+    assert json.loads(params['errors']) == []
+    assert params['log_solution_attempt'] is True
+    assert query.query_id == 42 and len(query.errors) == 1
+
+    assert analytics.flush(timeout=5)
+    analytics.stop()
+    link_context, insert_errors = [call.args[1] for call in execute.call_args_list]
+    assert link_context['context_hash'] == QueryContext.hash_context([_column('id')], [_unique('{id}')])
+    assert link_context['query_ids'] == [42]
+    assert json.loads(insert_errors['errors']) == [{'query_id': 42, 'error_id': 1, 'details': ['a', '1']}]
@@ -0,0 +1,53 @@
+import json
+import zlib
+from types import SimpleNamespace
+
+from server.db.admin.queries import QueryLog, QueryResultArchive
+from server.db.admin.writer import WriteBehindQueue
+
+
+def _query_log() -> QueryLog:
+    return QueryLog(
+        query_batch=SimpleNamespace(batch_id=3, user=SimpleNamespace(username='alice')),
+        sql_string='SELECT * FROM students',
+        search_path='public',
+        success=True,
+        result='summary',
+        query_type='SELECT',
+        query_goal='SELECT',
+    )
+
+
+def test_dataset_summary_is_logged_with_query(mocker):
+    mocker.patch('server.db.admin.queries.RESULT_ARCHIVE_ENABLED', False)
+    fetch = mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[[42]])
+    full_result = mocker.stub(name='full_result')
+
+    _query_log().dataset(rows=1000, content_hash='abc', full_result=full_result).flush()
+
+    params = fetch.call_args.args[1]
+    assert params['result'] == 'summary'
+    assert params['result_rows'] == 1000
+    assert params['result_hash'] == 'abc'
+    full_result.assert_not_called()
+
+
+def test_full_result_is_archived_in_background(mocker):
+    mocker.patch('server.db.admin.queries.RESULT_ARCHIVE_ENABLED', True)
+    mocker.patch('server.db.admin.queries.analytics', WriteBehindQueue(enabled=False))
+    mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[[42]])
+    execute = mocker.patch('server.db.admin.queries.db.execute')
+
+    _query_log().dataset(rows=2, content_hash='abc', full_result=lambda: 'id\n1\n2\n').flush()
+
+    params = execute.call_args.args[1]
+    [archived] = json.loads(params['results'])
+    assert archived['query_id'] == 42
+    assert archived['size'] == len('id\n1\n2\n')
+    assert params['encoding'] == QueryResultArchive.ENCODING
+
+
+def test_archived_results_are_decompressed(mocker):
+    mocker.patch('server.db.admin.queries.db.execute_and_fetch', return_value=[('zlib', memoryview(zlib.compress(b'id\n1\n')))])
+
+    assert QueryResultArchive.get(42) == 'id\n1\n'
@@ -0,0 +1,79 @@
+import threading
+
+from server.db.admin.writer import WriteBehindQueue
+
+
+def test_writes_are_batched_by_handler():
+    queue = WriteBehindQueue(batch_size=10)
+    release = threading.Event()
+    first, second = [], []
+
+    def blocked(items):
+        release.wait(5)
+
+    # Keep the thread busy, so that the next writes end up in the same batch
+    queue.submit(blocked, None)
+    for i in range(3):
+        queue.submit(first.append, i)
+        queue.submit(second.append, -i)
+    release.set()
+
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert first == [[0, 1, 2]]
+    assert second == [[0, -1, -2]]
+    assert queue.metrics.written == 7
+    assert queue.stats()['lag_seconds'] == 0
+
+
+def test_full_queue_writes_synchronously():
+    queue = WriteBehindQueue(size=1, enqueue_timeout=0.01)
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def blocked(items):
+        started.set()
+        release.wait(5)
+
+    # Once the blocked write is taken by the thread, the queue has room for one more
+    queue.submit(blocked, None)
+    assert started.wait(5)
+    queue.submit(written.extend, ['queued'])
+    queue.submit(written.extend, ['sync'])
+
+    assert written == [['sync']]
+    assert queue.metrics.sync_writes == 1
+    assert queue.lag_seconds > 0
+
+    release.set()
+    queue.stop(timeout=5)
+    assert written == [['sync'], ['queued']]
+
+
+def test_failed_writes_are_retried_then_discarded(mocker):
+    mocker.patch('server.db.admin.writer._RETRY_SECONDS', 0)
+    queue = WriteBehindQueue(retries=2)
+    attempts = []
+
+    def failing(items):
+        attempts.append(items)
+        raise RuntimeError('admin database unavailable')
+
+    queue.submit(failing, 'event')
+    queue.stop(timeout=5)
+
+    assert attempts == [['event'], ['event']]
+    assert queue.metrics.failed == 1
+    assert queue.metrics.written == 0
+
+
+def test_stop_flushes_and_later_writes_are_synchronous():
+    queue = WriteBehindQueue()
+    written = []
+
+    queue.submit(written.extend, 'before')
+    queue.stop(timeout=5)
+    queue.submit(written.extend, 'after')
+
+    assert written == ['before', 'after']
+    assert not queue.stats()['running']
@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+from server.db.users.postgresql import connection as pg
+from server.db.users.postgresql.exception import PostgresqlException
+
+
+class _UndefinedTable(psycopg2.Error):
+    pgcode = '42P01'
+
+
+class _SyntaxError(psycopg2.Error):
+    pgcode = '42601'
+
+
+class _FakeCursor:
+    def __init__(self, error: psycopg2.Error):
+        self.error = error
+        self.executed: list[str] = []
+
+    def execute(self, query: str) -> None:
+        self.executed.append(query)
+        if query.startswith('DECLARE'):
+            raise self.error
+
+
+def _connection(error: psycopg2.Error):
+    conn = pg.PostgresqlConnection.__new__(pg.PostgresqlConnection)
+    cur = _FakeCursor(error)
+
+    @contextmanager
+    def cursor():
+        yield cur
+
+    conn.connection = SimpleNamespace(info=SimpleNamespace(transaction_status=pg.TRANSACTION_STATUS_IDLE))
+    conn.cursor = cursor
+    conn.mark_alive = lambda: None
+    return conn, cur
+
+
+def test_cursor_errors_are_raised_without_running_the_query_again():
+    message = (
+        'relation "missing" does not exist\n'
+        f'LINE 1: {pg._DECLARE_CURSOR}SELECT * FROM missing\n'
+        f'        {" " * len(pg._DECLARE_CURSOR)}              ^'
+    )
+    conn, cur = _connection(_UndefinedTable(message))
+
+    with pytest.raises(PostgresqlException) as info:
+        conn._with_declared_cursor(SimpleNamespace(query='SELECT * FROM missing'), lambda cur: None)
+
+    assert info.value.description == 'relation "missing" does not exist'
+    assert info.value.traceback == [
+        'LINE 1: SELECT * FROM missing',
+        '                      ^',
+    ]
+    assert cur.executed[-1] == 'ROLLBACK'
+
+
+def test_queries_which_cannot_be_declared_fall_back():
+    conn, cur = _connection(_SyntaxError('syntax error at or near "SELEC"'))
+
+    assert conn._with_declared_cursor(SimpleNamespace(query='SELEC 1'), lambda cur: None) is None
+    assert cur.executed[-1] == 'ROLLBACK'
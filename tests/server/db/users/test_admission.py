@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from server.db.users.admission import AdmissionControl, AdmissionTimeoutError
+
+
+def test_statements_within_limit_are_admitted_immediately():
+    admission = AdmissionControl(max_concurrent=2, timeout=0.1)
+
+    with admission.slot():
+        with admission.slot():
+            assert admission.stats()['running'] == 2
+
+    stats = admission.stats()
+    assert stats['running'] == 0
+    assert stats['admitted'] == 2
+    assert stats['waits'] == 0
+
+
+def test_statement_over_limit_is_rejected_after_timeout():
+    admission = AdmissionControl(max_concurrent=1, timeout=0.05)
+
+    with admission.slot():
+        with pytest.raises(AdmissionTimeoutError):
+            with admission.slot():
+                pass
+
+    stats = admission.stats()
+    assert stats['rejected'] == 1
+    assert stats['running'] == 0
+
+
+def test_waiting_statement_is_admitted_when_slot_frees():
+    admission = AdmissionControl(max_concurrent=1, timeout=2)
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with admission.slot():
+            holding.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait()
+
+    threading.Timer(0.05, release.set).start()
+    with admission.slot():
+        assert admission.stats()['running'] == 1
+
+    thread.join()
+    assert admission.stats()['waits'] == 1
@@ -0,0 +1,57 @@
+from sqlscope import Catalog
+
+from server.db.users.catalog import SystemCatalog, SystemCatalogCache
+
+
+def _system_catalog() -> SystemCatalog:
+    catalog = Catalog()
+    catalog.add_column('pg_catalog', 'pg_class', 'relname', 'name')
+    catalog.add_column('information_schema', 'tables', 'table_name', 'name')
+    return SystemCatalog(catalog=catalog, search_path='pg_catalog,')
+
+
+def _user_catalog() -> Catalog:
+    catalog = Catalog()
+    catalog.add_column('public', 'students', 'name', 'text')
+    return catalog
+
+
+def test_overlay_matches_merge():
+    system = _system_catalog()
+    user = _user_catalog()
+
+    overlay = system.overlay(user)
+    merged = user.merge(system.catalog)
+
+    assert overlay.schema_names == merged.schema_names
+    assert overlay.table_names == merged.table_names
+
+
+def test_overlay_shares_system_schemas_until_modified():
+    system = _system_catalog()
+    overlay = system.overlay(_user_catalog())
+
+    copy = overlay.copy()
+    assert copy.lookup_schema('pg_catalog') is system.catalog.lookup_schema('pg_catalog')
+
+    copy.add_column('pg_catalog', 'pg_class', 'relkind', 'char')
+    copy.get_schema('information_schema')['extra'] = copy.get_table('public', 'students')
+
+    assert copy.lookup_schema('pg_catalog') is not system.catalog.lookup_schema('pg_catalog')
+    assert 'relkind' not in [column.name for column in system.catalog.get_table('pg_catalog', 'pg_class').columns]
+    assert system.catalog.table_names == {'pg_class', 'tables'}
+
+
+def test_system_catalog_is_loaded_once():
+    cache = SystemCatalogCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return _system_catalog()
+
+    first = cache.get('postgresql', load)
+    second = cache.get('postgresql', load)
+
+    assert first is second
+    assert len(loads) == 1
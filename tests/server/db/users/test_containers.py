@@ -0,0 +1,54 @@
+from server.db.users.containers import ContainerCache
+
+
+def _event(action: str, name: str) -> dict:
+    return {'Type': 'container', 'Action': action, 'Actor': {'Attributes': {'name': name}}}
+
+
+def test_running_container_is_cached():
+    cache = ContainerCache('lensql_db_user', ttl=60, watch_events=False)
+
+    assert cache.is_running('alice') is False
+    cache.mark_running('alice')
+
+    assert cache.is_running('alice') is True
+    assert cache.metrics.misses == 1
+    assert cache.metrics.hits == 1
+
+
+def test_entries_expire_without_watcher():
+    cache = ContainerCache('lensql_db_user', ttl=0, watch_events=False)
+
+    cache.mark_running('alice')
+
+    assert cache.is_running('alice') is False
+
+
+def test_invalidate_forgets_container():
+    cache = ContainerCache('lensql_db_user', ttl=60, watch_events=False)
+
+    cache.mark_running('alice')
+    cache.invalidate('alice')
+
+    assert cache.is_running('alice') is False
+    assert cache.metrics.invalidations == 1
+
+
+def test_docker_events_update_cache():
+    cache = ContainerCache('lensql_db_user', ttl=60, watch_events=False)
+
+    cache._handle_event(_event('start', 'alice'))
+    cache._handle_event(_event('start', 'bob'))
+    cache._handle_event(_event('die', 'bob'))
+    cache._handle_event(_event('health_status: healthy', 'carol'))
+
+    assert cache.is_running('alice') is True
+    assert cache.is_running('bob') is False
+    assert cache.is_running('carol') is False
+
+
+def test_lock_is_shared_per_container():
+    cache = ContainerCache('lensql_db_user', watch_events=False)
+
+    assert cache.lock('alice') is cache.lock('alice')
+    assert cache.lock('alice') is not cache.lock('bob')
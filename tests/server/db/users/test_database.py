@@ -1,10 +1,16 @@
 
+from types import SimpleNamespace
+
 import pandas as pd
 
 from sqlscope import Catalog
 from server.db.users.database import Database
+from server.db.users.governor import ResourceLimits
+from server.db.users.script import ScriptProgress
+from server.db.users.session import session_owner
 from server.sql.code import SQLCode
-from server.sql.result import Column, QueryResultDataset, QueryResultMessage
+from server.sql.exception import SQLException
+from server.sql.result import Column, QueryResultDataset, QueryResultError, QueryResultMessage
 
 
 class _BuiltinQueries:
@@ -117,3 +123,312 @@ def test_get_datatype_name_returns_name_or_fallback_id():
 
     assert database.get_datatype_name(23) == 'int4'
     assert database.get_datatype_name(9999) == 'id=9999'
+
+
+class _FakeSessionConnection:
+    def __init__(self):
+        self.executed = []
+        self.session_version = None
+        self.limits = object()
+        self.search_path = None
+
+    def execute_sql_raw(self, statement: str):
+        self.executed.append(statement)
+        return []
+
+
+def _patch_session(mocker, **state):
+    fake_user = SimpleNamespace(
+        session_state=(state.get('search_path'), state.get('settings', {}), state.get('version', 0), state.get('owner')),
+        set_session_owner=mocker.stub(name='set_session_owner'),
+    )
+    mocker.patch('server.db.users.database.admin.User', return_value=fake_user)
+    return fake_user
+
+
+def test_connection_behind_replays_session(mocker):
+    _patch_session(mocker, search_path='shop', settings={'datestyle': "SET datestyle TO 'ISO'"}, version=3)
+    database = _TestDatabase()
+    conn = _FakeSessionConnection()
+
+    database._sync_session(conn)
+
+    assert conn.executed == ["SET datestyle TO 'ISO'", 'SET search_path TO shop;']
+    assert conn.session_version == 3
+    assert conn.limits is None
+
+
+def test_connection_up_to_date_is_not_touched(mocker):
+    _patch_session(mocker, search_path='shop', version=3)
+    database = _TestDatabase()
+    conn = _FakeSessionConnection()
+    conn.session_version = 3
+
+    database._sync_session(conn)
+
+    assert conn.executed == []
+
+
+def test_state_held_by_another_connection_is_reported_once(mocker):
+    other = _FakeSessionConnection()
+    fake_user = _patch_session(mocker, owner=session_owner(other))
+    database = _TestDatabase()
+
+    database._sync_session(_FakeSessionConnection())
+
+    assert database._session_warning is not None
+    fake_user.set_session_owner.assert_called_once_with(None)
+
+
+class _FakeException(SQLException):
+    pass
+
+
+class _FakeBatchConnection:
+    '''Fails any batch containing a statement with `FAIL`, applying nothing.'''
+
+    atomic_batches = True
+    notices = []
+
+    def __init__(self):
+        self.batches = []
+
+    def execute_batch(self, statements):
+        if any('FAIL' in statement.query for statement in statements):
+            raise _FakeException(None, 'SyntaxError', '42601', 'syntax error', [])
+        self.batches.append([statement.query for statement in statements])
+
+    def apply_limits(self, limits):
+        pass
+
+    def rollback(self):
+        pass
+
+    def is_open(self):
+        return True
+
+    def is_timeout(self, exception):
+        return False
+
+    def is_disconnect(self, exception):
+        return False
+
+    def in_transaction(self):
+        return False
+
+
+def _script_database(mocker, conn):
+    database = _TestDatabase()
+    database.limits = ResourceLimits(0, 0)
+    mocker.patch.object(database, 'connect', return_value=conn)
+    mocker.patch.object(database, '_persist_session')
+    return database
+
+
+def test_script_runs_in_batches_and_reports_progress(mocker):
+    mocker.patch('server.db.users.database.SCRIPT_PROGRESS_EVERY', 2)
+    mocker.patch('server.db.users.database.SCRIPT_BATCH_STATEMENTS', 2)
+    conn = _FakeBatchConnection()
+    database = _script_database(mocker, conn)
+
+    items = list(database.execute_script('INSERT 1; INSERT 2; INSERT 3; INSERT 4; INSERT 5;'))
+
+    assert conn.batches == [['INSERT 1;', 'INSERT 2;'], ['INSERT 3;', 'INSERT 4;'], ['INSERT 5;']]
+    assert items == [ScriptProgress(2, 5), ScriptProgress(4, 5), ScriptProgress(5, 5)]
+
+
+def test_failed_batch_is_retried_one_statement_at_a_time(mocker):
+    conn = _FakeBatchConnection()
+    database = _script_database(mocker, conn)
+
+    items = list(database.execute_script('INSERT 1; FAIL 2; INSERT 3;'))
+
+    assert conn.batches == [['INSERT 1;'], ['INSERT 3;']]
+    assert len(items) == 2
+    assert isinstance(items[0], QueryResultError)
+    assert items[0].query.query == 'FAIL 2;'
+    assert items[1] == ScriptProgress(3, 3, errors=1)
+
+
+class _FakeTransactionConnection(_FakeBatchConnection):
+    '''Applies the statements of a batch one at a time, like a server running a batch which contains its own `COMMIT`.'''
+
+    def __init__(self):
+        super().__init__()
+        self.applied = []
+        self.committed = 0
+        self.transaction = False
+
+    def execute_batch(self, statements):
+        for statement in statements:
+            if 'FAIL' in statement.query:
+                raise _FakeException(None, 'SyntaxError', '42601', 'syntax error', [])
+
+            self.applied.append(statement.query)
+            if statement.query.startswith('BEGIN'):
+                self.transaction = True
+            elif statement.query.startswith('COMMIT'):
+                self.transaction = False
+                self.committed = len(self.applied)
+
+        if not self.transaction:
+            self.committed = len(self.applied)
+
+    def rollback(self):
+        del self.applied[self.committed:]
+        self.transaction = False
+
+    def in_transaction(self):
+        return self.transaction
+
+
+def test_statements_committed_by_the_script_are_not_executed_again(mocker):
+    conn = _FakeTransactionConnection()
+    database = _script_database(mocker, conn)
+
+    items = list(database.execute_script('INSERT 1; COMMIT; INSERT 2; FAIL 3;'))
+
+    assert conn.applied == ['INSERT 1;', 'COMMIT;', 'INSERT 2;']
+    assert items[-1] == ScriptProgress(4, 4, errors=1)
+
+
+def test_failures_inside_script_transactions_roll_back_the_transaction(mocker):
+    conn = _FakeTransactionConnection()
+    database = _script_database(mocker, conn)
+
+    items = list(database.execute_script('BEGIN; INSERT 1; FAIL 2; COMMIT;'))
+
+    # as if the statements were executed one at a time: the failure aborts the whole transaction
+    assert 'INSERT 1;' not in conn.applied
+    assert items[-1] == ScriptProgress(4, 4, errors=1)
+
+
+class _ImageDatabase(_TestDatabase):
+    supports_images = True
+
+    def __init__(self, image: bytes | None):
+        super().__init__()
+        self.built = []
+        self.restored = []
+        self.image = image
+
+    def build_image(self, script: str):
+        self.built.append(script)
+        return self.image
+
+    def restore_image(self, image: bytes):
+        self.restored.append(image)
+
+    def execute_script(self, script: str):
+        yield ScriptProgress(executed=0, total=0)
+
+
+def _patch_images(mocker, image: bytes | None):
+    store = SimpleNamespace(get=lambda: image, save=mocker.stub(name='save'))
+    mocker.patch('server.db.users.database.admin.DatasetImage', return_value=store, hash_script=lambda script: 'hash')
+    return store
+
+
+def test_dataset_is_restored_from_existing_image(mocker):
+    _patch_images(mocker, b'image')
+    conn = _FakeBatchConnection()
+    database = _ImageDatabase(None)
+    mocker.patch.object(database, 'connect', return_value=conn)
+    mocker.patch.object(database, '_persist_session')
+
+    items = list(database.init_dataset('SET search_path TO shop; CREATE TABLE t (a INT); INSERT INTO t VALUES (1);'))
+
+    assert database.built == []
+    assert database.restored == [b'image']
+    assert conn.batches == [['SET search_path TO shop;']]
+    assert items == [ScriptProgress(3, 3)]
+
+
+def test_missing_image_is_built_and_saved(mocker):
+    store = _patch_images(mocker, None)
+    database = _ImageDatabase(b'image')
+    mocker.patch.object(database, 'connect', return_value=_FakeBatchConnection())
+
+    list(database.init_dataset('CREATE TABLE t (a INT);'))
+
+    store.save.assert_called_once_with(b'image')
+    assert database.restored == [b'image']
+
+
+def test_script_without_image_is_executed(mocker):
+    store = _patch_images(mocker, None)
+    database = _ImageDatabase(None)
+    mocker.patch.object(database, 'connect', return_value=_FakeBatchConnection())
+
+    items = list(database.init_dataset('CREATE TABLE t (a INT); FAIL;'))
+
+    store.save.assert_called_once_with(b'')
+    assert database.restored == []
+    assert items == [ScriptProgress(0, 0)]
+
+
+class _FakeDroppingConnection(_FakeBatchConnection):
+    '''Loses the connection the first time a statement is sent.'''
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def execute_sql(self, statement, *, max_rows=None):
+        self.sent.append(statement.query)
+        if len(self.sent) == 1:
+            raise _FakeException(None, 'OperationalError', None, 'server closed the connection unexpectedly', [])
+        yield QueryResultMessage('OK', query=statement)
+
+    def is_disconnect(self, exception):
+        return True
+
+
+def _dropping_database(mocker, conn):
+    database = _script_database(mocker, conn)
+    mocker.patch('server.db.users.database.admin.User')
+
+    def connect():
+        database._conn = conn
+        return conn
+
+    database.connect.side_effect = connect
+    # The connection is not from the shared pool, and must not end up there
+    database.pool = SimpleNamespace(discard=mocker.stub(name='discard'), checkin=mocker.stub(name='checkin'))
+    return database
+
+
+def test_read_only_statements_are_retried_after_disconnection(mocker):
+    conn = _FakeDroppingConnection()
+    database = _dropping_database(mocker, conn)
+
+    results = list(Database.execute_sql(database, 'SELECT 1;'))
+
+    assert conn.sent == ['SELECT 1;', 'SELECT 1;']
+    assert isinstance(results[0], QueryResultMessage)
+    database.release()
+
+
+def test_sent_statements_which_may_change_data_are_not_retried(mocker):
+    conn = _FakeDroppingConnection()
+    database = _dropping_database(mocker, conn)
+
+    results = list(Database.execute_sql(database, 'INSERT INTO t VALUES (1);'))
+
+    assert conn.sent == ['INSERT INTO t VALUES (1);']
+    assert isinstance(results[0], QueryResultError)
+
+
+class _FakeStatementConnection(_FakeBatchConnection):
+    def execute_sql(self, statement, *, max_rows=None):
+        yield QueryResultMessage('OK', query=statement)
+
+
+def test_dataset_state_is_cleared_once_per_request(mocker):
+    database = _script_database(mocker, _FakeStatementConnection())
+    user = mocker.patch('server.db.users.database.admin.User').return_value
+
+    results = list(Database.execute_sql(database, 'SELECT 1; INSERT INTO t VALUES (1); INSERT INTO t VALUES (2); UPDATE t SET a = 3;'))
+
+    assert len(results) == 4
+    user.set_dataset_state.assert_called_once_with(None)
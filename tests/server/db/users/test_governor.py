@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from server.db.users.governor import ResourceLimits, Watchdog, parse_limit, STATEMENT_TIMEOUT_MS, LOCK_TIMEOUT_MS
+from server.sql.code import SQLCode
+from server.sql.exception import SQLException
+from server.sql.result import QueryResultError
+
+
+class _FakeConnection:
+    host = 'fake'
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+
+class _FakeException(SQLException):
+    pass
+
+
+def test_missing_limits_use_defaults():
+    limits = ResourceLimits.from_values(None, 100)
+
+    assert limits.statement_timeout_ms == STATEMENT_TIMEOUT_MS
+    assert limits.lock_timeout_ms == 100
+
+    assert ResourceLimits.from_values(None, None) == ResourceLimits(STATEMENT_TIMEOUT_MS, LOCK_TIMEOUT_MS)
+
+
+@pytest.mark.parametrize('value', [0, -1, 1001, '100', 1.5, True])
+def test_invalid_limits_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_limit(value, 1000)
+
+
+def test_stored_limits_out_of_range_use_defaults():
+    assert ResourceLimits.from_values(0, -5) == ResourceLimits(STATEMENT_TIMEOUT_MS, LOCK_TIMEOUT_MS)
+    assert parse_limit(None, 1000) is None and parse_limit(1000, 1000) == 1000
+
+
+def test_watchdog_cancels_statement_after_deadline():
+    watchdog = Watchdog()
+    conn = _FakeConnection()
+
+    watch = watchdog.watch(conn, 10)
+
+    assert conn.cancelled.wait(timeout=2)
+    assert watch.cancelled is True
+
+
+def test_watchdog_ignores_completed_statement():
+    watchdog = Watchdog()
+    conn = _FakeConnection()
+
+    watch = watchdog.watch(conn, 50)
+    watchdog.done(watch)
+
+    # A later statement makes sure the first deadline has been processed
+    other = _FakeConnection()
+    watchdog.watch(other, 100)
+    assert other.cancelled.wait(timeout=2)
+
+    assert not conn.cancelled.is_set()
+    assert watch.cancelled is False
+
+
+def test_unlimited_statement_is_not_watched():
+    watchdog = Watchdog()
+    conn = _FakeConnection()
+
+    watch = watchdog.watch(conn, 0)
+
+    assert watch.cancelled is False
+    assert watchdog._thread is None
+
+
+def test_timed_out_error_reports_timing():
+    exception = _FakeException(None, 'QueryCanceled', '57014', 'canceling statement due to statement timeout', [])
+    result = QueryResultError(exception, query=SQLCode('SELECT pg_sleep(10)'), elapsed_ms=1234.5, timeout_ms=1000)
+
+    assert result.timed_out is True
+    assert result.elapsed_ms == 1234.5
+    assert 'Elapsed: 1234 ms (limit: 1000 ms)' in result.result_text
+
+
+def test_other_errors_are_not_timeouts():
+    exception = _FakeException(None, 'SyntaxError', '42601', 'syntax error', [])
+    result = QueryResultError(exception, query=SQLCode('SELEC 1'), elapsed_ms=3)
+
+    assert result.timed_out is False
+    assert 'Elapsed' not in result.result_text
@@ -0,0 +1,50 @@
+import time
+
+from server.db.users.liveness import LivenessPolicy
+
+
+class _FakeConnection:
+    def __init__(self, *, open_: bool = True, alive: bool = True, last_alive: float | None = None):
+        self.open = open_
+        self.alive = alive
+        self.last_alive = time.monotonic() if last_alive is None else last_alive
+        self.pings = 0
+
+    def is_open(self) -> bool:
+        return self.open
+
+    def ping(self) -> bool:
+        self.pings += 1
+        return self.alive
+
+
+def test_recently_used_connection_is_not_pinged():
+    policy = LivenessPolicy(trust_seconds=30)
+    conn = _FakeConnection(alive=False)
+
+    assert policy.is_alive(conn) is True
+    assert conn.pings == 0
+
+
+def test_stale_connection_is_pinged():
+    policy = LivenessPolicy(trust_seconds=30)
+    conn = _FakeConnection(alive=False, last_alive=time.monotonic() - 60)
+
+    assert policy.is_alive(conn) is False
+    assert conn.pings == 1
+
+
+def test_closed_connection_is_never_alive():
+    policy = LivenessPolicy(trust_seconds=30)
+    conn = _FakeConnection(open_=False)
+
+    assert policy.is_alive(conn) is False
+    assert conn.pings == 0
+
+
+def test_zero_trust_always_pings():
+    policy = LivenessPolicy(trust_seconds=0)
+    conn = _FakeConnection()
+
+    assert policy.is_alive(conn) is True
+    assert conn.pings == 1
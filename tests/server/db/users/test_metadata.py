@@ -0,0 +1,144 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlscope import Catalog
+
+from server.db.users.catalog import SystemCatalog
+from server.db.users.database import Database
+from server.db.users.metadata import SchemaMetadata, SchemaMetadataCache, changes_schema, is_read_only
+from server.sql.code import SQLCode
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('SELECT * FROM t', False),
+    ('INSERT INTO t VALUES (1)', False),
+    ('SET search_path TO shop', False),
+    ('CREATE TABLE t (a INT)', True),
+    ('ALTER TABLE t ADD COLUMN b INT', True),
+    ('DROP VIEW v', True),
+    ('ROLLBACK', True),
+    ('CALL refresh()', True),
+    ('SELECT * INTO t2 FROM t', True),
+])
+def test_changes_schema(query, expected):
+    assert changes_schema(SQLCode(query)) is expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('SELECT * FROM t', True),
+    ('SHOW search_path', True),
+    ('SET search_path TO shop', True),
+    ('SELECT * INTO t2 FROM t', False),
+    ('INSERT INTO t VALUES (1)', False),
+    ('WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d', False),
+    ('CREATE TABLE t (a INT)', False),
+    ('CALL refresh()', False),
+])
+def test_is_read_only(query, expected):
+    assert is_read_only(SQLCode(query)) is expected
+
+
+def _metadata(version: int | None) -> SchemaMetadata:
+    return SchemaMetadata(columns=[], unique_columns=[], version=version)
+
+
+def test_cache_returns_metadata_of_current_version_only():
+    cache = SchemaMetadataCache()
+    metadata = _metadata(3)
+    cache.put('alice_postgresql', metadata)
+
+    assert cache.get('alice_postgresql', 3) is metadata
+    assert cache.get('alice_postgresql', 4) is None
+    assert cache.metrics.hits == 1
+    assert cache.metrics.misses == 1
+
+
+def test_cache_keeps_newer_version_and_skips_unknown_versions():
+    cache = SchemaMetadataCache()
+    newer = _metadata(5)
+    cache.put('alice_postgresql', newer)
+    cache.put('alice_postgresql', _metadata(4))
+    cache.put('bob_postgresql', _metadata(None))
+
+    assert cache.get('alice_postgresql', 5) is newer
+    assert cache.stats()['size'] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = SchemaMetadataCache(size=1)
+    cache.put('alice_postgresql', _metadata(1))
+    cache.put('bob_postgresql', _metadata(1))
+
+    assert cache.get('alice_postgresql', 1) is None
+    assert cache.metrics.evictions == 1
+
+
+def test_catalog_is_built_once_and_never_modified(mocker):
+    built = Catalog()
+    built.add_column('public', 'students', 'name', 'text')
+    build_catalog = mocker.patch('server.db.users.metadata.build_catalog', return_value=built)
+    metadata = _metadata(1)
+
+    first = metadata.catalog
+    first.add_column('public', 'students', 'age', 'int')
+    system = SystemCatalog(catalog=Catalog(), search_path='')
+    system.overlay(metadata.catalog).add_column('public', 'students', 'city', 'text')
+
+    build_catalog.assert_called_once()
+    assert [column.name for column in built.get_table('public', 'students').columns] == ['name']
+    assert [column.name for column in metadata.catalog.get_table('public', 'students').columns] == ['name']
+
+
+class _TestDatabase(Database):
+    def __init__(self):
+        super().__init__(
+            dbname='alice',
+            port=5432,
+            dbms_name='postgresql',
+            admin_username='postgres',
+            builtin_queries=None,
+            metadata_queries=None,
+            data_types={},
+        )
+
+    def create_container(self):
+        raise NotImplementedError
+
+    def _get_connection(self, autocommit: bool = True):
+        raise NotImplementedError
+
+
+def _metadata_database(mocker, version: int):
+    user = SimpleNamespace(schema_version=version, bump_schema_version=mocker.stub(name='bump_schema_version'))
+    mocker.patch('server.db.users.database.admin.User', return_value=user)
+
+    database = _TestDatabase()
+    mocker.patch.object(database, 'schemas', SchemaMetadataCache())
+    mocker.patch.object(database, 'get_columns', return_value=['columns'])
+    mocker.patch.object(database, 'get_unique_columns', return_value=['unique_columns'])
+    return database, user
+
+
+def test_metadata_is_loaded_once_per_schema_version(mocker):
+    database, user = _metadata_database(mocker, 1)
+
+    first = database.get_schema_metadata()
+    second = database.get_schema_metadata()
+
+    assert first is second
+    assert first.columns == ['columns']
+    database.get_columns.assert_called_once()
+
+    user.schema_version = 2
+    assert database.get_schema_metadata() is not first
+    assert database.get_columns.call_count == 2
+
+
+def test_invalidation_bumps_shared_schema_version(mocker):
+    database, user = _metadata_database(mocker, 1)
+    database.get_schema_metadata()
+
+    database.invalidate_schema_metadata()
+
+    user.bump_schema_version.assert_called_once()
+    assert database.schemas.stats()['size'] == 0
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from server.db.users.pool import ConnectionPool, PoolTimeoutError
+
+
+class _FakeConnection:
+    def __init__(self, host: str, *, open_: bool = True):
+        self.host = host
+        self.open = open_
+        self.closed = False
+
+    def is_open(self) -> bool:
+        return self.open
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _factory(host: str, created: list):
+    def factory():
+        conn = _FakeConnection(host)
+        created.append(conn)
+        return conn
+    return factory
+
+
+def test_checkin_makes_connection_reusable():
+    pool = ConnectionPool(max_per_key=2, max_total=10, checkout_timeout=1)
+    created = []
+
+    conn = pool.checkout('alice_postgresql', _factory('alice', created))
+    pool.checkin('alice_postgresql', conn)
+    again = pool.checkout('alice_postgresql', _factory('alice', created))
+
+    assert again is conn
+    assert len(created) == 1
+    assert pool.metrics.misses == 1
+    assert pool.metrics.hits == 1
+
+
+def test_concurrent_checkouts_get_distinct_connections():
+    pool = ConnectionPool(max_per_key=2, max_total=10, checkout_timeout=1)
+    created = []
+
+    first = pool.checkout('alice_postgresql', _factory('alice', created))
+    second = pool.checkout('alice_postgresql', _factory('alice', created))
+
+    assert first is not second
+    assert pool.stats()['in_use'] == 2
+
+
+def test_checkout_times_out_when_key_is_full():
+    pool = ConnectionPool(max_per_key=1, max_total=10, checkout_timeout=0.05)
+    created = []
+
+    pool.checkout('alice_postgresql', _factory('alice', created))
+
+    with pytest.raises(PoolTimeoutError):
+        pool.checkout('alice_postgresql', _factory('alice', created))
+
+    assert pool.metrics.waits == 1
+    assert pool.metrics.timeouts == 1
+
+
+def test_waiting_checkout_is_woken_by_checkin():
+    pool = ConnectionPool(max_per_key=1, max_total=10, checkout_timeout=5)
+    created = []
+    conn = pool.checkout('alice_postgresql', _factory('alice', created))
+    result = []
+
+    waiter = threading.Thread(target=lambda: result.append(pool.checkout('alice_postgresql', _factory('alice', created))))
+    waiter.start()
+    pool.checkin('alice_postgresql', conn)
+    waiter.join(timeout=5)
+
+    assert result == [conn]
+    assert len(created) == 1
+
+
+def test_global_cap_evicts_idle_connection_of_other_user():
+    pool = ConnectionPool(max_per_key=2, max_total=1, checkout_timeout=1)
+    created = []
+
+    alice = pool.checkout('alice_postgresql', _factory('alice', created))
+    pool.checkin('alice_postgresql', alice)
+    bob = pool.checkout('bob_postgresql', _factory('bob', created))
+
+    assert bob.host == 'bob'
+    assert alice.closed is True
+    assert pool.metrics.evictions == 1
+    assert pool.stats()['total'] == 1
+
+
+def test_broken_idle_connection_is_discarded():
+    pool = ConnectionPool(max_per_key=2, max_total=10, checkout_timeout=1)
+    created = []
+
+    conn = pool.checkout('alice_postgresql', _factory('alice', created))
+    pool.checkin('alice_postgresql', conn)
+    conn.open = False
+
+    new_conn = pool.checkout('alice_postgresql', _factory('alice', created), validate=lambda c: c.is_open())
+
+    assert new_conn is not conn
+    assert conn.closed is True
+    assert pool.metrics.discards == 1
+    assert pool.stats()['total'] == 1
+
+
+def test_failed_factory_releases_slot():
+    pool = ConnectionPool(max_per_key=1, max_total=10, checkout_timeout=0.05)
+
+    def failing_factory():
+        raise ConnectionError('container not ready')
+
+    with pytest.raises(ConnectionError):
+        pool.checkout('alice_postgresql', failing_factory)
+
+    assert pool.stats()['total'] == 0
+    assert pool.checkout('alice_postgresql', _factory('alice', [])).host == 'alice'
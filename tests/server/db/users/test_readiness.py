@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from server.db.users.readiness import ReadinessProbe, ReadinessTimeoutError
+
+
+def test_wait_ready_polls_until_ready():
+    probe = ReadinessProbe(timeout=5, initial_delay=0.001, max_delay=0.01)
+    answers = iter([False, False, True])
+
+    probe.wait_ready('alice', lambda: next(answers))
+
+    assert probe.metrics.boots == 1
+    assert 'alice' in probe.boot_seconds
+    assert probe.stats()['booting'] == 0
+
+
+def test_wait_ready_times_out():
+    probe = ReadinessProbe(timeout=0.05, initial_delay=0.01, max_delay=0.01)
+
+    with pytest.raises(ReadinessTimeoutError):
+        probe.wait_ready('alice', lambda: False)
+
+    assert probe.metrics.failures == 1
+    assert probe.wait_pending('alice') is False
+
+
+def test_concurrent_requests_share_the_same_boot():
+    probe = ReadinessProbe(timeout=5, initial_delay=0.001, max_delay=0.01)
+    ready = threading.Event()
+    probe.begin('alice')
+
+    booter = threading.Thread(target=lambda: probe.wait_ready('alice', ready.is_set))
+    booter.start()
+
+    waiters = [threading.Thread(target=probe.wait_pending, args=('alice',)) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    ready.set()
+    for thread in [booter, *waiters]:
+        thread.join(timeout=5)
+
+    assert probe.metrics.boots == 1
+    assert probe.metrics.shared_waits == 3
+
+
+def test_failed_boot_is_raised_to_waiters():
+    probe = ReadinessProbe(timeout=5)
+    probe.begin('alice')
+    probe.fail('alice', RuntimeError('container exited'))
+
+    # the failure is reported to requests already waiting, later requests start a new boot
+    assert probe.wait_pending('alice') is False
+    assert probe.metrics.failures == 1
@@ -0,0 +1,87 @@
+import pandas as pd
+
+from server.db.users.mysql.connection import MySQLConnection
+from server.sql.code import SQLCode
+from server.sql.result import Column, QueryResultDataset
+
+
+class _FakeMySQLCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.description = [('n', 3)]
+        self.rowcount = -1
+        self.fetched = 0
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        self.fetched += len(batch)
+        return batch
+
+    def close(self):
+        assert not self.rows, 'all rows must be read before closing an unbuffered cursor'
+
+
+class _FakeMySQLConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, buffered=True):
+        assert buffered is False
+        return self._cursor
+
+
+def _mysql_connection(rows) -> tuple[MySQLConnection, _FakeMySQLCursor]:
+    cursor = _FakeMySQLCursor(rows)
+    conn = MySQLConnection.__new__(MySQLConnection)
+    conn.host = 'alice'
+    conn.connection = _FakeMySQLConnection(cursor)
+    conn._closed = False
+    return conn, cursor
+
+
+def test_dataset_reports_truncation():
+    dataset = QueryResultDataset(
+        result=pd.DataFrame([[1], [2]], columns=['n']),
+        query=SQLCode('SELECT n FROM t'),
+        columns=[Column('n', 'int')],
+        total_rows=10,
+    )
+
+    assert dataset.truncated is True
+    assert dataset.total_rows == 10
+    assert dataset.row_count() == 2
+    assert '10 rows' in dataset.result_html
+
+
+def test_dataset_without_total_is_not_truncated():
+    dataset = QueryResultDataset(
+        result=pd.DataFrame([[1], [2]], columns=['n']),
+        query=SQLCode('SELECT n FROM t'),
+        columns=[Column('n', 'int')],
+    )
+
+    assert dataset.truncated is False
+    assert dataset.total_rows == 2
+
+
+def test_mysql_result_is_capped_and_counted():
+    conn, cursor = _mysql_connection([(i,) for i in range(1234)])
+
+    result = next(iter(conn.execute_sql(SQLCode('SELECT n FROM t'), max_rows=100)))
+
+    assert result.row_count() == 100
+    assert result.total_rows == 1234
+    assert result.truncated is True
+    assert cursor.fetched == 1234
+
+
+def test_mysql_result_is_complete_without_cap():
+    conn, _ = _mysql_connection([(i,) for i in range(1234)])
+
+    result = next(iter(conn.execute_sql(SQLCode('SELECT n FROM t'))))
+
+    assert result.row_count() == 1234
+    assert result.truncated is False
@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from server.db.users.database import Database
+from server.db.users.scheduler import ContainerScheduler
+
+
+class _FakeContainer:
+    def __init__(self, name: str):
+        self.name = name
+        self.stopped = False
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+def _scheduler(mocker, containers: list[tuple[_FakeContainer, float]], *, max_running: int = 10, bound_session: bool = False) -> ContainerScheduler:
+    scheduler = ContainerScheduler(max_idle=timedelta(hours=10), max_running=max_running)
+    mocker.patch.object(scheduler, '_list_running', return_value=containers)
+    mocker.patch.object(scheduler, '_has_bound_session', return_value=bound_session)
+    return scheduler
+
+
+def test_cleanup_stops_idle_containers(mocker):
+    now = time.time()
+    idle = _FakeContainer('lensql_db_user_alice_postgresql')
+    active = _FakeContainer('lensql_db_user_bob_postgresql')
+    scheduler = _scheduler(mocker, [(idle, now - 72000), (active, now - 60)])
+
+    scheduler.cleanup()
+
+    assert idle.stopped is True
+    assert active.stopped is False
+    assert scheduler.status()['hibernated_total'] == 1
+    assert scheduler.status()['running_containers'] == 1
+
+
+def test_cleanup_enforces_running_cap_least_recently_used_first(mocker):
+    now = time.time()
+    oldest = _FakeContainer('lensql_db_user_alice_postgresql')
+    older = _FakeContainer('lensql_db_user_bob_postgresql')
+    newest = _FakeContainer('lensql_db_user_carol_postgresql')
+    scheduler = _scheduler(mocker, [(newest, now - 1000), (oldest, now - 3000), (older, now - 2000)], max_running=1)
+
+    scheduler.cleanup()
+
+    assert oldest.stopped is True
+    assert older.stopped is True
+    assert newest.stopped is False
+
+
+def test_cleanup_skips_containers_in_use(mocker):
+    now = time.time()
+    busy = _FakeContainer('lensql_db_user_alice_postgresql')
+    scheduler = _scheduler(mocker, [(busy, now - 72000)])
+    mocker.patch.object(Database.pool, 'in_use', return_value=1)
+
+    scheduler.cleanup()
+
+    assert busy.stopped is False
+
+
+def test_cleanup_skips_containers_recently_used_by_other_processes(mocker):
+    now = time.time()
+    recent = _FakeContainer('lensql_db_user_alice_postgresql')
+    older = _FakeContainer('lensql_db_user_bob_postgresql')
+    scheduler = _scheduler(mocker, [(recent, now - 30), (older, now - 3000)], max_running=0)
+
+    scheduler.cleanup()
+
+    assert recent.stopped is False
+    assert older.stopped is True
+
+
+def test_cleanup_keeps_bound_sessions_until_idle_limit(mocker):
+    now = time.time()
+    bound = _FakeContainer('lensql_db_user_alice_postgresql')
+    abandoned = _FakeContainer('lensql_db_user_bob_postgresql')
+    scheduler = _scheduler(mocker, [(bound, now - 3000), (abandoned, now - 72000)], max_running=0, bound_session=True)
+
+    scheduler.cleanup()
+
+    assert bound.stopped is False
+    assert abandoned.stopped is True
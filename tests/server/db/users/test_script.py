@@ -0,0 +1,38 @@
+from server.db.users.script import batches
+from server.sql.code import SQLCode
+
+
+def _queries(batch):
+    return [statement.query for statement in batch]
+
+
+def test_batches_are_bounded_by_statement_count():
+    statements = SQLCode('SELECT 1; SELECT 2; SELECT 3;').split()
+
+    assert [_queries(batch) for batch in batches(statements, max_statements=2)] == [
+        ['SELECT 1;', 'SELECT 2;'],
+        ['SELECT 3;'],
+    ]
+
+
+def test_batches_are_bounded_by_size():
+    statements = SQLCode(f"INSERT INTO t VALUES ('{'x' * 100}'); SELECT 1; SELECT 2;").split()
+
+    assert [len(batch) for batch in batches(statements, max_statements=10, max_bytes=50)] == [1, 2]
+
+
+def test_no_statements_no_batches():
+    assert list(batches(SQLCode('-- only a comment').split())) == []
+
+
+def test_transaction_control_statements_are_batched_alone():
+    statements = SQLCode('BEGIN; INSERT 1; INSERT 2; COMMIT; INSERT 3; SAVEPOINT s; INSERT 4;').split()
+
+    assert [_queries(batch) for batch in batches(statements, max_statements=10)] == [
+        ['BEGIN;'],
+        ['INSERT 1;', 'INSERT 2;'],
+        ['COMMIT;'],
+        ['INSERT 3;'],
+        ['SAVEPOINT s;'],
+        ['INSERT 4;'],
+    ]
@@ -0,0 +1,42 @@
+from server.db.users.session import SessionState, setting_name
+
+
+def test_setting_name_of_session_variables():
+    assert setting_name("SET datestyle TO 'ISO, DMY'") == 'datestyle'
+    assert setting_name('SET SESSION work_mem = 1024') == 'work_mem'
+    assert setting_name("SET TIME ZONE 'UTC'") == 'timezone'
+    assert setting_name('RESET timezone') == 'timezone'
+    assert setting_name('RESET ALL') == '*'
+    assert setting_name('SET @counter = 1') == '@counter'
+    assert setting_name("SET @@session.sql_mode = ''") == 'sql_mode'
+
+
+def test_setting_name_ignores_non_replayable_statements():
+    assert setting_name('SET LOCAL work_mem = 1024') is None
+    assert setting_name('SET GLOBAL max_connections = 10') is None
+    assert setting_name('SET @@global.max_connections = 10') is None
+    assert setting_name('SET search_path TO public') is None
+    assert setting_name('SET TRANSACTION ISOLATION LEVEL SERIALIZABLE') is None
+    assert setting_name("UPDATE t SET a = 1") is None
+    assert setting_name('SELECT 1') is None
+
+
+def test_record_keeps_last_statement_for_each_variable():
+    state = SessionState()
+
+    assert state.record("SET datestyle TO 'ISO'") is True
+    assert state.record('SET work_mem = 1024') is True
+    assert state.record("SET datestyle TO 'SQL'") is True
+    assert state.record('SET work_mem = 1024') is False
+    assert state.record('SELECT 1') is False
+
+    assert list(state.settings.values()) == ['SET work_mem = 1024', "SET datestyle TO 'SQL'"]
+
+
+def test_reset_all_discards_previous_settings():
+    state = SessionState(settings={'work_mem': 'SET work_mem = 1024'})
+
+    state.record('RESET ALL')
+    state.record("SET datestyle TO 'ISO'")
+
+    assert list(state.settings.values()) == ['RESET ALL', "SET datestyle TO 'ISO'"]
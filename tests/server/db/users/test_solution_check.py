@@ -4,6 +4,8 @@ import pytest
 from server.db.users.database import Database
 from server.sql import Column, SQLCode
 from server.sql.result import QueryResultDataset, QueryResultMessage
+from server.sql.result.fingerprint import ResultFingerprint
+from server.sql.result.solutions import SolutionCache
 from sqlscope import Catalog
 
 
@@ -64,11 +66,22 @@ class _SolutionCheckDatabase(Database):
         )
         self.results_by_query = results_by_query
         self.calls = []
+        self.built = []
 
-    def _execute_solution_check(self, query: SQLCode, *, search_path: str | None = None):
+    def _fingerprint_solution_check(self, query: SQLCode, *, search_path: str | None = None):
         assert isinstance(query, SQLCode)
         query_text = query.query
         self.calls.append((query_text, search_path))
+
+        result, execution_success = self.results_by_query[query_text]
+        if result is None:
+            return None, execution_success
+        return ResultFingerprint.of_rows(result.columns, [list(result._result.itertuples(index=False, name=None))]), execution_success
+
+    def _execute_solution_check(self, query: SQLCode, *, search_path: str | None = None):
+        assert isinstance(query, SQLCode)
+        query_text = query.query
+        self.built.append((query_text, search_path))
         return self.results_by_query[query_text]
 
     def create_container(self):
@@ -323,3 +336,113 @@ def test_check_query_solution_parametrized(
         assert result.result.row_count() == expected_diff_rows
         assert '__UNEXPECTED__' in result.result.result_text
         assert '__MISSING__' in result.result.result_text
+
+
+def test_correct_query_is_confirmed_by_cached_solution(mocker):
+    cache = mocker.patch('server.db.users.database.solution_results', SolutionCache())
+    columns = [Column('id', 23), Column('name', 25)]
+    database = _SolutionCheckDatabase({
+        'USER': (_dataset('USER', columns, [[2, 'b'], [1, 'a']]), True),
+        'SOLUTION': (_dataset('SOLUTION', columns, [[1, 'a'], [2, 'b']]), True),
+    })
+    mocker.patch.object(database, 'matches_dataset', return_value=True)
+
+    for _ in range(2):
+        result = database.check_query_solution(
+            query_user=SQLCode('USER'),
+            query_solutions=['SOLUTION'],
+            solution_search_path='public',
+            exercise_id=1,
+            dataset_str='CREATE TABLE t();',
+        )
+        assert result.correct is True
+
+    # the solution is only run by the first check
+    assert database.calls == [('USER', None), ('SOLUTION', 'public'), ('USER', None)]
+    assert cache.stats()['hits'] == 1
+
+
+def test_wrong_query_is_compared_with_solution_even_if_cached(mocker):
+    mocker.patch('server.db.users.database.solution_results', SolutionCache())
+    columns = [Column('id', 23)]
+    database = _SolutionCheckDatabase({
+        'USER': (_dataset('USER', columns, [[1]]), True),
+        'SOLUTION': (_dataset('SOLUTION', columns, [[2]]), True),
+    })
+    mocker.patch.object(database, 'matches_dataset', return_value=True)
+
+    for _ in range(2):
+        result = database.check_query_solution(
+            query_user=SQLCode('USER'),
+            query_solutions=['SOLUTION'],
+            solution_search_path='public',
+            exercise_id=1,
+        )
+        assert result.correct is False
+        assert '__MISSING__' in result.result.result_text
+
+    # the solution result is built to show the differences, but its fingerprint is only computed once
+    assert database.calls.count(('SOLUTION', 'public')) == 1
+    assert database.built.count(('SOLUTION', 'public')) == 2
+
+
+def test_solutions_are_run_on_modified_databases(mocker):
+    cache = mocker.patch('server.db.users.database.solution_results', SolutionCache())
+    columns = [Column('id', 23)]
+    database = _SolutionCheckDatabase({
+        'USER': (_dataset('USER', columns, [[1]]), True),
+        'SOLUTION': (_dataset('SOLUTION', columns, [[1]]), True),
+    })
+    matches_dataset = mocker.patch.object(database, 'matches_dataset', return_value=False)
+
+    for _ in range(2):
+        result = database.check_query_solution(
+            query_user=SQLCode('USER'),
+            query_solutions=['SOLUTION'],
+            solution_search_path='public',
+            exercise_id=1,
+            dataset_str='CREATE TABLE t();',
+        )
+        assert result.correct is True
+
+    # results computed on a modified database are neither used nor shared
+    matches_dataset.assert_called_with('CREATE TABLE t();')
+    assert database.calls.count(('SOLUTION', 'public')) == 2
+    assert cache.stats()['solutions'] == 0
+
+
+def test_correct_query_does_not_build_results():
+    columns = [Column('id', 23)]
+    database = _SolutionCheckDatabase({
+        'USER': (_dataset('USER', columns, [[2], [1]]), True),
+        'SOLUTION': (_dataset('SOLUTION', columns, [[1], [2]]), True),
+    })
+
+    result = database.check_query_solution(
+        query_user=SQLCode('USER'),
+        query_solutions=['SOLUTION'],
+        solution_search_path='public',
+    )
+
+    assert result.correct is True
+    assert database.built == []
+
+
+def test_differences_are_shown_against_closest_solution():
+    columns = [Column('id', 23)]
+    database = _SolutionCheckDatabase({
+        'USER': (_dataset('USER', columns, [[1], [2], [3]]), True),
+        'FAR': (_dataset('FAR', columns, [[7], [8]]), True),
+        'CLOSE': (_dataset('CLOSE', columns, [[1], [2], [4]]), True),
+        'OTHER_COLUMNS': (_dataset('OTHER_COLUMNS', [Column('id', 23), Column('name', 25)], [[1, 'a']]), True),
+    })
+
+    result = database.check_query_solution(
+        query_user=SQLCode('USER'),
+        query_solutions=['OTHER_COLUMNS', 'FAR', 'CLOSE'],
+        solution_search_path='public',
+    )
+
+    assert result.correct is False
+    assert database.built == [('USER', None), ('CLOSE', 'public')]
+    assert result.result.row_count() == 3
@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+from server.db.users import tenancy
+
+
+def test_parse_hosts_uses_default_port():
+    hosts = tenancy.parse_hosts('pg1, pg2:6543,', 5432)
+
+    assert hosts == [('pg1', 5432), ('pg2', 6543)]
+
+
+def test_pick_host_is_stable():
+    hosts = [('pg1', 5432), ('pg2', 5432), ('pg3', 5432)]
+
+    assert tenancy.pick_host(hosts, 'alice') == tenancy.pick_host(list(hosts), 'alice')
+
+
+def test_tenant_name_is_safe_identifier():
+    name = tenancy.tenant_name('Robert"); DROP TABLE students;--')
+
+    assert re.fullmatch(r'u_[0-9a-f]{24}', name)
+    assert name != tenancy.tenant_name('alice')
+
+
+def test_tenant_password_depends_on_user(monkeypatch):
+    monkeypatch.setattr(tenancy, 'SHARED_SECRET', 'secret')
+
+    assert tenancy.tenant_password('alice') == tenancy.tenant_password('alice')
+    assert tenancy.tenant_password('alice') != tenancy.tenant_password('bob')
+
+
+def test_tenant_password_requires_secret(monkeypatch):
+    monkeypatch.setattr(tenancy, 'SHARED_SECRET', '')
+
+    with pytest.raises(ValueError):
+        tenancy.tenant_password('alice')
+
+
+def test_shared_tenancy_requires_secret(monkeypatch):
+    monkeypatch.setattr(tenancy, 'TENANCY', tenancy.TENANCY_SHARED)
+    monkeypatch.setattr(tenancy, 'SHARED_SECRET', '')
+
+    with pytest.raises(SystemExit):
+        tenancy.check_configuration()
+
+    monkeypatch.setattr(tenancy, 'SHARED_SECRET', 'secret')
+    tenancy.check_configuration()
+
+
+def test_container_tenancy_does_not_require_secret(monkeypatch):
+    monkeypatch.setattr(tenancy, 'TENANCY', tenancy.TENANCY_CONTAINER)
+    monkeypatch.setattr(tenancy, 'SHARED_SECRET', '')
+
+    tenancy.check_configuration()
+
+
+def test_registry_provisions_once():
+    registry = tenancy.TenantRegistry()
+    calls = []
+
+    assert registry.ensure('pg1/alice', lambda: calls.append(1)) is False
+    assert registry.ensure('pg1/alice', lambda: calls.append(1)) is True
+
+    registry.forget('pg1/alice')
+    assert registry.ensure('pg1/alice', lambda: calls.append(1)) is False
+    assert len(calls) == 2
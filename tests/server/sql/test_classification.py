@@ -0,0 +1,66 @@
+from server.sql.classification import ClassificationCache, Classification, query_hash
+from server.sql.code import SQLCode
+
+
+class _FakeStore:
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.saved = []
+
+    def get(self, query_hash):
+        return self.entries.get(query_hash)
+
+    def save(self, query_hash, query_type, query_goal):
+        self.saved.append((query_hash, query_type, query_goal))
+
+
+def test_hash_ignores_comments_and_whitespace():
+    assert query_hash(SQLCode('SELECT *\n  FROM t; -- all rows')) == query_hash(SQLCode('SELECT * FROM t;'))
+    assert query_hash(SQLCode('SELECT * FROM t;')) != query_hash(SQLCode('SELECT * FROM u;'))
+
+
+def test_repeated_queries_are_classified_once(mocker):
+    cache = ClassificationCache()
+    compute = mocker.spy(SQLCode, '_compute_query_goal')
+
+    first = cache.classify(SQLCode('SELECT * FROM t'))
+    second = cache.classify(SQLCode('SELECT  *  FROM t'))
+
+    assert first == second == Classification('SELECT', 'EXPLORATORY')
+    assert compute.call_count == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ClassificationCache(size=2)
+
+    cache.classify(SQLCode('SELECT 1'))
+    cache.classify(SQLCode('SELECT 2'))
+    cache.classify(SQLCode('SELECT 1'))
+    cache.classify(SQLCode('SELECT 3'))     # evicts SELECT 2
+
+    assert cache.metrics.evictions == 1
+    cache.classify(SQLCode('SELECT 1'))
+    assert cache.metrics.hits == 2
+
+
+def test_shared_store_is_read_and_written():
+    code = SQLCode('SELECT * FROM t WHERE a = 1')
+    store = _FakeStore({query_hash(code): ('SELECT', 'SOLUTION')})
+    cache = ClassificationCache(store=store)
+
+    assert cache.classify(code).query_goal == 'SOLUTION'
+    assert cache.metrics.store_hits == 1
+
+    cache.classify(SQLCode('INSERT INTO t VALUES (1)'))
+    assert store.saved == [(query_hash(SQLCode('INSERT INTO t VALUES (1)')), 'INSERT', 'UNKNOWN')]
+
+
+def test_untrusted_store_is_only_written():
+    code = SQLCode('SELECT * FROM t WHERE a = 1')
+    store = _FakeStore({query_hash(code): ('SELECT', 'SOLUTION')})
+    cache = ClassificationCache(store=store, trust_store=False)
+
+    assert cache.classify(code).query_goal == 'FOCUSED'
+    assert store.saved == [(query_hash(code), 'SELECT', 'FOCUSED')]
@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+import pandas as pd
+
+from server.sql import Column, QueryResultDataset, SQLCode
+from server.sql.result import compare
+
+
+def _dataset(df: pd.DataFrame, total_rows: int | None = None) -> QueryResultDataset:
+    return QueryResultDataset(
+        df,
+        query=SQLCode('SELECT * FROM students'),
+        columns=[Column(name, 25) for name in df.columns],
+        total_rows=total_rows,
+    )
+
+
+def test_result_text_only_contains_first_rows(mocker):
+    mocker.patch('server.sql.result.dataset.RESULT_TEXT_MAX_ROWS', 2)
+    result = _dataset(pd.DataFrame({'id': [1, 2, 3], 'name': ['a', None, 'c']}), total_rows=10)
+
+    assert result.result_text == ',id,name\n0,1,a\n1,2,NULL\n... (10 rows)\n'
+    assert result.result_csv == ',id,name\n0,1,a\n1,2,NULL\n2,3,c\n'
+
+
+def test_content_hash_depends_on_values_and_order_only():
+    df = pd.DataFrame({'id': [1, 2], 'tags': [{'a': 1}, ['b']]})
+
+    same = _dataset(df.set_index(pd.Index([5, 6])))
+    reordered = _dataset(df.iloc[::-1])
+
+    assert _dataset(df).content_hash == same.content_hash
+    assert _dataset(df).content_hash != reordered.content_hash
+    assert len(_dataset(df).row_hashes()) == 2
+
+
+def test_compare_results_counts_duplicate_rows():
+    user = _dataset(pd.DataFrame({'id': [1, 2, 2, 3], 'name': ['a', 'b', 'b', None]}))
+    solution = _dataset(pd.DataFrame({'id': [3, 1, 2, 4], 'name': [None, 'a', 'b', 'd']}))
+
+    equal, comparison = user.compare_results(solution)
+
+    assert not equal
+    assert comparison['check_result'].str.startswith('__UNEXPECTED__').sum() == 1
+    assert comparison['check_result'].str.startswith('__MISSING__').sum() == 1
+    assert comparison.iloc[0][['id', 'name']].tolist() == [2, 'b']
+    assert comparison.iloc[1][['id', 'name']].tolist() == [4, 'd']
+    assert comparison.iloc[2]['check_result'] == '__CORRECT__ 3 rows in your query are correct'
+
+
+def test_compare_results_ignores_order_and_pandas_types():
+    # integer columns containing NULLs are returned as floats
+    user = _dataset(pd.DataFrame({'id': [2.0, None], 'tags': [['x'], {'a': 1}]}))
+    solution = _dataset(pd.DataFrame({'id': pd.Series([None, 2], dtype=object), 'tags': [{'a': 1}, ['x']]}))
+
+    equal, comparison = user.compare_results(solution)
+
+    assert equal
+    assert comparison['check_result'].tolist() == ['__CORRECT__ 2 rows in your query are correct']
+
+
+def test_compare_normalises_decimals():
+    # NUMERIC values are read as Decimal, whose text form depends on their scale
+    user = pd.DataFrame({'n': [Decimal('3.0'), Decimal('0.10'), Decimal('-0.0')]})
+    solution = pd.DataFrame({'n': [Decimal('3'), Decimal('0.1'), Decimal('0')]})
+
+    assert compare.compare(user, solution).equal
+    assert compare.compare(pd.DataFrame({'n': [3.0, 0.1, 0.0]}), solution).equal
+    assert not compare.compare(pd.DataFrame({'n': [Decimal('3.01')]}), pd.DataFrame({'n': [Decimal('3.1')]})).equal
+
+
+def test_compare_limits_differing_rows():
+    comparison = compare.compare(pd.DataFrame({'id': [1, 1, 3, 1, 2]}), pd.DataFrame({'id': [1, 4]}), max_rows=3)
+
+    assert comparison.unexpected.tolist() == [0, 0, 2]
+    assert comparison.unexpected_count == 4
+    assert comparison.missing.tolist() == [1]
+    assert comparison.missing_count == 1
+    assert comparison.correct_count == 1
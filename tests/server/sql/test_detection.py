@@ -0,0 +1,83 @@
+import signal
+import time
+
+import pytest
+from sqlscope import Dialect
+
+from server.sql import detection
+from server.sql.detection import DetectionJob, DetectionTimeout, ErrorDetection
+
+
+def _job() -> DetectionJob:
+    return DetectionJob(
+        query_str='SELECT * FROM students',
+        solutions=['SELECT id FROM students'],
+        search_path='public',
+        solution_search_path='public',
+        dialect=Dialect.POSTGRES,
+    )
+
+
+def test_detected_errors_are_passed_to_callback(mocker):
+    mocker.patch('server.sql.detection.detect', return_value=[(1, ['a'])])
+    callback = mocker.stub(name='callback')
+    engine = ErrorDetection(workers=0)
+
+    future = engine.submit(_job(), callback)
+
+    assert future.result() == [(1, ['a'])]
+    callback.assert_called_once_with([(1, ['a'])])
+    assert engine.stats()['completed'] == 1
+    assert engine.stats()['pending'] == 0
+
+
+def test_failed_jobs_do_not_call_callback(mocker):
+    mocker.patch('server.sql.detection.detect', side_effect=ValueError('unsupported query'))
+    callback = mocker.stub(name='callback')
+    engine = ErrorDetection(workers=0)
+
+    future = engine.submit(_job(), callback)
+
+    assert isinstance(future.exception(), ValueError)
+    callback.assert_not_called()
+    assert engine.metrics.failed == 1
+
+
+def test_jobs_are_rejected_when_too_many_are_pending(mocker):
+    detect = mocker.patch('server.sql.detection.detect')
+    engine = ErrorDetection(workers=0, max_pending=0)
+
+    assert engine.submit(_job()) is None
+    detect.assert_not_called()
+    assert engine.metrics.rejected == 1
+
+
+def test_slow_jobs_are_interrupted(mocker):
+    mocker.patch('server.sql.detection.detect', side_effect=lambda job: time.sleep(5))
+    previous = signal.getsignal(signal.SIGALRM)
+
+    try:
+        detection._init_worker()
+        with pytest.raises(DetectionTimeout):
+            detection._detect_with_timeout(_job(), 0.05)
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+
+
+def test_broken_pools_do_not_replace_newer_ones(mocker):
+    engine = ErrorDetection(workers=0)
+    old, new = mocker.Mock(), mocker.Mock()
+    future = detection.Future()
+    future.set_exception(detection.BrokenProcessPool('a worker died'))
+
+    engine._pending = 2
+    engine._executor = new
+    engine._done(future, None, old)
+
+    assert engine._executor is new
+    new.shutdown.assert_not_called()
+
+    engine._done(future, None, new)
+
+    assert engine._executor is None
+    new.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import numpy as np
+
+from server.sql import Column
+from server.sql.result.fingerprint import FingerprintBuilder, ResultFingerprint
+
+
+def _fingerprint(*batches: list[tuple], data_type: int = 23) -> ResultFingerprint:
+    return ResultFingerprint.of_rows([Column('id', data_type), Column('tags', 3802)], batches)
+
+
+def test_fingerprints_ignore_row_order_and_batches():
+    solution = _fingerprint([(1, ['a']), (2, {'b': 1})], [(2, {'b': 1})])
+
+    assert solution.matches(_fingerprint([(Decimal('2'), {'b': 1}), (2.0, {'b': 1}), (1, ['a'])]))
+    assert not solution.matches(_fingerprint([(1, ['a']), (2, {'b': 1})]))
+    assert not solution.matches(_fingerprint([(1, ['a']), (2, {'b': 1}), (2, {'b': 1})], data_type=25))
+    assert solution.rows.rows == 3
+    assert solution.size == 2
+
+
+def test_similarity_prefers_rows_in_common():
+    user = _fingerprint([(1, None), (2, None), (3, None)])
+    close = _fingerprint([(1, None), (2, None)])
+    far = _fingerprint([(7, None), (8, None), (9, None)])
+
+    assert user.rows.common_rows(close.rows) == 2
+    assert user.similarity(close) > user.similarity(far)
+
+
+def test_empty_results_have_empty_fingerprints():
+    fingerprint = FingerprintBuilder([Column('id', 23)]).build()
+
+    assert fingerprint.rows.rows == 0
+    assert fingerprint.rows.keys.dtype == np.int64
+    assert fingerprint.matches(ResultFingerprint.of_rows([Column('id', 23)], [[]]))
+
+
+def test_rows_with_equal_python_hashes_are_distinguished():
+    # hash(-1) == hash(-2) in CPython
+    assert not _fingerprint([(-1, None)]).matches(_fingerprint([(-2, None)]))
+    assert not _fingerprint([('a', 'b')]).matches(_fingerprint([('ab', '')]))
+    assert _fingerprint([(Decimal('3.0'), None)]).matches(_fingerprint([(3, None)]))
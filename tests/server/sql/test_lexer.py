@@ -0,0 +1,111 @@
+from sqlscope import Dialect
+
+from server.sql.code import SQLCode
+from server.sql.lexer import lex
+
+
+def _texts(query: str, dialect: Dialect | None = None) -> list[str]:
+    return [statement.text for statement in lex(query, dialect).statements]
+
+
+def test_split_keeps_semicolons_and_skips_comment_only_statements():
+    assert _texts('SELECT 1; -- first\nSELECT 2; /* x */ SELECT 3;\n-- tail') == [
+        'SELECT 1; -- first',
+        'SELECT 2;',
+        '/* x */ SELECT 3;',
+    ]
+
+
+def test_semicolons_in_strings_and_identifiers_do_not_split():
+    query = '''SELECT 'a;b', "c;d", E'e\\';f'; SELECT 2'''
+
+    assert _texts(query, Dialect.POSTGRES) == ['''SELECT 'a;b', "c;d", E'e\\';f';''', 'SELECT 2']
+
+
+def test_postgres_dollar_quotes_and_nested_comments():
+    query = 'CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql; /* a /* b; */ c; */ SELECT 2;'
+    result = lex(query, Dialect.POSTGRES)
+
+    assert [statement.code for statement in result.statements] == [
+        'CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;',
+        'SELECT 2;',
+    ]
+
+
+def test_mysql_comments_escapes_and_backticks():
+    query = "SELECT 'a\\';b' # comment;\n, `x;y`; SELECT 1--2;"
+    result = lex(query, Dialect.MYSQL)
+
+    assert [statement.code for statement in result.statements] == ["SELECT 'a\\';b' \n, `x;y`;", 'SELECT 1--2;']
+
+
+def test_mysql_delimiter():
+    query = 'DELIMITER //\nCREATE PROCEDURE p() BEGIN SELECT 1; END //\nDELIMITER ;\nSELECT 1;'
+
+    assert _texts(query, Dialect.MYSQL) == ['CREATE PROCEDURE p() BEGIN SELECT 1; END', 'SELECT 1;']
+
+
+def test_create_blocks_without_delimiter():
+    query = 'CREATE PROCEDURE p() BEGIN IF x THEN SELECT 1; END IF; SELECT 2; END; SELECT 3;'
+
+    assert _texts(query, Dialect.MYSQL) == ['CREATE PROCEDURE p() BEGIN IF x THEN SELECT 1; END IF; SELECT 2; END;', 'SELECT 3;']
+
+
+def test_end_case_closes_case_statements():
+    query = 'CREATE PROCEDURE p() BEGIN CASE x WHEN 1 THEN SELECT 1; END CASE; SELECT CASE WHEN y THEN 2 END; END; SELECT 1;'
+
+    assert _texts(query, Dialect.MYSQL) == [
+        'CREATE PROCEDURE p() BEGIN CASE x WHEN 1 THEN SELECT 1; END CASE; SELECT CASE WHEN y THEN 2 END; END;',
+        'SELECT 1;',
+    ]
+
+
+def test_columns_named_begin_do_not_open_blocks():
+    query = 'CREATE TABLE log (id int, begin timestamp, finish timestamp); INSERT INTO log VALUES (1, NULL, NULL); SELECT 1;'
+
+    for dialect in (Dialect.POSTGRES, Dialect.MYSQL, None):
+        assert len(_texts(query, dialect)) == 3
+
+
+def test_postgres_atomic_bodies():
+    query = 'CREATE FUNCTION f() RETURNS int LANGUAGE sql BEGIN ATOMIC SELECT CASE WHEN true THEN 1 END; END; SELECT 2;'
+
+    assert _texts(query, Dialect.POSTGRES) == [
+        'CREATE FUNCTION f() RETURNS int LANGUAGE sql BEGIN ATOMIC SELECT CASE WHEN true THEN 1 END; END;',
+        'SELECT 2;',
+    ]
+
+
+def test_query_type():
+    assert SQLCode('SELECT 1').query_type == 'SELECT'
+    assert SQLCode('-- comment\n/* c */ select 1').query_type == 'SELECT'
+    assert SQLCode('WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x').query_type == 'INSERT'
+    assert SQLCode('(SELECT 1) UNION (SELECT 2)').query_type == 'SELECT'
+    assert SQLCode('CREATE OR REPLACE VIEW v AS SELECT 1').query_type == 'CREATE VIEW'
+    assert SQLCode('CREATE UNIQUE INDEX i ON t(a)').query_type == 'CREATE INDEX'
+    assert SQLCode('CREATE EXTENSION x').query_type == 'CREATE'
+    assert SQLCode('DROP TABLE t').query_type == 'DROP TABLE'
+    assert SQLCode('EXPLAIN ANALYZE SELECT 1').query_type == 'EXPLAIN ANALYZE'
+    assert SQLCode('VACUUM').query_type == 'UNKNOWN'
+    assert SQLCode('-- only a comment').query_type == 'UNKNOWN'
+    assert SQLCode('  ').query_type == 'EMPTY'
+
+
+def test_split_statements_reuse_lexer_result(mocker):
+    code = SQLCode('SELECT 1; -- c\nINSERT INTO t VALUES (1);')
+    statements = list(code.split())
+
+    lex_spy = mocker.patch('server.sql.code.lex')
+    assert [statement.query_type for statement in statements] == ['SELECT', 'INSERT']
+    assert statements[0].strip_comments().query == 'SELECT 1;'
+    lex_spy.assert_not_called()
+
+
+def test_large_script_is_split():
+    rows = ',\n'.join(f"({i}, 'name;{i}', NULL)" for i in range(10_000))
+    script = f'CREATE TABLE t (id INT, name TEXT, x INT);\nINSERT INTO t VALUES\n{rows};\n' * 4
+
+    statements = list(SQLCode(script).split())
+
+    assert len(statements) == 8
+    assert [statement.query_type for statement in statements[:2]] == ['CREATE TABLE', 'INSERT']
@@ -0,0 +1,57 @@
+import pandas as pd
+
+from server.sql import Column, QueryResultDataset, SQLCode
+from server.sql.result.store import ResultStore
+
+
+def _dataset(rows: int) -> QueryResultDataset:
+    return QueryResultDataset(
+        pd.DataFrame({'id': range(rows)}),
+        query=SQLCode('SELECT id FROM students'),
+        columns=[Column('id', 23)],
+    )
+
+
+def test_results_are_only_returned_to_their_owner():
+    store = ResultStore(max_rows=100)
+    result = _dataset(10)
+    store.put(1, 'alice', result)
+
+    assert store.get(1, 'alice') is result
+    assert store.get(1, 'bob') is None
+    assert store.get(2, 'alice') is None
+    assert store.metrics.hits == 1 and store.metrics.misses == 2
+
+
+def test_least_recently_used_results_are_evicted_within_row_budget():
+    store = ResultStore(max_rows=25)
+    store.put(1, 'alice', _dataset(10))
+    store.put(2, 'alice', _dataset(10))
+    store.get(1, 'alice')
+    store.put(3, 'alice', _dataset(10))
+
+    assert store.get(2, 'alice') is None
+    assert store.get(1, 'alice') is not None
+    assert store.stats()['rows'] == 20
+    assert store.metrics.evictions == 1
+    assert not store.put(4, 'alice', _dataset(30))
+
+
+def test_results_expire(mocker):
+    monotonic = mocker.patch('server.sql.result.store.time.monotonic', return_value=100)
+    store = ResultStore(max_rows=100, ttl=60)
+    store.put(1, 'alice', _dataset(10))
+
+    monotonic.return_value = 161
+
+    assert store.get(1, 'alice') is None
+    assert store.stats()['rows'] == 0
+    assert store.metrics.expirations == 1
+
+
+def test_stores_without_budget_keep_no_results():
+    # Used when requests are served by multiple workers, which cannot share pages
+    store = ResultStore(max_rows=0)
+
+    assert not store.put(1, 'alice', _dataset(10))
+    assert store.get(1, 'alice') is None
@@ -0,0 +1,36 @@
+from server.sql import Column
+from server.sql.result.fingerprint import ResultFingerprint
+from server.sql.result.solutions import SolutionCache, solution_key
+
+
+def _fingerprint(ids: list[int]) -> ResultFingerprint:
+    return ResultFingerprint.of_rows([Column('id', 23)], [[(i,) for i in ids]])
+
+
+def test_updates_invalidate_fingerprints():
+    cache = SolutionCache()
+    fingerprint = _fingerprint([1])
+
+    cache.put(solution_key(1, 'SELECT 1', 'dataset a'), fingerprint)
+    cache.put(solution_key(2, 'SELECT 2', 'dataset a'), fingerprint)
+    cache.put(solution_key(3, 'SELECT 3', 'dataset b'), fingerprint)
+
+    cache.invalidate(exercise_id=1)
+    assert cache.get(solution_key(1, 'SELECT 1', 'dataset a')) is None
+    assert cache.get(solution_key(2, 'SELECT 2', 'dataset a')) is fingerprint
+
+    cache.invalidate(dataset_str='dataset a')
+    assert cache.get(solution_key(2, 'SELECT 2', 'dataset a')) is None
+    assert cache.get(solution_key(3, ' SELECT 3 ', 'dataset b')) is fingerprint
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_cache_is_bounded_by_rows():
+    cache = SolutionCache(max_rows=3)
+
+    cache.put(solution_key(1, 'a', ''), _fingerprint([1, 2]))
+    cache.put(solution_key(2, 'b', ''), _fingerprint([1, 2]))
+
+    assert cache.get(solution_key(1, 'a', '')) is None
+    assert cache.stats()['rows'] == 2
+    assert not cache.put(solution_key(3, 'c', ''), _fingerprint([1, 2, 3, 4]))
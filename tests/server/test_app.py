@@ -11,6 +11,7 @@ def test_create_app_registers_expected_blueprints():
     assert 'query' in app.blueprints
     assert 'user' in app.blueprints
     assert 'navigation' in app.blueprints
+    assert 'system' in app.blueprints
 
 
 def test_create_app_sets_expected_core_config():
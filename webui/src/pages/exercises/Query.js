@@ -21,14 +21,25 @@ function Query({ exerciseId, datasetId, exerciseTitle, exerciseText, attempts, h
     const [sqlText, setSqlText] = useState(lastQuery || '');
     const [isExecuting, setIsExecuting] = useState(false);
     const [result, setResult] = useState([]);
+    const [initProgress, setInitProgress] = useState(null);
     const [showTopBtn, setShowTopBtn] = useState(false);
 
     const scheduledScrollRef = useRef(null);
     const resultEndRef = useRef(null);
 
+    // Progress updates replace each other, all other lines are results
+    function handleInitLine(parsed) {
+        if (parsed.progress) {
+            setInitProgress(parsed.progress);
+        } else {
+            setResult(prev => [...prev, parsed]);
+        }
+    }
+
     async function handleCreateDataset() {
         setIsExecuting(true);
         setResult([]);
+        setInitProgress(null);
 
         try {
             const stream = await apiRequest('/api/exercises/init-dataset', 'POST', {
@@ -52,7 +63,7 @@ function Query({ exerciseId, datasetId, exerciseTitle, exerciseText, attempts, h
                         if (line.trim() === '') continue;
                         try {
                             const parsed = JSON.parse(line);
-                            setResult(prev => [...prev, parsed]);
+                            handleInitLine(parsed);
                         } catch (e) {
                             console.error('Failed to parse line:', line);
                         }
@@ -63,7 +74,7 @@ function Query({ exerciseId, datasetId, exerciseTitle, exerciseText, attempts, h
             if (buffer.trim() !== '') {
                 try {
                     const parsed = JSON.parse(buffer);
-                    setResult(prev => [...prev, parsed]);
+                    handleInitLine(parsed);
                 } catch (e) {
                     console.error('Failed to parse last buffer:', buffer);
                 }
@@ -74,6 +85,7 @@ function Query({ exerciseId, datasetId, exerciseTitle, exerciseText, attempts, h
             console.error('Streaming error:', error);
         } finally {
             setIsExecuting(false);
+            setInitProgress(null);
         }
     }
 
@@ -150,6 +162,17 @@ function Query({ exerciseId, datasetId, exerciseTitle, exerciseText, attempts, h
                 {t('pages.exercises.query.init_dataset')}
             </ButtonAction>
 
+            {initProgress && initProgress.total > 0 && (
+                <div className="progress mb-3" role="progressbar" aria-valuenow={initProgress.executed} aria-valuemin="0" aria-valuemax={initProgress.total}>
+                    <div
+                        className={`progress-bar progress-bar-striped progress-bar-animated ${initProgress.errors > 0 ? 'bg-warning' : ''}`}
+                        style={{ width: `${100 * initProgress.executed / initProgress.total}%` }}
+                    >
+                        {t('pages.exercises.query.init_progress', { executed: initProgress.executed, total: initProgress.total })}
+                    </div>
+                </div>
+            )}
+
             <SqlEditor onChange={setSqlText} value={lastQuery || ''} />
 
             <div className="mt-3 support-buttons">
@@ -193,6 +216,7 @@ function Query({ exerciseId, datasetId, exerciseTitle, exerciseText, attempts, h
                     result.map((val, index) => (
                         <QueryResult
                             result={val.data}
+                            page={val.columns ? val : null}
                             isBuiltin={val.builtin}
                             queryId={val.id}
                             query={val.query}
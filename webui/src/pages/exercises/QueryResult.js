@@ -2,10 +2,11 @@ import { forwardRef } from 'react';
 import { useTranslation } from 'react-i18next';
 
 import Chat from './Chat';
+import ResultTable from './ResultTable';
 
 import './QueryResult.css';
 
-const QueryResult = forwardRef(({ result, isBuiltin, queryId, query, success, isMessage, notices }, ref) => {
+const QueryResult = forwardRef(({ result, page, isBuiltin, queryId, query, success, isMessage, notices }, ref) => {
     const { t } = useTranslation();
     
     return (
@@ -54,6 +55,15 @@ const QueryResult = forwardRef(({ result, isBuiltin, queryId, query, success, is
             {
                 isMessage ? (
                     <pre>{result}</pre>
+                ) : page ? (
+                    <ResultTable
+                        queryId={queryId}
+                        columns={page.columns}
+                        rows={page.rows}
+                        offset={page.offset}
+                        fetchedRows={page.fetched_rows}
+                        totalRows={page.total_rows}
+                    />
                 ) : (
                     <div dangerouslySetInnerHTML={{ __html: result }} />
                 )
@@ -0,0 +1,146 @@
+import { useEffect, useRef, useState } from 'react';
+import { useTranslation } from 'react-i18next';
+
+import useAuth from '../../hooks/useAuth';
+
+const ROW_HEIGHT = 33;      // pixels, must match `.result-table` rows
+const MAX_HEIGHT = 500;     // pixels
+const OVERSCAN = 10;        // rows rendered above and below the visible ones
+
+// Values of the comparison with the solution start with one of these markers
+const MARKERS = {
+    '__UNEXPECTED__': { key: 'unexpected', color: 'red' },
+    '__MISSING__': { key: 'missing', color: 'blue' },
+    '__CORRECT__': { key: 'correct', color: 'green' },
+};
+
+function Cell({ value }) {
+    const { t } = useTranslation();
+
+    if (value === null) {
+        return 'NULL';
+    }
+
+    if (typeof value === 'string') {
+        for (const [marker, { key, color }] of Object.entries(MARKERS)) {
+            if (value.startsWith(marker)) {
+                return (
+                    <>
+                        <b style={{ color }}>{t(`pages.exercises.query_result.${key}`)}:</b>
+                        {value.slice(marker.length)}
+                    </>
+                );
+            }
+        }
+    }
+
+    return String(value);
+}
+
+// Table rendering only the rows in view, so that large results do not slow down the page.
+// Rows not received with the result are requested in pages, as they are scrolled into view.
+function ResultTable({ queryId, columns, rows: firstRows, offset, fetchedRows, totalRows }) {
+    const { t } = useTranslation();
+    const { apiRequest } = useAuth();
+
+    const pageSize = Math.max(firstRows.length, 1);
+
+    const [rows, setRows] = useState(() => {
+        const loaded = new Array(fetchedRows).fill(undefined);
+        firstRows.forEach((row, i) => { loaded[offset + i] = row; });
+        return loaded;
+    });
+    const [scrollTop, setScrollTop] = useState(0);
+    const [error, setError] = useState(null);
+
+    const requestedPages = useRef(new Set([Math.floor(offset / pageSize)]));
+
+    const first = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const last = Math.min(fetchedRows, Math.ceil((scrollTop + MAX_HEIGHT) / ROW_HEIGHT) + OVERSCAN);
+
+    // Load the pages of the rows in view
+    useEffect(() => {
+        if (error || queryId === null || queryId === undefined) return;
+
+        for (let i = first; i < last; i++) {
+            if (rows[i] !== undefined) continue;
+
+            const page = Math.floor(i / pageSize);
+            if (requestedPages.current.has(page)) continue;
+            requestedPages.current.add(page);
+
+            apiRequest(`/api/queries/${queryId}/rows?offset=${page * pageSize}&limit=${pageSize}`, 'GET')
+                .then(data => {
+                    if (!data.success) {
+                        setError(data.message);
+                        return;
+                    }
+
+                    setRows(prev => {
+                        const loaded = [...prev];
+                        data.rows.forEach((row, j) => { loaded[data.offset + j] = row; });
+                        return loaded;
+                    });
+                })
+                .catch(() => requestedPages.current.delete(page));
+        }
+    }, [first, last, rows, pageSize, queryId, error, apiRequest]);
+
+    const visible = [];
+    for (let i = first; i < last; i++) {
+        visible.push(
+            <tr key={i} style={{ height: ROW_HEIGHT }}>
+                <th>{i}</th>
+                {
+                    rows[i] === undefined ? (
+                        <td colSpan={columns.length} className="text-muted">{t('pages.exercises.query_result.loading')}</td>
+                    ) : (
+                        rows[i].map((value, j) => (
+                            <td key={j}><Cell value={value} /></td>
+                        ))
+                    )
+                }
+            </tr>
+        );
+    }
+
+    return (
+        <>
+            <p>
+                <i>
+                    {
+                        totalRows > fetchedRows
+                            ? t('pages.exercises.query_result.dimensions_truncated', { total: totalRows, rows: fetchedRows, columns: columns.length })
+                            : t('pages.exercises.query_result.dimensions', { rows: fetchedRows, columns: columns.length })
+                    }
+                </i>
+            </p>
+
+            {error && <p className="text-danger">{error}</p>}
+
+            <div
+                className="result-table"
+                style={{ maxHeight: MAX_HEIGHT }}
+                onScroll={e => setScrollTop(e.currentTarget.scrollTop)}
+            >
+                <table className="table table-bordered table-hover">
+                    <thead className="table-dark">
+                        <tr>
+                            <th />
+                            {columns.map((column, j) => (
+                                <th key={j} title={column.type || undefined}>{column.name}</th>
+                            ))}
+                        </tr>
+                    </thead>
+                    <tbody className="table-group-divider">
+                        {first > 0 && <tr style={{ height: first * ROW_HEIGHT }} />}
+                        {visible}
+                        {last < fetchedRows && <tr style={{ height: (fetchedRows - last) * ROW_HEIGHT }} />}
+                    </tbody>
+                </table>
+            </div>
+        </>
+    );
+}
+
+export default ResultTable;